@@ -13,6 +13,45 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Auto-discover tasks from all registered Django app configs.
 app.autodiscover_tasks()
 
+# Run by the single `beat` process in the Procfile - never start more than one
+app.conf.beat_schedule = {
+    # Release stock held by abandoned checkouts
+    'expire-inventory-reservations': {
+        'task': 'clientapp.tasks.expire_inventory_reservations',
+        'schedule': crontab(minute='*/5'),
+    },
+    # Recompute co-purchase recommendations from full history
+    'rebuild-copurchase-index': {
+        'task': 'clientapp.tasks.rebuild_copurchase_index',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    # Project history tables into the activity feed read model
+    'catch-up-activity-feed': {
+        'task': 'clientapp.tasks.catch_up_activity_feed',
+        'schedule': crontab(minute='*/5'),
+    },
+    # Remind customers about carts idle for a day
+    'abandoned-cart-reminders': {
+        'task': 'clientapp.tasks.run_abandoned_cart_campaign',
+        'schedule': crontab(minute=15),
+    },
+    # Retry payment callbacks that arrived before their transaction
+    'process-payment-webhooks': {
+        'task': 'clientapp.tasks.process_payment_webhooks',
+        'schedule': crontab(minute='*'),
+    },
+    # Reconcile client dashboards and roll their 30-day/overdue windows
+    'refresh-client-dashboards': {
+        'task': 'clientapp.tasks.refresh_client_dashboards',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    # Merge leads that share an email (phone-only matches are left for review)
+    'merge-duplicate-leads': {
+        'task': 'clientapp.tasks.merge_duplicate_leads',
+        'schedule': crontab(hour=3, minute=30),
+    },
+}
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
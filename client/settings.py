@@ -46,6 +46,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
@@ -95,19 +96,50 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'client.wsgi.application'
+ASGI_APPLICATION = 'client.asgi.application'
 
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DB_POOL enables Django's native psycopg connection pool, shared by every
+# thread in a worker process. It is on by default because the web tier runs
+# under ASGI, where persistent per-thread connections (CONN_MAX_AGE) leak:
+# sync_to_async threads come and go. Without the pool, DB_CONN_MAX_AGE keeps
+# connections open and is only safe under WSGI.
+# DB_WEB_MAX_CONNECTIONS is the web tier's share of Postgres max_connections;
+# each gunicorn worker's pool gets an equal slice (WEB_CONCURRENCY is exported
+# by gunicorn.conf.py), so adding workers never exceeds it. Leave headroom
+# for Celery workers and admin sessions.
+# DB_PGBOUNCER disables server-side cursors, which break under pgbouncer's
+# transaction pooling.
+DB_POOL = config('DB_POOL', default=True, cast=bool)
+DB_CONN_MAX_AGE = config('DB_CONN_MAX_AGE', default=0, cast=int)
+DB_WEB_MAX_CONNECTIONS = config('DB_WEB_MAX_CONNECTIONS', default=40, cast=int)
+WEB_CONCURRENCY = config('WEB_CONCURRENCY', default=1, cast=int)
+DB_POOL_MAX_SIZE = config('DB_POOL_MAX_SIZE', default=max(2, DB_WEB_MAX_CONNECTIONS // max(WEB_CONCURRENCY, 1)), cast=int)
+DB_POOL_MIN_SIZE = min(config('DB_POOL_MIN_SIZE', default=2, cast=int), DB_POOL_MAX_SIZE)
+DB_POOL_TIMEOUT = config('DB_POOL_TIMEOUT', default=10, cast=int)
+DB_PGBOUNCER = config('DB_PGBOUNCER', default=False, cast=bool)
+
 DATABASES = {
     'default': dj_database_url.config(
         default=config('DATABASE_URL'),
-        conn_max_age=600,
-        conn_health_checks=True,
+        conn_max_age=0 if DB_POOL else DB_CONN_MAX_AGE,
+        conn_health_checks=not DB_POOL,
     )
 }
 
+if DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if DB_POOL:
+        DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+            'min_size': DB_POOL_MIN_SIZE,
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': DB_POOL_TIMEOUT,
+        }
+    if DB_PGBOUNCER:
+        DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -202,6 +234,8 @@ REST_FRAMEWORK = {
     "DEFAULT_THROTTLE_RATES": {
         "anon": "50/hour",
         "user": "500/hour",
+        # Public catalog: conditional/cached responses make this cheap
+        "storefront_catalog": "1000/hour",
     },
 }
 
@@ -282,7 +316,8 @@ else:
     CELERY_RESULT_BACKEND = 'cache+memory://'
 
 CELERY_BROKER_USE_SSL = False
-CELERY_BROKER_POOL_LIMIT = 1
+# Broker connections kept open per process (each is a Postgres connection with the database broker)
+CELERY_BROKER_POOL_LIMIT = config('CELERY_BROKER_POOL_LIMIT', default=4, cast=int)
 CELERY_BROKER_CONNECTION_RETRY = True
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
@@ -294,6 +329,54 @@ CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes hard time limit
 CELERY_RESULT_EXPIRES = 3600  # Results expire after 1 hour
 
+# Queues: latency-sensitive work never waits behind bulk jobs. Each entry of
+# CELERY_WORKER_POOLS is one worker process group in the Procfile, consuming
+# those queues; `manage.py queuebench` measures the same layout.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_WORKER_POOLS = {
+    'fast': ['realtime', 'email', 'default'],
+    'bulk': ['integrations', 'reports', 'media'],
+}
+# Priorities order tasks within a queue on brokers that support them (0-9, higher first)
+CELERY_TASK_QUEUE_MAX_PRIORITY = 9
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_TASK_ROUTES = {
+    # Realtime: payment confirmations and notifications
+    'clientapp.tasks.process_payment_webhooks': {'queue': 'realtime', 'priority': 9},
+    'clientapp.tasks.process_webhook': {'queue': 'realtime', 'priority': 8},
+    'clientapp.tasks.send_whatsapp_async': {'queue': 'realtime', 'priority': 7},
+    'clientapp.tasks.publish_progress': {'queue': 'realtime', 'priority': 7},
+    'clientapp.tasks.expire_inventory_reservations': {'queue': 'realtime', 'priority': 6},
+    # Customer-facing email
+    'clientapp.tasks.send_email_async': {'queue': 'email', 'priority': 7},
+    # Integrations
+    'clientapp.tasks.celery_sync_completed_pos_to_qb': {'queue': 'integrations'},
+    'clientapp.tasks.celery_batch_sync_lpos_to_qb': {'queue': 'integrations'},
+    'clientapp.tasks.celery_batch_sync_vendor_invoices_to_qb': {'queue': 'integrations'},
+    'clientapp.tasks.sync_products_to_storefront_task': {'queue': 'integrations'},
+    # Image resizing: CPU-heavy, kept off the pool that serves email and realtime
+    'clientapp.tasks.process_product_image': {'queue': 'media'},
+    # Reports, rebuilds and other bulk jobs (chunked jobs pick their own queue)
+    'clientapp.tasks.generate_daily_report': {'queue': 'reports'},
+    'clientapp.tasks.run_task_chunk': {'queue': 'reports'},
+    'clientapp.tasks.rebuild_copurchase_index': {'queue': 'reports'},
+    'clientapp.tasks.refresh_client_dashboards': {'queue': 'reports'},
+    'clientapp.tasks.merge_duplicate_leads': {'queue': 'reports'},
+    'clientapp.tasks.catch_up_activity_feed': {'queue': 'reports'},
+    'clientapp.tasks.regenerate_catalog_snapshot': {'queue': 'reports'},
+    'clientapp.tasks.run_abandoned_cart_campaign': {'queue': 'reports'},
+    'clientapp.tasks.send_expiring_estimate_reminders': {'queue': 'reports'},
+    'clientapp.tasks.archive_expired_estimates': {'queue': 'reports'},
+    'clientapp.tasks.cleanup_old_conversations': {'queue': 'reports'},
+    'clientapp.tasks.update_production_unit_status': {'queue': 'reports'},
+    'clientapp.tasks.celery_expire_old_quotes': {'queue': 'reports'},
+    'clientapp.tasks.celery_remind_approaching_job_deadlines': {'queue': 'reports'},
+    'clientapp.tasks.celery_check_po_delivery_overdue': {'queue': 'reports'},
+}
+# Reserve one task per worker process at a time, so a process busy with a long
+# job does not sit on prefetched tasks another process could start
+CELERY_WORKER_PREFETCH_MULTIPLIER = config('CELERY_WORKER_PREFETCH_MULTIPLIER', default=1, cast=int)
+
 
 
 
@@ -419,14 +502,116 @@ ESTIMATE_EXPIRY_DAYS = config('ESTIMATE_EXPIRY_DAYS', default=7, cast=int)
 EMAIL_VERIFICATION_EXPIRY_HOURS = config('EMAIL_VERIFICATION_EXPIRY_HOURS', default=24, cast=int)
 OTP_EXPIRY_MINUTES = config('OTP_EXPIRY_MINUTES', default=10, cast=int)
 
-# Cache Configuration for OTP/Tokens
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-        'LOCATION': 'storefront-cache',
-    }
+# Write ProductChangeHistory rows from a Celery task after commit instead
+# of inside the product save
+PRODUCT_HISTORY_ASYNC = config('PRODUCT_HISTORY_ASYNC', default=False, cast=bool)
+
+# Minutes an unpaid order's inventory reservation is held before the
+# expire_inventory_reservations sweeper releases it
+INVENTORY_RESERVATION_TTL_MINUTES = config('INVENTORY_RESERVATION_TTL_MINUTES', default=30, cast=int)
+
+# Co-purchase recommendations: older baskets count half after
+# CROSS_SELL_HALF_LIFE_DAYS; a quote containing two products counts
+# CROSS_SELL_QUOTE_WEIGHT of a paid order (0 = orders only)
+CROSS_SELL_HALF_LIFE_DAYS = config('CROSS_SELL_HALF_LIFE_DAYS', default=180, cast=float)
+CROSS_SELL_QUOTE_WEIGHT = config('CROSS_SELL_QUOTE_WEIGHT', default=0.5, cast=float)
+
+# Abandoned-cart reminders go out in batches of ABANDONED_CART_BATCH_SIZE
+# (max 1000, one Mailgun request each), throttled to
+# ABANDONED_CART_EMAILS_PER_MINUTE (0 = unthrottled)
+ABANDONED_CART_BATCH_SIZE = config('ABANDONED_CART_BATCH_SIZE', default=500, cast=int)
+ABANDONED_CART_EMAILS_PER_MINUTE = config('ABANDONED_CART_EMAILS_PER_MINUTE', default=600, cast=int)
+
+# Fulfilment quotes (clientapp.services.fulfilment): carrier rate backend
+# for API-priced shipping methods, and the weight charged when products have
+# no ProductShipping data
+SHIPPING_CARRIER_BACKEND = config('SHIPPING_CARRIER_BACKEND', default='clientapp.services.fulfilment.EstimateCarrier')
+SHIPPING_MIN_PARCEL_WEIGHT_KG = config('SHIPPING_MIN_PARCEL_WEIGHT_KG', default='1.0')
+
+# Activity feed read model: feed reads queue a catch-up of new history at
+# most every ACTIVITY_FEED_CATCH_UP_SECONDS; months older than
+# ACTIVITY_FEED_RETENTION_MONTHS are pruned (0 = keep everything)
+ACTIVITY_FEED_CATCH_UP_SECONDS = config('ACTIVITY_FEED_CATCH_UP_SECONDS', default=5, cast=int)
+ACTIVITY_FEED_RETENTION_MONTHS = config('ACTIVITY_FEED_RETENTION_MONTHS', default=0, cast=int)
+
+# Payment gateway callbacks (clientapp.services.payment_webhooks): Stripe
+# signing secret, and the ?token= M-Pesa/Pesapal callback URLs must carry
+# (empty = callbacks refused, unless DEBUG)
+PAYMENT_WEBHOOK_SECRETS = {
+    'stripe': config('STRIPE_WEBHOOK_SECRET', default=''),
+    'mpesa': config('MPESA_CALLBACK_TOKEN', default=''),
+    'pesapal': config('PESAPAL_IPN_TOKEN', default=''),
 }
 
+# Pesapal IPNs carry no status; the webhook worker reads it from the
+# Pesapal API (sandbox: https://cybqa.pesapal.com/pesapalv3)
+PESAPAL_API_URL = config('PESAPAL_API_URL', default='https://pay.pesapal.com/v3')
+PESAPAL_CONSUMER_KEY = config('PESAPAL_CONSUMER_KEY', default='')
+PESAPAL_CONSUMER_SECRET = config('PESAPAL_CONSUMER_SECRET', default='')
+
+# Lead deduplication: country code given to local phone numbers (0712...)
+# when they are normalized to E.164
+LEAD_DEFAULT_COUNTRY_CODE = config('LEAD_DEFAULT_COUNTRY_CODE', default='254')
+
+# Design file preflight (clientapp.services.preflight). Analysis runs in a
+# bounded process pool with a per-file timeout; PREFLIGHT_ALLOWED_HOSTS
+# limits which hosts file URLs may be fetched from (empty = any public host).
+# The endpoint is synchronous, so the download and the analysis are each
+# bounded by PREFLIGHT_TIMEOUT and downloads by PREFLIGHT_MAX_FILE_MB
+PREFLIGHT_WORKERS = config('PREFLIGHT_WORKERS', default=2, cast=int)
+PREFLIGHT_TIMEOUT = config('PREFLIGHT_TIMEOUT', default=15, cast=int)
+PREFLIGHT_MAX_FILE_MB = config('PREFLIGHT_MAX_FILE_MB', default=50, cast=int)
+PREFLIGHT_ALLOWED_HOSTS = config('PREFLIGHT_ALLOWED_HOSTS', default='', cast=Csv())
+
+# Channels layer - Redis when REDIS_URL is set so group_send reaches sockets
+# held by other worker processes; in-memory otherwise (single process only)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        }
+    }
+
+# Cache Configuration for OTP/Tokens and the catalog cache-aside layer
+# (clientapp.services.cache). Must be shared by all worker processes:
+# Redis when REDIS_URL is set, memcached when MEMCACHED_LOCATION is set,
+# otherwise a file-based cache on local disk (shared by the workers on one
+# host and kept across restarts).
+MEMCACHED_LOCATION = config('MEMCACHED_LOCATION', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'printduka',
+        }
+    }
+elif MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION,
+            'KEY_PREFIX': 'printduka',
+        }
+    }
+else:
+    import tempfile as _tempfile
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default=os.path.join(_tempfile.gettempdir(), 'printduka-cache')),
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
 # Logging Configuration
 # Create logs directory if it doesn't exist
 import os as _os
@@ -0,0 +1,18 @@
+"""
+Gunicorn worker classes for the web dyno (see gunicorn.conf.py).
+
+UvicornWorker is uvicorn_worker's worker with permessage-deflate made
+explicit: progress stream frames are small, repetitive JSON and compress
+well. Set WEB_WS_DEFLATE=0 to turn compression off when CPU matters more
+than bandwidth.
+"""
+import os
+
+from uvicorn_worker import UvicornWorker as BaseUvicornWorker
+
+
+class UvicornWorker(BaseUvicornWorker):
+    CONFIG_KWARGS = {
+        **BaseUvicornWorker.CONFIG_KWARGS,
+        'ws_per_message_deflate': os.environ.get('WEB_WS_DEFLATE', '1') != '0',
+    }
@@ -11,7 +11,7 @@ from .models import (
     TurnAroundTime, ProductCategory, ProductSubCategory, ProductFamily, Vendor,
     ProductTag, ProductPricing, ProductVariable, ProductVariableOption,
     ProductVideo, ProductDownloadableFile, ProductSEO,
-    ProductReviewSettings, ProductFAQ, ProductShipping, ProductLegal,
+    ProductReviewSettings, ProductFAQ, ProductShipping, ProductLegal, ChatbotIntentKeyword,
     ProductProduction, ProductChangeHistory,
     # Process-related models for formula-based pricing
     Process, ProcessVariable, ProcessVariableRange, ProcessTier,
@@ -650,6 +650,15 @@ class ProductFAQAdmin(admin.ModelAdmin):
     question_preview.short_description = 'Question'
 
 
+@admin.register(ChatbotIntentKeyword)
+class ChatbotIntentKeywordAdmin(admin.ModelAdmin):
+    list_display = ['keyword', 'intent', 'weight', 'is_active', 'created_at']
+    list_filter = ['intent', 'is_active']
+    search_fields = ['keyword', 'intent']
+    list_editable = ['weight', 'is_active']
+    ordering = ['intent', 'keyword']
+
+
 @admin.register(ProductChangeHistory)
 class ProductChangeHistoryAdmin(admin.ModelAdmin):
     list_display = ['product', 'change_type', 'changed_by', 'changed_at', 'field_changed']
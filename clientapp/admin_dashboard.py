@@ -317,10 +317,12 @@ def get_profit_margin_data():
 def create_low_stock_alerts():
     """
     Check inventory and create alerts for low stock
+    Only materials whose stock or reservations changed since the last run are
+    checked; reservations raise their own alerts as they happen.
     """
-    from .models import SystemAlert
+    from .services.inventory import refresh_low_stock_alerts
     
-    pass
+    return refresh_low_stock_alerts()
 
 
 def create_quote_expiry_alerts():
@@ -74,6 +74,7 @@ from .models import (
     #webhook and other models
     ProductRule,
     TimelineEvent,
+    ActivityFeedEntry,
     DesignSession,
     DesignVersion,
     ProofApproval,
@@ -138,6 +139,7 @@ from .models import (
     DocumentShare,
     JobMessage,
 )
+from .services import media_pipeline
 
 
 class LeadSerializer(serializers.ModelSerializer):
@@ -248,11 +250,25 @@ class ProductPricingSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
-    """Serializer for ProductImage"""
+    """Serializer for ProductImage, with responsive variants for <img srcset>/<picture>"""
+    srcset = serializers.SerializerMethodField()
+    sources = serializers.SerializerMethodField()
+    
     class Meta:
         model = ProductImage
-        fields = ['id', 'image', 'alt_text', 'is_primary', 'display_order', 'uploaded_at']
-        read_only_fields = ['id', 'uploaded_at']
+        fields = [
+            'id', 'image', 'alt_text', 'is_primary', 'display_order', 'uploaded_at',
+            'width', 'height', 'blurhash', 'processing_status', 'srcset', 'sources'
+        ]
+        read_only_fields = ['id', 'uploaded_at', 'width', 'height', 'blurhash', 'processing_status']
+    
+    def get_srcset(self, obj):
+        """Fallback-format srcset (empty until processing finishes)"""
+        return media_pipeline.srcset(obj, request=self.context.get('request'))
+    
+    def get_sources(self, obj):
+        """AVIF/WebP <source> entries, best format first"""
+        return media_pipeline.picture_sources(obj, request=self.context.get('request'))
 
 
 class ProductVideoSerializer(serializers.ModelSerializer):
@@ -468,11 +484,12 @@ class ProductSerializer(serializers.ModelSerializer):
     
     def get_image_count(self, obj):
         """Get number of product images"""
-        return obj.images.count()
+        # len() over all() reuses prefetched images instead of querying per product
+        return len(obj.images.all())
     
     def get_primary_image_url(self, obj):
         """Get primary image URL"""
-        primary = obj.images.filter(is_primary=True).first()
+        primary = next((image for image in obj.images.all() if image.is_primary), None)
         return primary.image.url if primary else None
     
     def get_completion_percentage(self, obj):
@@ -969,6 +986,12 @@ class TimelineEventSerializer(serializers.ModelSerializer):
         model = TimelineEvent
         fields = "__all__"
 
+class ActivityFeedEntrySerializer(serializers.ModelSerializer):
+    actor_name = serializers.CharField(source='actor.get_full_name', read_only=True)
+    class Meta:
+        model = ActivityFeedEntry
+        exclude = ['month']
+
 class DesignVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = DesignVersion
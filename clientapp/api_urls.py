@@ -174,6 +174,9 @@ router.register("v1/chatbot-conversations", storefront_views.ChatbotConversation
 # Storefront messages (for AM)
 router.register("v1/storefront-messages", storefront_views.StorefrontMessageViewSet, basename="storefront-message")
 
+# Public storefront catalog (ETag/Last-Modified, edge-cacheable)
+router.register("storefront/public-products", storefront_views.StorefrontProductViewSet, basename="storefront-public-product")
+
 
 urlpatterns = router.urls + [
     # Canonical Pricing Engine
@@ -182,6 +185,8 @@ urlpatterns = router.urls + [
     path('product-configurations/validate/', api_views.ProductConfigurationValidationView.as_view(), name='product-config-validate'),
     # Preflight Service
     path('files/preflight/', api_views.PreflightView.as_view(), name='preflight'),
+    # Pre-rendered storefront catalog snapshot
+    path('storefront/catalog.json', storefront_views.StorefrontCatalogSnapshotView.as_view(), name='storefront-catalog-snapshot'),
     
     # ============================================================================
     # STOREFRONT ECOMMERCE ENDPOINTS (v1)
@@ -206,4 +211,7 @@ urlpatterns = router.urls + [
     
     # Quote Management
     path('v1/quotes/save-from-storefront/', storefront_views.SaveQuoteFromStorefrontView.as_view(), name='save-quote-from-storefront'),
+
+    # Payment gateway callbacks
+    path('v1/payments/webhooks/<str:provider>/', storefront_views.PaymentWebhookView.as_view(), name='payment-webhook'),
 ]
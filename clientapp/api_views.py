@@ -1,6 +1,7 @@
 from django.utils import timezone
 from django.contrib.auth.models import User, Group
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from django.db.models import Q, F
 from rest_framework import viewsets, status, decorators, serializers
 from rest_framework.decorators import action
@@ -240,6 +241,7 @@ from .api_serializers import (
 
     ProductRuleSerializer,
     TimelineEventSerializer,
+    ActivityFeedEntrySerializer,
     DesignSessionSerializer,
     DesignVersionSerializer,
     ProofApprovalSerializer,
@@ -279,6 +281,11 @@ from .permissions import (
     IsClientOwner,
     IsVendor,
 )
+from .services import cache as catalog_cache
+from .services.cache import CachedReadMixin
+from .services.catalog_snapshot import CatalogValidatorsMixin
+from .services import activity_feed, client_dashboard, fulfilment, inventory, lead_dedup, promotions
+from .services.roles import has_group, roles_for
 
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['Account Manager']))
 @method_decorator(name='create', decorator=swagger_auto_schema(tags=['Account Manager']))
@@ -298,6 +305,21 @@ class LeadViewSet(viewsets.ModelViewSet):
         """Set the creator of the lead"""
         serializer.save(created_by=self.request.user)
 
+    def create(self, request, *args, **kwargs):
+        """Create the lead and list existing leads that look like the same prospect"""
+        response = super().create(request, *args, **kwargs)
+        matches = lead_dedup.candidates(
+            name=response.data.get('name', ''),
+            email=response.data.get('email', ''),
+            phone=response.data.get('phone', ''),
+            exclude=response.data.get('id'),
+        )
+        response.data['possible_duplicates'] = [
+            {'id': lead.id, 'lead_id': lead.lead_id, 'name': lead.name, 'score': lead.match_score}
+            for lead in matches
+        ]
+        return response
+
     
     def get_queryset(self):
         """Restrict AMs to their own leads unless they're Admin"""
@@ -305,11 +327,11 @@ class LeadViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Admin can see all leads
-        if user.groups.filter(name="Admin").exists():
+        if has_group(user, "Admin"):
             return queryset
         
         # Account Manager can only see leads they created
-        if user.groups.filter(name="Account Manager").exists():
+        if has_group(user, "Account Manager"):
             return queryset.filter(created_by=user)
         
         return queryset
@@ -547,11 +569,11 @@ class ClientViewSet(viewsets.ModelViewSet):
         user = self.request.user
         
         # Admin can see all clients
-        if user.groups.filter(name="Admin").exists():
+        if has_group(user, "Admin"):
             return queryset
         
         # Account Manager can only see clients they manage
-        if user.groups.filter(name="Account Manager").exists():
+        if has_group(user, "Account Manager"):
             return queryset.filter(account_manager=user)
         
         return queryset
@@ -699,10 +721,12 @@ class ProductViewSet(viewsets.ModelViewSet):
                 alt_text=request.data.get('alt_text', product.name)
             )
             
+            # Variants are generated in the background (see media_pipeline)
             return Response({
                 'id': image.id,
                 'url': image.image.url,
                 'is_primary': True,
+                'processing_status': image.processing_status,
                 'message': 'Primary image uploaded successfully'
             }, status=status.HTTP_201_CREATED)
         
@@ -736,7 +760,8 @@ class ProductViewSet(viewsets.ModelViewSet):
                 created_images.append({
                     'id': image.id,
                     'url': image.image.url,
-                    'order': image.display_order
+                    'order': image.display_order,
+                    'processing_status': image.processing_status
                 })
             
             except serializers.ValidationError as e:
@@ -1116,11 +1141,11 @@ class ProductApprovalRequestViewSet(viewsets.ModelViewSet):
         queryset = ProductApprovalRequest.objects.all()
         
         # Admins see all
-        if user.groups.filter(name='Admin').exists():
+        if has_group(user, 'Admin'):
             return queryset
         
         # Production Team sees their own and assigned to them
-        if user.groups.filter(name='Production Team').exists():
+        if has_group(user, 'Production Team'):
             return queryset.filter(
                 models.Q(requested_by=user) | models.Q(assigned_to=user)
             )
@@ -1203,15 +1228,18 @@ class ProductApprovalRequestViewSet(viewsets.ModelViewSet):
 #storefront- for later use
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['Product Catalog']))
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(tags=['Product Catalog']))
-class StorefrontProductViewSet(viewsets.ReadOnlyModelViewSet):
+class StorefrontProductViewSet(CatalogValidatorsMixin, CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     Public storefront-safe product listing for ecommerce/landing pages.
-    Only returns visible, published products.
+    Only returns visible, published products; conditional GETs get a 304.
     """
 
-    queryset = Product.objects.filter(status="published", is_visible=True)
+    queryset = Product.objects.filter(status="published", is_visible=True).select_related(
+        "pricing", "seo", "created_by", "updated_by"
+    ).prefetch_related("images", "videos")
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
+    cache_namespace = catalog_cache.CATALOG
     filterset_fields = ["primary_category", "sub_category", "customization_level"]
     search_fields = ["name", "short_description", "primary_category", "sub_category"]
     ordering_fields = ["created_at", "base_price"]
@@ -1296,8 +1324,8 @@ class QuoteViewSet(viewsets.ModelViewSet):
         # Create a simple lead for tracking
         lead = None
         if email or phone:
-            lead = Lead.objects.create(
-                name=name,
+            lead, _ = lead_dedup.find_or_create(
+                name,
                 email=email or "",
                 phone=phone or "",
                 source="Website",
@@ -2711,10 +2739,11 @@ class QuantityPricingViewSet(viewsets.ReadOnlyModelViewSet):
 
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['System & Configuration']))
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(tags=['System & Configuration']))
-class TurnAroundTimeViewSet(viewsets.ReadOnlyModelViewSet):
+class TurnAroundTimeViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     queryset = TurnAroundTime.objects.select_related("product").all()
     serializer_class = TurnAroundTimeSerializer
     permission_classes = [AllowAny]
+    cache_namespace = catalog_cache.TURNAROUND
     filterset_fields = ["product", "is_available", "is_default"]
 
 
@@ -2911,7 +2940,7 @@ class NotificationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         # Only return notifications for the current user by default
         qs = super().get_queryset()
-        if self.request.user.is_superuser or self.request.user.groups.filter(name="Admin").exists():
+        if self.request.user.is_superuser or has_group(self.request.user, "Admin"):
             return qs
         return qs.filter(recipient=self.request.user)
 
@@ -4606,30 +4635,63 @@ class CartViewSet(viewsets.ModelViewSet):
         cart = self.get_object()
         coupon_code = request.data.get('coupon_code')
         
-        try:
-            coupon = Coupon.objects.get(code=coupon_code, is_active=True)
-            is_valid, message = coupon.is_valid(
-                customer=cart.customer,
-                order_amount=cart.subtotal
+        evaluation = promotions.evaluate(
+            promotions.cart_lines(cart.items.all()),
+            customer=cart.customer,
+            coupon_code=coupon_code
+        )
+        if evaluation['coupon_error']:
+            return Response(
+                {'error': evaluation['coupon_error']},
+                status=status.HTTP_404_NOT_FOUND if evaluation['coupon_error'] == 'Invalid coupon code'
+                else status.HTTP_400_BAD_REQUEST
             )
-            
-            if not is_valid:
-                return Response(
-                    {'error': message},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            return Response({
-                'coupon_code': coupon.code,
-                'discount_type': coupon.discount_type,
-                'discount_value': coupon.discount_value,
-                'message': 'Coupon applied successfully'
-            })
-        except Coupon.DoesNotExist:
+        
+        coupon = next(d for d in evaluation['discounts'] if d['kind'] == 'coupon')
+        return Response({
+            'coupon_code': coupon['code'],
+            'discount_amount': float(coupon['amount']),
+            'discount_total': float(evaluation['discount_total']),
+            'free_shipping': evaluation['free_shipping'],
+            'discounts': [
+                {'name': d['name'], 'amount': float(d['amount']), 'free_shipping': d['free_shipping']}
+                for d in evaluation['discounts']
+            ],
+            'message': 'Coupon applied successfully'
+        })
+    
+    @decorators.action(detail=True, methods=['get'])
+    def shipping_options(self, request, pk=None):
+        """Every available shipping method with its cost, plus tax, in one call"""
+        cart = self.get_object()
+        shipping_address_id = request.query_params.get('shipping_address_id')
+        
+        try:
+            shipping_address = CustomerAddress.objects.get(id=shipping_address_id) if shipping_address_id else None
+        except CustomerAddress.DoesNotExist:
             return Response(
-                {'error': 'Invalid coupon code'},
+                {'error': 'Address not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        quoter = fulfilment.FulfilmentQuoter()
+        subtotal = cart.subtotal
+        options = quoter.quote_all(fulfilment.cart_lines(cart), subtotal, destination=shipping_address)
+        tax_amount, tax_rate = quoter.tax(subtotal, shipping_address, cart.customer)
+        
+        return Response({
+            'subtotal': float(subtotal),
+            'tax_amount': float(tax_amount),
+            'tax_rate': float(tax_rate),
+            'options': [
+                {
+                    **option,
+                    'shipping_cost': float(option['shipping_cost']),
+                    'weight_kg': float(option['weight_kg']),
+                }
+                for option in options
+            ],
+        })
     
     @decorators.action(detail=True, methods=['post'])
     def checkout(self, request, pk=None):
@@ -4650,44 +4712,88 @@ class CartViewSet(viewsets.ModelViewSet):
             billing_address = CustomerAddress.objects.get(id=billing_address_id) if billing_address_id else None
             shipping_address = CustomerAddress.objects.get(id=shipping_address_id) if shipping_address_id else None
             
-            # Calculate totals
-            subtotal = cart.subtotal
-            shipping_cost = Decimal('0')  #Calculated by shipping method
-            tax_amount = Decimal('0')  # Calculated by tax engine
-            discount_amount = Decimal('0')  # From coupon 
-            total_amount = subtotal + shipping_cost + tax_amount - discount_amount
-            
-            # Create order
-            order = Order.objects.create(
+            # Discounts: coupon (optional) + automatic promotions
+            cart_items = list(cart.items.all())
+            coupon_code = request.data.get('coupon_code')
+            evaluation = promotions.evaluate(
+                promotions.cart_lines(cart_items),
                 customer=cart.customer,
-                subtotal=subtotal,
-                shipping_cost=shipping_cost,
-                tax_amount=tax_amount,
-                discount_amount=discount_amount,
-                total_amount=total_amount,
-                billing_address=billing_address,
-                shipping_address=shipping_address,
-                status='pending',
-                payment_status='pending',
+                coupon_code=coupon_code
             )
+            if evaluation['coupon_error']:
+                return Response(
+                    {'error': evaluation['coupon_error']},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            coupon_id = next((d['id'] for d in evaluation['discounts'] if d['kind'] == 'coupon'), None)
             
-            # Create order items
-            for cart_item in cart.items.all():
-                OrderItem.objects.create(
-                    order=order,
-                    product=cart_item.product,
-                    product_name=cart_item.product_name,
-                    product_sku=cart_item.product_sku,
-                    unit_price=cart_item.unit_price,
-                    quantity=cart_item.quantity,
-                    design_state_json=cart_item.design_state_json,
-                    design_file_url=cart_item.design_file_url,
-                    line_total=cart_item.line_total,
+            # Calculate totals
+            subtotal = cart.subtotal
+            quoter = fulfilment.FulfilmentQuoter()
+            shipping_method_id = request.data.get('shipping_method_id')
+            shipping_cost = Decimal('0')
+            if shipping_method_id:
+                quote = quoter.quote(
+                    [(item.product_id, item.quantity) for item in cart_items],
+                    subtotal,
+                    destination=shipping_address,
+                    shipping_method_id=shipping_method_id
                 )
+                if quote is None:
+                    return Response(
+                        {'error': 'Shipping method not available'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                if not evaluation['free_shipping']:
+                    shipping_cost = quote['shipping_cost']
+            discount_amount = evaluation['discount_total']
+            # Tax is charged on what the customer pays for the goods, after discounts
+            tax_amount, _ = quoter.tax(max(subtotal - discount_amount, Decimal('0')), shipping_address, cart.customer)
+            total_amount = subtotal + shipping_cost + tax_amount - discount_amount
             
-            # Deactivate cart
-            cart.is_active = False
-            cart.save()
+            with transaction.atomic():
+                # Create order
+                order = Order.objects.create(
+                    customer=cart.customer,
+                    subtotal=subtotal,
+                    shipping_cost=shipping_cost,
+                    tax_amount=tax_amount,
+                    discount_amount=discount_amount,
+                    total_amount=total_amount,
+                    billing_address=billing_address,
+                    shipping_address=shipping_address,
+                    shipping_method_id=shipping_method_id or None,
+                    coupon_id=coupon_id,
+                    coupon_code=coupon_code if coupon_id else '',
+                    status='pending',
+                    payment_status='pending',
+                )
+                
+                # Create order items
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product=cart_item.product,
+                        product_name=cart_item.product_name,
+                        product_sku=cart_item.product_sku,
+                        unit_price=cart_item.unit_price,
+                        quantity=cart_item.quantity,
+                        design_state_json=cart_item.design_state_json,
+                        design_file_url=cart_item.design_file_url,
+                        line_total=cart_item.line_total,
+                    )
+                    for cart_item in cart_items
+                ])
+                
+                # Hold the materials until payment - fails if another checkout took them
+                inventory.reserve_order(order, ttl=inventory.reservation_ttl())
+                
+                # Count coupon/promotion uses - fails if a limit was reached meanwhile
+                promotions.redeem(order, evaluation, customer=cart.customer)
+                
+                # Deactivate cart
+                cart.is_active = False
+                cart.save()
             
             return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
         except CustomerAddress.DoesNotExist:
@@ -4695,6 +4801,19 @@ class CartViewSet(viewsets.ModelViewSet):
                 {'error': 'Address not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except promotions.PromotionUnavailable as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_409_CONFLICT
+            )
+        except inventory.InsufficientStock as e:
+            return Response(
+                {
+                    'error': 'Not enough stock to fulfil this order',
+                    'shortages': {material_id: float(quantity) for material_id, quantity in e.shortages.items()},
+                },
+                status=status.HTTP_409_CONFLICT
+            )
 
 
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
@@ -4726,32 +4845,29 @@ class OrderViewSet(viewsets.ModelViewSet):
         order = self.get_object()
         shipping_method_id = request.data.get('shipping_method_id')
         
-        try:
-            shipping_method = ShippingMethod.objects.get(id=shipping_method_id, is_active=True)
-            
-            # Calculate total weight (placeholder - would need product weight)
-            total_weight = Decimal('1.0')  # Placeholder
-            
-            shipping_cost = shipping_method.calculate_shipping_cost(
-                weight=total_weight,
-                order_amount=order.subtotal,
-                destination=order.shipping_address
-            )
-            
-            order.shipping_cost = shipping_cost
-            order.shipping_method = shipping_method
-            order.total_amount = order.subtotal + order.shipping_cost + order.tax_amount - order.discount_amount
-            order.save()
-            
-            return Response({
-                'shipping_cost': float(shipping_cost),
-                'total_amount': float(order.total_amount),
-            })
-        except ShippingMethod.DoesNotExist:
+        quote = fulfilment.FulfilmentQuoter().quote(
+            fulfilment.order_lines(order),
+            order.subtotal,
+            destination=order.shipping_address,
+            shipping_method_id=shipping_method_id
+        )
+        if not shipping_method_id or quote is None:
             return Response(
                 {'error': 'Shipping method not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        shipping_cost = quote['shipping_cost']
+        order.shipping_cost = shipping_cost
+        order.shipping_method_id = quote['shipping_method_id']
+        order.total_amount = order.subtotal + order.shipping_cost + order.tax_amount - order.discount_amount
+        order.save()
+        
+        return Response({
+            'shipping_cost': float(shipping_cost),
+            'weight_kg': float(quote['weight_kg']),
+            'total_amount': float(order.total_amount),
+        })
     
     @decorators.action(detail=True, methods=['post'])
     def calculate_tax(self, request, pk=None):
@@ -4764,22 +4880,20 @@ class OrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Find applicable tax configuration
-        tax_config = None
-        for config in TaxConfiguration.objects.filter(is_active=True):
-            if config.applies_to(order.shipping_address, order.customer):
-                tax_config = config
-                break
+        # Find applicable tax configuration (cached configuration rows)
+        quoter = fulfilment.FulfilmentQuoter()
+        tax_config = quoter.tax_configuration(order.shipping_address, order.customer)
         
         if tax_config:
-            tax_amount = tax_config.calculate_tax(order.subtotal)
+            taxable = max(order.subtotal - order.discount_amount, Decimal('0'))
+            tax_amount, tax_rate = quoter.tax(taxable, order.shipping_address, order.customer)
             order.tax_amount = tax_amount
             order.total_amount = order.subtotal + order.shipping_cost + tax_amount - order.discount_amount
             order.save()
             
             return Response({
                 'tax_amount': float(tax_amount),
-                'tax_rate': float(tax_config.rate),
+                'tax_rate': float(tax_rate),
                 'total_amount': float(order.total_amount),
             })
         else:
@@ -4978,11 +5092,12 @@ class ProductReviewViewSet(viewsets.ModelViewSet):
 
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
-class ShippingMethodViewSet(viewsets.ReadOnlyModelViewSet):
+class ShippingMethodViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     """Shipping Methods"""
     queryset = ShippingMethod.objects.filter(is_active=True)
     serializer_class = ShippingMethodSerializer
     permission_classes = [AllowAny]
+    cache_namespace = catalog_cache.SHIPPING
     
     filterset_fields = ['carrier', 'pricing_type', 'is_active', 'is_default']
     ordering_fields = ['is_default', 'name']
@@ -4990,11 +5105,12 @@ class ShippingMethodViewSet(viewsets.ReadOnlyModelViewSet):
 
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
 @method_decorator(name='retrieve', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
-class TaxConfigurationViewSet(viewsets.ReadOnlyModelViewSet):
+class TaxConfigurationViewSet(CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     """Tax Configuration"""
     queryset = TaxConfiguration.objects.filter(is_active=True)
     serializer_class = TaxConfigurationSerializer
     permission_classes = [AllowAny]
+    cache_namespace = catalog_cache.TAX
     
     filterset_fields = ['country', 'state_province', 'city', 'tax_type', 'is_active']
 
@@ -5064,12 +5180,14 @@ class ProductConfigurationValidationView(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        from ..services.product_configuration import ProductConfigurationValidator
+        from .services.product_configuration import ProductConfigurationValidator
         from rest_framework import serializers
         
         class ValidationRequestSerializer(serializers.Serializer):
             product_id = serializers.IntegerField(required=True)
             variables = serializers.DictField(required=True)
+            # Still-valid options per variable, for greying out choices
+            include_options = serializers.BooleanField(required=False, default=True)
         
         serializer = ValidationRequestSerializer(data=request.data)
         if not serializer.is_valid():
@@ -5077,7 +5195,8 @@ class ProductConfigurationValidationView(APIView):
         
         result = ProductConfigurationValidator.validate(
             product_id=serializer.validated_data['product_id'],
-            variables=serializer.validated_data['variables']
+            variables=serializer.validated_data['variables'],
+            include_options=serializer.validated_data['include_options']
         )
         
         return Response(result)
@@ -5091,7 +5210,7 @@ class PreflightView(APIView):
     permission_classes = [AllowAny]
     
     def post(self, request):
-        from ..services.preflight import PreflightService
+        from .services.preflight import PreflightService
         from rest_framework import serializers
         
         class PreflightRequestSerializer(serializers.Serializer):
@@ -5104,7 +5223,7 @@ class PreflightView(APIView):
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        result = PreflightService.validate(**serializer.validated_data)
+        result = PreflightService.validate(**serializer.validated_data, request_host=request.get_host())
         return Response(result)
 
 
@@ -5127,6 +5246,41 @@ class TimelineEventViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TimelineEventSerializer
     permission_classes = [IsAuthenticated]
     filterset_fields = ['entity_type', 'entity_id', 'event_type']
+    
+    @decorators.action(detail=False, methods=['get'])
+    def feed(self, request):
+        """
+        Unified activity feed of one entity, newest first
+        GET /timeline/feed/?entity_type=client&entity_id=5[&cursor=...][&limit=50][&related=false]
+        """
+        entity_type = request.query_params.get('entity_type')
+        try:
+            entity_id = int(request.query_params.get('entity_id', ''))
+            limit = int(request.query_params.get('limit', activity_feed.DEFAULT_PAGE_SIZE))
+        except ValueError:
+            entity_id = limit = None
+        if not entity_type or entity_id is None:
+            return Response(
+                {'error': 'entity_type and a numeric entity_id are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        activity_feed.schedule_catch_up()
+        try:
+            entries, next_cursor = activity_feed.feed(
+                entity_type,
+                entity_id,
+                cursor=request.query_params.get('cursor'),
+                limit=limit,
+                include_related=request.query_params.get('related', 'true').lower() != 'false',
+            )
+        except activity_feed.InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'results': ActivityFeedEntrySerializer(entries, many=True).data,
+            'next_cursor': next_cursor,
+        })
 
 @method_decorator(name='list', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
 @method_decorator(name='create', decorator=swagger_auto_schema(tags=['Design & Ecommerce']))
@@ -5653,7 +5807,7 @@ class ClientPortalUserViewSet(viewsets.ModelViewSet):
             return queryset.filter(client=portal_user.client)
         except ClientPortalUser.DoesNotExist:
             # Admin can see all
-            if user.is_superuser or user.groups.filter(name="Admin").exists():
+            if user.is_superuser or has_group(user, "Admin"):
                 return queryset
             return queryset.none()
     
@@ -5960,7 +6114,7 @@ class ClientPaymentViewSet(viewsets.ModelViewSet):
         """Admin verifies payment completion"""
         payment = self.get_object()
         
-        if not request.user.groups.filter(name="Admin").exists():
+        if not has_group(request.user, "Admin"):
             return Response({'error': 'Only admins can verify payments'}, status=status.HTTP_403_FORBIDDEN)
         
         payment.status = 'completed'
@@ -6111,7 +6265,7 @@ class ClientSupportTicketViewSet(viewsets.ModelViewSet):
         """Resolve/close ticket"""
         ticket = self.get_object()
         
-        if not request.user.groups.filter(name="Support").exists():
+        if not has_group(request.user, "Support"):
             return Response({'error': 'Only support can resolve tickets'}, status=status.HTTP_403_FORBIDDEN)
         
         ticket.status = 'resolved'
@@ -6324,7 +6478,7 @@ class InvoiceDisputeViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Get disputes, filter for PT team"""
-        if self.request.user.groups.filter(name='Production Team').exists():
+        if has_group(self.request.user, 'Production Team'):
             return InvoiceDispute.objects.select_related('invoice', 'vendor', 'created_by')
         return InvoiceDispute.objects.none()
     
@@ -6393,7 +6547,7 @@ class JobProgressUpdateViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Get progress updates for PT team"""
-        if self.request.user.groups.filter(name='Production Team').exists():
+        if has_group(self.request.user, 'Production Team'):
             return JobProgressUpdate.objects.select_related('job_vendor_stage', 'created_by').all()
         return JobProgressUpdate.objects.none()
     
@@ -6425,7 +6579,7 @@ class SLAEscalationViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Get escalations for PT team"""
-        if self.request.user.groups.filter(name='Production Team').exists():
+        if has_group(self.request.user, 'Production Team'):
             return SLAEscalation.objects.select_related('job_vendor_stage').all()
         return SLAEscalation.objects.none()
     
@@ -6739,7 +6893,7 @@ class ProofSubmissionViewSet(viewsets.ModelViewSet):
         """Approve proof submission"""
         proof = self.get_object()
         
-        if request.user.groups.filter(name='ProductionTeam').exists() or request.user.is_staff:
+        if has_group(request.user, 'ProductionTeam') or request.user.is_staff:
             proof.status = 'approved'
             proof.reviewed_by = request.user
             proof.reviewed_at = timezone.now()
@@ -6765,7 +6919,7 @@ class ProofSubmissionViewSet(viewsets.ModelViewSet):
         proof = self.get_object()
         revision_reason = request.data.get('revision_reason', 'Please revise and resubmit')
         
-        if request.user.groups.filter(name='ProductionTeam').exists() or request.user.is_staff:
+        if has_group(request.user, 'ProductionTeam') or request.user.is_staff:
             proof.status = 'revision_requested'
             proof.revision_reason = revision_reason
             proof.reviewed_by = request.user
@@ -6854,7 +7008,7 @@ class VendorPerformanceViewSet(viewsets.ReadOnlyModelViewSet):
         Recalculate all VPS scores
         Formula: (on_time_percentage * 0.3) + (quality_score * 0.4) + (communication_score * 0.2) + (delivery_percentage * 0.1)
         """
-        if not (request.user.groups.filter(name='ProductionTeam').exists() or request.user.is_staff):
+        if not (has_group(request.user, 'ProductionTeam') or request.user.is_staff):
             return Response({'detail': 'Permission denied'}, status=status.HTTP_403_FORBIDDEN)
         
         vendors = Vendor.objects.all()
@@ -7019,32 +7173,35 @@ class ClientDashboardViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return dashboard for authenticated client"""
-        if not hasattr(self.request.user, 'client_profile'):
+        client_id = roles_for(self.request.user).client_id
+        if client_id is None:
             return ClientDashboard.objects.none()
-        return ClientDashboard.objects.filter(client=self.request.user.client_profile)
+        return ClientDashboard.objects.filter(client_id=client_id)
     
     @action(detail=False, methods=['get'])
     def my_dashboard(self, request):
-        """Get current client's dashboard"""
-        if not hasattr(request.user, 'client_profile'):
+        """Get current client's dashboard (kept current by delta updates)"""
+        client_id = roles_for(request.user).client_id
+        if client_id is None:
             return Response({'detail': 'Not a client'}, status=status.HTTP_403_FORBIDDEN)
         
-        client = request.user.client_profile
-        dashboard, created = ClientDashboard.objects.get_or_create(client=client)
-        dashboard.refresh_metrics()
+        dashboard = ClientDashboard.objects.filter(client_id=client_id).first()
+        if dashboard is None:
+            client_dashboard.refresh([client_id])
+            dashboard = ClientDashboard.objects.get(client_id=client_id)
         
         serializer = self.get_serializer(dashboard)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
     @action(detail=False, methods=['post'])
     def refresh(self, request):
-        """Refresh dashboard metrics"""
-        if not hasattr(request.user, 'client_profile'):
+        """Recompute dashboard metrics from scratch"""
+        client_id = roles_for(request.user).client_id
+        if client_id is None:
             return Response({'detail': 'Not a client'}, status=status.HTTP_403_FORBIDDEN)
         
-        client = request.user.client_profile
-        dashboard, created = ClientDashboard.objects.get_or_create(client=client)
-        dashboard.refresh_metrics()
+        client_dashboard.refresh([client_id])
+        dashboard = ClientDashboard.objects.get(client_id=client_id)
         
         serializer = self.get_serializer(dashboard)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -7319,7 +7476,7 @@ class DeadlineAlertViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filter by user's assigned jobs"""
         user = self.request.user
-        if user.groups.filter(name='Account Manager').exists() or user.is_superuser:
+        if has_group(user, 'Account Manager') or user.is_superuser:
             return DeadlineAlert.objects.all()
         return DeadlineAlert.objects.filter(job__person_in_charge=user)
     
@@ -7410,7 +7567,7 @@ class JobFileViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filter by user's jobs or shared files"""
         user = self.request.user
-        if user.groups.filter(name='Account Manager').exists() or user.is_superuser:
+        if has_group(user, 'Account Manager') or user.is_superuser:
             return JobFile.objects.all()
         
         # Return files from assigned jobs or shared with user
@@ -1,9 +1,13 @@
 # clientapp/consumers.py
+import asyncio
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.db.models import F
 from django.utils import timezone
-from .models import Job, MaterialSubstitutionRequest, VendorInvoice
+from .models import MaterialSubstitutionRequest
+from .services import progress_stream
+from .services.job_detail import asnapshot
+from .services.roles import ahas_group
 
 
 class JobUpdateConsumer(AsyncWebsocketConsumer):
@@ -14,8 +18,9 @@ class JobUpdateConsumer(AsyncWebsocketConsumer):
         self.job_id = self.scope['url_route']['kwargs']['job_id']
         self.job_group_name = f'job_{self.job_id}'
         
-        # Verify user has access to this job
-        if not await self.user_has_job_access(self.job_id):
+        # Initial snapshot and access check share one cached read
+        snapshot = await asnapshot(int(self.job_id)) if self.job_id.isdigit() else None
+        if not await self.user_has_job_access(snapshot):
             await self.close()
             return
         
@@ -28,11 +33,10 @@ class JobUpdateConsumer(AsyncWebsocketConsumer):
         await self.accept()
         
         # Send initial job data
-        job_data = await self.get_job_data(self.job_id)
         await self.send(text_data=json.dumps({
             'type': 'job_update',
             'action': 'initial',
-            'data': job_data
+            'data': snapshot['data']
         }))
     
     async def disconnect(self, close_code):
@@ -56,6 +60,13 @@ class JobUpdateConsumer(AsyncWebsocketConsumer):
             })
         
         elif event_type == 'progress_update':
+            # Repeats of the last reported values are dropped instead of fanned out
+            frame = await progress_stream.apublish('job', int(self.job_id), {
+                'reported_progress': data.get('progress'),
+                'reported_notes': data.get('notes'),
+            })
+            if frame is None:
+                return
             await self.broadcast_job_update({
                 'type': 'job_progress_updated',
                 'job_id': self.job_id,
@@ -90,37 +101,23 @@ class JobUpdateConsumer(AsyncWebsocketConsumer):
             event
         )
     
-    @database_sync_to_async
-    def user_has_job_access(self, job_id):
+    async def user_has_job_access(self, snapshot):
         """Verify user has access to job"""
-        try:
-            job = Job.objects.get(pk=job_id)
-            user = self.scope['user']
-            
-            # Check if user is assigned to this job or is in PT/AM/Admin
-            return (
-                job.person_in_charge == user or
-                user.groups.filter(name__in=['Production Team', 'Account Manager']).exists() or
-                user.is_superuser
-            )
-        except Job.DoesNotExist:
+        user = self.scope['user']
+        if snapshot is None or not user.is_authenticated:
             return False
+        
+        # Check if user is assigned to this job or is in PT/AM/Admin
+        return (
+            snapshot['person_in_charge_id'] == user.pk or
+            user.is_superuser or
+            await ahas_group(user, 'Production Team', 'Account Manager')
+        )
     
-    @database_sync_to_async
-    def get_job_data(self, job_id):
+    async def get_job_data(self, job_id):
         """Get current job data"""
-        try:
-            job = Job.objects.get(pk=job_id)
-            return {
-                'id': job.id,
-                'job_number': job.job_number,
-                'status': job.status,
-                'progress': job.progress if hasattr(job, 'progress') else 0,
-                'deadline': job.deadline.isoformat() if job.deadline else None,
-                'person_in_charge': job.person_in_charge.get_full_name() if job.person_in_charge else None,
-            }
-        except Job.DoesNotExist:
-            return None
+        snapshot = await asnapshot(int(job_id))
+        return snapshot['data'] if snapshot else None
 
 
 class DashboardConsumer(AsyncWebsocketConsumer):
@@ -290,7 +287,8 @@ class SubstitutionConsumer(AsyncWebsocketConsumer):
         self.substitution_group = f'substitution_{self.substitution_id}'
         
         # Verify user has access to this substitution
-        if not await self.user_has_substitution_access(self.substitution_id):
+        substitution = await self.load_substitution(self.substitution_id)
+        if not await self.user_has_substitution_access(substitution):
             await self.close()
             return
         
@@ -303,11 +301,10 @@ class SubstitutionConsumer(AsyncWebsocketConsumer):
         await self.accept()
         
         # Send initial substitution data
-        sub_data = await self.get_substitution_data(self.substitution_id)
         await self.send(text_data=json.dumps({
             'type': 'substitution_update',
             'action': 'initial',
-            'data': sub_data
+            'data': self.substitution_data(substitution)
         }))
     
     async def disconnect(self, close_code):
@@ -357,36 +354,153 @@ class SubstitutionConsumer(AsyncWebsocketConsumer):
             event
         )
     
-    @database_sync_to_async
-    def user_has_substitution_access(self, substitution_id):
+    async def load_substitution(self, substitution_id):
+        """The substitution and its vendor's user in one async query (None if missing)"""
+        if not str(substitution_id).isdigit():
+            return None
+        return await MaterialSubstitutionRequest.objects.filter(pk=substitution_id).values(
+            'id', 'original_material', 'proposed_material', 'status', 'match_percentage', 'created_at',
+            vendor_user_id=F('purchase_order__vendor__user_id'),
+        ).afirst()
+    
+    async def user_has_substitution_access(self, substitution):
         """Verify user has access to substitution"""
-        try:
-            substitution = MaterialSubstitutionRequest.objects.get(pk=substitution_id)
-            user = self.scope['user']
-            
-            # Vendor can see their own requests
-            # PT can see all for their clients
-            # Admin can see all
-            return (
-                substitution.purchase_order.vendor_stage.vendor.user == user or
-                user.groups.filter(name__in=['Production Team', 'Account Manager']).exists() or
-                user.is_superuser
-            )
-        except MaterialSubstitutionRequest.DoesNotExist:
+        user = self.scope['user']
+        if substitution is None or not user.is_authenticated:
             return False
+        
+        # Vendor can see their own requests
+        # PT can see all for their clients
+        # Admin can see all
+        return (
+            substitution['vendor_user_id'] == user.pk or
+            user.is_superuser or
+            await ahas_group(user, 'Production Team', 'Account Manager')
+        )
+    
+    def substitution_data(self, substitution):
+        """Initial substitution message payload"""
+        return {
+            'id': substitution['id'],
+            'original_material': substitution['original_material'],
+            'proposed_material': substitution['proposed_material'],
+            'status': substitution['status'],
+            'match_percentage': float(substitution['match_percentage']),
+            'created_at': substitution['created_at'].isoformat(),
+        }
+
+
+class ProgressStreamConsumer(AsyncWebsocketConsumer):
+    """
+    One socket for the progress of many jobs and purchase orders.
+
+    Client messages:
+        {"action": "subscribe", "entities": [{"type": "job", "id": 42, "since": 1712}, ...]}
+        {"action": "unsubscribe", "entities": [{"type": "po", "id": 7}]}
+
+    Server frames carry only changed fields, coalesced per entity:
+        {"type": "progress", "entity": "job:42", "seq": 1715, "changes": {...}, "reset": false}
+    A client resumes after a reconnect by subscribing with the last seq it saw.
+    """
     
-    @database_sync_to_async
-    def get_substitution_data(self, substitution_id):
-        """Get current substitution data"""
+    MAX_SUBSCRIPTIONS = 200
+    
+    async def connect(self):
+        """Accept authenticated users; entities are added by subscribe messages"""
+        if not self.scope['user'].is_authenticated:
+            await self.close()
+            return
+        
+        self.subscriptions = set()
+        self.sent_seq = {}
+        self.pending = {}
+        self.flush_task = None
+        await self.accept()
+    
+    async def disconnect(self, close_code):
+        """Leave every entity group and drop unsent deltas"""
+        if getattr(self, 'flush_task', None):
+            self.flush_task.cancel()
+        for entity in getattr(self, 'subscriptions', ()):
+            await self.channel_layer.group_discard(progress_stream.group_name(entity), self.channel_name)
+    
+    async def receive(self, text_data):
+        """Handle subscribe/unsubscribe messages"""
         try:
-            sub = MaterialSubstitutionRequest.objects.get(pk=substitution_id)
-            return {
-                'id': sub.id,
-                'original_material': sub.original_material,
-                'proposed_material': sub.proposed_material,
-                'status': sub.status,
-                'match_percentage': sub.match_percentage,
-                'created_at': sub.created_at.isoformat(),
-            }
-        except MaterialSubstitutionRequest.DoesNotExist:
-            return None
+            data = json.loads(text_data)
+        except ValueError:
+            data = None
+        entities = data.get('entities') if isinstance(data, dict) else None
+        if not isinstance(entities, list):
+            await self.send(text_data=json.dumps({'type': 'error', 'error': 'invalid message'}))
+            return
+        action = data.get('action')
+        for item in entities[:self.MAX_SUBSCRIPTIONS]:
+            if not isinstance(item, dict):
+                await self.send(text_data=json.dumps({'type': 'error', 'error': 'invalid entity'}))
+                continue
+            entity_type, entity_id = item.get('type'), str(item.get('id', ''))
+            if entity_type not in progress_stream.ENTITY_TYPES or not entity_id.isdigit():
+                continue
+            if action == 'subscribe':
+                await self.subscribe(entity_type, int(entity_id), item.get('since'))
+            elif action == 'unsubscribe':
+                await self.unsubscribe(progress_stream.entity_key(entity_type, entity_id))
+    
+    async def subscribe(self, entity_type, entity_id, since):
+        """Join the entity's group, then send what changed since ``since`` (or everything)"""
+        entity = progress_stream.entity_key(entity_type, entity_id)
+        if entity in self.subscriptions:
+            return
+        if len(self.subscriptions) >= self.MAX_SUBSCRIPTIONS or not await progress_stream.acan_view(
+            self.scope['user'], entity_type, entity_id
+        ):
+            await self.send(text_data=json.dumps({'type': 'error', 'entity': entity, 'error': 'forbidden'}))
+            return
+        
+        # Join first so nothing published between the read and the join is lost
+        await self.channel_layer.group_add(progress_stream.group_name(entity), self.channel_name)
+        self.subscriptions.add(entity)
+        resume = await progress_stream.achanges_since(
+            entity_type, entity_id, since if isinstance(since, int) else None
+        )
+        if resume is None:
+            return
+        seq, changes, reset = resume
+        self.sent_seq[entity] = seq
+        if changes or reset:
+            await self.send_frame(entity, seq, changes, reset)
+    
+    async def unsubscribe(self, entity):
+        if entity in self.subscriptions:
+            self.subscriptions.discard(entity)
+            self.sent_seq.pop(entity, None)
+            self.pending.pop(entity, None)
+            await self.channel_layer.group_discard(progress_stream.group_name(entity), self.channel_name)
+    
+    async def progress_delta(self, event):
+        """Queue a published delta; queued deltas go out together after the coalescing window"""
+        entity = event['entity']
+        if entity not in self.subscriptions or event['seq'] <= self.sent_seq.get(entity, 0):
+            return
+        queued = self.pending.setdefault(entity, {'seq': 0, 'changes': {}})
+        queued['seq'] = max(queued['seq'], event['seq'])
+        queued['changes'].update(event['changes'])
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_after_window())
+    
+    async def flush_after_window(self):
+        await asyncio.sleep(progress_stream.COALESCE_SECONDS)
+        pending, self.pending, self.flush_task = self.pending, {}, None
+        for entity, queued in pending.items():
+            self.sent_seq[entity] = queued['seq']
+            await self.send_frame(entity, queued['seq'], queued['changes'])
+    
+    async def send_frame(self, entity, seq, changes, reset=False):
+        await self.send(text_data=json.dumps({
+            'type': 'progress',
+            'entity': entity,
+            'seq': seq,
+            'changes': changes,
+            'reset': reset,
+        }))
@@ -0,0 +1,148 @@
+"""
+Management command to load-test the main API endpoints of a running server.
+Reports requests per second and p50/p95/p99 latency per endpoint, and can
+save a run to JSON so a later run (e.g. after switching worker model or
+resizing DB_POOL) can be compared against it.
+
+Usage: python manage.py loadtest --base-url http://localhost:8000
+       python manage.py loadtest --token <JWT> --requests 500 --concurrency 32
+       python manage.py loadtest --save before.json
+       python manage.py loadtest --compare before.json
+"""
+import json
+import math
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+DEFAULT_ENDPOINTS = [
+    '/api/v1/storefront-products/',
+    '/api/v1/turnaround-times/',
+    '/api/v1/products/',
+    '/api/v1/quotes/',
+    '/api/v1/jobs/',
+    '/api/v1/notifications/',
+]
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(pct / 100.0 * len(sorted_values)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Load-test API endpoints and report requests/sec and p99 latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://localhost:8000')
+        parser.add_argument(
+            '--endpoint',
+            action='append',
+            dest='endpoints',
+            help='Endpoint path to test (repeatable). Defaults to the main API list endpoints.',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=16, help='Concurrent client threads')
+        parser.add_argument('--token', default='', help='JWT access token for authenticated endpoints')
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--save', default='', help='Write results to this JSON file')
+        parser.add_argument('--compare', default='', help='Compare against results saved by an earlier run')
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/')
+        endpoints = options['endpoints'] or DEFAULT_ENDPOINTS
+        total = options['requests']
+        concurrency = options['concurrency']
+        timeout = options['timeout']
+
+        if total < 1 or concurrency < 1:
+            raise CommandError('--requests and --concurrency must be positive')
+
+        headers = {'Accept': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f"Bearer {options['token']}"
+
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        def hit(url):
+            start = time.perf_counter()
+            try:
+                response = session.get(url, headers=headers, timeout=timeout)
+                ok = response.status_code < 400
+            except requests.RequestException:
+                ok = False
+            return (time.perf_counter() - start) * 1000.0, ok
+
+        results = {}
+        self.stdout.write(self.style.SUCCESS(
+            f'Load test: {total} requests x {len(endpoints)} endpoints, concurrency {concurrency}'
+        ))
+        self.stdout.write('')
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for endpoint in endpoints:
+                url = f'{base_url}{endpoint}'
+                wall_start = time.perf_counter()
+                samples = list(pool.map(hit, [url] * total))
+                wall = time.perf_counter() - wall_start
+
+                latencies = sorted(ms for ms, _ in samples)
+                errors = sum(1 for _, ok in samples if not ok)
+                results[endpoint] = {
+                    'requests': total,
+                    'errors': errors,
+                    'rps': round(total / wall, 2) if wall else 0.0,
+                    'mean_ms': round(statistics.fmean(latencies), 2),
+                    'p50_ms': round(percentile(latencies, 50), 2),
+                    'p95_ms': round(percentile(latencies, 95), 2),
+                    'p99_ms': round(percentile(latencies, 99), 2),
+                }
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh).get('results', {})
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        header = f"{'endpoint':<40} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for endpoint, row in results.items():
+            self.stdout.write(
+                f"{endpoint:<40} {row['rps']:>9.1f} {row['p50_ms']:>9.1f} "
+                f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['errors']:>7}"
+            )
+            before = baseline.get(endpoint)
+            if before:
+                self.stdout.write(
+                    f"{'  vs baseline':<40} {row['rps'] - before['rps']:>+9.1f} "
+                    f"{row['p50_ms'] - before['p50_ms']:>+9.1f} "
+                    f"{row['p95_ms'] - before['p95_ms']:>+9.1f} "
+                    f"{row['p99_ms'] - before['p99_ms']:>+9.1f}"
+                )
+            if row['errors']:
+                self.stdout.write(self.style.WARNING(
+                    f'  {row["errors"]} failed requests (auth required? pass --token)'
+                ))
+
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump({
+                    'base_url': base_url,
+                    'concurrency': concurrency,
+                    'results': results,
+                }, fh, indent=2)
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['save']}"))
@@ -5,6 +5,8 @@ Usage: python manage.py populate_storefront_products
 from django.core.management.base import BaseCommand
 from decimal import Decimal
 from clientapp.models import StorefrontProduct
+from clientapp.services import cache as catalog_cache
+from clientapp.services.catalog_snapshot import schedule_snapshot_rebuild
 
 
 class Command(BaseCommand):
@@ -104,20 +106,31 @@ class Command(BaseCommand):
             },
         ]
 
-        count = 0
+        existing = set(
+            StorefrontProduct.objects.filter(
+                product_id__in=[p['product_id'] for p in products_data]
+            ).values_list('product_id', flat=True)
+        )
+        new_products = [
+            StorefrontProduct(**product_data)
+            for product_data in products_data
+            if product_data['product_id'] not in existing
+        ]
+        StorefrontProduct.objects.bulk_create(new_products, ignore_conflicts=True)
+
         for product_data in products_data:
-            product, created = StorefrontProduct.objects.get_or_create(
-                product_id=product_data['product_id'],
-                defaults=product_data
-            )
-            if created:
-                count += 1
+            if product_data['product_id'] in existing:
+                self.stdout.write(f"- Already exists: {product_data['name']}")
+            else:
                 self.stdout.write(
-                    self.style.SUCCESS(f'✓ Created: {product.name}')
+                    self.style.SUCCESS(f"✓ Created: {product_data['name']}")
                 )
-            else:
-                self.stdout.write(f'- Already exists: {product.name}')
+
+        if new_products:
+            # bulk_create skips post_save, so invalidate the catalog here
+            catalog_cache.bump_namespace(catalog_cache.CATALOG)
+            schedule_snapshot_rebuild()
 
         self.stdout.write(
-            self.style.SUCCESS(f'\n✓ Successfully created {count} products!')
+            self.style.SUCCESS(f'\n✓ Successfully created {len(new_products)} products!')
         )
@@ -0,0 +1,54 @@
+"""
+Management command to run the media pipeline over existing product images
+(images uploaded before the pipeline existed, or ones that failed).
+
+Usage: python manage.py process_product_images
+       python manage.py process_product_images --all (reprocess ready images too)
+       python manage.py process_product_images --queue (hand off to Celery)
+"""
+from django.core.management.base import BaseCommand
+from clientapp.models import ProductImage
+from clientapp.services.media_pipeline import process_image_by_id
+
+
+class Command(BaseCommand):
+    help = 'Generate responsive variants, dimensions and blurhash for product images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            dest='all',
+            help='Reprocess every image, not just pending/failed ones',
+        )
+        parser.add_argument(
+            '--queue',
+            action='store_true',
+            dest='queue',
+            help='Queue Celery tasks instead of processing inline',
+        )
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='')
+        if not options['all']:
+            images = images.exclude(processing_status='ready')
+        image_ids = list(images.order_by('pk').values_list('pk', flat=True))
+
+        self.stdout.write(self.style.SUCCESS(f'Processing {len(image_ids)} product images...'))
+
+        if options['queue']:
+            from clientapp.tasks import process_product_image
+            for image_id in image_ids:
+                process_product_image.delay(image_id)
+            self.stdout.write(self.style.SUCCESS(f'✓ Queued {len(image_ids)} images'))
+            return
+
+        processed = failed = 0
+        for image_id in image_ids:
+            if process_image_by_id(image_id) is None:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'✗ Failed: image {image_id}'))
+            else:
+                processed += 1
+
+        self.stdout.write(self.style.SUCCESS(f'\n✓ Processed {processed} images ({failed} failed)'))
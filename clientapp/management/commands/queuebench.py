@@ -0,0 +1,170 @@
+"""
+Management command to benchmark Celery queue routing in-process: a bulk
+integration sync floods its queue while customer emails are enqueued, and
+the command reports how long each email waited from enqueue to start.
+
+Workers run in threads against the in-memory broker, one per worker
+process of each pool in CELERY_WORKER_POOLS (or a single pool on one queue
+with --single-queue, the layout before routing), so no broker or worker
+process is needed. The stand-in tasks are routed like the real email and
+QuickBooks sync tasks.
+
+Usage: python manage.py queuebench
+       python manage.py queuebench --records 10000 --single-queue --save before.json
+       python manage.py queuebench --records 10000 --compare before.json
+"""
+import json
+import statistics
+import threading
+import time
+from contextlib import ExitStack
+
+from celery import Celery
+from celery.contrib.testing.worker import start_worker
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from clientapp.management.commands.loadtest import percentile
+
+# Stand-in task -> the real task whose route it takes
+STAND_INS = {
+    'queuebench.email': 'clientapp.tasks.send_email_async',
+    'queuebench.sync': 'clientapp.tasks.celery_sync_completed_pos_to_qb',
+}
+# The memory transport polls; keep its interval well below the latencies measured
+POLL_INTERVAL = 0.005
+
+
+class Command(BaseCommand):
+    help = 'Measure email enqueue-to-start latency while a bulk sync is running'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=10000, help='Records in the simulated sync')
+        parser.add_argument('--batch-size', type=int, default=100, help='Records per sync task')
+        parser.add_argument('--record-ms', type=float, default=0.5, help='Processing time per record')
+        parser.add_argument('--emails', type=int, default=50, help='Emails enqueued during the sync')
+        parser.add_argument('--email-interval-ms', type=float, default=20.0, help='Pause between emails')
+        parser.add_argument('--concurrency', type=int, default=2, help='Worker processes per pool')
+        parser.add_argument('--single-queue', action='store_true', help='Everything on one queue and one pool (no routing)')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Seconds to wait for every email to start')
+        parser.add_argument('--save', default='', help='Write results to this JSON file')
+        parser.add_argument('--compare', default='', help='Compare against results saved by an earlier run')
+
+    def handle(self, *args, **options):
+        if min(options['records'], options['batch_size'], options['emails'], options['concurrency']) < 1:
+            raise CommandError('--records, --batch-size, --emails and --concurrency must be positive')
+        single = options['single_queue']
+        pools = self.pools(single, options['concurrency'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Queue benchmark: {options['emails']} emails during a {options['records']}-record sync "
+            f"({'single queue' if single else 'routed'}: "
+            + ', '.join(f"{name}[{','.join(queues)}]x{processes}" for name, (queues, processes) in pools.items()) + ')'
+        ))
+        results = self.run(pools, single, options)
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh).get('results', {})
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        self.stdout.write('')
+        for label, key in (
+            ('email wait p50 ms', 'p50_ms'), ('email wait p95 ms', 'p95_ms'), ('email wait p99 ms', 'p99_ms'),
+            ('email wait max ms', 'max_ms'), ('sync records done', 'sync_records_done'),
+        ):
+            line = f'{label:<24} {results[key]:>10.1f}'
+            if key in baseline:
+                line += f'   ({results[key] - baseline[key]:+.1f} vs baseline)'
+            self.stdout.write(line)
+        self.stdout.write(f"{'emails started':<24} {results['emails_started']:>10}")
+        if results['emails_started'] < options['emails']:
+            self.stdout.write(self.style.WARNING(
+                f"  {options['emails'] - results['emails_started']} emails did not start within {options['timeout']}s"
+            ))
+
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump({'single_queue': single, 'records': options['records'], 'results': results}, fh, indent=2)
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['save']}"))
+
+    def pools(self, single, concurrency):
+        """pool name -> (queues, worker processes)"""
+        if single:
+            return {'all': ([settings.CELERY_TASK_DEFAULT_QUEUE], concurrency * len(settings.CELERY_WORKER_POOLS))}
+        return {name: (queues, concurrency) for name, queues in settings.CELERY_WORKER_POOLS.items()}
+
+    def run(self, pools, single, options):
+        app = Celery('queuebench', broker='memory://', backend='cache+memory://', set_as_current=False)
+        app.conf.update(
+            task_default_queue=settings.CELERY_TASK_DEFAULT_QUEUE,
+            task_routes={} if single else {
+                name: settings.CELERY_TASK_ROUTES.get(task, {}) for name, task in STAND_INS.items()
+            },
+            worker_prefetch_multiplier=settings.CELERY_WORKER_PREFETCH_MULTIPLIER,
+            worker_hijack_root_logger=False,
+            broker_transport_options={'polling_interval': POLL_INTERVAL},
+        )
+        waits, synced, lock = {}, [0], threading.Lock()
+
+        @app.task(name='queuebench.email')
+        def email(index, enqueued_at):
+            waits[index] = (time.time() - enqueued_at) * 1000.0
+
+        @app.task(name='queuebench.sync')
+        def sync(records, record_ms):
+            time.sleep(records * record_ms / 1000.0)
+            with lock:
+                synced[0] += records
+
+        try:
+            with ExitStack() as workers:
+                # One solo worker per process of the pool, as with the prefork pool
+                for name, (queues, processes) in pools.items():
+                    for number in range(processes):
+                        workers.enter_context(start_worker(
+                            app, pool='solo', queues=queues, perform_ping_check=False,
+                            hostname=f'{name}{number}@queuebench', shutdown_timeout=options['timeout'],
+                        ))
+
+                remaining = options['records']
+                while remaining > 0:
+                    batch = min(options['batch_size'], remaining)
+                    sync.delay(batch, options['record_ms'])
+                    remaining -= batch
+
+                wall_start = time.perf_counter()
+                for index in range(options['emails']):
+                    email.delay(index, time.time())
+                    time.sleep(options['email_interval_ms'] / 1000.0)
+                deadline = time.monotonic() + options['timeout']
+                while len(waits) < options['emails'] and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                wall = time.perf_counter() - wall_start
+                sync_records_done = synced[0]
+
+                # Drop the unfinished sync so the workers can stop
+                with app.connection_for_write() as conn:
+                    for queues, _ in pools.values():
+                        for queue in queues:
+                            conn.default_channel.queue_purge(queue)
+        finally:
+            # start_worker makes the benchmark app the current one
+            from client.celery import app as project_app
+            project_app.set_current()
+            project_app.set_default()
+
+        latencies = sorted(waits.values())
+        return {
+            'emails_started': len(latencies),
+            'sync_records_done': sync_records_done,
+            'wall_seconds': round(wall, 2),
+            'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        }
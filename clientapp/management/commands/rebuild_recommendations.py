@@ -0,0 +1,20 @@
+"""
+Management command to rebuild the co-purchase recommendation index from
+order and quote history (normally done nightly by Celery beat).
+
+Usage: python manage.py rebuild_recommendations
+"""
+from django.core.management.base import BaseCommand
+from clientapp.services.recommendations import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild co-purchase counts and top-K product recommendations'
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Rebuilding co-purchase index...'))
+        stats = rebuild_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {stats['orders']} orders and {stats['quotes']} quotes -> "
+            f"{stats['pairs']} product pairs for {stats['products']} products"
+        ))
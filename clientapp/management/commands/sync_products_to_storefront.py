@@ -1,117 +1,94 @@
 """
-Management command to sync visible products from Product model to StorefrontProduct.
-This syncs all products marked as is_visible=True in the Product model to StorefrontProduct.
+Management command to sync products from Product model to StorefrontProduct.
+By default only products changed since the last sync (the watermark on
+Product.updated_at) are considered; changed rows are written with chunked
+bulk upserts.
 
 Usage: python manage.py sync_products_to_storefront
-       python manage.py sync_products_to_storefront --force (to overwrite existing)
+       python manage.py sync_products_to_storefront --full (consider every product)
+       python manage.py sync_products_to_storefront --force (rewrite unchanged rows too)
+       python manage.py sync_products_to_storefront --dry-run (print the diff, write nothing)
 """
 from django.core.management.base import BaseCommand, CommandError
-from django.utils.text import slugify
-from decimal import Decimal
-from clientapp.models import Product, StorefrontProduct
+from django.utils.dateparse import parse_datetime
+from clientapp.models import StorefrontProduct
+from clientapp.services.storefront_sync import StorefrontSyncService, DEFAULT_CHUNK_SIZE, get_watermark
 
 
 class Command(BaseCommand):
-    help = 'Sync visible products from Product model to StorefrontProduct'
+    help = 'Sync changed products from Product model to StorefrontProduct'
 
     def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            dest='full',
+            help='Consider every product, not just those changed since the last sync',
+        )
         parser.add_argument(
             '--force',
             action='store_true',
             dest='force',
-            help='Overwrite existing StorefrontProduct records',
+            help='Rewrite StorefrontProduct records even when nothing changed',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            help='Report what would change without writing anything',
+        )
+        parser.add_argument(
+            '--since',
+            dest='since',
+            help='Override the watermark (ISO datetime)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            dest='chunk_size',
+            help='Rows per bulk upsert',
         )
 
     def handle(self, *args, **options):
-        force = options.get('force', False)
-        
-        self.stdout.write(self.style.SUCCESS('Starting product sync from Product to StorefrontProduct...'))
-        self.stdout.write('')
+        since = None
+        if options.get('since'):
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
 
-        # Get all visible products
-        visible_products = Product.objects.filter(is_visible=True, status='published')
-        
-        if not visible_products.exists():
-            self.stdout.write(self.style.WARNING('No visible published products found to sync!'))
-            return
+        full = options.get('full', False)
+        dry_run = options.get('dry_run', False)
 
-        self.stdout.write(f'Found {visible_products.count()} visible products to sync')
+        self.stdout.write(self.style.SUCCESS('Starting product sync from Product to StorefrontProduct...'))
+        if full:
+            self.stdout.write('Mode: full')
+        else:
+            self.stdout.write(f'Mode: incremental (changed since {since or get_watermark() or "never"})')
+        if dry_run:
+            self.stdout.write(self.style.WARNING('Dry run - no changes will be written'))
         self.stdout.write('')
 
-        created_count = 0
-        updated_count = 0
-        skipped_count = 0
-        error_count = 0
-
-        for product in visible_products:
-            try:
-                # Use internal_code as product_id, or generate one
-                product_id = product.internal_code or f"PROD-{product.id}"
-                
-                # Prepare data for StorefrontProduct
-                storefront_data = {
-                    'name': product.name,
-                    'description_short': product.short_description or '',
-                    'description_long': product.long_description or '',
-                    'category': product.primary_category or 'uncategorized',
-                    'storefront_visible': True,  # Only sync visible products
-                    'show_price': True,
-                    'featured': product.feature_product or product.bestseller_badge,
-                    'customization_level': product.customization_level or 'semi_customizable',
-                    'available_customizations': {},
-                }
-
-                # Try to get base price from ProductPricing
-                base_price = Decimal('0.00')
-                try:
-                    pricing = product.productpricing_set.first()
-                    if pricing and pricing.base_cost:
-                        # Apply default margin to get customer-facing price
-                        base_price = pricing.base_cost * (1 + Decimal(pricing.default_margin or 0.3))
-                except:
-                    pass
-                
-                storefront_data['base_price'] = base_price or Decimal('100.00')
-                storefront_data['price_range_min'] = storefront_data['base_price']
-                storefront_data['price_range_max'] = storefront_data['base_price'] * 3
-
-                # Get or create StorefrontProduct
-                storefront_product, created = StorefrontProduct.objects.get_or_create(
-                    product_id=product_id,
-                    defaults=storefront_data
-                )
+        stats = StorefrontSyncService.sync(
+            full=full,
+            since=since,
+            force=options.get('force', False),
+            dry_run=dry_run,
+            chunk_size=options['chunk_size'],
+        )
 
-                if created:
-                    created_count += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(f'✓ CREATED: {product.name} (ID: {product_id})')
-                    )
-                elif force:
-                    # Update existing record
-                    for field, value in storefront_data.items():
-                        setattr(storefront_product, field, value)
-                    storefront_product.save()
-                    updated_count += 1
-                    self.stdout.write(
-                        self.style.SUCCESS(f'✓ UPDATED: {product.name} (ID: {product_id})')
-                    )
-                else:
-                    skipped_count += 1
-                    self.stdout.write(f'- SKIPPED: {product.name} (already exists, use --force to update)')
+        if dry_run:
+            for entry in stats['diff']:
+                self.stdout.write(f"{entry['action'].upper():<7} {entry['product_id']}")
+                for field, (old, new) in entry['changes'].items():
+                    self.stdout.write(f'          {field}: {old!r} -> {new!r}')
+            self.stdout.write('')
 
-            except Exception as e:
-                error_count += 1
-                self.stdout.write(
-                    self.style.ERROR(f'✗ ERROR syncing {product.name}: {str(e)}')
-                )
+        self.stdout.write(self.style.SUCCESS('=== SYNC COMPLETE ===' if not dry_run else '=== DRY RUN COMPLETE ==='))
+        self.stdout.write(f"Created:   {stats['created']}")
+        self.stdout.write(f"Updated:   {stats['updated']}")
+        self.stdout.write(f"Hidden:    {stats['hidden']}")
+        self.stdout.write(f"Unchanged: {stats['unchanged']}")
 
-        self.stdout.write('')
-        self.stdout.write(self.style.SUCCESS('=== SYNC COMPLETE ==='))
-        self.stdout.write(f'Created:  {created_count}')
-        self.stdout.write(f'Updated:  {updated_count}')
-        self.stdout.write(f'Skipped:  {skipped_count}')
-        if error_count > 0:
-            self.stdout.write(self.style.ERROR(f'Errors:   {error_count}'))
-        
         total_in_storefront = StorefrontProduct.objects.filter(storefront_visible=True).count()
         self.stdout.write(f'Total visible products in storefront: {total_in_storefront}')
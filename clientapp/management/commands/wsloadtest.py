@@ -0,0 +1,125 @@
+"""
+Management command to benchmark a WebSocket connection storm against the
+consumers in-process (the ASGI application without a server in front).
+Opens many connections at once and reports time-to-first-message: how long
+each client waits from connecting until its initial snapshot arrives.
+
+Usage: python manage.py wsloadtest --job-id 42 --username pt_user
+       python manage.py wsloadtest --job-id 42 --username pt_user --connections 2000 --cold
+       python manage.py wsloadtest --job-id 42 --username pt_user --save before.json
+       python manage.py wsloadtest --job-id 42 --username pt_user --compare before.json
+"""
+import asyncio
+import json
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from clientapp.management.commands.loadtest import percentile
+from clientapp.routing import websocket_urlpatterns
+from clientapp.services import job_detail, roles
+
+
+class Command(BaseCommand):
+    help = 'Open many job WebSockets at once and report time-to-first-message'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job-id', type=int, required=True)
+        parser.add_argument('--username', required=True, help='User the sockets authenticate as')
+        parser.add_argument('--connections', type=int, default=2000, help='Concurrent connections')
+        parser.add_argument('--timeout', type=float, default=60.0, help='Seconds to wait for each first message')
+        parser.add_argument('--cold', action='store_true', help="Drop the job's cached snapshot and the user's roles first")
+        parser.add_argument('--save', default='', help='Write results to this JSON file')
+        parser.add_argument('--compare', default='', help='Compare against results saved by an earlier run')
+
+    def handle(self, *args, **options):
+        connections = options['connections']
+        if connections < 1:
+            raise CommandError('--connections must be positive')
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}")
+        job_id = options['job_id']
+        if options['cold']:
+            job_detail.invalidate([job_id])
+            roles.invalidate([user.pk])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"WebSocket storm: {connections} connections to ws/jobs/{job_id}/ ({'cold' if options['cold'] else 'warm'} cache)"
+        ))
+        results = async_to_sync(self.storm)(user, job_id, connections, options['timeout'])
+
+        baseline = {}
+        if options['compare']:
+            try:
+                with open(options['compare']) as fh:
+                    baseline = json.load(fh).get('results', {})
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        self.stdout.write('')
+        for label, key in (
+            ('connects/sec', 'connects_per_sec'), ('first message p50 ms', 'p50_ms'), ('first message p95 ms', 'p95_ms'),
+            ('first message p99 ms', 'p99_ms'), ('first message max ms', 'max_ms'),
+        ):
+            line = f'{label:<24} {results[key]:>10.1f}'
+            if key in baseline:
+                line += f'   ({results[key] - baseline[key]:+.1f} vs baseline)'
+            self.stdout.write(line)
+        self.stdout.write(f"{'accepted':<24} {results['accepted']:>10}")
+        if results['rejected'] or results['timeouts']:
+            self.stdout.write(self.style.WARNING(
+                f"  {results['rejected']} rejected, {results['timeouts']} timed out (does the user have access to the job?)"
+            ))
+
+        if options['save']:
+            with open(options['save'], 'w') as fh:
+                json.dump({'job_id': job_id, 'connections': connections, 'results': results}, fh, indent=2)
+            self.stdout.write('')
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['save']}"))
+
+    async def storm(self, user, job_id, connections, timeout):
+        application = URLRouter(websocket_urlpatterns)
+        path = f'/ws/jobs/{job_id}/'
+
+        async def connect():
+            communicator = ApplicationCommunicator(application, {
+                'type': 'websocket', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+                'headers': [], 'subprotocols': [], 'user': user,
+            })
+            start = time.perf_counter()
+            await communicator.send_input({'type': 'websocket.connect'})
+            try:
+                accepted = await communicator.receive_output(timeout)
+                if accepted['type'] != 'websocket.accept':
+                    return None, 'rejected'
+                await communicator.receive_output(timeout)
+                return (time.perf_counter() - start) * 1000.0, 'ok'
+            except asyncio.TimeoutError:
+                return None, 'timeout'
+            finally:
+                await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+                await communicator.wait(timeout)
+
+        wall_start = time.perf_counter()
+        samples = await asyncio.gather(*[connect() for _ in range(connections)])
+        wall = time.perf_counter() - wall_start
+
+        latencies = sorted(ms for ms, outcome in samples if outcome == 'ok')
+        return {
+            'accepted': len(latencies),
+            'rejected': sum(1 for _, outcome in samples if outcome == 'rejected'),
+            'timeouts': sum(1 for _, outcome in samples if outcome == 'timeout'),
+            'connects_per_sec': round(len(latencies) / wall, 2) if wall else 0.0,
+            'mean_ms': round(statistics.fmean(latencies), 2) if latencies else 0.0,
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(latencies[-1], 2) if latencies else 0.0,
+        }
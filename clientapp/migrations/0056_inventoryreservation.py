@@ -0,0 +1,32 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0055_productimage_media_pipeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reference', models.CharField(blank=True, db_index=True, help_text='What the stock is held for, e.g. a cart or quote id', max_length=100)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('committed', 'Committed'), ('released', 'Released'), ('expired', 'Expired')], default='active', max_length=20)),
+                ('expires_at', models.DateTimeField(blank=True, help_text='Active reservations past this are released by the sweeper', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('material', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='clientapp.materialinventory')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='inventory_reservations', to='clientapp.order')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'expires_at'], name='clientapp_i_status_a9307e_idx'), models.Index(fields=['material', 'status'], name='clientapp_i_materia_db217b_idx'), models.Index(fields=['order', 'status'], name='clientapp_i_order_i_22fab0_idx'), models.Index(fields=['updated_at'], name='clientapp_i_updated_08abab_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0056_inventoryreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='copurchase_indexed_at',
+            field=models.DateTimeField(blank=True, editable=False, help_text='When the items were added to the co-purchase index', null=True),
+        ),
+        migrations.CreateModel(
+            name='ProductRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('neighbours', models.JSONField(default=list, help_text='[[product_id, score], ...] best first')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='recommendation', to='clientapp.product')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProductCoPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_score', models.FloatField(default=0, help_text='Decayed count of paid orders containing both')),
+                ('quote_score', models.FloatField(default=0, help_text='Decayed count of quotes containing both')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='co_purchases', to='clientapp.product')),
+                ('related_product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='clientapp.product')),
+            ],
+            options={
+                'unique_together': {('product', 'related_product')},
+            },
+        ),
+    ]
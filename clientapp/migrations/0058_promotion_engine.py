@@ -0,0 +1,81 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_coupon_usage(apps, schema_editor):
+    """
+    Seed the usage counters from paid orders, which is what per-customer
+    limits were previously counted from
+    """
+    Order = apps.get_model('clientapp', 'Order')
+    Coupon = apps.get_model('clientapp', 'Coupon')
+    PromotionUsage = apps.get_model('clientapp', 'PromotionUsage')
+
+    paid = Order.objects.filter(coupon__isnull=False, payment_status='completed')
+    PromotionUsage.objects.bulk_create([
+        PromotionUsage(customer_id=row['customer_id'], coupon_id=row['coupon_id'], uses=row['uses'])
+        for row in paid.values('customer_id', 'coupon_id').annotate(uses=Count('id'))
+    ], batch_size=1000)
+    for row in paid.values('coupon_id').annotate(uses=Count('id')):
+        Coupon.objects.filter(pk=row['coupon_id'], usage_count__lt=row['uses']).update(usage_count=row['uses'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0057_copurchase_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coupon',
+            name='stackable',
+            field=models.BooleanField(default=True, help_text='Can be combined with other stackable discounts'),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='stackable',
+            field=models.BooleanField(default=True, help_text='Can be combined with other stackable discounts'),
+        ),
+        migrations.AddField(
+            model_name='promotion',
+            name='usage_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='PromotionRedemption',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('free_shipping', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('applied', 'Applied'), ('released', 'Released')], default='applied', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('coupon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='redemptions', to='clientapp.coupon')),
+                ('customer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='clientapp.customer')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promotion_redemptions', to='clientapp.order')),
+                ('promotion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='redemptions', to='clientapp.promotion')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['order', 'status'], name='clientapp_p_order_i_0169f9_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PromotionUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uses', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('coupon', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='customer_usage', to='clientapp.coupon')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='promotion_usage', to='clientapp.customer')),
+                ('promotion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='customer_usage', to='clientapp.promotion')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('customer', 'coupon'), name='unique_customer_coupon_usage'), models.UniqueConstraint(fields=('customer', 'promotion'), name='unique_customer_promotion_usage')],
+            },
+        ),
+        migrations.RunPython(backfill_coupon_usage, migrations.RunPython.noop),
+    ]
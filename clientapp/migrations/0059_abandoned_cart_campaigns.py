@@ -0,0 +1,40 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0058_promotion_engine'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AbandonedCartCampaign',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='running', max_length=20)),
+                ('threshold_hours', models.IntegerField(default=24)),
+                ('last_cart_id', models.BigIntegerField(default=0)),
+                ('marked_count', models.IntegerField(default=0)),
+                ('sent_count', models.IntegerField(default=0)),
+                ('failed_count', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='reminder_sent_at',
+            field=models.DateTimeField(blank=True, help_text='When the abandoned-cart reminder was claimed for sending', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['is_active', 'is_abandoned', 'updated_at'], name='clientapp_c_is_acti_cdc1f7_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0059_abandoned_cart_campaigns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatbotIntentKeyword',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('intent', models.CharField(db_index=True, help_text='Intent name, e.g. pricing or order_tracking', max_length=50)),
+                ('keyword', models.CharField(help_text='Word or phrase, matched on word boundaries', max_length=100)),
+                ('weight', models.PositiveSmallIntegerField(default=1, help_text='Score added to the intent per match')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['intent', 'keyword'],
+                'unique_together': {('intent', 'keyword')},
+            },
+        ),
+    ]
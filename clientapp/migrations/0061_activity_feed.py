@@ -0,0 +1,39 @@
+# Generated by Django 5.2.7 on 2026-10-19 00:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0060_chatbot_intent_keywords'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActivityFeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(db_index=True, help_text="First day of the entry's month")),
+                ('timestamp', models.DateTimeField()),
+                ('entity_type', models.CharField(max_length=50)),
+                ('entity_id', models.BigIntegerField()),
+                ('parent_type', models.CharField(blank=True, max_length=50)),
+                ('parent_id', models.BigIntegerField(blank=True, null=True)),
+                ('source', models.CharField(choices=[('timeline', 'Timeline Event'), ('activity', 'Client Activity'), ('portal', 'Client Portal Activity'), ('audit', 'Audit Log'), ('product_change', 'Product Change'), ('job_progress', 'Job Progress')], max_length=20)),
+                ('source_id', models.BigIntegerField()),
+                ('event_type', models.CharField(max_length=50)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('metadata', models.JSONField(blank=True, default=dict)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='activity_feed_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-timestamp', '-id'],
+                'indexes': [models.Index(fields=['entity_type', 'entity_id', '-timestamp', '-id'], name='activity_feed_entity_idx'), models.Index(fields=['parent_type', 'parent_id', '-timestamp', '-id'], name='activity_feed_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'source_id'), name='unique_activity_feed_source_row')],
+            },
+        ),
+    ]
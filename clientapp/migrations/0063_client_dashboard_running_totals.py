@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:15
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0062_quote_latest_line_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientdashboard',
+            name='completion_time_total',
+            field=models.DurationField(default=datetime.timedelta(0)),
+        ),
+        migrations.AddField(
+            model_name='clientdashboard',
+            name='on_time_deliveries',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='clientdashboard',
+            name='timed_completions',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='clientorder',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
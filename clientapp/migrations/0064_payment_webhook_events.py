@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0063_client_dashboard_running_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(choices=[('mpesa', 'M-Pesa'), ('stripe', 'Stripe'), ('pesapal', 'Pesapal')], max_length=20)),
+                ('event_id', models.CharField(help_text='Gateway event id (or payload hash)', max_length=255)),
+                ('transaction_id', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('status', models.CharField(choices=[('completed', 'Completed'), ('failed', 'Failed'), ('unknown', 'Unknown')], max_length=20)),
+                ('message', models.TextField(blank=True)),
+                ('occurred_at', models.DateTimeField(blank=True, help_text='Event time reported by the gateway', null=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, choices=[('applied', 'Applied'), ('duplicate', 'Duplicate'), ('stale', 'Stale'), ('ignored', 'Ignored'), ('unmatched', 'Unmatched'), ('error', 'Error')], max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['processed_at', 'id'], name='payment_webhook_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'event_id'), name='payment_webhook_event_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.7 on 2026-10-19 01:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0065_lead_dedup_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='systemalert',
+            name='alert_type',
+            field=models.CharField(choices=[('low_stock', 'Low Stock Alert'), ('urgent_order', 'Urgent Order'), ('payment_due', 'Payment Due'), ('system_error', 'System Error'), ('new_lead', 'New Lead'), ('quote_expired', 'Quote Expired'), ('po_overdue', 'PO Overdue'), ('info', 'General Information')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='ChunkedTaskRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='running', max_length=20)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('rows', models.IntegerField(default=0)),
+                ('metrics', models.JSONField(blank=True, default=dict, help_text="Counters summed over the run's chunks")),
+                ('failed_chunks', models.IntegerField(default=0)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'indexes': [models.Index(fields=['name', 'status'], name='chunked_run_name_status_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ChunkedTaskChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('start_pk', models.BigIntegerField(help_text='Exclusive lower bound')),
+                ('end_pk', models.BigIntegerField(help_text='Inclusive upper bound')),
+                ('last_pk', models.BigIntegerField(help_text='Checkpoint: rows up to here are processed')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('attempts', models.IntegerField(default=0)),
+                ('rows', models.IntegerField(default=0)),
+                ('metrics', models.JSONField(blank=True, default=dict)),
+                ('duration_ms', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='clientapp.chunkedtaskrun')),
+            ],
+            options={
+                'ordering': ['run', 'index'],
+                'indexes': [models.Index(fields=['run', 'status'], name='chunked_chunk_run_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('run', 'index'), name='chunked_chunk_run_index_unique')],
+            },
+        ),
+    ]
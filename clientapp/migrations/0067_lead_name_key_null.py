@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-19 03:10
+
+from django.db import migrations, models
+
+
+def mark_unindexed(apps, schema_editor):
+    """
+    Leads whose keys were never derived carry an empty name_key; NULL is now
+    the "not indexed" marker, so an empty key can mean "indexed, nothing to key"
+    """
+    Lead = apps.get_model('clientapp', 'Lead')
+    Lead.objects.filter(name_key='').update(name_key=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0066_chunked_task_runs'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='lead',
+            name='name_key',
+            field=models.CharField(blank=True, default=None, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(mark_unindexed, migrations.RunPython.noop),
+    ]
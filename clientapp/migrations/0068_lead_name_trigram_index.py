@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-19 14:20
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0067_lead_name_key_null'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='lead',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='lead_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
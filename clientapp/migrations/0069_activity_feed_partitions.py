@@ -0,0 +1,92 @@
+# Generated by Django 5.2.7 on 2026-10-19 15:05
+
+from django.db import migrations, models
+
+# The feed table is rebuilt range-partitioned on month. Postgres requires the
+# partition key in every unique constraint, so the primary key becomes
+# (id, month) and the source-row constraint gains month (a source row's month
+# never changes, so it still identifies the row). Existing rows land in the
+# DEFAULT partition; services.activity_feed.ensure_partitions() moves them
+# into monthly partitions and creates the months ahead.
+
+COLUMNS = '''
+    "id" bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+    "month" date NOT NULL,
+    "timestamp" timestamp with time zone NOT NULL,
+    "entity_type" varchar(50) NOT NULL,
+    "entity_id" bigint NOT NULL,
+    "parent_type" varchar(50) NOT NULL,
+    "parent_id" bigint NULL,
+    "source" varchar(20) NOT NULL,
+    "source_id" bigint NOT NULL,
+    "event_type" varchar(50) NOT NULL,
+    "title" varchar(255) NOT NULL,
+    "metadata" jsonb NOT NULL,
+    "actor_id" integer NULL
+'''
+COLUMN_NAMES = (
+    '"id", "month", "timestamp", "entity_type", "entity_id", "parent_type", "parent_id", "source", "source_id", '
+    '"event_type", "title", "metadata", "actor_id"'
+)
+INDEXES = '''
+ALTER TABLE "clientapp_activityfeedentry" ADD CONSTRAINT "clientapp_activityfeedentry_actor_id_e4efd6e7_fk_auth_user_id"
+    FOREIGN KEY ("actor_id") REFERENCES "auth_user" ("id") DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX "clientapp_activityfeedentry_month_214dbf52" ON "clientapp_activityfeedentry" ("month");
+CREATE INDEX "clientapp_activityfeedentry_actor_id_e4efd6e7" ON "clientapp_activityfeedentry" ("actor_id");
+CREATE INDEX "activity_feed_entity_idx" ON "clientapp_activityfeedentry" ("entity_type", "entity_id", "timestamp" DESC, "id" DESC);
+CREATE INDEX "activity_feed_parent_idx" ON "clientapp_activityfeedentry" ("parent_type", "parent_id", "timestamp" DESC, "id" DESC);
+SELECT setval(pg_get_serial_sequence('"clientapp_activityfeedentry"', 'id'), COALESCE(MAX("id"), 1), MAX("id") IS NOT NULL)
+    FROM "clientapp_activityfeedentry";
+'''
+
+PARTITION = f'''
+CREATE TABLE "clientapp_activityfeedentry_new" ({COLUMNS},
+    CONSTRAINT "clientapp_activityfeedentry_new_pkey" PRIMARY KEY ("id", "month"),
+    CONSTRAINT "unique_activity_feed_source_row_new" UNIQUE ("source", "source_id", "month")
+) PARTITION BY RANGE ("month");
+CREATE TABLE "clientapp_activityfeedentry_default" PARTITION OF "clientapp_activityfeedentry_new" DEFAULT;
+INSERT INTO "clientapp_activityfeedentry_new" ({COLUMN_NAMES})
+    SELECT {COLUMN_NAMES} FROM "clientapp_activityfeedentry";
+DROP TABLE "clientapp_activityfeedentry";
+ALTER TABLE "clientapp_activityfeedentry_new" RENAME TO "clientapp_activityfeedentry";
+ALTER TABLE "clientapp_activityfeedentry" RENAME CONSTRAINT "clientapp_activityfeedentry_new_pkey" TO "clientapp_activityfeedentry_pkey";
+ALTER TABLE "clientapp_activityfeedentry" RENAME CONSTRAINT "unique_activity_feed_source_row_new" TO "unique_activity_feed_source_row";
+{INDEXES}'''
+
+UNPARTITION = f'''
+CREATE TABLE "clientapp_activityfeedentry_new" ({COLUMNS},
+    CONSTRAINT "clientapp_activityfeedentry_new_pkey" PRIMARY KEY ("id"),
+    CONSTRAINT "unique_activity_feed_source_row_new" UNIQUE ("source", "source_id")
+);
+INSERT INTO "clientapp_activityfeedentry_new" ({COLUMN_NAMES})
+    SELECT {COLUMN_NAMES} FROM "clientapp_activityfeedentry";
+DROP TABLE "clientapp_activityfeedentry" CASCADE;
+ALTER TABLE "clientapp_activityfeedentry_new" RENAME TO "clientapp_activityfeedentry";
+ALTER TABLE "clientapp_activityfeedentry" RENAME CONSTRAINT "clientapp_activityfeedentry_new_pkey" TO "clientapp_activityfeedentry_pkey";
+ALTER TABLE "clientapp_activityfeedentry" RENAME CONSTRAINT "unique_activity_feed_source_row_new" TO "unique_activity_feed_source_row";
+{INDEXES}'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('clientapp', '0068_lead_name_trigram_index'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(PARTITION, UNPARTITION),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name='activityfeedentry',
+                    name='unique_activity_feed_source_row',
+                ),
+                migrations.AddConstraint(
+                    model_name='activityfeedentry',
+                    constraint=models.UniqueConstraint(fields=('source', 'source_id', 'month'), name='unique_activity_feed_source_row'),
+                ),
+            ],
+        ),
+    ]
@@ -8,6 +8,7 @@ from datetime import timedelta
 from decimal import Decimal
 from django.utils.text import slugify
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
 from django import forms
 import json
 from datetime import date
@@ -61,6 +62,12 @@ class Lead(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     converted_to_client = models.BooleanField(default=False)
     converted_at = models.DateTimeField(null=True, blank=True)
+
+    # Duplicate match keys (clientapp.services.lead_dedup), derived on save.
+    # name_key is NULL until the keys are derived (e.g. bulk-created rows)
+    email_key = models.CharField(max_length=254, blank=True, default='', editable=False)
+    phone_key = models.CharField(max_length=20, blank=True, default='', editable=False)
+    name_key = models.CharField(max_length=64, blank=True, null=True, default=None, editable=False)
     
     class Meta:
         ordering = ['-created_at']
@@ -68,6 +75,11 @@ class Lead(models.Model):
             models.Index(fields=['email']),
             models.Index(fields=['phone']),
             models.Index(fields=['status']),
+            models.Index(fields=['email_key'], name='lead_email_key_idx'),
+            models.Index(fields=['phone_key'], name='lead_phone_key_idx'),
+            models.Index(fields=['name_key'], name='lead_name_key_idx'),
+            # pg_trgm: typo-tolerant name matches (name__trigram_similar)
+            GinIndex(fields=['name'], name='lead_name_trgm_idx', opclasses=['gin_trgm_ops']),
         ]
     
     def __str__(self):
@@ -75,13 +87,13 @@ class Lead(models.Model):
     
     def check_duplicate(self):
         """Check if lead is duplicate (exists in Lead or Client tables)"""
+        from .services.lead_dedup import canonical_email
+
         # Check in Lead table
-        if self.pk:
-            duplicate_lead = Lead.objects.filter(
-                email=self.email
-            ).exclude(pk=self.pk).first()
-        else:
-            duplicate_lead = Lead.objects.filter(email=self.email).first()
+        email_key = canonical_email(self.email)
+        duplicate_lead = None
+        if email_key:
+            duplicate_lead = Lead.objects.filter(email_key=email_key).exclude(pk=self.pk).first()
         
         if duplicate_lead:
             return True, f"Email already exists as lead {duplicate_lead.lead_id}"
@@ -108,6 +120,13 @@ class Lead(models.Model):
                 new_number = 1
             
             self.lead_id = f'LD-{year}-{new_number:03d}'
+
+        from .services.lead_dedup import keys_for
+        for field, value in keys_for(self.name, self.email, self.phone).items():
+            setattr(self, field, value)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'name', 'email', 'phone'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'email_key', 'phone_key', 'name_key'}
         
         super().save(*args, **kwargs)
 
@@ -446,9 +465,68 @@ class ProductFamily(models.Model):
 
 
 
-class Product(models.Model):
+class ChangeTrackingMixin:
+    """
+    Remember the values of ``TRACKED_FIELDS`` as loaded from the database,
+    so changes can be diffed at save time without re-reading the row.
+    Fields deferred at load time are not tracked for that instance.
+    """
+    TRACKED_FIELDS = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            field: getattr(instance, field)
+            for field in cls.TRACKED_FIELDS
+            if field in instance.__dict__
+        }
+        return instance
+
+    def tracked_changes(self):
+        """{field: (old, new)} for tracked fields changed since load/last save"""
+        loaded = getattr(self, '_loaded_values', None) or {}
+        return {
+            field: (old, getattr(self, field))
+            for field, old in loaded.items()
+            if getattr(self, field) != old
+        }
+
+    def loaded_value(self, field):
+        """Value of ``field`` as loaded (the current value if it is not tracked)"""
+        loaded = getattr(self, '_loaded_values', None) or {}
+        return loaded[field] if field in loaded else getattr(self, field)
+
+    def reset_tracked_values(self):
+        """Make the current values the baseline for the next save (deferred fields stay untracked)"""
+        self._loaded_values = {
+            field: self.__dict__[field]
+            for field in self.TRACKED_FIELDS
+            if field in self.__dict__
+        }
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        # Reloaded fields (including a deferred field on first access) are
+        # the new baseline; other fields keep their unsaved changes
+        refreshed = self.TRACKED_FIELDS if fields is None else [f for f in fields if f in self.TRACKED_FIELDS]
+        self._loaded_values = {
+            **(getattr(self, '_loaded_values', None) or {}),
+            **{field: self.__dict__[field] for field in refreshed if field in self.__dict__},
+        }
+
+
+class Product(ChangeTrackingMixin, models.Model):
     """Main Product Model - General Info Tab"""
     
+    # Fields whose changes are recorded in ProductChangeHistory
+    TRACKED_FIELDS = (
+        'name', 'short_description', 'long_description', 'technical_specs',
+        'customization_level', 'primary_category', 'sub_category', 'product_family',
+        'visibility', 'feature_product', 'bestseller_badge', 'new_arrival',
+        'base_price', 'status', 'internal_code',
+    )
+    
     # Product Type Choices
     PRODUCT_TYPE_CHOICES = [
         ('physical', 'Physical Product'),
@@ -721,9 +799,11 @@ class ProductTag(models.Model):
         super().save(*args, **kwargs)
 
 
-class ProductPricing(models.Model):
+class ProductPricing(ChangeTrackingMixin, models.Model):
     """Pricing & Variables Tab"""
     
+    TRACKED_FIELDS = ('base_cost', 'default_margin', 'minimum_margin', 'return_margin')
+    
     PRICING_MODEL_CHOICES = [
         ('variable', 'Variable Pricing (customer selects options)'),
         ('simple', 'Simple/Fixed Pricing (one price)'),
@@ -1048,6 +1128,18 @@ class ProductImage(models.Model):
     associated_variable = models.ForeignKey(ProductVariable, on_delete=models.SET_NULL, null=True, blank=True)
     associated_option = models.ForeignKey(ProductVariableOption, on_delete=models.SET_NULL, null=True, blank=True)
     
+    # Media pipeline output (filled in by the process_product_image task)
+    PROCESSING_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+    processing_status = models.CharField(max_length=20, choices=PROCESSING_STATUS_CHOICES, default='pending')
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    blurhash = models.CharField(max_length=64, blank=True, help_text="Placeholder shown while the image loads")
+    variants = models.JSONField(default=dict, blank=True, help_text="Resized copies: {format: [{width, height, name}]}")
+    
     uploaded_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -1679,6 +1771,8 @@ class Quote(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['client']),
             models.Index(fields=['production_status']),
+            # Newest line of each quote (quotes_list grouping)
+            models.Index(fields=['quote_id', '-created_at'], name='quote_latest_line_idx'),
         ]
     
     def __str__(self):
@@ -2690,6 +2784,7 @@ class SystemAlert(models.Model):
         ('system_error', 'System Error'),
         ('new_lead', 'New Lead'),
         ('quote_expired', 'Quote Expired'),
+        ('po_overdue', 'PO Overdue'),
         ('info', 'General Information'),
     ]
     
@@ -3554,6 +3649,7 @@ class Cart(models.Model):
     # Status
     is_active = models.BooleanField(default=True)
     is_abandoned = models.BooleanField(default=False)
+    reminder_sent_at = models.DateTimeField(null=True, blank=True, help_text="When the abandoned-cart reminder was claimed for sending")
     
     # Tracking
     created_at = models.DateTimeField(auto_now_add=True)
@@ -3565,6 +3661,7 @@ class Cart(models.Model):
         indexes = [
             models.Index(fields=['customer', 'is_active']),
             models.Index(fields=['session_key', 'is_active']),
+            models.Index(fields=['is_active', 'is_abandoned', 'updated_at']),
         ]
     
     def __str__(self):
@@ -3585,6 +3682,35 @@ class Cart(models.Model):
         return self.subtotal  # Will be enhanced with tax/shipping/discounts
 
 
+class AbandonedCartCampaign(models.Model):
+    """
+    One run of the abandoned-cart reminder campaign
+    last_cart_id is the checkpoint: a run that stopped part-way resumes
+    after it, and carts are claimed (reminder_sent_at) before sending, so
+    nobody is emailed twice.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    ]
+    
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    threshold_hours = models.IntegerField(default=24)
+    last_cart_id = models.BigIntegerField(default=0)
+    marked_count = models.IntegerField(default=0)
+    sent_count = models.IntegerField(default=0)
+    failed_count = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+    
+    def __str__(self):
+        return f"Abandoned cart campaign {self.pk} ({self.status}: {self.sent_count} sent)"
+
+
 class CartItem(models.Model):
     """Individual items in a shopping cart"""
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
@@ -3701,6 +3827,7 @@ class Order(models.Model):
     paid_at = models.DateTimeField(null=True, blank=True)
     shipped_at = models.DateTimeField(null=True, blank=True)
     delivered_at = models.DateTimeField(null=True, blank=True)
+    copurchase_indexed_at = models.DateTimeField(null=True, blank=True, editable=False, help_text="When the items were added to the co-purchase index")
     
     class Meta:
         ordering = ['-created_at']
@@ -3757,6 +3884,36 @@ class OrderItem(models.Model):
         return f"{self.quantity}x {self.product_name} in {self.order.order_number}"
 
 
+class ProductCoPurchase(models.Model):
+    """
+    Sparse product x product co-occurrence matrix (one row per direction)
+    Scores are forward-decayed: each basket adds 2^(age since a fixed epoch /
+    half-life), so newer baskets weigh more without rewriting old rows.
+    Maintained by clientapp.services.recommendations.
+    """
+    product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='co_purchases')
+    related_product = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='+')
+    order_score = models.FloatField(default=0, help_text="Decayed count of paid orders containing both")
+    quote_score = models.FloatField(default=0, help_text="Decayed count of quotes containing both")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = [['product', 'related_product']]
+    
+    def __str__(self):
+        return f"{self.product_id} -> {self.related_product_id} ({self.order_score:.2f})"
+
+
+class ProductRecommendation(models.Model):
+    """Top-K co-purchase neighbours of a product, ready to serve"""
+    product = models.OneToOneField('Product', on_delete=models.CASCADE, related_name='recommendation')
+    neighbours = models.JSONField(default=list, help_text="[[product_id, score], ...] best first")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recommendations for {self.product_id}"
+
+
 class Coupon(models.Model):
     """Coupon/Discount Engine"""
     TYPE_CHOICES = [
@@ -3787,6 +3944,7 @@ class Coupon(models.Model):
     usage_limit = models.IntegerField(null=True, blank=True, help_text="Total times coupon can be used")
     usage_count = models.IntegerField(default=0)
     usage_limit_per_customer = models.IntegerField(default=1, help_text="Times per customer")
+    stackable = models.BooleanField(default=True, help_text="Can be combined with other stackable discounts")
     
     # Validity
     valid_from = models.DateTimeField()
@@ -3818,18 +3976,20 @@ class Coupon(models.Model):
         
         if customer:
             # Check per-customer usage limit
-            customer_usage = Order.objects.filter(
+            customer_usage = PromotionUsage.objects.filter(
                 customer=customer,
-                coupon=self,
-                payment_status='completed'
-            ).count()
+                coupon=self
+            ).values_list('uses', flat=True).first() or 0
             if customer_usage >= self.usage_limit_per_customer:
                 return False, "You have already used this coupon"
         
         return True, "Valid"
     
     def calculate_discount(self, order_amount, items=None):
-        """Calculate discount amount for an order"""
+        """
+        Calculate discount amount for an order
+        items: cart lines ({'product_id', 'quantity', 'unit_price'}) - needed for buy_x_get_y
+        """
         if self.discount_type == 'percentage':
             discount = order_amount * (self.discount_value / 100)
             if self.maximum_discount_amount:
@@ -3840,8 +4000,17 @@ class Coupon(models.Model):
         elif self.discount_type == 'free_shipping':
             return Decimal('0')  # Applied separately
         elif self.discount_type == 'buy_x_get_y':
-            # Complex logic for BOGO
-            return Decimal('0')  # Placeholder
+            from .services.promotions import buy_x_get_y_discount
+            
+            product_ids = set(self.applicable_products.values_list('id', flat=True))
+            eligible = [
+                item for item in items or []
+                if not product_ids or item['product_id'] in product_ids
+            ]
+            discount = buy_x_get_y_discount(eligible, self.buy_quantity, self.get_quantity)
+            if self.maximum_discount_amount:
+                discount = min(discount, self.maximum_discount_amount)
+            return discount
         return Decimal('0')
 
 
@@ -4153,6 +4322,60 @@ class PaymentTransaction(models.Model):
         return f"{self.payment_method.upper()} - {self.transaction_id} ({self.status})"
 
 
+class PaymentWebhookEvent(models.Model):
+    """
+    Raw payment gateway callback, stored as received (append-only) and
+    applied later by a worker (services.payment_webhooks). Only the
+    processing fields are ever updated, plus the status and message of a
+    Pesapal IPN once the worker has looked them up.
+    """
+    PROVIDER_CHOICES = [
+        ('mpesa', 'M-Pesa'),
+        ('stripe', 'Stripe'),
+        ('pesapal', 'Pesapal'),
+    ]
+    STATUS_CHOICES = [
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+        ('unknown', 'Unknown'),
+    ]
+    OUTCOME_CHOICES = [
+        ('applied', 'Applied'),
+        ('duplicate', 'Duplicate'),
+        ('stale', 'Stale'),
+        ('ignored', 'Ignored'),
+        ('unmatched', 'Unmatched'),
+        ('error', 'Error'),
+    ]
+
+    provider = models.CharField(max_length=20, choices=PROVIDER_CHOICES)
+    event_id = models.CharField(max_length=255, help_text="Gateway event id (or payload hash)")
+    transaction_id = models.CharField(max_length=255, blank=True, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    message = models.TextField(blank=True)
+    occurred_at = models.DateTimeField(null=True, blank=True, help_text="Event time reported by the gateway")
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+
+    # Processing
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=20, choices=OUTCOME_CHOICES, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='payment_webhook_event_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['processed_at', 'id'], name='payment_webhook_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider} {self.event_id} ({self.outcome or 'pending'})"
+
+
 # ==================== STOREFRONT BACKEND ENHANCEMENTS ====================
 
 class ProductRule(models.Model):
@@ -4255,6 +4478,61 @@ class TimelineEvent(models.Model):
         return f"{self.event_type} - {self.entity_type}#{self.entity_id} at {self.timestamp}"
 
 
+class ActivityFeedEntry(models.Model):
+    """
+    Unified activity feed - read model over TimelineEvent and the history
+    tables (ActivityLog, ClientActivityLog, AuditLog, ProductChangeHistory,
+    JobProgressUpdate), projected by services.activity_feed.
+    Each row belongs to an entity and optionally a parent entity (a quote's
+    client, a job stage's job), so one query serves both streams.
+    The table is range-partitioned on month (migration 0069): the database
+    key is (id, month), services.activity_feed creates the monthly
+    partitions and prunes by dropping them.
+    """
+    SOURCE_CHOICES = [
+        ('timeline', 'Timeline Event'),
+        ('activity', 'Client Activity'),
+        ('portal', 'Client Portal Activity'),
+        ('audit', 'Audit Log'),
+        ('product_change', 'Product Change'),
+        ('job_progress', 'Job Progress'),
+    ]
+    
+    month = models.DateField(db_index=True, help_text="First day of the entry's month")
+    timestamp = models.DateTimeField()
+    entity_type = models.CharField(max_length=50)
+    entity_id = models.BigIntegerField()
+    parent_type = models.CharField(max_length=50, blank=True)
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.BigIntegerField()
+    event_type = models.CharField(max_length=50)
+    title = models.CharField(max_length=255, blank=True)
+    actor = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='activity_feed_entries'
+    )
+    metadata = models.JSONField(default=dict, blank=True)
+    
+    class Meta:
+        ordering = ['-timestamp', '-id']
+        constraints = [
+            # Unique constraints on a partitioned table must include the partition key
+            models.UniqueConstraint(fields=['source', 'source_id', 'month'], name='unique_activity_feed_source_row'),
+        ]
+        indexes = [
+            models.Index(fields=['entity_type', 'entity_id', '-timestamp', '-id'], name='activity_feed_entity_idx'),
+            models.Index(fields=['parent_type', 'parent_id', '-timestamp', '-id'], name='activity_feed_parent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} - {self.entity_type}#{self.entity_id} at {self.timestamp}"
+
+
 class DesignSession(models.Model):
     """
     Design Session - Tracks customer design sessions
@@ -4507,6 +4785,8 @@ class Promotion(models.Model):
     # Usage limits
     usage_limit = models.IntegerField(null=True, blank=True)
     usage_limit_per_customer = models.IntegerField(null=True, blank=True, default=1)
+    usage_count = models.IntegerField(default=0)
+    stackable = models.BooleanField(default=True, help_text="Can be combined with other stackable discounts")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -4518,6 +4798,54 @@ class Promotion(models.Model):
         return f"{self.name} ({self.get_promotion_type_display()})"
 
 
+class PromotionUsage(models.Model):
+    """
+    Per-customer usage counter of a coupon or promotion
+    Incremented atomically at checkout so limits are checked without
+    counting orders.
+    """
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='promotion_usage')
+    coupon = models.ForeignKey(Coupon, on_delete=models.CASCADE, null=True, blank=True, related_name='customer_usage')
+    promotion = models.ForeignKey(Promotion, on_delete=models.CASCADE, null=True, blank=True, related_name='customer_usage')
+    uses = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'coupon'], name='unique_customer_coupon_usage'),
+            models.UniqueConstraint(fields=['customer', 'promotion'], name='unique_customer_promotion_usage'),
+        ]
+    
+    def __str__(self):
+        return f"{self.customer_id}: {self.coupon or self.promotion} x{self.uses}"
+
+
+class PromotionRedemption(models.Model):
+    """Discount applied to an order - released again if the order is cancelled"""
+    STATUS_CHOICES = [
+        ('applied', 'Applied'),
+        ('released', 'Released'),
+    ]
+    
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='promotion_redemptions')
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True, blank=True)
+    coupon = models.ForeignKey(Coupon, on_delete=models.SET_NULL, null=True, blank=True, related_name='redemptions')
+    promotion = models.ForeignKey(Promotion, on_delete=models.SET_NULL, null=True, blank=True, related_name='redemptions')
+    amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    free_shipping = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='applied')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['order', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.coupon or self.promotion} on {self.order_id}: {self.amount}"
+
+
 class MaterialInventory(models.Model):
     """
     Inventory & Material Commitment 
@@ -4585,6 +4913,43 @@ class MaterialInventory(models.Model):
         return self.available_stock <= self.low_stock_threshold
 
 
+class InventoryReservation(models.Model):
+    """
+    Inventory reservation ledger
+    One row per material held for an order/quote. MaterialInventory.reserved_stock
+    is the sum of the active rows, maintained by clientapp.services.inventory
+    with conditional UPDATEs.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('committed', 'Committed'),
+        ('released', 'Released'),
+        ('expired', 'Expired'),
+    ]
+    
+    material = models.ForeignKey(MaterialInventory, on_delete=models.CASCADE, related_name='reservations')
+    order = models.ForeignKey('Order', on_delete=models.CASCADE, null=True, blank=True, related_name='inventory_reservations')
+    reference = models.CharField(max_length=100, blank=True, db_index=True, help_text="What the stock is held for, e.g. a cart or quote id")
+    quantity = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
+    expires_at = models.DateTimeField(null=True, blank=True, help_text="Active reservations past this are released by the sweeper")
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'expires_at']),
+            models.Index(fields=['material', 'status']),
+            models.Index(fields=['order', 'status']),
+            models.Index(fields=['updated_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.quantity} {self.material.unit} of {self.material.material_name} ({self.status})"
+
+
 class Refund(models.Model):
     """
     Refunds - Immutable payment corrections
@@ -5048,11 +5413,14 @@ class ClientPortalUser(models.Model):
         return f"{self.user.username} - {self.client.client_id} ({self.role})"
 
 
-class ClientOrder(models.Model):
+class ClientOrder(ChangeTrackingMixin, models.Model):
     """
     Client Portal Order - Represents a Quote converted to Order for B2B Clients
     Linked to Quote for tracking purposes
     """
+    # Fields the client dashboard counters depend on
+    TRACKED_FIELDS = ('client_id', 'status', 'total_amount', 'delivery_date', 'delivered_at')
+
     STATUS_CHOICES = [
         ('draft', 'Draft'),
         ('submitted', 'Submitted'),
@@ -5089,6 +5457,7 @@ class ClientOrder(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     submitted_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-created_at']
@@ -5114,6 +5483,9 @@ class ClientOrder(models.Model):
                 new_num = 1
             
             self.order_number = f'CO-{year}-{new_num:05d}'
+
+        if self.status == 'delivered' and self.delivered_at is None:
+            self.delivered_at = timezone.now()
         
         super().save(*args, **kwargs)
 
@@ -5139,11 +5511,14 @@ class ClientOrderItem(models.Model):
         return f"{self.quantity}x {self.product_name} - Order {self.order.order_number}"
 
 
-class ClientInvoice(models.Model):
+class ClientInvoice(ChangeTrackingMixin, models.Model):
     """
     Client Portal Invoice - Generated from Orders/Jobs
     Synced with QuickBooks
     """
+    # Fields the client dashboard counters depend on
+    TRACKED_FIELDS = ('client_id', 'status', 'balance_due')
+
     STATUS_CHOICES = [
         ('draft', 'Draft'),
         ('issued', 'Issued'),
@@ -6345,6 +6720,25 @@ class ChatbotConversation(models.Model):
         super().save(*args, **kwargs)
 
 
+class ChatbotIntentKeyword(models.Model):
+    """
+    Admin-editable keyword for chatbot intent detection
+    Merged with the built-in intent tables when the matcher is compiled.
+    """
+    intent = models.CharField(max_length=50, db_index=True, help_text="Intent name, e.g. pricing or order_tracking")
+    keyword = models.CharField(max_length=100, help_text="Word or phrase, matched on word boundaries")
+    weight = models.PositiveSmallIntegerField(default=1, help_text="Score added to the intent per match")
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['intent', 'keyword']
+        unique_together = ['intent', 'keyword']
+    
+    def __str__(self):
+        return f"{self.intent}: {self.keyword}"
+
+
 class QuotePricingSnapshot(models.Model):
     """
     Audit trail for quote pricing changes
@@ -6639,8 +7033,11 @@ class ProgressUpdatePhoto(models.Model):
         return f"Photo - {self.progress_update.job.job_number}"
 
 
-class ProofSubmission(models.Model):
+class ProofSubmission(ChangeTrackingMixin, models.Model):
     """Vendor proof submissions (deliverables)"""
+    # Field the client dashboard counters depend on
+    TRACKED_FIELDS = ('status',)
+
     PROOF_TYPES = [
         ('sample', 'Sample'),
         ('final', 'Final'),
@@ -6806,6 +7203,11 @@ class ClientDashboard(models.Model):
     orders_this_month = models.IntegerField(default=0)
     avg_completion_days = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     on_time_delivery_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+
+    # Running totals behind the averages (services.client_dashboard)
+    timed_completions = models.IntegerField(default=0)
+    on_time_deliveries = models.IntegerField(default=0)
+    completion_time_total = models.DurationField(default=timedelta(0))
     
     # Tracking
     last_updated = models.DateTimeField(auto_now=True)
@@ -6818,39 +7220,11 @@ class ClientDashboard(models.Model):
         return f"{self.client.client_id} - Dashboard"
     
     def refresh_metrics(self):
-        """Recalculate dashboard metrics from related orders"""
-        from django.db.models import Count, Q
-        from datetime import timedelta
-        
-        now = timezone.now()
-        thirty_days_ago = now - timedelta(days=30)
-        
-        # Count orders by status
-        orders = self.client.orders.all()
-        self.total_orders = orders.count()
-        self.completed_orders = orders.filter(status='completed').count()
-        self.active_orders = orders.filter(status__in=['pending', 'in_progress', 'approved']).count()
-        self.overdue_orders = orders.filter(deadline__lt=now, status__in=['pending', 'in_progress']).count()
-        
-        # Count pending proofs
-        self.pending_proofs = orders.filter(
-            proofs__status='pending_review'
-        ).distinct().count()
-        
-        # Financial metrics
-        self.total_spent = sum([o.total_price for o in orders]) or 0
-        self.pending_payment = sum([o.total_price for o in orders.filter(payment_status='pending')]) or 0
-        
-        # This month metrics
-        self.orders_this_month = orders.filter(created_at__gte=thirty_days_ago).count()
-        
-        # Calculate completion time
-        completed = orders.filter(status='completed').exclude(completed_at__isnull=True)
-        if completed.exists():
-            avg_days = sum([(o.completed_at - o.created_at).days for o in completed]) / completed.count()
-            self.avg_completion_days = avg_days
-        
-        self.save()
+        """Recalculate dashboard metrics from scratch (they are otherwise kept current by deltas)"""
+        from .services import client_dashboard
+
+        client_dashboard.refresh([self.client_id])
+        self.refresh_from_db()
 
 
 class ClientFeedback(models.Model):
@@ -7716,3 +8090,75 @@ class DocumentShare(models.Model):
         return f"Shared {self.file.file_name} with {recipient}"
 
 
+
+
+class ChunkedTaskRun(models.Model):
+    """
+    One run of a chunked periodic task (services.chunked_tasks)
+    The run's rows are split into primary-key ranges (ChunkedTaskChunk),
+    each processed by its own Celery task. A run left running by a crash is
+    resumed by the next start instead of a new run being opened.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    ]
+    
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    chunk_count = models.IntegerField(default=0)
+    rows = models.IntegerField(default=0)
+    metrics = models.JSONField(default=dict, blank=True, help_text="Counters summed over the run's chunks")
+    failed_chunks = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['name', 'status'], name='chunked_run_name_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} run {self.pk} ({self.status})"
+
+
+class ChunkedTaskChunk(models.Model):
+    """
+    One primary-key range (start_pk, end_pk] of a chunked task run
+    last_pk is the checkpoint, saved after every batch: a chunk whose
+    worker died resumes after it.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    run = models.ForeignKey(ChunkedTaskRun, on_delete=models.CASCADE, related_name='chunks')
+    index = models.IntegerField()
+    start_pk = models.BigIntegerField(help_text="Exclusive lower bound")
+    end_pk = models.BigIntegerField(help_text="Inclusive upper bound")
+    last_pk = models.BigIntegerField(help_text="Checkpoint: rows up to here are processed")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(default=0)
+    rows = models.IntegerField(default=0)
+    metrics = models.JSONField(default=dict, blank=True)
+    duration_ms = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['run', 'index']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'index'], name='chunked_chunk_run_index_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['run', 'status'], name='chunked_chunk_run_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.run.name} chunk {self.index} ({self.status})"
@@ -1,10 +1,10 @@
 from rest_framework import permissions
 
+from .services.roles import has_group, roles_for
+
 
 def _in_group(user, group_name: str) -> bool:
-    if not user or not user.is_authenticated:
-        return False
-    return user.is_superuser or user.groups.filter(name=group_name).exists()
+    return has_group(user, group_name, allow_superuser=True)
 
 
 class IsAdmin(permissions.BasePermission):
@@ -44,14 +44,8 @@ class IsClient(permissions.BasePermission):
     """Allow Client Portal Users - authenticated only"""
 
     def has_permission(self, request, view):
-        if not request.user or not request.user.is_authenticated:
-            return False
-        # Check if user has a client portal profile
-        try:
-            from .models import ClientPortalUser
-            return ClientPortalUser.objects.filter(user=request.user, is_active=True).exists()
-        except:
-            return False
+        # Check if user has an active client portal profile
+        return roles_for(request.user).portal_user_id is not None
 
 
 class IsClientOwner(permissions.BasePermission):
@@ -60,43 +54,28 @@ class IsClientOwner(permissions.BasePermission):
     """
 
     def has_object_permission(self, request, view, obj):
-        from .models import ClientPortalUser
-        
-        try:
-            portal_user = ClientPortalUser.objects.get(user=request.user, is_active=True)
-        except:
+        client_id = roles_for(request.user).client_id
+        if client_id is None:
             return False
-        
+
         # Get client from object (different models have different field names)
-        obj_client = getattr(obj, "client", None) or getattr(obj, "portal_user.client", None)
-        
-        return portal_user.client == obj_client
+        obj_client_id = getattr(obj, "client_id", None)
+        if obj_client_id is None and getattr(obj, "portal_user_id", None):
+            obj_client_id = obj.portal_user.client_id
+
+        return obj_client_id == client_id
 
 
 class IsVendor(permissions.BasePermission):
     """Allow Vendor Portal Users - vendors who have active user profile"""
 
     def has_permission(self, request, view):
-        if not request.user or not request.user.is_authenticated:
-            return False
         # Check if user is associated with an active vendor
-        try:
-            from .models import Vendor
-            return Vendor.objects.filter(user=request.user, active=True).exists()
-        except:
-            return False
+        return roles_for(request.user).vendor_id is not None
     
     def has_object_permission(self, request, view, obj):
         """Vendor can only access their own purchase orders"""
-        if not request.user or not request.user.is_authenticated:
-            return False
-        try:
-            from .models import Vendor
-            vendor = Vendor.objects.get(user=request.user, active=True)
-            # Check if object is owned by this vendor
-            if hasattr(obj, 'vendor'):
-                return obj.vendor == vendor
-            return False
-        except:
-            return False
+        vendor_id = roles_for(request.user).vendor_id
+        # Check if object is owned by this vendor
+        return vendor_id is not None and getattr(obj, 'vendor_id', None) == vendor_id
 
@@ -7,4 +7,5 @@ websocket_urlpatterns = [
     re_path(r'ws/dashboard/(?P<dashboard_type>\w+)/$', consumers.DashboardConsumer.as_asgi()),
     re_path(r'ws/notifications/(?P<user_id>\w+)/$', consumers.NotificationConsumer.as_asgi()),
     re_path(r'ws/substitutions/(?P<substitution_id>\w+)/$', consumers.SubstitutionConsumer.as_asgi()),
+    re_path(r'ws/progress/$', consumers.ProgressStreamConsumer.as_asgi()),
 ]
@@ -0,0 +1,400 @@
+"""
+Activity Feed Read Model
+Projects TimelineEvent and the per-domain history tables into
+ActivityFeedEntry, so an entity's timeline is one indexed query instead of
+several table reads merged in Python.
+
+Projection is by cursor: each source keeps the last source id it scanned
+(in SystemSetting) and newer source rows are projected in batches. The
+cursor moves past rows that project to nothing, e.g. audit rows about a
+non-numeric key. The history tables are often written with bulk_create
+(no post_save), so this catches every row without signals. EventBus
+projects its own events immediately; feed reads queue a catch-up at most
+every ACTIVITY_FEED_CATCH_UP_SECONDS; the periodic task also replays a window
+behind the cursor for rows that committed out of id order.
+
+Feed pages are keyset-paginated on (timestamp, id). An entity's own rows
+and the rows of its children (parent_type/parent_id) come back from one
+OR query over the two composite indexes.
+
+The table is range-partitioned on month. ensure_partitions() (run by the
+periodic task) creates the coming months' partitions and moves rows that
+fell into the DEFAULT partition - history older than the partitions, or
+a month the task had not reached yet - into their own. prune() drops whole
+partitions instead of deleting rows.
+"""
+import base64
+import binascii
+import logging
+import re
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import (
+    ActivityFeedEntry, ActivityLog, AuditLog, ClientActivityLog, Job, JobProgressUpdate,
+    ProductChangeHistory, Quote, SystemSetting, TimelineEvent,
+)
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+REPLAY_WINDOW = 1000
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+CATCH_UP_LOCK_KEY = 'activity-feed:catch-up'
+CURSOR_KEY = 'activity_feed_cursor_{source}'
+PARTITIONS_AHEAD = 2
+_PARTITION_MONTH = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _month(timestamp) -> date:
+    return timestamp.date().replace(day=1)
+
+
+def _entry(source: str, row, timestamp, entity: Tuple[str, int], parent: Optional[Tuple[str, int]] = None,
+           **fields) -> ActivityFeedEntry:
+    return ActivityFeedEntry(
+        month=_month(timestamp),
+        timestamp=timestamp,
+        entity_type=entity[0],
+        entity_id=entity[1],
+        parent_type=parent[0] if parent else '',
+        parent_id=parent[1] if parent else None,
+        source=source,
+        source_id=row.pk,
+        **fields
+    )
+
+
+# ==================== Projectors ====================
+# Each takes a batch of source rows and returns their feed entries.
+
+# Timeline entity types whose rows belong to a client's feed too
+_CLIENT_OWNED = {'quote': Quote, 'job': Job}
+
+
+def _project_timeline(events: List[TimelineEvent]) -> List[ActivityFeedEntry]:
+    owners: Dict[Tuple[str, int], int] = {}
+    for entity_type, model in _CLIENT_OWNED.items():
+        ids = {event.entity_id for event in events if event.entity_type == entity_type}
+        if ids:
+            for pk, client_id in model.objects.filter(pk__in=ids, client__isnull=False).values_list('pk', 'client_id'):
+                owners[(entity_type, pk)] = client_id
+    entries = []
+    for event in events:
+        client_id = owners.get((event.entity_type, event.entity_id))
+        entries.append(_entry(
+            'timeline', event, event.timestamp,
+            entity=(event.entity_type, event.entity_id),
+            parent=('client', client_id) if client_id else None,
+            event_type=event.event_type,
+            title=event.get_event_type_display(),
+            actor_id=event.actor_id,
+            metadata=event.metadata or {},
+        ))
+    return entries
+
+
+def _project_activity(rows: List[ActivityLog]) -> List[ActivityFeedEntry]:
+    return [
+        _entry(
+            'activity', row, row.created_at,
+            entity=('quote', row.related_quote_id) if row.related_quote_id else ('client', row.client_id),
+            parent=('client', row.client_id) if row.related_quote_id else None,
+            event_type=f'activity.{row.activity_type.lower()}',
+            title=row.title,
+            actor_id=row.created_by_id,
+            metadata={'description': row.description[:500]},
+        )
+        for row in rows
+    ]
+
+
+def _project_portal(rows: List[ClientActivityLog]) -> List[ActivityFeedEntry]:
+    return [
+        _entry(
+            'portal', row, row.created_at,
+            entity=('client_order', row.order_id) if row.order_id else ('client', row.portal_user.client_id),
+            parent=('client', row.portal_user.client_id) if row.order_id else None,
+            event_type=f'portal.{row.action_type}',
+            title=row.description[:255],
+            metadata={'portal_user_id': row.portal_user_id, 'invoice_id': row.invoice_id},
+        )
+        for row in rows
+    ]
+
+
+def _project_audit(rows: List[AuditLog]) -> List[ActivityFeedEntry]:
+    # Only rows about a numeric primary key belong to an entity feed
+    return [
+        _entry(
+            'audit', row, row.timestamp,
+            entity=(row.model_name.lower(), int(row.object_id)),
+            event_type=f'audit.{row.action.lower()}',
+            title=(row.object_repr or '')[:255],
+            actor_id=row.user_id,
+            metadata={'details': row.details[:500]},
+        )
+        for row in rows
+        if row.object_id and row.object_id.isdigit()
+    ]
+
+
+def _project_product_change(rows: List[ProductChangeHistory]) -> List[ActivityFeedEntry]:
+    return [
+        _entry(
+            'product_change', row, row.changed_at,
+            entity=('product', row.product_id),
+            event_type=f'product.{row.change_type}',
+            title=f'{row.field_changed} changed' if row.field_changed else row.change_type.replace('_', ' ').capitalize(),
+            actor_id=row.changed_by_id,
+            metadata={'field': row.field_changed, 'old': row.old_value[:200], 'new': row.new_value[:200]},
+        )
+        for row in rows
+    ]
+
+
+def _project_job_progress(rows: List[JobProgressUpdate]) -> List[ActivityFeedEntry]:
+    return [
+        _entry(
+            'job_progress', row, row.created_at,
+            entity=('job_vendor_stage', row.job_vendor_stage_id),
+            parent=('job', row.job_vendor_stage.job_id),
+            event_type='job.progress',
+            title=f'{row.progress_percentage}% - {row.status}',
+            actor_id=row.created_by_id,
+            metadata={'progress': row.progress_percentage, 'notes': row.notes[:500]},
+        )
+        for row in rows
+    ]
+
+
+# source -> (queryset factory, projector)
+SOURCES: Dict[str, Tuple[Callable, Callable[[list], List[ActivityFeedEntry]]]] = {
+    'timeline': (lambda: TimelineEvent.objects.all(), _project_timeline),
+    'activity': (lambda: ActivityLog.objects.all(), _project_activity),
+    'portal': (lambda: ClientActivityLog.objects.select_related('portal_user'), _project_portal),
+    'audit': (lambda: AuditLog.objects.all(), _project_audit),
+    'product_change': (lambda: ProductChangeHistory.objects.all(), _project_product_change),
+    'job_progress': (lambda: JobProgressUpdate.objects.select_related('job_vendor_stage'), _project_job_progress),
+}
+
+
+def project(source: str, rows: Iterable) -> int:
+    """Project the given source rows (idempotent); returns how many rows were written"""
+    entries = SOURCES[source][1](list(rows))
+    ActivityFeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def watermark(source: str) -> int:
+    """Highest projected source id (the starting cursor of a source never scanned before)"""
+    return ActivityFeedEntry.objects.filter(source=source).aggregate(top=Max('source_id'))['top'] or 0
+
+
+def get_cursor(source: str) -> int:
+    """Last source id scanned for ``source``"""
+    setting = SystemSetting.objects.filter(key=CURSOR_KEY.format(source=source)).first()
+    return int(setting.value) if setting and setting.value else watermark(source)
+
+
+def set_cursor(source: str, value: int) -> None:
+    SystemSetting.objects.update_or_create(
+        key=CURSOR_KEY.format(source=source),
+        defaults={'value': str(value), 'description': f'Last {source} row scanned into the activity feed'},
+    )
+
+
+def catch_up(max_batches: Optional[int] = None, replay: int = 0, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Project source rows after each source's cursor.
+
+    Args:
+        max_batches: Stop each source after this many batches (None = until caught up)
+        replay: Re-scan this many ids behind the cursor
+        batch_size: Source rows per batch
+    """
+    projected = {}
+    for source, (queryset, _) in SOURCES.items():
+        cursor = get_cursor(source)
+        position = max(cursor - replay, 0)
+        batches = projected[source] = 0
+        while max_batches is None or batches < max_batches:
+            rows = list(queryset().filter(pk__gt=position).order_by('pk')[:batch_size])
+            if not rows:
+                break
+            projected[source] += project(source, rows)
+            position = rows[-1].pk
+            batches += 1
+            if position > cursor:
+                cursor = position
+                set_cursor(source, cursor)
+            if len(rows) < batch_size:
+                break
+    return projected
+
+
+def schedule_catch_up() -> None:
+    """Queue a catch-up, at most once per ACTIVITY_FEED_CATCH_UP_SECONDS across processes"""
+    interval = getattr(settings, 'ACTIVITY_FEED_CATCH_UP_SECONDS', 5)
+    if not cache.add(CATCH_UP_LOCK_KEY, 1, interval):
+        return
+    try:
+        from clientapp.tasks import catch_up_activity_feed
+        catch_up_activity_feed.delay(replay=0)
+    except Exception as e:
+        # The periodic task picks the rows up
+        logger.warning(f"Could not queue activity feed catch-up: {e}")
+
+
+# ==================== Partitions ====================
+
+def _add_months(month: date, count: int) -> date:
+    months = month.year * 12 + month.month - 1 + count
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f'{ActivityFeedEntry._meta.db_table}_y{month.year}m{month.month:02d}'
+
+
+def _default_partition() -> str:
+    return f'{ActivityFeedEntry._meta.db_table}_default'
+
+
+def partitions() -> Dict[date, str]:
+    """Monthly partitions of the feed table, by month"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid '
+            'WHERE i.inhparent = %s::regclass',
+            [ActivityFeedEntry._meta.db_table],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    found = {}
+    for name in names:
+        match = _PARTITION_MONTH.search(name)
+        if match:
+            found[date(int(match.group(1)), int(match.group(2)), 1)] = name
+    return found
+
+
+def create_partition(month: date) -> None:
+    """Create ``month``'s partition, moving its rows out of the DEFAULT partition"""
+    quote = connection.ops.quote_name
+    table, default = quote(ActivityFeedEntry._meta.db_table), quote(_default_partition())
+    bounds = [month, _add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Hold off inserts that would land in the DEFAULT partition meanwhile
+        cursor.execute(f'LOCK TABLE {default} IN SHARE ROW EXCLUSIVE MODE')
+        cursor.execute(f'CREATE TEMPORARY TABLE activity_feed_moving (LIKE {table})')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM {default} WHERE month >= %s AND month < %s RETURNING *) '
+            f'INSERT INTO activity_feed_moving SELECT * FROM moved',
+            bounds,
+        )
+        cursor.execute(
+            f'CREATE TABLE {quote(_partition_name(month))} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)',
+            bounds,
+        )
+        cursor.execute(f'INSERT INTO {table} SELECT * FROM activity_feed_moving')
+        cursor.execute('DROP TABLE activity_feed_moving')
+
+
+def ensure_partitions(ahead: int = PARTITIONS_AHEAD) -> int:
+    """
+    Create partitions for this month, the next ``ahead`` months and every
+    month that has rows in the DEFAULT partition; returns partitions created
+    """
+    this_month = _month(timezone.now())
+    months = {_add_months(this_month, n) for n in range(ahead + 1)}
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT DISTINCT month FROM {connection.ops.quote_name(_default_partition())}')
+        months.update(row[0] for row in cursor.fetchall())
+    missing = sorted(months - set(partitions()))
+    for month in missing:
+        create_partition(month)
+    return len(missing)
+
+
+def prune(retention_months: int) -> int:
+    """Drop the partitions of months older than ``retention_months``; returns rows removed"""
+    cutoff = _add_months(_month(timezone.now()), -retention_months)
+    removed = 0
+    # Deferred foreign key checks still pending in this transaction would block the DROP
+    connection.check_constraints()
+    with connection.cursor() as cursor:
+        for month, name in sorted(partitions().items()):
+            if month >= cutoff:
+                break
+            cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(name)}')
+            removed += cursor.fetchone()[0]
+            cursor.execute(f'DROP TABLE {connection.ops.quote_name(name)}')
+    # Old rows not yet moved out of the DEFAULT partition
+    deleted, _ = ActivityFeedEntry.objects.filter(month__lt=cutoff).delete()
+    return removed + deleted
+
+
+# ==================== Reading ====================
+
+def encode_cursor(entry: ActivityFeedEntry) -> str:
+    return base64.urlsafe_b64encode(f'{entry.timestamp.isoformat()}|{entry.pk}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple:
+    try:
+        timestamp, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        parsed = parse_datetime(timestamp)
+        if parsed is None:
+            raise ValueError(timestamp)
+        return parsed, int(pk)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise InvalidCursor('Invalid cursor') from None
+
+
+def feed(
+    entity_type: str,
+    entity_id: int,
+    cursor: Optional[str] = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+    include_related: bool = True,
+) -> Tuple[List[ActivityFeedEntry], Optional[str]]:
+    """
+    One page of an entity's activity, newest first.
+
+    Args:
+        entity_type: e.g. 'client', 'job', 'quote', 'product'
+        entity_id: Entity primary key
+        cursor: next_cursor of the previous page
+        limit: Page size (max 200)
+        include_related: Merge in the activity of child entities (a client's quotes and jobs, a job's stages)
+
+    Returns:
+        (entries, next_cursor or None on the last page)
+
+    Raises:
+        InvalidCursor: The cursor could not be decoded
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    match = Q(entity_type=entity_type, entity_id=entity_id)
+    if include_related:
+        match |= Q(parent_type=entity_type, parent_id=entity_id)
+    entries = ActivityFeedEntry.objects.filter(match)
+    if cursor:
+        timestamp, pk = decode_cursor(cursor)
+        entries = entries.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, pk__lt=pk))
+
+    page = list(entries.select_related('actor').order_by('-timestamp', '-id')[:limit + 1])
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_cursor
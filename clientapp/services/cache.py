@@ -0,0 +1,229 @@
+"""
+Cache-aside layer over the shared Django cache
+Versioned namespaces for invalidation, with stampede protection
+(single-flight rebuild + probabilistic early refresh)
+"""
+import asyncio
+import hashlib
+import math
+import random
+import time
+from typing import Any, Callable, Iterable, Optional
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+DEFAULT_TIMEOUT = 300
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+
+# Namespaces used by the catalog/config read paths. Bumping a namespace
+# orphans every key built under it; the orphans age out via their TTL.
+CATALOG = 'catalog'
+TURNAROUND = 'turnaround'
+SHIPPING = 'shipping'
+TAX = 'tax'
+PROMOTIONS = 'promotions'
+CHATBOT = 'chatbot'
+ROLES = 'roles'
+JOB_DETAIL = 'job-detail'
+
+
+def _version_key(namespace: str) -> str:
+    return f'cache-ns:{namespace}'
+
+
+def namespace_version(namespace: str) -> int:
+    """
+    Current version of a namespace.
+
+    Seeded from the clock rather than 1, so a version key that was evicted
+    never comes back at a value whose old entries are still cached.
+    """
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_namespace(*namespaces: str) -> None:
+    """Invalidate every key in the given namespaces"""
+    for namespace in namespaces:
+        key = _version_key(namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def make_key(namespace: str, *parts: Any) -> str:
+    """Build a versioned cache key for ``parts`` under ``namespace``"""
+    suffix = ':'.join(str(part) for part in parts)
+    # Keep keys memcached-safe (<250 chars, no whitespace)
+    if len(suffix) > 150 or any(c.isspace() for c in suffix):
+        suffix = hashlib.sha1(suffix.encode()).hexdigest()
+    return f'{namespace}:v{namespace_version(namespace)}:{suffix}'
+
+
+def get_or_set(
+    namespace: str,
+    key_parts: Iterable[Any],
+    builder: Callable[[], Any],
+    timeout: int = DEFAULT_TIMEOUT,
+    beta: float = 1.0,
+) -> Any:
+    """
+    Cache-aside read.
+
+    Returns the cached value for ``key_parts`` or builds it with ``builder``.
+    Only one caller rebuilds a missing key at a time (the others wait for the
+    result instead of all hitting the database), and a hot key is refreshed
+    slightly before it expires with probability rising towards expiry
+    (XFetch), so it rarely goes missing under load at all.
+
+    Args:
+        namespace: Invalidation namespace (see bump_namespace)
+        key_parts: Values that identify the entry within the namespace
+        builder: Zero-argument callable producing the value
+        timeout: TTL in seconds
+        beta: Early-refresh aggressiveness; 0 disables early refresh
+
+    Returns:
+        The cached or freshly built value
+    """
+    key = make_key(namespace, *key_parts)
+    envelope = cache.get(key)
+
+    if envelope is not None:
+        value, delta, expires_at = envelope
+        early = beta > 0 and time.time() - delta * beta * math.log(random.random() or 1e-12) >= expires_at
+        if not early:
+            return value
+        # Someone else is already refreshing - keep serving the current value
+        if not cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+            return value
+        return _build(key, builder, timeout, locked=True)
+
+    if cache.add(f'{key}:lock', 1, LOCK_TIMEOUT):
+        return _build(key, builder, timeout, locked=True)
+
+    # Another process is building this key: wait for it rather than stampede
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        envelope = cache.get(key)
+        if envelope is not None:
+            return envelope[0]
+        if cache.get(f'{key}:lock') is None:
+            break
+    return _build(key, builder, timeout, locked=False)
+
+
+def _build(key: str, builder: Callable[[], Any], timeout: int, locked: bool) -> Any:
+    start = time.time()
+    try:
+        value = builder()
+        # None means "nothing cacheable" - leave the key empty
+        if value is not None:
+            delta = time.time() - start
+            cache.set(key, (value, delta, time.time() + timeout), timeout)
+        return value
+    finally:
+        if locked:
+            cache.delete(f'{key}:lock')
+
+
+# ==================== Async ====================
+# The same entries, read from async code (WebSocket consumers) with the
+# cache's async API; only a miss leaves the event loop to run the builder.
+
+async def anamespace_version(namespace: str) -> int:
+    key = _version_key(namespace)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, int(time.time() * 1000), None)
+        version = await cache.aget(key)
+    return version
+
+
+async def amake_key(namespace: str, *parts: Any) -> str:
+    suffix = ':'.join(str(part) for part in parts)
+    if len(suffix) > 150 or any(c.isspace() for c in suffix):
+        suffix = hashlib.sha1(suffix.encode()).hexdigest()
+    return f'{namespace}:v{await anamespace_version(namespace)}:{suffix}'
+
+
+async def aget_or_set(
+    namespace: str,
+    key_parts: Iterable[Any],
+    builder: Callable[[], Any],
+    timeout: int = DEFAULT_TIMEOUT,
+) -> Any:
+    """
+    Async get_or_set. ``builder`` is synchronous (it usually queries the
+    database) and runs in the sync executor, single-flight like get_or_set.
+    """
+    key = await amake_key(namespace, *key_parts)
+    envelope = await cache.aget(key)
+    if envelope is not None:
+        return envelope[0]
+
+    if not await cache.aadd(f'{key}:lock', 1, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            envelope = await cache.aget(key)
+            if envelope is not None:
+                return envelope[0]
+            if await cache.aget(f'{key}:lock') is None:
+                break
+        return await sync_to_async(_build)(key, builder, timeout, locked=False)
+    return await sync_to_async(_build)(key, builder, timeout, locked=True)
+
+
+class CachedReadMixin:
+    """
+    Cache list/retrieve responses of a read-only, user-independent ViewSet.
+
+    Set ``cache_namespace`` to the namespace whose bump should invalidate the
+    responses. Keys include the absolute URL with query string, so filtered,
+    searched and paginated variants (and absolute media URLs) are cached
+    separately.
+    """
+    cache_namespace: Optional[str] = None
+    cache_timeout = DEFAULT_TIMEOUT
+
+    def _cached_response(self, request, handler, *args, **kwargs):
+        if request.method != 'GET' or not self.cache_namespace:
+            return handler(request, *args, **kwargs)
+
+        uncacheable = []
+
+        def build():
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                uncacheable.append(response)
+                return None
+            return response.data
+
+        data = get_or_set(
+            self.cache_namespace,
+            (type(self).__name__, self.action, request.build_absolute_uri()),
+            build,
+            timeout=self.cache_timeout,
+        )
+        if uncacheable:
+            return uncacheable[0]
+        if data is None:
+            return handler(request, *args, **kwargs)
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(request, super().retrieve, *args, **kwargs)
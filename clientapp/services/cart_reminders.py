@@ -0,0 +1,235 @@
+"""
+Abandoned Cart Campaigns
+Marks stale carts abandoned with one set-based UPDATE and emails their
+owners in rate-limited batches.
+
+The reminder is rendered once per run with Mailgun recipient variables
+(%recipient.first_name% ...) in place of the personal fields. With the
+Mailgun API configured, each chunk is one batch-send request; otherwise the
+placeholders are filled in locally and the chunk goes out over a single
+reused SMTP connection. Carts are claimed (reminder_sent_at) and the
+campaign checkpoint advanced before a chunk is sent, so a run that dies
+part-way is resumed without emailing anyone twice.
+"""
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import requests
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.html import escape, strip_tags
+
+from ..models import AbandonedCartCampaign, Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = 'emails/abandoned_cart.html'
+RECIPIENT_FIELDS = ('first_name', 'items', 'subtotal', 'currency', 'cart_link')
+# Mailgun accepts at most 1000 recipients per batch request
+MAX_CHUNK_SIZE = 1000
+DEFAULT_CHUNK_SIZE = 500
+MAX_ITEMS_LISTED = 5
+
+
+def abandoned_carts(hours_threshold: int = 24):
+    """Active carts with items that have not been touched for ``hours_threshold`` hours"""
+    threshold_time = timezone.now() - timezone.timedelta(hours=hours_threshold)
+    return Cart.objects.filter(
+        is_active=True,
+        is_abandoned=False,
+        updated_at__lt=threshold_time,
+    ).filter(Exists(CartItem.objects.filter(cart=OuterRef('pk'))))
+
+
+def mark_abandoned(hours_threshold: int = 24) -> int:
+    """Flag every abandoned cart in one UPDATE (updated_at is left alone)"""
+    return abandoned_carts(hours_threshold).update(is_abandoned=True)
+
+
+# ==================== Rendering ====================
+
+def render_reminder() -> Tuple[str, str, str]:
+    """Subject, HTML and text of the reminder, with recipient-variable placeholders"""
+    context = {field: f'%recipient.{field}%' for field in RECIPIENT_FIELDS}
+    context.update({
+        'company_name': settings.COMPANY_NAME,
+        'company_email': settings.COMPANY_EMAIL,
+        'company_phone': settings.COMPANY_PHONE,
+    })
+    html = render_to_string(TEMPLATE, context)
+    return f"You left something in your cart at {settings.COMPANY_NAME}", html, strip_tags(html)
+
+
+def personalize(body: str, variables: Dict[str, str]) -> str:
+    for field in RECIPIENT_FIELDS:
+        body = body.replace(f'%recipient.{field}%', variables[field])
+    return body
+
+
+def recipients_for(cart_ids: List[int]) -> Dict[str, Dict[str, str]]:
+    """
+    Recipient variables per email address for the given carts (two queries).
+    Values are HTML-escaped, since they are substituted into the HTML body.
+    """
+    items = defaultdict(list)
+    for cart_id, name, quantity, line_total in CartItem.objects.filter(cart_id__in=cart_ids).order_by('pk').values_list(
+        'cart_id', 'product_name', 'quantity', 'line_total'
+    ):
+        items[cart_id].append((name, quantity, line_total))
+
+    recipients = {}
+    carts = Cart.objects.filter(pk__in=cart_ids).exclude(customer__email='').values_list(
+        'pk', 'customer__email', 'customer__first_name', 'customer__preferred_currency'
+    )
+    for cart_id, email, first_name, currency in carts:
+        lines = items.get(cart_id)
+        if not email or not lines:
+            continue
+        summary = ', '.join(f'{quantity} x {name}' for name, quantity, _ in lines[:MAX_ITEMS_LISTED])
+        if len(lines) > MAX_ITEMS_LISTED:
+            summary += f' and {len(lines) - MAX_ITEMS_LISTED} more'
+        # One reminder per address even if it owns several abandoned carts
+        recipients[email] = {
+            'first_name': escape(first_name or 'there'),
+            'items': escape(summary),
+            'subtotal': escape(f'{sum(total for _, _, total in lines):,.2f}'),
+            'currency': escape(currency or 'KES'),
+            'cart_link': escape(f'{settings.STOREFRONT_URL}/cart'),
+        }
+    return recipients
+
+
+# ==================== Sending ====================
+
+def _mailgun_configured() -> bool:
+    return bool(getattr(settings, 'MAILGUN_API_KEY', '') and getattr(settings, 'MAILGUN_DOMAIN', ''))
+
+
+def send_batch(recipients: Dict[str, Dict[str, str]], subject: str, html: str, text: str, connection=None) -> int:
+    """Send one reminder per recipient; returns how many were accepted"""
+    if not recipients:
+        return 0
+
+    if _mailgun_configured():
+        response = requests.post(
+            f'https://api.mailgun.net/v3/{settings.MAILGUN_DOMAIN}/messages',
+            auth=('api', settings.MAILGUN_API_KEY),
+            data={
+                'from': settings.DEFAULT_FROM_EMAIL,
+                'to': list(recipients),
+                'subject': subject,
+                'html': html,
+                'text': text,
+                'recipient-variables': json.dumps(recipients),
+                'o:tag': 'abandoned-cart',
+            },
+            timeout=30,
+        )
+        response.raise_for_status()
+        return len(recipients)
+
+    messages = []
+    for email, variables in recipients.items():
+        message = EmailMultiAlternatives(
+            subject=subject,
+            body=personalize(text, variables),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
+            connection=connection,
+        )
+        message.attach_alternative(personalize(html, variables), 'text/html')
+        messages.append(message)
+    return (connection or get_connection()).send_messages(messages) or 0
+
+
+# ==================== Campaign runner ====================
+
+def _claim_chunk(campaign: AbandonedCartCampaign, chunk_size: int) -> List[int]:
+    """Claim the next carts after the checkpoint and advance it, in one transaction"""
+    with transaction.atomic():
+        cart_ids = list(
+            Cart.objects.filter(
+                is_active=True,
+                is_abandoned=True,
+                reminder_sent_at__isnull=True,
+                customer__isnull=False,
+                pk__gt=campaign.last_cart_id,
+            )
+            .order_by('pk')
+            .select_for_update(skip_locked=True)
+            .values_list('pk', flat=True)[:chunk_size]
+        )
+        if cart_ids:
+            Cart.objects.filter(pk__in=cart_ids).update(reminder_sent_at=timezone.now())
+            campaign.last_cart_id = cart_ids[-1]
+            AbandonedCartCampaign.objects.filter(pk=campaign.pk).update(last_cart_id=cart_ids[-1])
+    return cart_ids
+
+
+def run_campaign(hours_threshold: int = 24, chunk_size: int = None, rate_per_minute: int = None) -> Dict[str, int]:
+    """
+    Mark abandoned carts and send their reminders, resuming an unfinished
+    run if there is one.
+
+    Args:
+        hours_threshold: Idle hours before a cart counts as abandoned
+        chunk_size: Carts per batch (max 1000)
+        rate_per_minute: Email rate limit (0 = unlimited)
+
+    Returns:
+        {"campaign_id", "marked", "sent", "failed"} for this invocation
+    """
+    chunk_size = min(chunk_size or getattr(settings, 'ABANDONED_CART_BATCH_SIZE', DEFAULT_CHUNK_SIZE), MAX_CHUNK_SIZE)
+    if rate_per_minute is None:
+        rate_per_minute = getattr(settings, 'ABANDONED_CART_EMAILS_PER_MINUTE', 0)
+
+    campaign = AbandonedCartCampaign.objects.filter(status='running').order_by('started_at').first()
+    if campaign is None:
+        campaign = AbandonedCartCampaign.objects.create(threshold_hours=hours_threshold)
+    else:
+        logger.info(f"Resuming abandoned cart campaign {campaign.pk} after cart {campaign.last_cart_id}")
+
+    stats = {'campaign_id': campaign.pk, 'marked': mark_abandoned(campaign.threshold_hours), 'sent': 0, 'failed': 0}
+    AbandonedCartCampaign.objects.filter(pk=campaign.pk).update(marked_count=F('marked_count') + stats['marked'])
+
+    subject, html, text = render_reminder()
+    connection = None if _mailgun_configured() else get_connection()
+    try:
+        while True:
+            started = time.monotonic()
+            cart_ids = _claim_chunk(campaign, chunk_size)
+            if not cart_ids:
+                break
+
+            recipients = recipients_for(cart_ids)
+            try:
+                sent = send_batch(recipients, subject, html, text, connection=connection)
+            except Exception as e:
+                # Claimed carts are not retried - a partial send must not repeat
+                logger.error(f"Abandoned cart batch after cart {cart_ids[0]} failed: {e}")
+                sent = 0
+            failed = len(recipients) - sent
+            stats['sent'] += sent
+            stats['failed'] += failed
+            AbandonedCartCampaign.objects.filter(pk=campaign.pk).update(
+                sent_count=F('sent_count') + sent,
+                failed_count=F('failed_count') + failed,
+            )
+
+            if rate_per_minute and recipients:
+                pause = len(recipients) * 60 / rate_per_minute - (time.monotonic() - started)
+                if pause > 0:
+                    time.sleep(pause)
+    finally:
+        if connection is not None:
+            connection.close()
+
+    AbandonedCartCampaign.objects.filter(pk=campaign.pk).update(status='completed', finished_at=timezone.now())
+    return stats
@@ -0,0 +1,245 @@
+"""
+Storefront Catalog Snapshot - HTTP validators and pre-rendered catalog
+ETag/Last-Modified for the public catalog endpoints (CatalogValidatorsMixin),
+plus a pre-compressed JSON snapshot of the whole catalog served with
+static-file semantics
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Dict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, parse_etags
+from django.views.decorators.http import condition
+
+from . import cache as catalog_cache
+
+try:
+    import brotli
+except ImportError:  # brotli is optional - gzip is always produced
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_NAME = 'catalog.json'
+SNAPSHOT_PENDING_KEY = 'catalog-snapshot:pending'
+CATALOG_CACHE_CONTROL = 'public, max-age=60, stale-while-revalidate=600'
+
+# Encodings in order of preference: (Accept-Encoding token, file suffix)
+_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def snapshot_dir() -> Path:
+    return Path(getattr(settings, 'STOREFRONT_SNAPSHOT_DIR', Path(settings.MEDIA_ROOT) / 'storefront'))
+
+
+def catalog_state() -> Dict[str, Any]:
+    """
+    Catalog version counter and newest StorefrontProduct.updated_at.
+
+    Cached under the catalog namespace, so it costs one aggregate query per
+    catalog change rather than one per request.
+    """
+    from ..models import StorefrontProduct
+
+    def build():
+        state = StorefrontProduct.objects.aggregate(
+            last_modified=Max('updated_at'),
+            visible=Count('id', filter=Q(storefront_visible=True)),
+        )
+        state['version'] = catalog_cache.namespace_version(catalog_cache.CATALOG)
+        return state
+
+    return catalog_cache.get_or_set(catalog_cache.CATALOG, ('state',), build, timeout=300)
+
+
+def catalog_etag(request, *args, **kwargs) -> str:
+    """ETag for a catalog response - changes with the catalog and the query"""
+    state = catalog_state()
+    raw = f"{state['version']}:{state['last_modified']}:{state['visible']}:{request.get_full_path()}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def catalog_last_modified(request, *args, **kwargs):
+    """
+    The later of the newest StorefrontProduct edit and the moment the current
+    catalog version was first seen. Deletions and Product edits bump the
+    version without moving updated_at, and an If-Modified-Since-only client
+    must not get a 304 for them. Rounded up to the next second, the
+    precision of the header.
+    """
+    state = catalog_state()
+    key = catalog_cache.make_key(catalog_cache.CATALOG, 'changed_at')
+    cache.add(key, timezone.now().replace(microsecond=0) + timedelta(seconds=1), None)
+    changed_at = cache.get(key)
+    return max(filter(None, (state['last_modified'], changed_at)), default=None)
+
+
+class CatalogValidatorsMixin:
+    """
+    Conditional GETs for a public catalog ViewSet: list/retrieve answer
+    If-None-Match/If-Modified-Since from the cached catalog state before the
+    queryset is built or evaluated, and reads carry CATALOG_CACHE_CONTROL.
+    Put it before CachedReadMixin so a 304 skips the response cache too.
+    """
+
+    @method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+            response['Cache-Control'] = CATALOG_CACHE_CONTROL
+            patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+
+def build_snapshot() -> Path:
+    """
+    Render every visible StorefrontProduct to catalog.json, with .gz (and
+    .br when brotli is installed) variants. Files are written to temp files
+    and renamed into place so readers never see a partial snapshot.
+
+    Returns:
+        Path of the uncompressed snapshot
+    """
+    from ..models import StorefrontProduct
+    from ..storefront_serializers import StorefrontProductSerializer
+
+    products = StorefrontProduct.objects.filter(storefront_visible=True).order_by('sort_order', '-featured', 'name')
+    results = StorefrontProductSerializer(products, many=True).data
+    payload = json.dumps(
+        {
+            'generated_at': timezone.now().isoformat(),
+            'count': len(results),
+            'results': results,
+        },
+        cls=DjangoJSONEncoder,
+        separators=(',', ':'),
+    ).encode()
+
+    target_dir = snapshot_dir()
+    target_dir.mkdir(parents=True, exist_ok=True)
+    target = target_dir / SNAPSHOT_NAME
+
+    variants = {'': payload, '.gz': gzip.compress(payload, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['.br'] = brotli.compress(payload, quality=11)
+
+    for suffix, content in variants.items():
+        _atomic_write(target.with_name(SNAPSHOT_NAME + suffix), content)
+
+    stale_br = target.with_name(SNAPSHOT_NAME + '.br')
+    if brotli is None and stale_br.exists():
+        stale_br.unlink()
+
+    logger.info(f"Catalog snapshot rebuilt: {len(results)} products, {len(payload)} bytes")
+    return target
+
+
+def _atomic_write(path: Path, content: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def schedule_snapshot_rebuild() -> None:
+    """
+    Queue a snapshot rebuild, falling back to an inline rebuild without a
+    worker. Changes arriving while a rebuild is still queued are coalesced
+    into it (the task clears the pending flag before reading the catalog).
+    """
+    if not cache.add(SNAPSHOT_PENDING_KEY, 1, 300):
+        return
+    try:
+        from ..tasks import regenerate_catalog_snapshot
+        regenerate_catalog_snapshot.delay()
+    except Exception as e:
+        logger.warning(f"Could not queue catalog snapshot rebuild, rebuilding inline: {e}")
+        cache.delete(SNAPSHOT_PENDING_KEY)
+        try:
+            build_snapshot()
+        except Exception as build_error:
+            logger.error(f"Catalog snapshot rebuild failed: {build_error}")
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding as {coding: q}; codings with q=0 are refused"""
+    accepted = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def serve_snapshot(request):
+    """
+    Serve the snapshot the way WhiteNoise serves static files: pick the best
+    pre-compressed variant for Accept-Encoding, stat-based ETag and
+    Last-Modified, 304 on a matching If-None-Match, and a shared Cache-Control.
+    """
+    base = snapshot_dir() / SNAPSHOT_NAME
+    if not base.exists():
+        build_snapshot()
+
+    path, encoding = base, None
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    weights = {token: accepted.get(token, accepted.get('*', 0.0)) for token, _ in _ENCODINGS}
+    # Highest q wins; the sort is stable, so ties keep the preference order
+    for token, suffix in sorted(_ENCODINGS, key=lambda e: -weights[e[0]]):
+        candidate = base.with_name(SNAPSHOT_NAME + suffix)
+        if weights[token] > 0 and candidate.exists():
+            path, encoding = candidate, token
+            break
+
+    stat = path.stat()
+    etag = f'"{int(stat.st_mtime_ns):x}-{stat.st_size:x}"'
+
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(path, 'rb'), content_type='application/json')
+        response['Content-Length'] = str(stat.st_size)
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = CATALOG_CACHE_CONTROL
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
@@ -0,0 +1,243 @@
+"""
+Chatbot Intent Matching and FAQ Retrieval
+Both are compiled once per process and reused until chatbot content changes.
+
+Intents: every keyword of an intent table (plus the admin-editable
+ChatbotIntentKeyword rows) goes into one regex alternation with word
+boundaries, longest phrase first, so a message is scanned once instead of
+once per keyword. Each match adds its weight to the intents it belongs to.
+
+Retrieval: a BM25 index over the built-in FAQs, active ProductFAQs and
+visible StorefrontProducts, held as an inverted index so a query only
+touches the postings of its own terms.
+
+Both are keyed by the 'chatbot' cache namespace version, which the
+storefront signals bump when any of those models change.
+"""
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from ..models import ChatbotIntentKeyword, ProductFAQ, StorefrontProduct
+from . import cache as chatbot_cache
+
+# Answers that do not live in the database
+BUILTIN_FAQS = [
+    {
+        'id': 'turnaround',
+        'question': 'How long is the turnaround time? How long does printing take?',
+        'answer': "We offer 3 turnaround options:\n• Standard: 7 days\n• Rush: 3 days (+1000 KES/item)\n• Expedited: 1 day (+2500 KES/item)",
+    },
+    {
+        'id': 'payment',
+        'question': 'What payment options and payment terms do you accept?',
+        'answer': "We accept: Prepaid, Net 7/15/30 days, Bank transfer, Card, M-Pesa",
+    },
+    {
+        'id': 'delivery',
+        'question': 'Do you offer delivery or shipping? Courier or pickup?',
+        'answer': "We offer: Pickup, Courier (Nairobi), Courier (Nationwide)",
+    },
+    {
+        'id': 'minimum',
+        'question': 'What is the minimum order quantity?',
+        'answer': "Minimum order depends on product. Most products start at 100 units.",
+    },
+    {
+        'id': 'customization',
+        'question': 'Can I customize products or order custom designs?',
+        'answer': "Most of our products are fully customizable. Contact sales for special requirements.",
+    },
+]
+
+STOPWORDS = frozenset(
+    'a an and are as at be by can could do does for from have how i if in is it its me my of on or our '
+    's so that the their them there this to was we what when where which who why will with would you your'.split()
+)
+_TOKEN = re.compile(r'[a-z0-9]+')
+
+# BM25 parameters and the score below which a hit is not an answer
+K1 = 1.5
+B = 0.75
+MIN_SCORE = 1.0
+
+_lock = threading.Lock()
+_matchers: Dict[str, Tuple[int, 'IntentMatcher']] = {}
+_index: Optional[Tuple[int, 'RetrievalIndex']] = None
+
+
+def invalidate() -> None:
+    """Recompile matchers and the retrieval index in every process"""
+    chatbot_cache.bump_namespace(chatbot_cache.CHATBOT)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase terms without stopwords, plural 's' stripped"""
+    terms = []
+    for term in _TOKEN.findall(text.lower()):
+        if term in STOPWORDS:
+            continue
+        if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+# ==================== Intents ====================
+
+class IntentMatcher:
+    """
+    One intent table compiled into a single regex.
+
+    Ties between intents go to the one listed first, so table order doubles
+    as priority.
+    """
+
+    def __init__(self, table: Dict[str, Iterable[Tuple[str, int]]]):
+        self.priority = {intent: position for position, intent in enumerate(table)}
+        # normalized keyword -> [(intent, weight)]
+        self.keywords: Dict[str, List[Tuple[str, int]]] = defaultdict(list)
+        for intent, keywords in table.items():
+            for keyword, weight in keywords:
+                keyword = ' '.join(keyword.lower().split())
+                if keyword:
+                    self.keywords[keyword].append((intent, weight))
+
+        self.pattern = None
+        if self.keywords:
+            # Longest first: 'place order' is taken whole rather than as 'order'
+            alternation = '|'.join(
+                re.escape(keyword).replace(r'\ ', r'\s+')
+                for keyword in sorted(self.keywords, key=len, reverse=True)
+            )
+            self.pattern = re.compile(rf'(?<!\w)(?:{alternation})(?!\w)')
+
+    def scores(self, message: str) -> Dict[str, int]:
+        scores: Dict[str, int] = defaultdict(int)
+        if self.pattern is None:
+            return scores
+        for match in self.pattern.finditer(message.lower()):
+            for intent, weight in self.keywords[' '.join(match.group().split())]:
+                scores[intent] += weight
+        return scores
+
+    def best(self, message: str, default: str = 'general') -> str:
+        scores = self.scores(message)
+        if not scores:
+            return default
+        return max(scores, key=lambda intent: (scores[intent], -self.priority[intent]))
+
+
+def intent_matcher(name: str, builtin: Dict[str, Iterable[str]]) -> IntentMatcher:
+    """
+    Compiled matcher for the intent table ``builtin`` (cached under ``name``),
+    with the active admin keywords of the same intents merged in
+    """
+    version = chatbot_cache.namespace_version(chatbot_cache.CHATBOT)
+    with _lock:
+        cached = _matchers.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    table = {intent: [(keyword, 1) for keyword in keywords] for intent, keywords in builtin.items()}
+    extra = ChatbotIntentKeyword.objects.filter(is_active=True, intent__in=list(table)).values_list(
+        'intent', 'keyword', 'weight'
+    )
+    for intent, keyword, weight in extra:
+        table[intent].append((keyword, weight))
+    matcher = IntentMatcher(table)
+
+    with _lock:
+        _matchers[name] = (version, matcher)
+    return matcher
+
+
+# ==================== Retrieval ====================
+
+class RetrievalIndex:
+    """BM25 over documents ``{kind, id, title, text, answer}``; titles count twice"""
+
+    def __init__(self, documents: List[Dict]):
+        self.documents = documents
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self.lengths = []
+        for position, document in enumerate(documents):
+            terms = tokenize(document['title']) * 2 + tokenize(document['text'])
+            self.lengths.append(len(terms))
+            for term, frequency in Counter(terms).items():
+                self.postings[term].append((position, frequency))
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1.0
+        count = len(documents)
+        self.idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(
+        self,
+        query: str,
+        limit: int = 3,
+        kinds: Optional[Iterable[str]] = None,
+        min_score: float = MIN_SCORE,
+    ) -> List[Dict]:
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for position, frequency in self.postings[term]:
+                norm = frequency + K1 * (1 - B + B * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (K1 + 1) / norm
+
+        kinds = set(kinds) if kinds else None
+        candidates = (
+            position for position, score in scores.items()
+            if score >= min_score and (kinds is None or self.documents[position]['kind'] in kinds)
+        )
+        return [
+            {**self.documents[position], 'score': round(scores[position], 4)}
+            for position in heapq.nlargest(limit, candidates, key=scores.get)
+        ]
+
+
+def _documents() -> List[Dict]:
+    documents = [
+        {'kind': 'faq', 'id': faq['id'], 'title': faq['question'], 'text': faq['answer'], 'answer': faq['answer']}
+        for faq in BUILTIN_FAQS
+    ]
+    faqs = ProductFAQ.objects.filter(is_active=True).values_list('pk', 'question', 'answer', 'product__name')
+    for pk, question, answer, product_name in faqs:
+        documents.append({
+            'kind': 'faq', 'id': pk, 'title': question, 'text': f'{answer} {product_name}', 'answer': answer,
+        })
+    products = StorefrontProduct.objects.filter(storefront_visible=True).values_list(
+        'product_id', 'name', 'description_short', 'category'
+    )
+    for product_id, name, description, category in products:
+        documents.append({
+            'kind': 'product', 'id': product_id, 'title': name, 'text': f'{description} {category}',
+            'answer': f'{name}: {description}' if description else name,
+        })
+    return documents
+
+
+def retrieval_index() -> RetrievalIndex:
+    global _index
+    version = chatbot_cache.namespace_version(chatbot_cache.CHATBOT)
+    with _lock:
+        cached = _index
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    index = RetrievalIndex(_documents())
+    with _lock:
+        _index = (version, index)
+    return index
+
+
+def search(query: str, limit: int = 3, kinds: Optional[Iterable[str]] = None) -> List[Dict]:
+    """Best FAQ/product matches for ``query``, best first"""
+    return retrieval_index().search(query, limit=limit, kinds=kinds)
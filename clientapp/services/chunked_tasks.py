@@ -0,0 +1,213 @@
+"""
+Chunked Periodic Tasks
+Periodic jobs walk their table in bounded primary-key chunks instead of
+looping over a whole queryset inside one task invocation.
+
+start() opens a run (or resumes the open one) and plans it: keyset
+pagination over the job's queryset finds the key closing every chunk_size
+rows, and each range becomes a ChunkedTaskChunk. Every chunk is its own
+Celery task (tasks.run_task_chunk, sent to the job's queue); at most
+max_concurrency are queued or running at once and each finished chunk
+queues the next. Inside a chunk, rows are processed batch_size at a time
+and each batch commits together with the chunk's checkpoint (last_pk) and
+counters, so a chunk killed by the time limit or a crash resumes after its
+last committed batch. A chunk that raises goes back in line for the same
+run until it has been tried MAX_ATTEMPTS times; start() re-queues chunks
+that went quiet for longer than the task time limit.
+
+Jobs are declared with @register in services.periodic_jobs.
+"""
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Max, QuerySet
+from django.utils import timezone
+
+from ..models import ChunkedTaskChunk, ChunkedTaskRun
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_CONCURRENCY = 4
+DEFAULT_QUEUE = 'reports'
+MAX_ATTEMPTS = 3
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+@dataclass(frozen=True)
+class ChunkedJob:
+    name: str
+    queryset: Callable[[], QuerySet]
+    process: Callable[[List], Dict[str, int]]
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    batch_size: int = DEFAULT_BATCH_SIZE
+    max_concurrency: int = DEFAULT_CONCURRENCY
+    queue: str = DEFAULT_QUEUE
+
+
+JOBS: Dict[str, ChunkedJob] = {}
+
+
+def register(name: str, queryset: Callable[[], QuerySet], **options):
+    """Register ``process(rows) -> counters`` as the chunked job ``name`` over ``queryset()``"""
+    def decorator(process):
+        JOBS[name] = ChunkedJob(name, queryset, process, **options)
+        return process
+    return decorator
+
+
+def get_job(name: str) -> ChunkedJob:
+    from . import periodic_jobs  # noqa: F401 - registers the jobs
+    return JOBS[name]
+
+
+def _stale_before():
+    # A chunk silent for longer than the hard time limit has lost its worker
+    return timezone.now() - timedelta(seconds=getattr(settings, 'CELERY_TASK_TIME_LIMIT', 30 * 60) + 60)
+
+
+def _chunk_task():
+    try:
+        from ..tasks import run_task_chunk
+    except ImportError:
+        return None
+    return run_task_chunk
+
+
+# ==================== Planning ====================
+
+def plan(run: ChunkedTaskRun, job: ChunkedJob) -> int:
+    """Split the job's rows into (start_pk, end_pk] ranges of chunk_size rows; returns chunks created"""
+    keys = job.queryset().order_by('pk').values_list('pk', flat=True)
+    chunks, lower = [], 0
+    while True:
+        upper = next(iter(keys.filter(pk__gt=lower)[job.chunk_size - 1:job.chunk_size]), None)
+        if upper is None:
+            upper = job.queryset().filter(pk__gt=lower).aggregate(top=Max('pk'))['top']
+        if upper is None:
+            break
+        chunks.append(ChunkedTaskChunk(run=run, index=len(chunks), start_pk=lower, end_pk=upper, last_pk=lower))
+        lower = upper
+    ChunkedTaskChunk.objects.bulk_create(chunks, batch_size=1000)
+    return len(chunks)
+
+
+def start(name: str, inline: bool = False) -> Dict:
+    """
+    Start the job ``name`` or resume its unfinished run.
+
+    Chunks are handed to Celery unless ``inline`` (or Celery is missing), in
+    which case they are processed one after another in this process.
+    """
+    job = get_job(name)
+    with transaction.atomic():
+        run = ChunkedTaskRun.objects.select_for_update().filter(name=name, status='running').first()
+        resumed = run is not None
+        if resumed:
+            run.chunks.filter(status='failed', attempts__lt=MAX_ATTEMPTS).update(status='pending')
+            run.chunks.filter(status__in=ACTIVE_STATUSES, updated_at__lt=_stale_before()).update(status='pending')
+        else:
+            run = ChunkedTaskRun.objects.create(name=name)
+            run.chunk_count = plan(run, job)
+            run.save(update_fields=['chunk_count'])
+
+    summary = {'run': run.pk, 'resumed': resumed, 'chunks': run.chunk_count}
+    if inline or _chunk_task() is None:
+        # Re-read after every chunk: a chunk that failed is pending again until its attempts run out
+        while True:
+            chunk_id = run.chunks.filter(status='pending').order_by('index').values_list('pk', flat=True).first()
+            if chunk_id is None:
+                break
+            run_chunk(chunk_id, advance=False)
+        finish(run)
+        run.refresh_from_db()
+        return dict(summary, rows=run.rows, metrics=run.metrics, failed_chunks=run.failed_chunks, completed=run.status == 'completed')
+    return dict(summary, queued=len(fill(run, job)))
+
+
+# ==================== Execution ====================
+
+def fill(run: ChunkedTaskRun, job: ChunkedJob) -> List[int]:
+    """Queue pending chunks up to the job's concurrency cap; finishes the run when none are left"""
+    with transaction.atomic():
+        # Serializes chunks finishing at the same moment
+        ChunkedTaskRun.objects.select_for_update().filter(pk=run.pk).first()
+        active = run.chunks.filter(status__in=ACTIVE_STATUSES).count()
+        slots = max(job.max_concurrency - active, 0)
+        chunk_ids = list(run.chunks.filter(status='pending').order_by('index').values_list('pk', flat=True)[:slots])
+        if chunk_ids:
+            ChunkedTaskChunk.objects.filter(pk__in=chunk_ids).update(status='queued', updated_at=timezone.now())
+            task = _chunk_task()
+            transaction.on_commit(lambda: [task.apply_async((chunk_id,), queue=job.queue) for chunk_id in chunk_ids])
+    if not chunk_ids and not active:
+        finish(run)
+    return chunk_ids
+
+
+def run_chunk(chunk_id: int, advance: bool = True) -> Optional[Dict]:
+    """
+    Process one chunk from its checkpoint, a batch per transaction.
+    Returns the chunk's metrics, or None if it was already claimed or finished.
+    """
+    claimed = ChunkedTaskChunk.objects.filter(pk=chunk_id, status__in=('pending', 'queued')).update(
+        status='running', attempts=F('attempts') + 1, updated_at=timezone.now(),
+    )
+    if not claimed:
+        return None
+    chunk = ChunkedTaskChunk.objects.select_related('run').get(pk=chunk_id)
+    job = get_job(chunk.run.name)
+    counters = Counter(chunk.metrics)
+    elapsed_before, started = chunk.duration_ms, time.monotonic()
+
+    try:
+        while True:
+            rows = list(job.queryset().filter(pk__gt=chunk.last_pk, pk__lte=chunk.end_pk).order_by('pk')[:job.batch_size])
+            if not rows:
+                break
+            with transaction.atomic():
+                counters.update(job.process(rows) or {})
+                chunk.last_pk = rows[-1].pk
+                chunk.rows += len(rows)
+                chunk.metrics = dict(counters)
+                chunk.duration_ms = elapsed_before + int((time.monotonic() - started) * 1000)
+                chunk.save(update_fields=['last_pk', 'rows', 'metrics', 'duration_ms', 'updated_at'])
+        chunk.status, chunk.error = 'done', ''
+    except Exception as exc:
+        retry = chunk.attempts < MAX_ATTEMPTS
+        logger.error(f"{job.name} chunk {chunk.index} failed after pk {chunk.last_pk} "
+                     f"(attempt {chunk.attempts}/{MAX_ATTEMPTS}{', retrying' if retry else ''}): {exc}")
+        chunk.status, chunk.error = 'pending' if retry else 'failed', str(exc)
+
+    chunk.duration_ms = elapsed_before + int((time.monotonic() - started) * 1000)
+    chunk.finished_at = timezone.now() if chunk.status != 'pending' else None
+    chunk.save(update_fields=['status', 'error', 'duration_ms', 'finished_at', 'updated_at'])
+    logger.info(f"{job.name} chunk {chunk.index}: {chunk.rows} rows in {chunk.duration_ms} ms {chunk.metrics}")
+
+    if advance:
+        fill(chunk.run, job)
+    return {'chunk': chunk.index, 'status': chunk.status, 'rows': chunk.rows, 'duration_ms': chunk.duration_ms, **chunk.metrics}
+
+
+def finish(run: ChunkedTaskRun) -> bool:
+    """Close the run once no chunk is left to process or retry; totals its metrics"""
+    unfinished = run.chunks.exclude(status__in=('done', 'failed')).exists()
+    if unfinished or run.chunks.filter(status='failed', attempts__lt=MAX_ATTEMPTS).exists():
+        return False
+    rows, totals, failed = 0, Counter(), 0
+    for chunk_rows, metrics, status in run.chunks.values_list('rows', 'metrics', 'status').iterator():
+        rows += chunk_rows
+        totals.update(metrics)
+        failed += status == 'failed'
+    closed = ChunkedTaskRun.objects.filter(pk=run.pk, status='running').update(
+        status='completed', rows=rows, metrics=dict(totals), failed_chunks=failed, finished_at=timezone.now(),
+    )
+    if closed:
+        logger.info(f"{run.name} run {run.pk} completed: {rows} rows, {failed} failed chunks {dict(totals)}")
+    return bool(closed)
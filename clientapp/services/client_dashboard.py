@@ -0,0 +1,247 @@
+"""
+Client Dashboard Metrics
+Keeps ClientDashboard rows current with delta updates instead of
+recounting a client's whole history.
+
+Every ClientOrder, ProofSubmission and ClientInvoice contributes a small
+set of counters to its client's dashboard (see the *_contribution
+functions). When one of them is saved or deleted, the difference between
+its old contribution (ChangeTrackingMixin) and its new one is added to
+the dashboard with a single F() UPDATE, in the same transaction.
+
+refresh() recomputes dashboards from scratch with grouped aggregates,
+one chunk of clients at a time, for reconciliation and for the windowed
+metrics that drift with time (overdue_orders, orders_this_month). The
+nightly task refreshes every client in one pass.
+"""
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+
+from ..models import Client, ClientDashboard, ClientInvoice, ClientOrder, Job, ProofSubmission
+
+ACTIVE_ORDER_STATUSES = ('submitted', 'acknowledged', 'in_production', 'ready', 'shipped')
+COMPLETED_ORDER_STATUS = 'delivered'
+# Orders that never cost the client anything
+UNBILLED_ORDER_STATUSES = ('draft', 'cancelled')
+OPEN_INVOICE_STATUSES = ('issued', 'overdue')
+PENDING_PROOF_STATUS = 'pending_review'
+RECENT_DAYS = 30
+CHUNK_SIZE = 1000
+
+# Counters maintained by deltas
+COUNTERS = (
+    'total_orders', 'active_orders', 'completed_orders', 'orders_this_month', 'total_spent',
+    'timed_completions', 'on_time_deliveries', 'completion_time_total', 'pending_proofs', 'pending_payment',
+)
+# Recomputed only by refresh()
+WINDOWED = ('overdue_orders',)
+DERIVED = ('avg_completion_days', 'on_time_delivery_rate')
+
+
+def _on_time(delivered_at, delivery_date) -> bool:
+    return delivery_date is None or timezone.localdate(delivered_at) <= delivery_date
+
+
+# ==================== Contributions ====================
+
+def order_contribution(status, total_amount, created_at, delivery_date, delivered_at) -> Dict:
+    """Counters one ClientOrder adds to its client's dashboard"""
+    timed = status == COMPLETED_ORDER_STATUS and delivered_at is not None and created_at is not None
+    return {
+        'total_orders': 1,
+        'active_orders': int(status in ACTIVE_ORDER_STATUSES),
+        'completed_orders': int(status == COMPLETED_ORDER_STATUS),
+        'orders_this_month': int(created_at is None or created_at >= timezone.now() - timedelta(days=RECENT_DAYS)),
+        'total_spent': Decimal('0') if status in UNBILLED_ORDER_STATUSES else (total_amount or Decimal('0')),
+        'timed_completions': int(timed),
+        'on_time_deliveries': int(timed and _on_time(delivered_at, delivery_date)),
+        'completion_time_total': (delivered_at - created_at) if timed else timedelta(0),
+    }
+
+
+def proof_contribution(status) -> Dict:
+    return {'pending_proofs': int(status == PENDING_PROOF_STATUS)}
+
+
+def invoice_contribution(status, balance_due) -> Dict:
+    return {'pending_payment': (balance_due or Decimal('0')) if status in OPEN_INVOICE_STATUSES else Decimal('0')}
+
+
+def difference(old: Optional[Dict], new: Optional[Dict]) -> Dict:
+    """new - old, counter by counter (None = no contribution)"""
+    old, new = old or {}, new or {}
+    delta = {}
+    for field in set(old) | set(new):
+        zero = timedelta(0) if field == 'completion_time_total' else 0
+        change = new.get(field, zero) - old.get(field, zero)
+        if change:
+            delta[field] = change
+    return delta
+
+
+# ==================== Delta updates ====================
+
+def _derived(values: Dict) -> Dict:
+    timed = values['timed_completions']
+    if not timed:
+        return {'avg_completion_days': Decimal('0'), 'on_time_delivery_rate': Decimal('0')}
+    days = Decimal(values['completion_time_total'].total_seconds()) / Decimal(86400) / timed
+    rate = Decimal(values['on_time_deliveries'] * 100) / timed
+    return {
+        'avg_completion_days': days.quantize(Decimal('0.01')),
+        'on_time_delivery_rate': rate.quantize(Decimal('0.01')),
+    }
+
+
+def apply(client_id: Optional[int], delta: Dict) -> None:
+    """Add ``delta`` to the client's dashboard (creating it from a full refresh if missing)"""
+    if not client_id or not delta:
+        return
+    dashboards = ClientDashboard.objects.filter(client_id=client_id)
+    updated = dashboards.update(
+        last_updated=timezone.now(),
+        **{field: F(field) + change for field, change in delta.items()}
+    )
+    if not updated:
+        refresh([client_id])
+        return
+    if {'timed_completions', 'on_time_deliveries', 'completion_time_total'} & set(delta):
+        values = dashboards.values('timed_completions', 'on_time_deliveries', 'completion_time_total').first()
+        if values:
+            dashboards.update(**_derived(values))
+
+
+def _client_of_job(job_id: Optional[int]) -> Optional[int]:
+    if not job_id:
+        return None
+    return Job.objects.filter(pk=job_id).values_list('client_id', flat=True).first()
+
+
+def _order_contribution(order: ClientOrder, loaded: bool = False) -> Dict:
+    value = order.loaded_value if loaded else (lambda field: getattr(order, field))
+    return order_contribution(
+        value('status'), value('total_amount'), order.created_at, value('delivery_date'), value('delivered_at')
+    )
+
+
+def order_changed(order: ClientOrder, deleted: bool = False, created: bool = False) -> None:
+    old = None if created else _order_contribution(order, loaded=True)
+    new = None if deleted else _order_contribution(order)
+    old_client = order.loaded_value('client_id')
+    if old is not None and old_client != order.client_id:
+        # Moved to another client: take it off the old dashboard whole
+        apply(old_client, difference(old, None))
+        old = None
+    apply(order.client_id, difference(old, new))
+
+
+def proof_changed(proof: ProofSubmission, deleted: bool = False, created: bool = False) -> None:
+    old = None if created else proof_contribution(proof.loaded_value('status'))
+    new = None if deleted else proof_contribution(proof.status)
+    delta = difference(old, new)
+    if delta:
+        apply(_client_of_job(proof.job_id), delta)
+
+
+def invoice_changed(invoice: ClientInvoice, deleted: bool = False, created: bool = False) -> None:
+    old = None if created else invoice_contribution(invoice.loaded_value('status'), invoice.loaded_value('balance_due'))
+    new = None if deleted else invoice_contribution(invoice.status, invoice.balance_due)
+    old_client = invoice.loaded_value('client_id')
+    if old is not None and old_client != invoice.client_id:
+        apply(old_client, difference(old, None))
+        old = None
+    apply(invoice.client_id, difference(old, new))
+
+
+# ==================== Full recompute ====================
+
+def _metrics_for(client_ids: List[int]) -> Dict[int, Dict]:
+    """Every counter of the given clients from three grouped aggregate queries"""
+    now = timezone.now()
+    timed = Q(status=COMPLETED_ORDER_STATUS, delivered_at__isnull=False)
+    metrics = {client_id: {
+        'total_orders': 0, 'active_orders': 0, 'completed_orders': 0, 'overdue_orders': 0,
+        'orders_this_month': 0, 'total_spent': Decimal('0'), 'timed_completions': 0, 'on_time_deliveries': 0,
+        'completion_time_total': timedelta(0), 'pending_proofs': 0, 'pending_payment': Decimal('0'),
+    } for client_id in client_ids}
+
+    orders = ClientOrder.objects.filter(client_id__in=client_ids).order_by().values('client_id').annotate(
+        total_orders=Count('id'),
+        active_orders=Count('id', filter=Q(status__in=ACTIVE_ORDER_STATUSES)),
+        completed_orders=Count('id', filter=Q(status=COMPLETED_ORDER_STATUS)),
+        overdue_orders=Count('id', filter=Q(status__in=ACTIVE_ORDER_STATUSES, delivery_date__lt=timezone.localdate())),
+        orders_this_month=Count('id', filter=Q(created_at__gte=now - timedelta(days=RECENT_DAYS))),
+        total_spent=Sum('total_amount', filter=~Q(status__in=UNBILLED_ORDER_STATUSES)),
+        timed_completions=Count('id', filter=timed),
+        on_time_deliveries=Count('id', filter=timed & (
+            Q(delivery_date__isnull=True) | Q(delivered_at__date__lte=F('delivery_date'))
+        )),
+        completion_time_total=Sum(
+            ExpressionWrapper(F('delivered_at') - F('created_at'), output_field=DurationField()), filter=timed
+        ),
+    )
+    for row in orders:
+        client_id = row.pop('client_id')
+        metrics[client_id].update({field: value for field, value in row.items() if value is not None})
+
+    proofs = ProofSubmission.objects.filter(job__client_id__in=client_ids, status=PENDING_PROOF_STATUS).order_by()
+    for client_id, count in proofs.values('job__client_id').annotate(count=Count('id')).values_list('job__client_id', 'count'):
+        metrics[client_id]['pending_proofs'] = count
+
+    invoices = ClientInvoice.objects.filter(client_id__in=client_ids, status__in=OPEN_INVOICE_STATUSES).order_by()
+    for client_id, balance in invoices.values('client_id').annotate(balance=Sum('balance_due')).values_list('client_id', 'balance'):
+        metrics[client_id]['pending_payment'] = balance or Decimal('0')
+
+    for values in metrics.values():
+        values.update(_derived(values))
+    return metrics
+
+
+def refresh(client_ids: Optional[Iterable[int]] = None, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Recompute dashboards from the source tables.
+
+    Args:
+        client_ids: Clients to refresh (None = every client)
+        chunk_size: Clients per aggregate/bulk-write round
+
+    Returns:
+        Number of dashboards written
+    """
+    if client_ids is None:
+        client_ids = Client.objects.order_by('pk').values_list('pk', flat=True).iterator(chunk_size=chunk_size)
+    fields = list(COUNTERS + WINDOWED + DERIVED) + ['last_updated']
+
+    written = 0
+    chunk: List[int] = []
+    for client_id in client_ids:
+        chunk.append(client_id)
+        if len(chunk) >= chunk_size:
+            written += _refresh_chunk(chunk, fields)
+            chunk = []
+    if chunk:
+        written += _refresh_chunk(chunk, fields)
+    return written
+
+
+def _refresh_chunk(client_ids: List[int], fields: List[str]) -> int:
+    metrics = _metrics_for(client_ids)
+    now = timezone.now()
+    existing = {dashboard.client_id: dashboard for dashboard in ClientDashboard.objects.filter(client_id__in=client_ids)}
+    missing = []
+    for client_id, values in metrics.items():
+        dashboard = existing.get(client_id)
+        if dashboard is None:
+            dashboard = ClientDashboard(client_id=client_id)
+            missing.append(dashboard)
+        for field, value in values.items():
+            setattr(dashboard, field, value)
+        dashboard.last_updated = now
+    ClientDashboard.objects.bulk_update(list(existing.values()), fields)
+    # A concurrent delta may have created one of these meanwhile; it is reconciled next run
+    ClientDashboard.objects.bulk_create(missing, ignore_conflicts=True)
+    return len(metrics)
@@ -7,6 +7,7 @@ from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 from ..models import TimelineEvent, WebhookSubscription, WebhookDelivery
+from . import activity_feed
 
 User = get_user_model()
 
@@ -45,6 +46,9 @@ class EventBus:
             metadata=metadata or {}
         )
         
+        # Feed read model (services.activity_feed)
+        activity_feed.project('timeline', [event])
+        
         # Trigger webhook deliveries asynchronously (would use Celery/Dramatiq in production)
         EventBus._trigger_webhooks(event)
         
@@ -0,0 +1,255 @@
+"""
+Fulfilment Cost Service
+Tax and shipping quotes for carts and orders.
+
+A FulfilmentQuoter lives for one request. It reads each configuration
+source at most once: shipping methods and tax configurations come from the
+shared cache (SHIPPING / TAX namespaces) and are then memoized on the
+quoter, together with parcels and matched tax rows. Quoting every active
+shipping method for a cart takes one ProductShipping query, plus one
+carrier request per API carrier (cached too).
+
+Parcel weight is the chargeable weight of each line: the larger of the
+ProductShipping weight and its volumetric weight (L x W x H / 5000 cm3 per
+kg), times the quantity. Carrier APIs are reached through the backend named
+by SHIPPING_CARRIER_BACKEND.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from ..models import CartItem, OrderItem, ProductShipping, ShippingMethod, TaxConfiguration
+from . import cache as catalog_cache
+
+CENT = Decimal('0.01')
+VOLUMETRIC_DIVISOR = Decimal('5000')  # cm3 per kg
+CARRIER_RATE_TIMEOUT = 600
+
+KG_PER_UNIT = {'kg': Decimal('1'), 'g': Decimal('0.001'), 'lb': Decimal('0.45359237'), 'oz': Decimal('0.028349523')}
+CM_PER_UNIT = {'cm': Decimal('1'), 'mm': Decimal('0.1'), 'm': Decimal('100'), 'in': Decimal('2.54')}
+
+
+def min_parcel_weight() -> Decimal:
+    """Weight charged when products have no shipping data (the old 1 kg placeholder)"""
+    return Decimal(str(getattr(settings, 'SHIPPING_MIN_PARCEL_WEIGHT_KG', '1.0')))
+
+
+@dataclass
+class Parcel:
+    weight_kg: Decimal
+    subtotal: Decimal
+    # Every line ships free (product free_shipping or its threshold met)
+    ships_free: bool = False
+    lines: Tuple[Tuple[int, int], ...] = field(default_factory=tuple)
+
+
+# ==================== Carriers ====================
+
+class CarrierClient:
+    """Real-time rates for a carrier's API-priced methods"""
+
+    def rates(self, methods: List[ShippingMethod], parcel: Parcel, destination) -> Dict[int, Decimal]:
+        """{shipping_method_id: cost} for the given methods; omit methods the carrier cannot serve"""
+        raise NotImplementedError
+
+
+class EstimateCarrier(CarrierClient):
+    """Offline estimate from the method's configured rates (no carrier integration yet)"""
+
+    def rates(self, methods, parcel, destination):
+        rates = {}
+        for method in methods:
+            if method.weight_rate_per_kg:
+                rates[method.pk] = parcel.weight_kg * method.weight_rate_per_kg
+            else:
+                rates[method.pk] = method.flat_rate or Decimal('0')
+        return rates
+
+
+def carrier_client() -> CarrierClient:
+    return import_string(getattr(settings, 'SHIPPING_CARRIER_BACKEND', 'clientapp.services.fulfilment.EstimateCarrier'))()
+
+
+# ==================== Lines ====================
+
+def cart_lines(cart) -> List[Tuple[int, int]]:
+    return list(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+
+
+def order_lines(order) -> List[Tuple[int, int]]:
+    return list(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity'))
+
+
+def _destination_key(destination) -> Tuple:
+    if destination is None:
+        return ()
+    return (destination.country, destination.state_province, destination.city, destination.postal_code)
+
+
+def _serves(method: ShippingMethod, destination) -> bool:
+    if destination is None:
+        return True
+    if method.available_countries and destination.country not in method.available_countries:
+        return False
+    if method.available_regions and not {destination.city, destination.state_province} & set(method.available_regions):
+        return False
+    return True
+
+
+# ==================== Quoter ====================
+
+class FulfilmentQuoter:
+    """Tax and shipping quotes with configuration memoized for the quoter's lifetime (one request)"""
+
+    def __init__(self):
+        self._memo: Dict[Tuple, Any] = {}
+
+    def _memoized(self, key: Tuple, builder: Callable[[], Any]) -> Any:
+        if key not in self._memo:
+            self._memo[key] = builder()
+        return self._memo[key]
+
+    # ---------- configuration ----------
+
+    def shipping_methods(self) -> List[ShippingMethod]:
+        """Active shipping methods (same cache entry as ShippingCalculatorService.get_active_methods)"""
+        return self._memoized(('methods',), lambda: catalog_cache.get_or_set(
+            catalog_cache.SHIPPING,
+            ('active-methods',),
+            lambda: list(ShippingMethod.objects.filter(is_active=True)),
+            timeout=3600
+        ))
+
+    def tax_configurations(self) -> List[TaxConfiguration]:
+        return self._memoized(('tax-configs',), lambda: catalog_cache.get_or_set(
+            catalog_cache.TAX,
+            ('active-configs',),
+            lambda: list(TaxConfiguration.objects.filter(is_active=True)),
+            timeout=3600
+        ))
+
+    def tax_configuration(self, address, customer=None) -> Optional[TaxConfiguration]:
+        """First active configuration that applies to the address/customer"""
+        if address is None:
+            return None
+        client = getattr(customer, 'matched_client', None) if customer else None
+        key = ('tax', _destination_key(address), getattr(client, 'client_type', None))
+        return self._memoized(key, lambda: next(
+            (config for config in self.tax_configurations() if config.applies_to(address, customer)), None
+        ))
+
+    def tax(self, amount: Decimal, address, customer=None) -> Tuple[Decimal, Decimal]:
+        """(tax amount, rate) for ``amount`` shipped to ``address``"""
+        config = self.tax_configuration(address, customer)
+        if config is None:
+            return Decimal('0'), Decimal('0')
+        return Decimal(config.calculate_tax(amount)).quantize(CENT), config.rate
+
+    # ---------- shipping ----------
+
+    def parcel(self, lines: Iterable[Tuple[int, int]], subtotal: Decimal) -> Parcel:
+        """Chargeable weight of ``(product_id, quantity)`` lines in one ProductShipping query"""
+        lines = tuple(sorted((product_id, quantity) for product_id, quantity in lines if product_id))
+        return self._memoized(('parcel', lines, subtotal), lambda: self._build_parcel(lines, subtotal))
+
+    @staticmethod
+    def _build_parcel(lines: Tuple[Tuple[int, int], ...], subtotal: Decimal) -> Parcel:
+        shipping = {
+            row[0]: row[1:] for row in ProductShipping.objects.filter(product_id__in={p for p, _ in lines}).values_list(
+                'product_id', 'shipping_weight', 'shipping_weight_unit', 'package_length', 'package_width',
+                'package_height', 'package_dimension_unit', 'free_shipping', 'free_shipping_threshold',
+            )
+        }
+        weight = Decimal('0')
+        ships_free = bool(lines)
+        for product_id, quantity in lines:
+            data = shipping.get(product_id)
+            if data is None:
+                ships_free = False
+                continue
+            unit_weight, weight_unit, length, width, height, dimension_unit, free, threshold = data
+            actual = (unit_weight or Decimal('0')) * KG_PER_UNIT.get((weight_unit or 'kg').lower(), Decimal('1'))
+            volumetric = Decimal('0')
+            if length and width and height:
+                cm = CM_PER_UNIT.get((dimension_unit or 'cm').lower(), Decimal('1'))
+                volumetric = (length * cm) * (width * cm) * (height * cm) / VOLUMETRIC_DIVISOR
+            weight += max(actual, volumetric) * quantity
+            if not (free or (threshold and subtotal >= threshold)):
+                ships_free = False
+        return Parcel(
+            weight_kg=max(weight, min_parcel_weight()).quantize(Decimal('0.001')),
+            subtotal=subtotal,
+            ships_free=ships_free,
+            lines=lines,
+        )
+
+    def _carrier_rates(self, methods: List[ShippingMethod], parcel: Parcel, destination) -> Dict[int, Decimal]:
+        """API rates of one carrier's methods - one carrier request, cached in the shared cache"""
+        key = ('carrier-rates', methods[0].carrier, tuple(m.pk for m in methods), str(parcel.weight_kg),
+               str(parcel.subtotal), *_destination_key(destination))
+        return self._memoized(key, lambda: catalog_cache.get_or_set(
+            catalog_cache.SHIPPING,
+            key,
+            lambda: carrier_client().rates(methods, parcel, destination),
+            timeout=CARRIER_RATE_TIMEOUT
+        ))
+
+    def quote_all(self, lines: Iterable[Tuple[int, int]], subtotal: Decimal, destination=None) -> List[Dict]:
+        """
+        Cost of every active shipping method that serves ``destination``,
+        cheapest first (the default method wins ties)
+        """
+        parcel = self.parcel(lines, subtotal)
+        methods = [method for method in self.shipping_methods() if _serves(method, destination)]
+
+        by_carrier: Dict[str, List[ShippingMethod]] = {}
+        for method in methods:
+            if method.pricing_type == 'api' and method.carrier_api_enabled and not parcel.ships_free:
+                by_carrier.setdefault(method.carrier or '', []).append(method)
+        api_methods = {method.pk for carrier_methods in by_carrier.values() for method in carrier_methods}
+        api_rates: Dict[int, Decimal] = {}
+        for carrier_methods in by_carrier.values():
+            api_rates.update(self._carrier_rates(carrier_methods, parcel, destination))
+
+        quotes = []
+        for method in methods:
+            if parcel.ships_free:
+                cost = Decimal('0')
+            elif method.pk in api_methods:
+                if method.pk not in api_rates:
+                    continue  # the carrier cannot serve this parcel
+                cost = api_rates[method.pk]
+            else:
+                cost = method.calculate_shipping_cost(weight=parcel.weight_kg, order_amount=subtotal, destination=destination)
+            quotes.append({
+                'shipping_method_id': method.pk,
+                'method_name': method.name,
+                'carrier': method.carrier or 'Custom',
+                'shipping_cost': Decimal(cost).quantize(CENT),
+                'estimated_days_min': method.estimated_days_min,
+                'estimated_days_max': method.estimated_days_max,
+                'is_default': method.is_default,
+                'weight_kg': parcel.weight_kg,
+            })
+        quotes.sort(key=lambda quote: (quote['shipping_cost'], not quote['is_default']))
+        return quotes
+
+    def quote(
+        self,
+        lines: Iterable[Tuple[int, int]],
+        subtotal: Decimal,
+        destination=None,
+        shipping_method_id=None,
+    ) -> Optional[Dict]:
+        """Quote of the given method, else of the default (or first) active method; None if unavailable"""
+        quotes = self.quote_all(lines, subtotal, destination)
+        if shipping_method_id:
+            return next((q for q in quotes if str(q['shipping_method_id']) == str(shipping_method_id)), None)
+        by_id = {q['shipping_method_id']: q for q in quotes}
+        for method in self.shipping_methods():
+            if method.is_default and method.pk in by_id:
+                return by_id[method.pk]
+        return next((by_id[m.pk] for m in self.shipping_methods() if m.pk in by_id), None)
@@ -0,0 +1,321 @@
+"""
+Inventory Reservation Engine
+Holds MaterialInventory stock for orders through an InventoryReservation
+ledger.
+
+Stock is never read-then-written: every reservation is a conditional UPDATE
+(``reserved_stock = reserved_stock + x WHERE virtual_stock - reserved_stock >= x``)
+so concurrent checkouts cannot both take the last units, without row locks.
+A whole order is reserved by one UPDATE over all of its materials; if any
+material is short the statement matches fewer rows and the transaction is
+rolled back. Reservations of unpaid orders carry an expiry and are released
+by a periodic sweeper. Low-stock alerts are evaluated only for the materials
+a ledger change touched.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_UP, Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import (
+    InventoryReservation, MaterialInventory, OrderItem, ProductMaterialLink,
+    SystemAlert, SystemSetting,
+)
+
+DEFAULT_TTL_MINUTES = 30
+SWEEP_BATCH_SIZE = 500
+ALERT_WATERMARK_KEY = 'low_stock_alert_watermark'
+
+_QUANTITY = DecimalField(max_digits=12, decimal_places=2)
+CENT = Decimal('0.01')
+
+
+class InsufficientStock(Exception):
+    """Raised when a reservation cannot be satisfied; ``shortages`` maps material id -> missing quantity"""
+
+    def __init__(self, shortages: Dict[int, Decimal]):
+        self.shortages = shortages
+        super().__init__(f"Insufficient stock for materials {sorted(shortages)}")
+
+
+def reservation_ttl() -> timedelta:
+    return timedelta(minutes=getattr(settings, 'INVENTORY_RESERVATION_TTL_MINUTES', DEFAULT_TTL_MINUTES))
+
+
+def _per_material(amounts: Dict[int, Decimal]) -> Case:
+    """CASE id WHEN ... THEN amount END over the given materials"""
+    return Case(
+        *[When(pk=material_id, then=Value(amount)) for material_id, amount in amounts.items()],
+        output_field=_QUANTITY,
+    )
+
+
+def _alert_link(material_id: int) -> str:
+    return f'/admin/clientapp/materialinventory/{material_id}/change/'
+
+
+# ==================== Availability ====================
+
+def available_quantities(material_ids: Iterable[int]) -> Dict[int, Decimal]:
+    """virtual_stock - reserved_stock of active materials, computed in the database"""
+    return dict(
+        MaterialInventory.objects.filter(pk__in=list(material_ids), is_active=True)
+        .annotate(available=F('virtual_stock') - F('reserved_stock'))
+        .values_list('pk', 'available')
+    )
+
+
+def requirements_for(lines: Iterable[tuple]) -> Dict[int, Decimal]:
+    """
+    Material quantities needed for ``(product_id, quantity)`` lines, summed
+    per material from the products' material links.
+    """
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+
+    needed: Dict[int, Decimal] = defaultdict(Decimal)
+    links = ProductMaterialLink.objects.filter(product_id__in=list(quantities)).values_list(
+        'product_id', 'material_id', 'quantity_per_product'
+    )
+    for product_id, material_id, per_product in links:
+        if per_product > 0:
+            needed[material_id] += Decimal(per_product) * quantities[product_id]
+    return dict(needed)
+
+
+def order_requirements(order) -> Dict[int, Decimal]:
+    return requirements_for(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity'))
+
+
+def _shortages(needed: Dict[int, Decimal]) -> Dict[int, Decimal]:
+    available = available_quantities(needed)
+    return {
+        material_id: amount - available.get(material_id, Decimal('0'))
+        for material_id, amount in needed.items()
+        if available.get(material_id, Decimal('0')) < amount
+    }
+
+
+# ==================== Reserve / release / commit ====================
+
+def reserve(
+    needed: Dict[int, Decimal],
+    order=None,
+    reference: str = '',
+    ttl: Optional[timedelta] = None,
+) -> List[InventoryReservation]:
+    """
+    Atomically reserve ``{material_id: quantity}``: either every material is
+    held or none is.
+
+    Args:
+        needed: Quantities per MaterialInventory id
+        order: Order the stock is held for (optional)
+        reference: Free-form owner reference, e.g. a cart or quote id
+        ttl: Expire the hold after this long; None keeps it until released
+
+    Raises:
+        InsufficientStock: A material does not have enough unreserved stock
+    """
+    # Stock columns hold 2 decimals; round up so the ledger matches reserved_stock
+    needed = {
+        material_id: Decimal(amount).quantize(CENT, rounding=ROUND_UP)
+        for material_id, amount in needed.items()
+        if amount > 0
+    }
+    if not needed:
+        return []
+
+    amount = _per_material(needed)
+    try:
+        with transaction.atomic():
+            updated = MaterialInventory.objects.filter(
+                pk__in=list(needed),
+                is_active=True,
+                virtual_stock__gte=F('reserved_stock') + amount,
+            ).update(reserved_stock=F('reserved_stock') + amount, updated_at=timezone.now())
+            if updated != len(needed):
+                # Rolls back the materials that did fit
+                raise InsufficientStock({})
+            expires_at = timezone.now() + ttl if ttl else None
+            reservations = InventoryReservation.objects.bulk_create([
+                InventoryReservation(
+                    material_id=material_id,
+                    order=order,
+                    reference=reference,
+                    quantity=quantity,
+                    expires_at=expires_at,
+                )
+                for material_id, quantity in needed.items()
+            ])
+    except InsufficientStock:
+        raise InsufficientStock(_shortages(needed) or dict(needed)) from None
+
+    raise_low_stock_alerts(needed)
+    return reservations
+
+
+def reserve_order(order, ttl: Optional[timedelta] = None) -> List[InventoryReservation]:
+    """Reserve every material the order's items need in one statement"""
+    return reserve(order_requirements(order), order=order, reference=order.order_number, ttl=ttl)
+
+
+def _settle(reservations, status: str, consume: bool) -> int:
+    """
+    Move active reservations to ``status`` and take their quantities off
+    reserved_stock (and off virtual_stock too when ``consume``).
+
+    Rows are claimed with SKIP LOCKED, so a release racing the sweeper
+    settles each reservation exactly once.
+    """
+    with transaction.atomic():
+        claimed = list(
+            reservations.filter(status='active')
+            .select_for_update(skip_locked=True)
+            .values_list('pk', 'material_id', 'quantity')
+        )
+        if not claimed:
+            return 0
+
+        totals: Dict[int, Decimal] = defaultdict(Decimal)
+        for _, material_id, quantity in claimed:
+            totals[material_id] += quantity
+        amount = _per_material(totals)
+
+        changes = {'reserved_stock': F('reserved_stock') - amount, 'updated_at': timezone.now()}
+        if consume:
+            changes['virtual_stock'] = F('virtual_stock') - amount
+        MaterialInventory.objects.filter(pk__in=list(totals)).update(**changes)
+        InventoryReservation.objects.filter(pk__in=[pk for pk, _, _ in claimed]).update(
+            status=status, updated_at=timezone.now()
+        )
+
+    raise_low_stock_alerts(totals)
+    return len(claimed)
+
+
+def release_order(order) -> int:
+    """Return an order's held stock (cancelled/refunded/abandoned orders)"""
+    return _settle(InventoryReservation.objects.filter(order=order), 'released', consume=False)
+
+
+def commit_order(order) -> int:
+    """Consume an order's held stock from virtual_stock (order went to production)"""
+    return _settle(InventoryReservation.objects.filter(order=order), 'committed', consume=True)
+
+
+def keep_order(order) -> int:
+    """Clear the expiry of a paid order's reservations so the sweeper leaves them alone"""
+    return InventoryReservation.objects.filter(order=order, status='active').update(
+        expires_at=None, updated_at=timezone.now()
+    )
+
+
+def expire_stale_reservations(batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Release active reservations past their expiry; returns how many expired"""
+    expired = 0
+    while True:
+        batch = list(
+            InventoryReservation.objects.filter(status='active', expires_at__lte=timezone.now())
+            .order_by('expires_at')
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return expired
+        settled = _settle(InventoryReservation.objects.filter(pk__in=batch), 'expired', consume=False)
+        expired += settled
+        if settled < len(batch):
+            # The rest is being settled elsewhere right now
+            return expired
+
+
+# ==================== Low-stock alerts ====================
+
+def raise_low_stock_alerts(material_ids: Iterable[int]) -> int:
+    """
+    Create a low_stock SystemAlert for each of the given materials that is
+    at or below its threshold and has none active yet, and close active
+    alerts of those that recovered. Returns how many alerts were created.
+    """
+    material_ids = list(material_ids)
+    if not material_ids:
+        return 0
+
+    low = list(
+        MaterialInventory.objects.filter(
+            pk__in=material_ids,
+            is_active=True,
+            virtual_stock__lte=F('reserved_stock') + F('low_stock_threshold'),
+        ).annotate(available=F('virtual_stock') - F('reserved_stock'))
+    )
+    low_links = {_alert_link(material.pk) for material in low}
+    active_links = set(
+        SystemAlert.objects.filter(
+            alert_type='low_stock',
+            is_active=True,
+            link__in=[_alert_link(pk) for pk in material_ids],
+        ).values_list('link', flat=True)
+    )
+
+    recovered = active_links - low_links
+    if recovered:
+        SystemAlert.objects.filter(alert_type='low_stock', is_active=True, link__in=recovered).update(is_active=False)
+
+    alerts = [
+        SystemAlert(
+            alert_type='low_stock',
+            severity='high' if material.available <= 0 else 'medium',
+            title=f'Low Stock: {material.material_name}',
+            message=(
+                f'{material.material_name} has {material.available} {material.unit} available '
+                f'(threshold {material.low_stock_threshold})'
+            ),
+            link=_alert_link(material.pk),
+            visible_to_production=True,
+        )
+        for material in low
+        if _alert_link(material.pk) not in active_links
+    ]
+    SystemAlert.objects.bulk_create(alerts)
+    return len(alerts)
+
+
+def refresh_low_stock_alerts() -> int:
+    """
+    Re-evaluate alerts for materials whose stock or ledger changed since the
+    last run (catches stock edited outside this module, e.g. in the admin)
+    """
+    setting = SystemSetting.objects.filter(key=ALERT_WATERMARK_KEY).first()
+    since = parse_datetime(setting.value) if setting and setting.value else None
+    now = timezone.now()
+
+    materials = MaterialInventory.objects.all()
+    ledger = InventoryReservation.objects.all()
+    if since:
+        materials = materials.filter(updated_at__gte=since)
+        ledger = ledger.filter(updated_at__gte=since)
+    touched = set(materials.values_list('pk', flat=True)) | set(ledger.values_list('material_id', flat=True))
+
+    created = raise_low_stock_alerts(touched)
+    SystemSetting.objects.update_or_create(
+        key=ALERT_WATERMARK_KEY,
+        defaults={'value': now.isoformat(), 'description': 'Last low-stock alert refresh'},
+    )
+    return created
+
+
+def reserved_totals(material_ids: Iterable[int]) -> Dict[int, Decimal]:
+    """Active ledger quantity per material - what reserved_stock should equal"""
+    return dict(
+        InventoryReservation.objects.filter(material_id__in=list(material_ids), status='active')
+        .values('material_id')
+        .annotate(total=Sum('quantity'))
+        .values_list('material_id', 'total')
+    )
@@ -0,0 +1,264 @@
+"""
+Job Detail Read Model
+The job detail page, the AM job modal, the job WebSocket and the progress
+API all read one assembled view-model instead of querying separately.
+
+The job and everything shown with it load in one select_related query plus
+a fixed set of Prefetch queries, and the result is cached under a per-job
+namespace. The client's job list is cached under a per-client namespace,
+and the job WebSocket's initial snapshot under the job's namespace too.
+The signals in storefront_signals bump those namespaces when a job or a
+related row (attachment, note, production update, vendor stage, QC
+inspection, quote, client) changes; vendor changes bump JOB_DETAIL as a
+whole. Values that depend on the current time (deadline text, overdue
+flags) are computed on every read and never cached.
+"""
+from datetime import datetime, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from ..models import Job, JobAttachment, JobNote, JobVendorStage, ProductionUpdate, QCInspection
+from . import cache as detail_cache
+
+DETAIL_TIMEOUT = 300
+ACTIVE_STAGE_STATUSES = ('in_production', 'sent_to_vendor')
+# Progress shown for sibling jobs in the client job list
+STATUS_PROGRESS = {'completed': 100, 'in_progress': 50, 'pending': 10}
+
+
+def job_namespace(job_id: int) -> str:
+    return f'{detail_cache.JOB_DETAIL}:job:{job_id}'
+
+
+def client_namespace(client_id: int) -> str:
+    return f'{detail_cache.JOB_DETAIL}:client:{client_id}'
+
+
+def invalidate(job_ids: Iterable[int] = (), client_ids: Iterable[int] = ()) -> None:
+    """Drop the cached detail of ``job_ids`` and the cached job lists of ``client_ids``"""
+    detail_cache.bump_namespace(
+        *[job_namespace(job_id) for job_id in set(job_ids) if job_id],
+        *[client_namespace(client_id) for client_id in set(client_ids) if client_id],
+    )
+
+
+# ==================== Assembly ====================
+
+def load(job_id: int) -> Optional[Job]:
+    """The job with everything the detail view shows (select_related + five prefetches)"""
+    return Job.objects.select_related('client', 'quote', 'created_by', 'person_in_charge').prefetch_related(
+        Prefetch(
+            'attachments', queryset=JobAttachment.objects.select_related('uploaded_by').order_by('-uploaded_at'),
+            to_attr='detail_attachments',
+        ),
+        Prefetch('job_notes', queryset=JobNote.objects.select_related('created_by').order_by('-created_at'), to_attr='detail_notes'),
+        Prefetch(
+            'production_updates', queryset=ProductionUpdate.objects.select_related('created_by').order_by('-created_at'),
+            to_attr='detail_updates',
+        ),
+        Prefetch('vendor_stages', queryset=JobVendorStage.objects.select_related('vendor').order_by('stage_order'), to_attr='detail_stages'),
+        Prefetch('qc_inspections', queryset=QCInspection.objects.order_by('-created_at'), to_attr='detail_inspections'),
+    ).filter(pk=job_id).first()
+
+
+def progress(job: Job, stages: List[JobVendorStage], updates: List[ProductionUpdate]) -> Tuple[int, Optional[JobVendorStage]]:
+    """(overall progress %, stage currently in production)"""
+    if stages:
+        completed = sum(1 for stage in stages if stage.status == 'completed')
+        current = next((stage for stage in stages if stage.status in ACTIVE_STAGE_STATUSES), None)
+        if current:
+            return int(completed / len(stages) * 100 + current.progress / len(stages)), current
+        return int(completed / len(stages) * 100), None
+    if job.status == 'completed':
+        return 100, None
+    if job.status == 'in_progress':
+        return (updates[0].progress if updates else 50), None
+    return 0, None
+
+
+def specs(job: Job) -> Dict[str, str]:
+    if job.quote:
+        return {
+            'product_type': job.quote.product_name or job.product,
+            'colors': '4/4 (CMYK both sides)',  # Default, could be stored in quote
+            'size': 'A4 (210mm × 297mm)',
+            'finishing': 'Matt Lamination',  # Default
+            'quantity': f"{job.quantity:,} pcs",
+            'folding': 'Tri-fold',  # Default
+            'material': '150gsm Gloss Art Paper',
+            'binding': 'None',
+        }
+    return {
+        'product_type': job.product,
+        'colors': '4/4 (CMYK both sides)',
+        'size': 'A4 (210mm × 297mm)',
+        'finishing': 'Matt Lamination',
+        'quantity': f"{job.quantity:,} pcs",
+        'folding': 'None',
+        'material': 'Standard',
+        'binding': 'None',
+    }
+
+
+def _build_job(job_id: int) -> Optional[Dict]:
+    job = load(job_id)
+    if job is None:
+        return None
+    stages, updates = job.detail_stages, job.detail_updates
+    overall_progress, current_stage = progress(job, stages, updates)
+    primary_stage = current_stage or (stages[0] if stages else None)
+    return {
+        'job': job,
+        'attachments': job.detail_attachments,
+        'notes': job.detail_notes,
+        'production_updates': updates,
+        'vendor_stages': stages,
+        'qc_inspection': job.detail_inspections[0] if job.detail_inspections else None,
+        'overall_progress': overall_progress,
+        'current_stage': current_stage,
+        'primary_vendor': primary_stage.vendor if primary_stage else None,
+        'am_name': (job.created_by.get_full_name() or job.created_by.username) if job.created_by else 'System',
+        'specs': specs(job),
+    }
+
+
+def _build_client_jobs(client_id: int) -> List[Dict]:
+    jobs = Job.objects.filter(client_id=client_id).select_related('person_in_charge').order_by('-created_at')
+    return [
+        {
+            'id': job.id,
+            'job_number': job.job_number,
+            'product': job.product,
+            'quantity': job.quantity,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'priority': job.priority,
+            'priority_display': job.get_priority_display(),
+            'expected_completion': job.expected_completion,
+            'progress': STATUS_PROGRESS.get(job.status, 0),
+            'job_type': job.get_job_type_display(),
+            'person_in_charge': job.person_in_charge,
+            'notes': job.notes[:50] + '...' if job.notes and len(job.notes) > 50 else job.notes,
+        }
+        for job in jobs
+    ]
+
+
+# ==================== Reading ====================
+
+def deadline(job: Job, now: datetime) -> Dict:
+    due = timezone.make_aware(datetime.combine(job.expected_completion, time.min)) if job.expected_completion else now
+    hours_remaining = int((due - now).total_seconds() / 3600)
+    if hours_remaining < 0:
+        text = f"Overdue by {abs(hours_remaining)}h"
+    elif hours_remaining < 24:
+        text = f"{hours_remaining}h remaining"
+    else:
+        text = f"{hours_remaining // 24} days remaining"
+    return {'deadline_text': text, 'hours_remaining': hours_remaining, 'is_overdue': hours_remaining < 0}
+
+
+def _current_stage_text(detail: Dict, now: datetime) -> str:
+    stage, status = detail['current_stage'], detail['job'].status
+    if stage:
+        day = (now - stage.started_at).days + 1 if stage.started_at else 1
+        length = (stage.expected_completion - stage.started_at).days if stage.started_at and stage.expected_completion else '?'
+        return f"{stage.stage_name} (Day {day} of {length})"
+    if status == 'completed':
+        return "Completed"
+    if status == 'in_progress':
+        return "Vendor Production"
+    return "Not Started"
+
+
+def job_detail(job_id: int, include_client_jobs: bool = True, now: Optional[datetime] = None) -> Optional[Dict]:
+    """
+    The job detail view-model (None if the job does not exist).
+
+    Keys: job, attachments, notes, production_updates, vendor_stages,
+    qc_inspection, overall_progress, current_stage, current_stage_text,
+    primary_vendor, am_name, specs, deadline_text, hours_remaining,
+    is_overdue and, with include_client_jobs, client_jobs and job_stats.
+    """
+    now = now or timezone.now()
+    detail = detail_cache.get_or_set(
+        job_namespace(job_id),
+        (detail_cache.namespace_version(detail_cache.JOB_DETAIL),),
+        lambda: _build_job(job_id),
+        timeout=DETAIL_TIMEOUT,
+    )
+    if detail is None:
+        return None
+    detail = dict(detail, **deadline(detail['job'], now), current_stage_text=_current_stage_text(detail, now))
+    if include_client_jobs:
+        detail['client_jobs'], detail['job_stats'] = client_jobs(detail['job'], now)
+    return detail
+
+
+def snapshot(job_id: int) -> Optional[Dict]:
+    """The initial message of the job WebSocket, plus who is in charge (for authorization)"""
+    detail = job_detail(job_id, include_client_jobs=False)
+    if detail is None:
+        return None
+    job = detail['job']
+    return {'person_in_charge_id': job.person_in_charge_id, 'data': snapshot_data(job, detail['overall_progress'])}
+
+
+def snapshot_data(job: Job, overall_progress: int) -> Dict:
+    return {
+        'id': job.id,
+        'job_number': job.job_number,
+        'status': job.status,
+        'progress': overall_progress,
+        'deadline': job.expected_completion.isoformat() if job.expected_completion else None,
+        'person_in_charge': job.person_in_charge.get_full_name() if job.person_in_charge else None,
+    }
+
+
+def live_snapshot_data(job_id: int) -> Optional[Dict]:
+    """
+    snapshot()'s data read from the job row, its stages and latest production
+    update (three queries) - for publishers that must not rebuild the cached detail
+    """
+    job = Job.objects.select_related('person_in_charge').filter(pk=job_id).first()
+    if job is None:
+        return None
+    stages = list(job.vendor_stages.order_by('stage_order'))
+    updates = list(job.production_updates.order_by('-created_at')[:1])
+    return snapshot_data(job, progress(job, stages, updates)[0])
+
+
+async def asnapshot(job_id: int) -> Optional[Dict]:
+    """snapshot() cached per job version, read without leaving the event loop on a hit"""
+    return await detail_cache.aget_or_set(
+        job_namespace(job_id),
+        ('snapshot', await detail_cache.anamespace_version(detail_cache.JOB_DETAIL)),
+        lambda: snapshot(job_id),
+        timeout=DETAIL_TIMEOUT,
+    )
+
+
+def client_jobs(job: Job, now: datetime) -> Tuple[List[Dict], Dict[str, int]]:
+    """The jobs of ``job``'s client with deadline flags, and their status counts"""
+    stats = {'total': 0, 'in_progress': 0, 'overdue': 0, 'completed': 0, 'pending': 0}
+    if not job.client_id:
+        return [], stats
+    rows = detail_cache.get_or_set(
+        client_namespace(job.client_id),
+        (detail_cache.namespace_version(detail_cache.JOB_DETAIL),),
+        lambda: _build_client_jobs(job.client_id),
+        timeout=DETAIL_TIMEOUT,
+    )
+    today = now.date()
+    jobs = []
+    for row in rows:
+        days = (row['expected_completion'] - today).days if row['expected_completion'] else 0
+        jobs.append(dict(row, days_remaining=days, is_overdue=days < 0, is_current=row['id'] == job.id))
+        stats['total'] += 1
+        if row['status'] in ('in_progress', 'completed', 'pending'):
+            stats[row['status']] += 1
+        if days < 0 and row['status'] != 'completed':
+            stats['overdue'] += 1
+    return jobs, stats
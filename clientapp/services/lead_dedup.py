@@ -0,0 +1,282 @@
+"""
+Lead Deduplication
+Normalized match keys for leads, ranked duplicate lookups and a batched
+merge of existing duplicates.
+
+Every Lead stores three keys, each with its own index (set in Lead.save):
+  email_key  canonical email (lower-cased, +tag dropped, Gmail dots removed)
+  phone_key  E.164 phone (local numbers get LEAD_DEFAULT_COUNTRY_CODE)
+  name_key   sorted Soundex codes of the name's words, so "Anne Smyth",
+             "smith, ann" and "Ann Smith Ltd" share a key
+
+Soundex keeps the first letter and the consonant order, so typos that
+change either ("Katherine Mwagni" for "Catherine Mwangi") miss the key;
+names are also matched by pg_trgm similarity (the % operator, served by a
+GIN trigram index on Lead.name).
+
+candidates() looks all of these up in one OR query over those indexes and
+ranks rows by which keys matched, then by name similarity. Only an email
+match identifies a person: it is what find_or_create() reuses and
+merge_duplicates() merges. Phones are shared by offices and switchboards,
+so phone and name matches are only ever suggested for review.
+"""
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, IntegerField, Q, Value, When
+
+from ..models import Lead
+
+EMAIL_SCORE = 4
+PHONE_SCORE = 3
+NAME_SCORE = 2
+MAX_CANDIDATES = 5
+MERGE_BATCH_SIZE = 200
+
+# Company suffixes and fillers ignored by the name key
+_NAME_STOPWORDS = {'the', 'and', 'of', 'ltd', 'limited', 'co', 'company', 'inc', 'llc', 'plc', 'group', 'enterprises'}
+_GMAIL_DOMAINS = {'gmail.com', 'googlemail.com'}
+_SOUNDEX = {
+    **dict.fromkeys('bfpv', '1'), **dict.fromkeys('cgjkqsxz', '2'), **dict.fromkeys('dt', '3'),
+    'l': '4', **dict.fromkeys('mn', '5'), 'r': '6',
+}
+
+
+# ==================== Keys ====================
+
+def canonical_email(email: str) -> str:
+    email = (email or '').strip().lower()
+    local, at, domain = email.rpartition('@')
+    if not at or not local or not domain:
+        return ''
+    local = local.split('+', 1)[0]
+    if domain in _GMAIL_DOMAINS:
+        local, domain = local.replace('.', ''), 'gmail.com'
+    return f'{local}@{domain}'
+
+
+def canonical_phone(phone: str, country_code: Optional[str] = None) -> str:
+    """E.164 form of ``phone`` ('' if it has too few digits to be a number)"""
+    raw = (phone or '').strip()
+    digits = re.sub(r'\D', '', raw)
+    country_code = country_code or getattr(settings, 'LEAD_DEFAULT_COUNTRY_CODE', '254')
+    if raw.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = country_code + digits[1:]
+    elif not digits.startswith(country_code) or len(digits) <= 9:
+        digits = country_code + digits
+    if not 8 <= len(digits) <= 15:
+        return ''
+    return f'+{digits}'
+
+
+def _soundex(word: str) -> str:
+    code = word[0].upper()
+    previous = _SOUNDEX.get(word[0], '')
+    for letter in word[1:]:
+        digit = _SOUNDEX.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'hw':
+            previous = digit
+    return (code + '000')[:4]
+
+
+def name_key(name: str) -> str:
+    ascii_name = unicodedata.normalize('NFKD', name or '').encode('ascii', 'ignore').decode().lower()
+    words = [word for word in re.findall(r'[a-z]+', ascii_name) if word not in _NAME_STOPWORDS]
+    return ' '.join(sorted({_soundex(word) for word in words}))[:64]
+
+
+def keys_for(name: str = '', email: str = '', phone: str = '') -> Dict[str, str]:
+    return {'email_key': canonical_email(email), 'phone_key': canonical_phone(phone), 'name_key': name_key(name)}
+
+
+# ==================== Matching ====================
+
+def candidates(
+    name: str = '',
+    email: str = '',
+    phone: str = '',
+    exclude: Optional[int] = None,
+    limit: int = MAX_CANDIDATES,
+    require: Optional[str] = None,
+) -> List[Lead]:
+    """
+    Leads that may be the same person, best match first, from one indexed query.
+    Each lead carries ``match_score`` (EMAIL_SCORE + PHONE_SCORE + NAME_SCORE for the keys it shares;
+    a name shares its key when the Soundex keys match or the names are trigram-similar)
+    and ``name_similarity``, which breaks ties.
+    ``require`` names a key (e.g. 'email_key') every returned lead must share.
+    """
+    keys = keys_for(name, email, phone)
+    if require and not keys[require]:
+        return []
+    name = (name or '').strip()
+    weights = {'email_key': EMAIL_SCORE, 'phone_key': PHONE_SCORE, 'name_key': NAME_SCORE}
+    conditions = {field: Q(**{field: value}) for field, value in keys.items() if value}
+    if name:
+        conditions['name_key'] = conditions.get('name_key', Q()) | Q(name__trigram_similar=name)
+    match = Q()
+    score = Value(0)
+    for field, condition in conditions.items():
+        match |= condition
+        score = score + Case(When(condition, then=Value(weights[field])), default=Value(0))
+    if not match:
+        return []
+
+    leads = Lead.objects.filter(match)
+    if require:
+        leads = leads.filter(**{require: keys[require]})
+    if exclude:
+        leads = leads.exclude(pk=exclude)
+    similarity = TrigramSimilarity('name', name) if name else Value(0.0)
+    return list(
+        leads.annotate(match_score=ExpressionWrapper(score, output_field=IntegerField()), name_similarity=similarity)
+        .order_by('-match_score', '-name_similarity', '-converted_to_client', 'created_at')[:limit]
+    )
+
+
+def find_or_create(name: str, email: str = '', phone: str = '', **fields) -> Tuple[Lead, bool]:
+    """The existing lead with this email (best phone/name match first), or a new one; returns (lead, created)"""
+    best = next(iter(candidates(name, email, phone, limit=1, require='email_key')), None)
+    if best is not None:
+        return best, False
+    return Lead.objects.create(name=name, email=email or '', phone=phone or '', **fields), True
+
+
+# ==================== Bulk maintenance ====================
+
+def reindex(batch_size: int = MERGE_BATCH_SIZE) -> int:
+    """Fill the keys of leads saved before they existed; returns leads updated"""
+    updated = position = 0
+    while True:
+        leads = list(Lead.objects.filter(name_key__isnull=True, pk__gt=position).order_by('pk')[:batch_size])
+        if not leads:
+            return updated
+        for lead in leads:
+            for field, value in keys_for(lead.name, lead.email, lead.phone).items():
+                setattr(lead, field, value)
+        Lead.objects.bulk_update(leads, ['email_key', 'phone_key', 'name_key'])
+        updated += len(leads)
+        position = leads[-1].pk
+
+
+def _shared(key: str):
+    """Values of ``key`` held by more than one lead, with their member counts"""
+    return (
+        Lead.objects.exclude(**{key: ''}).order_by(key).values(key)
+        .annotate(members=Count('id')).filter(members__gt=1)
+    )
+
+
+def _survivors(key: str, limit: int) -> Dict[int, int]:
+    """duplicate id -> surviving id for the first groups sharing ``key`` (about ``limit`` duplicates)"""
+    groups = _shared(key)
+    values, duplicates = [], 0
+    for group in groups.iterator():
+        values.append(group[key])
+        duplicates += group['members'] - 1
+        if duplicates >= limit:
+            break
+    mapping: Dict[int, int] = {}
+    survivors: Dict[str, int] = {}
+    rows = Lead.objects.filter(**{f'{key}__in': values}).order_by(key, '-converted_to_client', 'pk')
+    for pk, value in rows.values_list('pk', key):
+        if value in survivors:
+            mapping[pk] = survivors[value]
+        else:
+            survivors[value] = pk
+    return mapping
+
+
+def _reassign(mapping: Dict[int, int]) -> None:
+    """Point every row referencing a duplicate at its survivor, one UPDATE per relation"""
+    for relation in Lead._meta.related_objects:
+        if relation.many_to_many:
+            continue
+        model, column, attname = relation.related_model, relation.field.name, relation.field.attname
+        rows = list(model._base_manager.filter(**{f'{column}__in': mapping}).values_list('pk', attname))
+        if relation.one_to_one:
+            # Only one row may point at a lead: keep the survivor's own, move the first of the rest
+            taken = set(model._base_manager.filter(**{f'{column}__in': set(mapping.values())}).values_list(attname, flat=True))
+            moved = []
+            for pk, lead_id in rows:
+                if mapping[lead_id] not in taken:
+                    taken.add(mapping[lead_id])
+                    moved.append((pk, lead_id))
+            rows = moved
+        if not rows:
+            continue
+        lead_ids = {lead_id for _, lead_id in rows}
+        model._base_manager.filter(pk__in=[pk for pk, _ in rows]).update(**{attname: Case(
+            *[When(**{attname: lead_id}, then=Value(mapping[lead_id])) for lead_id in lead_ids],
+            output_field=IntegerField(),
+        )})
+
+
+def merge(mapping: Dict[int, int]) -> int:
+    """
+    Fold each duplicate into its survivor: references are moved, blank
+    survivor fields are filled from the duplicate, and the duplicate is
+    deleted. Returns leads deleted.
+    """
+    if not mapping:
+        return 0
+    with transaction.atomic():
+        leads = Lead.objects.select_for_update().in_bulk(set(mapping) | set(mapping.values()))
+        mapping = {dup: keep for dup, keep in mapping.items() if dup in leads and keep in leads}
+        _reassign(mapping)
+
+        fill = ('email', 'source', 'product_interest', 'follow_up_date')
+        changed = {}
+        for duplicate_id, survivor_id in sorted(mapping.items()):
+            survivor, duplicate = leads[survivor_id], leads[duplicate_id]
+            for field in fill:
+                if not getattr(survivor, field) and getattr(duplicate, field):
+                    setattr(survivor, field, getattr(duplicate, field))
+            if duplicate.notes and duplicate.notes not in survivor.notes:
+                survivor.notes = '\n\n'.join(filter(None, [survivor.notes, f'[Merged {duplicate.lead_id}] {duplicate.notes}']))
+            if duplicate.converted_to_client and not survivor.converted_to_client:
+                survivor.converted_to_client, survivor.converted_at = True, duplicate.converted_at
+            survivor.email_key = canonical_email(survivor.email)
+            changed[survivor_id] = survivor
+        Lead.objects.bulk_update(list(changed.values()), list(fill) + ['notes', 'email_key', 'converted_to_client', 'converted_at'])
+        Lead.objects.filter(pk__in=list(mapping)).delete()
+    return len(mapping)
+
+
+def phone_matches(limit: int = MERGE_BATCH_SIZE) -> List[List[int]]:
+    """
+    Lead ids grouped by a shared phone, for review - never merged
+    automatically, since colleagues share office and switchboard numbers
+    """
+    values = [group['phone_key'] for group in _shared('phone_key')[:limit]]
+    groups: Dict[str, List[int]] = {}
+    for pk, value in Lead.objects.filter(phone_key__in=values).order_by('phone_key', 'pk').values_list('pk', 'phone_key'):
+        groups.setdefault(value, []).append(pk)
+    return list(groups.values())
+
+
+def merge_duplicates(batch_size: int = MERGE_BATCH_SIZE, max_batches: Optional[int] = None) -> Dict[str, int]:
+    """
+    Merge leads sharing an email key, ``batch_size`` duplicates per
+    transaction, and count the phone-only groups left for review
+    """
+    merged: Dict[str, int] = {'reindexed': reindex(batch_size), 'email_key': 0}
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        mapping = _survivors('email_key', batch_size)
+        if not mapping:
+            break
+        merged['email_key'] += merge(mapping)
+        batches += 1
+    merged['phone_suggestions'] = _shared('phone_key').count()
+    return merged
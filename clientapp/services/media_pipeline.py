@@ -0,0 +1,272 @@
+"""
+Product Media Pipeline
+Turns an uploaded ProductImage into responsive, metadata-stripped variants
+(fallback format + WebP + AVIF where Pillow supports it), and records the
+original dimensions and a blurhash placeholder. The stored original is
+re-saved without its EXIF/GPS data too, since it is served as uploaded.
+"""
+import io
+import logging
+import math
+import posixpath
+from typing import Any, Dict, List, Optional
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# Responsive widths (px). Only widths smaller than the original are produced,
+# plus the original width itself capped at the largest size.
+RESPONSIVE_WIDTHS = (320, 640, 960, 1280, 1920)
+VARIANT_DIR = 'products/images/variants'
+
+# format key -> (Pillow format, extension, mime type, save options)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'png': ('PNG', 'png', 'image/png', {'optimize': True}),
+    'webp': ('WEBP', 'webp', 'image/webp', {'quality': 80, 'method': 6}),
+    'avif': ('AVIF', 'avif', 'image/avif', {'quality': 60}),
+}
+# Preferred first, as listed in <picture><source> order
+MODERN_FORMATS = ('avif', 'webp')
+
+# Metadata that can identify the photographer or place (EXIF carries GPS)
+IDENTIFYING_INFO = ('exif', 'xmp', 'XML:com.adobe.xmp', 'comment', 'photoshop')
+# Re-saving the original is a second lossy pass for these, so keep it light
+ORIGINAL_OPTIONS = {'JPEG': {'quality': 95}, 'WEBP': {'quality': 95}}
+
+BLURHASH_COMPONENTS = (4, 3)
+
+
+def _modern_formats() -> List[str]:
+    return [fmt for fmt in MODERN_FORMATS if features.check(fmt)]
+
+
+def target_widths(original_width: int) -> List[int]:
+    widths = [w for w in RESPONSIVE_WIDTHS if w < original_width]
+    widths.append(min(original_width, RESPONSIVE_WIDTHS[-1]))
+    return widths
+
+
+def process_image(product_image) -> Dict[str, Any]:
+    """
+    Generate variants, dimensions and blurhash for a ProductImage and save
+    them on the instance.
+
+    Variants are re-encoded from pixels only, so EXIF/GPS/ICC metadata in the
+    upload never reaches the storefront; EXIF orientation is applied first.
+    An original that carries EXIF, XMP or comments is replaced by an oriented
+    copy without them; its ICC profile stays so colours do not shift.
+
+    Returns:
+        The variants mapping that was stored
+    """
+    with product_image.image.open('rb') as fh:
+        source = Image.open(fh)
+        source.load()
+    identifying = bool(source.getexif()) or any(key in source.info for key in IDENTIFYING_INFO)
+    pil_format = source.format
+    source = ImageOps.exif_transpose(source)
+    replaced = _strip_original(product_image, source, pil_format) if identifying else None
+
+    has_alpha = source.mode in ('RGBA', 'LA') or (source.mode == 'P' and 'transparency' in source.info)
+    source = source.convert('RGBA' if has_alpha else 'RGB')
+    fallback = 'png' if has_alpha else 'jpeg'
+
+    old_names = _variant_names(product_image.variants)
+    variants: Dict[str, List[Dict[str, Any]]] = {}
+    for width in target_widths(source.width):
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+        for fmt in [fallback] + _modern_formats():
+            name = _save_variant(product_image, resized, fmt, width)
+            variants.setdefault(fmt, []).append({'width': width, 'height': height, 'name': name})
+
+    product_image.width = source.width
+    product_image.height = source.height
+    product_image.blurhash = encode_blurhash(source.convert('RGB'))
+    product_image.variants = variants
+    product_image.processing_status = 'ready'
+    update_fields = ['width', 'height', 'blurhash', 'variants', 'processing_status']
+    product_image.save(update_fields=update_fields + (['image'] if replaced else []))
+
+    if replaced:
+        product_image.image.storage.delete(replaced)
+    # Clear variants of a previous upload that were not overwritten this time
+    for name in old_names - _variant_names(variants):
+        default_storage.delete(name)
+
+    return variants
+
+
+def _strip_original(product_image, image: Image.Image, pil_format: Optional[str]) -> Optional[str]:
+    """
+    Store the oriented upload again without identifying metadata and point
+    the field at it. Returns the superseded file's name, to delete once the
+    new name is saved (None if it was overwritten in place or not replaced).
+    """
+    Image.init()
+    if pil_format not in Image.SAVE:
+        logger.warning(f"ProductImage {product_image.pk}: cannot re-save {pil_format} original without metadata")
+        return None
+    clean = image.copy()
+    clean.info = {key: value for key, value in image.info.items() if key not in IDENTIFYING_INFO}
+    options = dict(ORIGINAL_OPTIONS.get(pil_format, {}))
+    if clean.info.get('icc_profile'):
+        options['icc_profile'] = clean.info['icc_profile']
+    buffer = io.BytesIO()
+    clean.save(buffer, pil_format, **options)
+
+    field = product_image.image
+    old_name = field.name
+    field.name = field.storage.save(old_name, ContentFile(buffer.getvalue()))
+    return old_name if field.name != old_name else None
+
+
+def _save_variant(product_image, image: Image.Image, fmt: str, width: int) -> str:
+    pil_format, extension, _, options = FORMATS[fmt]
+    buffer = io.BytesIO()
+    image.save(buffer, pil_format, **options)
+
+    name = posixpath.join(VARIANT_DIR, str(product_image.pk), f'{width}w.{extension}')
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def _variant_names(variants: Optional[Dict[str, List[Dict[str, Any]]]]) -> set:
+    return {entry['name'] for entries in (variants or {}).values() for entry in entries}
+
+
+def delete_variants(product_image) -> None:
+    for name in _variant_names(product_image.variants):
+        default_storage.delete(name)
+
+
+def schedule_image_processing(image_id: int) -> None:
+    """Queue processing after the upload commits; process inline without a worker"""
+    def enqueue():
+        try:
+            from ..tasks import process_product_image
+            process_product_image.delay(image_id)
+        except Exception as e:
+            logger.warning(f"Could not queue image processing, processing inline: {e}")
+            process_image_by_id(image_id)
+
+    transaction.on_commit(enqueue)
+
+
+def process_image_by_id(image_id: int) -> Optional[Dict[str, Any]]:
+    from ..models import ProductImage
+
+    product_image = ProductImage.objects.filter(pk=image_id).first()
+    if product_image is None or not product_image.image:
+        return None
+    try:
+        return process_image(product_image)
+    except Exception as e:
+        logger.error(f"Image processing failed for ProductImage {image_id}: {e}")
+        ProductImage.objects.filter(pk=image_id).update(processing_status='failed')
+        return None
+
+
+# ==================== Serializer helpers ====================
+
+def _url(name: str, request=None) -> str:
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def srcset(product_image, fmt: Optional[str] = None, request=None) -> str:
+    """``srcset`` attribute value for one format (defaults to the fallback format)"""
+    variants = product_image.variants or {}
+    if fmt is None:
+        fmt = 'png' if 'png' in variants else 'jpeg'
+    return ', '.join(f"{_url(v['name'], request)} {v['width']}w" for v in variants.get(fmt, []))
+
+
+def picture_sources(product_image, request=None) -> List[Dict[str, str]]:
+    """``<source>`` entries for a <picture> element, best format first"""
+    variants = product_image.variants or {}
+    return [
+        {'type': FORMATS[fmt][2], 'srcset': srcset(product_image, fmt, request)}
+        for fmt in MODERN_FORMATS
+        if variants.get(fmt)
+    ]
+
+
+# ==================== Blurhash ====================
+
+_BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+def _base83(value: int, length: int) -> str:
+    return ''.join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    return v / 12.92 if v <= 0.04045 else ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def encode_blurhash(image: Image.Image, components=BLURHASH_COMPONENTS) -> str:
+    """
+    Encode a blurhash (https://blurha.sh) of an RGB image. The image is
+    shrunk to 32px first - the hash only keeps a handful of DCT components.
+    """
+    cx, cy = components
+    small = image.copy()
+    small.thumbnail((32, 32))
+    width, height = small.size
+    pixels = [tuple(_srgb_to_linear(c) for c in px) for px in small.getdata()]
+
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(cx)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(cy)]
+
+    factors = []
+    for j in range(cy):
+        for i in range(cx):
+            scale = (1 if i == 0 and j == 0 else 2) / (width * height)
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                for x in range(width):
+                    basis = cos_x[i][x] * cos_y[j][y]
+                    pr, pg, pb = pixels[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83((cx - 1) + (cy - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(c) for factor in ac for c in factor)
+        quantised_max = int(max(0, min(82, math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_value = 0, 1
+    result += _base83(quantised_max, 1)
+
+    result += _base83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+
+    for factor in ac:
+        q = [int(max(0, min(18, math.floor(_sign_pow(c / max_value, 0.5) * 9 + 9.5)))) for c in factor]
+        result += _base83(q[0] * 19 * 19 + q[1] * 19 + q[2], 2)
+
+    return result
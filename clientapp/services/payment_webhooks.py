@@ -0,0 +1,492 @@
+"""
+Payment Webhook Ingestion
+Gateway callbacks are stored and acknowledged at once; a worker applies them.
+
+receive() verifies the callback, normalizes it and inserts it into
+PaymentWebhookEvent, where the unique (provider, event_id) key turns gateway
+retries away at INSERT time. It then schedules a drain of the queue: one
+task per burst, not one per callback.
+
+process_pending() claims unprocessed events with skip_locked and applies
+each under select_for_update on its order and transaction, so a callback
+and a verify cannot interleave. Statuses only move forward (pending ->
+failed -> completed): a late 'failed' after 'completed' is stale, and an
+event that arrives before its transaction exists is retried.
+
+A Pesapal IPN only says that an order's status changed (OrderTrackingId,
+OrderMerchantReference, OrderNotificationType). It is stored under its
+tracking id with status 'unknown', and the worker reads the actual status
+from Pesapal's GetTransactionStatus before applying it, retrying while the
+payment is still pending. Another IPN for an already processed order
+re-arms the stored event instead of being dropped as a duplicate.
+
+FakeGateway builds signed callbacks (and answers Pesapal status lookups)
+for tests and local development.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Optional, Tuple
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Order, PaymentTransaction, PaymentWebhookEvent
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+MAX_ATTEMPTS = 10
+# Stripe rejects signatures older than this by default
+SIGNATURE_TOLERANCE = 300
+DRAIN_LOCK_KEY = 'payment-webhooks:drain-scheduled'
+DRAIN_COALESCE_SECONDS = 1
+PESAPAL_TOKEN_KEY = 'payment-webhooks:pesapal-token'
+# Pesapal access tokens are valid for five minutes
+PESAPAL_TOKEN_TTL = 240
+PESAPAL_TIMEOUT = 15
+
+# Forward-only precedence of transaction statuses
+_RANK = {'pending': 0, 'processing': 1, 'cancelled': 2, 'failed': 2, 'completed': 3, 'refunded': 4}
+_COMPLETED = {'completed', 'success', 'succeeded', 'paid'}
+_FAILED = {'failed', 'cancelled', 'canceled', 'invalid', 'reversed'}
+
+
+class WebhookRejected(Exception):
+    """The callback failed verification or could not be parsed"""
+
+
+class WebhookNotConfigured(WebhookRejected):
+    """No secret is configured for the provider, so its callbacks cannot be trusted"""
+
+
+@dataclass
+class ParsedEvent:
+    event_id: str
+    transaction_id: str
+    status: str
+    message: str = ''
+    occurred_at: Optional[datetime] = None
+
+
+def _normalize(status) -> str:
+    status = str(status or '').lower()
+    if status in _COMPLETED:
+        return 'completed'
+    if status in _FAILED:
+        return 'failed'
+    return 'unknown'
+
+
+def _payload_hash(payload: Dict) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+# ==================== Provider formats ====================
+
+def _parse_stripe(payload: Dict) -> ParsedEvent:
+    intent = (payload.get('data') or {}).get('object') or {}
+    event_type = payload.get('type', '')
+    if event_type.endswith('.succeeded'):
+        status = 'completed'
+    elif event_type.endswith('.payment_failed') or event_type.endswith('.canceled'):
+        status = 'failed'
+    else:
+        status = 'unknown'
+    created = payload.get('created')
+    return ParsedEvent(
+        event_id=payload.get('id') or _payload_hash(payload),
+        transaction_id=(intent.get('metadata') or {}).get('transaction_id') or intent.get('id', ''),
+        status=status,
+        message=((intent.get('last_payment_error') or {}).get('message') or ''),
+        occurred_at=datetime.fromtimestamp(created, tz=dt_timezone.utc) if created else None,
+    )
+
+
+def _parse_mpesa(payload: Dict) -> ParsedEvent:
+    callback = (payload.get('Body') or {}).get('stkCallback')
+    if not callback:
+        return _parse_generic(payload)
+    # Daraja retries a callback with the same CheckoutRequestID
+    return ParsedEvent(
+        event_id=callback.get('CheckoutRequestID') or _payload_hash(payload),
+        transaction_id=callback.get('CheckoutRequestID', ''),
+        status='completed' if str(callback.get('ResultCode')) == '0' else 'failed',
+        message=callback.get('ResultDesc', ''),
+    )
+
+
+def _parse_pesapal(payload: Dict) -> ParsedEvent:
+    tracking_id = payload.get('OrderTrackingId')
+    if not tracking_id:
+        return _parse_generic(payload)
+    # The IPN carries no status; the worker looks it up (resolve_pesapal)
+    return ParsedEvent(
+        event_id=str(tracking_id),
+        transaction_id=payload.get('OrderMerchantReference', ''),
+        status='unknown',
+    )
+
+
+def _parse_generic(payload: Dict) -> ParsedEvent:
+    """The original {transaction_id|reference, status, message} callback format"""
+    return ParsedEvent(
+        event_id=str(payload.get('event_id') or _payload_hash(payload)),
+        transaction_id=payload.get('transaction_id') or payload.get('reference') or '',
+        status=_normalize(payload.get('status')),
+        message=payload.get('message', ''),
+    )
+
+
+PARSERS = {'stripe': _parse_stripe, 'mpesa': _parse_mpesa, 'pesapal': _parse_pesapal}
+
+
+# ==================== Verification ====================
+
+def webhook_secret(provider: str) -> str:
+    return (getattr(settings, 'PAYMENT_WEBHOOK_SECRETS', {}) or {}).get(provider, '')
+
+
+def stripe_signature(secret: str, body: bytes, timestamp: int) -> str:
+    signed = f'{timestamp}.'.encode() + body
+    return hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+
+
+def verify(provider: str, body: bytes, headers: Dict[str, str], token: str = '') -> None:
+    """
+    Check the callback came from the gateway. Stripe signs the body; M-Pesa
+    and Pesapal callbacks carry a token in the callback URL we registered
+    with them. Without a configured secret callbacks are refused, except
+    under DEBUG for local development.
+
+    Raises:
+        WebhookNotConfigured: The provider has no secret configured
+        WebhookRejected: Signature or token mismatch
+    """
+    secret = webhook_secret(provider)
+    if not secret:
+        if settings.DEBUG:
+            return
+        logger.error(f"Refused a {provider} callback: no webhook secret is configured")
+        raise WebhookNotConfigured(f'Payment callbacks for {provider} are not configured')
+    if provider != 'stripe':
+        if not hmac.compare_digest(token or '', secret):
+            raise WebhookRejected('Invalid callback token')
+        return
+
+    parts = {}
+    for item in headers.get('Stripe-Signature', '').split(','):
+        key, _, value = item.partition('=')
+        parts.setdefault(key.strip(), []).append(value.strip())
+    try:
+        timestamp = int(parts['t'][0])
+    except (KeyError, ValueError):
+        raise WebhookRejected('Missing signature timestamp') from None
+    if abs(time.time() - timestamp) > SIGNATURE_TOLERANCE:
+        raise WebhookRejected('Signature too old')
+    expected = stripe_signature(secret, body, timestamp)
+    if not any(hmac.compare_digest(expected, candidate) for candidate in parts.get('v1', [])):
+        raise WebhookRejected('Invalid signature')
+
+
+# ==================== Receiving ====================
+
+def record(provider: str, payload: Dict) -> Tuple[PaymentWebhookEvent, bool]:
+    """Store a parsed callback; returns (event, created) - created is False for a retry"""
+    if provider not in PARSERS:
+        raise WebhookRejected(f'Unsupported payment provider: {provider}')
+    try:
+        parsed = PARSERS[provider](payload)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise WebhookRejected(f'Malformed {provider} callback: {e}') from None
+
+    event = PaymentWebhookEvent(
+        provider=provider,
+        event_id=parsed.event_id[:255],
+        transaction_id=(parsed.transaction_id or '')[:255],
+        status=parsed.status,
+        message=parsed.message or '',
+        occurred_at=parsed.occurred_at,
+        payload=payload,
+    )
+    try:
+        with transaction.atomic():
+            event.save()
+        return event, True
+    except IntegrityError:
+        # A gateway retry of an event we already hold
+        stored = PaymentWebhookEvent.objects.filter(provider=provider, event_id=event.event_id)
+        if provider == 'pesapal':
+            # ...or a later status change of the same order: look the status up again
+            stored.filter(processed_at__isnull=False).update(processed_at=None, outcome='', attempts=0, last_error='')
+        return stored.get(), False
+
+
+def receive(provider: str, body: bytes, headers: Dict[str, str], token: str = '') -> Tuple[PaymentWebhookEvent, bool]:
+    """
+    Verify, store and schedule a callback. Cheap enough to run inside the
+    gateway's request: one INSERT (plus a SELECT for retries).
+
+    Raises:
+        WebhookNotConfigured: The provider has no secret configured
+        WebhookRejected: Verification failed or the body is not a JSON object
+    """
+    verify(provider, body, headers, token)
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        raise WebhookRejected('Body is not JSON') from None
+    if not isinstance(payload, dict):
+        raise WebhookRejected('Body is not a JSON object')
+    event, created = record(provider, payload)
+    transaction.on_commit(schedule_drain)
+    return event, created
+
+
+def schedule_drain() -> None:
+    """Queue one worker run per DRAIN_COALESCE_SECONDS, however many callbacks arrive"""
+    if not cache.add(DRAIN_LOCK_KEY, 1, DRAIN_COALESCE_SECONDS):
+        return
+    try:
+        from clientapp.tasks import process_payment_webhooks
+        process_payment_webhooks.delay()
+    except Exception as e:
+        # The periodic task picks the events up
+        logger.warning(f"Could not queue payment webhook processing: {e}")
+
+
+# ==================== Pesapal status lookup ====================
+
+def _pesapal_url(path: str) -> str:
+    return getattr(settings, 'PESAPAL_API_URL', 'https://pay.pesapal.com/v3').rstrip('/') + path
+
+
+def _pesapal_token() -> str:
+    token = cache.get(PESAPAL_TOKEN_KEY)
+    if token:
+        return token
+    consumer_key = getattr(settings, 'PESAPAL_CONSUMER_KEY', '')
+    consumer_secret = getattr(settings, 'PESAPAL_CONSUMER_SECRET', '')
+    if not consumer_key or not consumer_secret:
+        raise WebhookNotConfigured('Pesapal API credentials are not configured')
+    response = requests.post(
+        _pesapal_url('/api/Auth/RequestToken'),
+        json={'consumer_key': consumer_key, 'consumer_secret': consumer_secret},
+        headers={'Accept': 'application/json'},
+        timeout=PESAPAL_TIMEOUT,
+    )
+    response.raise_for_status()
+    data = response.json()
+    if not data.get('token'):
+        raise RuntimeError(f"Pesapal token request failed: {data.get('error') or data.get('message')}")
+    cache.set(PESAPAL_TOKEN_KEY, data['token'], PESAPAL_TOKEN_TTL)
+    return data['token']
+
+
+def pesapal_transaction_status(tracking_id: str) -> Dict:
+    """Pesapal's GetTransactionStatus response for an order tracking id"""
+    response = requests.get(
+        _pesapal_url('/api/Transactions/GetTransactionStatus'),
+        params={'orderTrackingId': tracking_id},
+        headers={'Accept': 'application/json', 'Authorization': f'Bearer {_pesapal_token()}'},
+        timeout=PESAPAL_TIMEOUT,
+    )
+    response.raise_for_status()
+    data = response.json()
+    error = data.get('error') or {}
+    if error.get('code') or error.get('message'):
+        raise RuntimeError(f"Pesapal status lookup failed for {tracking_id}: {error.get('message') or error.get('code')}")
+    return data
+
+
+def resolve_pesapal(event: PaymentWebhookEvent) -> Dict:
+    """Look up the status an IPN announced and store it on the event; returns Pesapal's response"""
+    response = pesapal_transaction_status(event.event_id)
+    event.status = _normalize(response.get('payment_status_description'))
+    event.message = response.get('description') or ''
+    PaymentWebhookEvent.objects.filter(pk=event.pk).update(status=event.status, message=event.message)
+    return response
+
+
+# ==================== Processing ====================
+
+def apply_status(payment_transaction: PaymentTransaction, status: str, message: str = '', response=None) -> str:
+    """
+    Move a locked transaction (and its locked order) forward to ``status``.
+    Returns 'applied', 'duplicate' or 'stale'.
+    """
+    current = payment_transaction.status
+    if status == current:
+        return 'duplicate'
+    if _RANK.get(status, -1) <= _RANK.get(current, -1):
+        return 'stale'
+
+    now = timezone.now()
+    payment_transaction.status = status
+    if response is not None:
+        payment_transaction.gateway_response = response
+    if status == 'completed':
+        payment_transaction.completed_at = now
+        payment_transaction.save(update_fields=['status', 'gateway_response', 'completed_at', 'updated_at'])
+
+        order = payment_transaction.order
+        order.payment_status = 'completed'
+        if order.status == 'pending':
+            order.status = 'paid'
+        if order.paid_at is None:
+            order.paid_at = now
+        order.save()
+    else:
+        payment_transaction.failure_reason = message or 'Payment failed'
+        payment_transaction.save(update_fields=['status', 'gateway_response', 'failure_reason', 'updated_at'])
+    return 'applied'
+
+
+def process_event(event: PaymentWebhookEvent) -> str:
+    """Apply one stored event; call inside a transaction. Returns its outcome ('' = retry later)."""
+    response = event.payload
+    if event.provider == 'pesapal':
+        response = resolve_pesapal(event)
+        if event.status == 'unknown':
+            # Still pending at Pesapal; look again on a later run
+            return 'ignored' if event.attempts + 1 >= MAX_ATTEMPTS else ''
+    if event.status == 'unknown':
+        return 'ignored'
+    order_id = PaymentTransaction.objects.filter(
+        transaction_id=event.transaction_id, payment_method=event.provider
+    ).values_list('order_id', flat=True).first()
+    if order_id is None:
+        # The callback may have beaten the transaction's own commit
+        return 'unmatched' if event.attempts + 1 >= MAX_ATTEMPTS else ''
+
+    # Same lock order everywhere: order, then transaction
+    Order.objects.select_for_update().filter(pk=order_id).first()
+    payment_transaction = PaymentTransaction.objects.select_for_update().select_related('order').get(
+        transaction_id=event.transaction_id, payment_method=event.provider
+    )
+    return apply_status(payment_transaction, event.status, event.message, response=response)
+
+
+def process(event: PaymentWebhookEvent) -> str:
+    """Apply one event in a savepoint and record the attempt; returns its outcome ('' = retry later)"""
+    error = ''
+    try:
+        with transaction.atomic():
+            outcome = process_event(event)
+    except Exception as e:
+        logger.exception(f"Payment webhook {event.provider}/{event.event_id} failed")
+        outcome = 'error' if event.attempts + 1 >= MAX_ATTEMPTS else ''
+        error = str(e)
+
+    fields = {'attempts': F('attempts') + 1, 'last_error': error}
+    if outcome:
+        fields.update(processed_at=timezone.now(), outcome=outcome)
+    PaymentWebhookEvent.objects.filter(pk=event.pk).update(**fields)
+    return outcome
+
+
+def process_pending(batch_size: int = BATCH_SIZE, max_batches: Optional[int] = None) -> Dict[str, int]:
+    """
+    Apply unprocessed events in arrival order.
+
+    Each event is claimed with skip_locked and committed in its own
+    transaction, so several workers drain the queue in parallel and order
+    rows are locked only while their own event is applied.
+
+    Returns:
+        Count per outcome ('retry' for events left for a later run)
+    """
+    pending = PaymentWebhookEvent.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+    counts: Dict[str, int] = {}
+    position = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        batch = list(pending.filter(pk__gt=position).order_by('pk').values_list('pk', flat=True)[:batch_size])
+        for pk in batch:
+            with transaction.atomic():
+                event = pending.filter(pk=pk).select_for_update(skip_locked=True).first()
+                if event is None:
+                    # Claimed by another worker (or finished) meanwhile
+                    continue
+                outcome = process(event)
+            counts[outcome or 'retry'] = counts.get(outcome or 'retry', 0) + 1
+        batches += 1
+        if len(batch) < batch_size:
+            break
+        position = batch[-1]
+    return counts
+
+
+# ==================== Local fake gateway ====================
+
+class FakeGateway:
+    """
+    Builds callbacks the way each gateway sends them, signed with the
+    configured secret: ``body, headers, token = FakeGateway('stripe').callback(...)``
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.sequence = 0
+        # Pesapal: tracking id -> (merchant reference, status) for transaction_status()
+        self.orders: Dict[str, Tuple[str, str]] = {}
+
+    def payload(self, transaction_id: str, status: str, event_id: Optional[str] = None) -> Dict:
+        self.sequence += 1
+        if self.provider == 'stripe':
+            return {
+                'id': event_id or f'evt_fake_{self.sequence}',
+                'type': 'payment_intent.succeeded' if status == 'completed' else 'payment_intent.payment_failed',
+                'created': int(time.time()),
+                'data': {'object': {
+                    'id': f'pi_fake_{self.sequence}',
+                    'metadata': {'transaction_id': transaction_id},
+                    'last_payment_error': None if status == 'completed' else {'message': 'Card declined'},
+                }},
+            }
+        if self.provider == 'mpesa':
+            return {'Body': {'stkCallback': {
+                'MerchantRequestID': event_id or f'fake-{self.sequence}',
+                'CheckoutRequestID': transaction_id,
+                'ResultCode': 0 if status == 'completed' else 1032,
+                'ResultDesc': 'The service request is processed successfully.' if status == 'completed'
+                else 'Request cancelled by user',
+            }}}
+        # One tracking id per order, as Pesapal assigns it; the status is only in the lookup
+        tracking_id = event_id or f'trk-{transaction_id}'
+        self.orders[tracking_id] = (transaction_id, status)
+        return {
+            'OrderTrackingId': tracking_id,
+            'OrderMerchantReference': transaction_id,
+            'OrderNotificationType': 'IPNCHANGE',
+        }
+
+    def transaction_status(self, tracking_id: str) -> Dict:
+        """What Pesapal's GetTransactionStatus returns for an order this gateway has called back about"""
+        transaction_id, status = self.orders[tracking_id]
+        description, code = {'completed': ('Completed', 1), 'failed': ('Failed', 2)}.get(status, ('Pending', 0))
+        return {
+            'payment_status_description': description,
+            'status_code': code,
+            'merchant_reference': transaction_id,
+            'description': '' if status == 'completed' else f'Payment {description.lower()}',
+            'error': {'error_type': None, 'code': None, 'message': None},
+            'status': '200',
+        }
+
+    def callback(self, transaction_id: str, status: str, event_id: Optional[str] = None) -> Tuple[bytes, Dict[str, str], str]:
+        body = json.dumps(self.payload(transaction_id, status, event_id)).encode()
+        secret = webhook_secret(self.provider)
+        headers: Dict[str, str] = {}
+        if self.provider == 'stripe' and secret:
+            timestamp = int(time.time())
+            headers['Stripe-Signature'] = f't={timestamp},v1={stripe_signature(secret, body, timestamp)}'
+        return body, headers, secret if self.provider != 'stripe' else ''
@@ -0,0 +1,156 @@
+"""
+Periodic Jobs
+The row-by-row periodic tasks of tasks.py as chunked jobs
+(services.chunked_tasks). Each processor handles one batch of rows with a
+fixed number of queries: duplicate checks are one lookup for the whole
+batch and new rows are bulk-created.
+"""
+from datetime import timedelta
+from typing import Dict, List
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import ActivityLog, ChatbotConversation, Job, Notification, ProductionUnit, PurchaseOrder, SystemAlert
+from . import progress_stream
+from .chunked_tasks import register
+
+REMINDER_WINDOW_DAYS = 3
+OPEN_PO_STATUSES = ['NEW', 'ACCEPTED', 'IN_PRODUCTION', 'AWAITING_APPROVAL']
+CONVERSATION_RETENTION_DAYS = 90
+
+
+# ==================== Job deadline reminders ====================
+
+def approaching_jobs():
+    today = timezone.now().date()
+    return Job.objects.filter(
+        expected_completion__gte=today,
+        expected_completion__lte=today + timedelta(days=REMINDER_WINDOW_DAYS),
+        status__in=['pending', 'in_progress'],
+        person_in_charge__isnull=False,
+    ).select_related('person_in_charge', 'client')
+
+
+@register('job-deadline-reminders', approaching_jobs, batch_size=200)
+def send_deadline_reminders(jobs: List[Job]) -> Dict[str, int]:
+    """Notify the person in charge, at most once a day per job"""
+    today = timezone.now().date()
+    titles = {job.pk: f'Deadline Reminder for Job {job.job_number}' for job in jobs}
+    reminded = set(ActivityLog.objects.filter(
+        client_id__in={job.client_id for job in jobs},
+        title__in=titles.values(),
+        created_at__gte=timezone.now() - timedelta(days=1),
+    ).values_list('title', flat=True))
+    due = [job for job in jobs if titles[job.pk] not in reminded]
+
+    Notification.objects.bulk_create([
+        Notification(
+            recipient=job.person_in_charge,
+            notification_type='job_deadline_reminder',
+            title=f'Deadline Reminder: {job.job_name}',
+            message=f'Job {job.job_number} ({job.client.name}) is due on {job.expected_completion}. Days remaining: {(job.expected_completion - today).days}',
+            link=f'/jobs/{job.id}/',
+        )
+        for job in due
+    ])
+    ActivityLog.objects.bulk_create([
+        ActivityLog(
+            client=job.client,
+            activity_type='Job',
+            title=titles[job.pk],
+            description=f'Reminder sent to {job.person_in_charge.get_full_name()}. Due: {job.expected_completion}',
+        )
+        for job in due
+    ])
+    return {'reminders_sent': len(due), 'already_reminded': len(jobs) - len(due)}
+
+
+# ==================== Purchase orders ====================
+
+def overdue_pos():
+    return PurchaseOrder.objects.filter(
+        required_by__lt=timezone.now().date(),
+        status__in=OPEN_PO_STATUSES,
+    ).select_related('vendor')
+
+
+@register('po-overdue-alerts', overdue_pos, batch_size=200)
+def create_overdue_alerts(pos: List[PurchaseOrder]) -> Dict[str, int]:
+    """One open alert per overdue PO for PT to follow up with the vendor"""
+    today = timezone.now().date()
+    titles = {po.pk: f'PO {po.po_number} Overdue' for po in pos}
+    alerted = set(SystemAlert.objects.filter(
+        title__in=titles.values(), is_active=True, is_dismissed=False,
+    ).values_list('title', flat=True))
+    new = [po for po in pos if titles[po.pk] not in alerted]
+    SystemAlert.objects.bulk_create([
+        SystemAlert(
+            alert_type='po_overdue',
+            severity='high',
+            title=titles[po.pk],
+            message=f'PO {po.po_number} from {po.vendor.name} was due on {po.required_by} ({(today - po.required_by).days} days overdue). Status: {po.status}',
+            visible_to_production=True,
+        )
+        for po in new
+    ])
+    return {'alerts_created': len(new), 'already_alerted': len(pos) - len(new)}
+
+
+def unsynced_completed_pos():
+    return PurchaseOrder.objects.filter(status='COMPLETED', invoice_sent=False).only('pk')
+
+
+@register('qb-po-sync', unsynced_completed_pos, queue='integrations')
+def mark_pos_for_qb_sync(pos: List[PurchaseOrder]) -> Dict[str, int]:
+    """
+    Mark completed POs ready for QB sync (the QB service does the actual sync).
+    The bulk update skips PurchaseOrder post_save, so the progress stream is told here.
+    """
+    marked = list(PurchaseOrder.objects.select_for_update().filter(
+        pk__in=[po.pk for po in pos], invoice_sent=False,
+    ).values_list('pk', flat=True))
+    now = timezone.now()
+    PurchaseOrder.objects.filter(pk__in=marked).update(invoice_sent=True, updated_at=now, last_activity_at=now)
+    transaction.on_commit(lambda: [progress_stream.publish_current('po', pk) for pk in marked], robust=True)
+    return {'pos_synced': len(marked)}
+
+
+# ==================== Production units ====================
+
+def units_due_for_status():
+    today = timezone.now().date()
+    return ProductionUnit.objects.filter(
+        Q(expected_start_date__lte=today, status='pending_po') |
+        Q(expected_end_date__lt=today, status__in=['pending_po', 'in_progress'])
+    ).only('pk')
+
+
+@register('production-unit-status', units_due_for_status)
+def advance_unit_status(units: List[ProductionUnit]) -> Dict[str, int]:
+    """Start units whose start date has come, then flag those past their end date as delayed"""
+    today = timezone.now().date()
+    unit_ids = [unit.pk for unit in units]
+    started = ProductionUnit.objects.filter(
+        pk__in=unit_ids, expected_start_date__lte=today, status='pending_po',
+    ).update(status='in_progress')
+    delayed = ProductionUnit.objects.filter(
+        pk__in=unit_ids, expected_end_date__lt=today, status__in=['pending_po', 'in_progress'],
+    ).update(status='delayed')
+    return {'started': started, 'delayed': delayed}
+
+
+# ==================== Chatbot ====================
+
+def old_conversations():
+    return ChatbotConversation.objects.filter(
+        ended_at__lt=timezone.now() - timedelta(days=CONVERSATION_RETENTION_DAYS),
+        resolved=True,
+    ).only('pk')
+
+
+@register('conversation-cleanup', old_conversations, batch_size=1000)
+def delete_conversations(conversations: List[ChatbotConversation]) -> Dict[str, int]:
+    _, deleted = ChatbotConversation.objects.filter(pk__in=[c.pk for c in conversations]).delete()
+    return {'deleted_count': deleted.get(ChatbotConversation._meta.label, 0)}
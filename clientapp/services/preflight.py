@@ -2,10 +2,304 @@
 Design & Artwork Intelligence - Preflight Service
 Stateless file validation for print-ready artwork
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Set, Tuple
 from decimal import Decimal
-import mimetypes
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError, wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse, unquote
+import hashlib
+import ipaddress
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
 
+from django.conf import settings
+from django.http.request import split_domain_port, validate_host
+
+from . import cache as preflight_cache
+from .preflight_analyzer import ANALYZER_VERSION, analyze_file
+
+logger = logging.getLogger(__name__)
+
+PREFLIGHT = 'preflight'
+RESULT_CACHE_TIMEOUT = 30 * 24 * 3600
+READ_CHUNK = 1024 * 1024
+MM_PER_INCH = Decimal('25.4')
+MM_PER_POINT = Decimal('25.4') / 72
+# Box comparisons tolerate rounding in the authoring tool (mm)
+BOX_TOLERANCE_MM = Decimal('0.5')
+
+_UNIT_TO_MM = {'mm': Decimal('1'), 'cm': Decimal('10'), 'in': MM_PER_INCH}
+
+# Requirements used when a product has no ProductProduction row
+DEFAULT_REQUIREMENTS = {
+    'color_profile': 'cmyk',
+    'bleed_mm': Decimal('3.0'),
+    'min_resolution_dpi': 300,
+}
+
+
+class PreflightError(Exception):
+    """The design file could not be fetched for analysis"""
+
+
+# ==================== Bounded analysis pool ====================
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+_slots: Optional[threading.BoundedSemaphore] = None
+# Futures submitted to each pool, so a retired pool can finish them first
+_in_flight: Dict[ProcessPoolExecutor, Set[Future]] = {}
+
+
+def _get_executor() -> Tuple[ProcessPoolExecutor, threading.BoundedSemaphore]:
+    global _executor, _slots
+    with _executor_lock:
+        if _executor is None:
+            workers = max(1, settings.PREFLIGHT_WORKERS)
+            # spawn: workers only import the Django-free analyzer module, and
+            # never inherit the parent's threads, DB connections or sockets
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            if _slots is None:
+                # Work admitted at once: one running + one queued per worker.
+                # Created once - requests in flight release the same object
+                _slots = threading.BoundedSemaphore(workers * 2)
+        return _executor, _slots
+
+
+def _submit(executor: ProcessPoolExecutor, path: str) -> Future:
+    future = executor.submit(analyze_file, path)
+    with _executor_lock:
+        _in_flight.setdefault(executor, set()).add(future)
+
+    def forget(done: Future) -> None:
+        with _executor_lock:
+            futures = _in_flight.get(executor)
+            if futures is not None:
+                futures.discard(done)
+                if not futures and executor is not _executor:
+                    del _in_flight[executor]
+
+    future.add_done_callback(forget)
+    return future
+
+
+def _retire_executor(executor: ProcessPoolExecutor, stuck: Optional[Future] = None) -> None:
+    """
+    Send new work to a fresh pool and let this one finish the other requests'
+    analyses before its workers - including one stuck on a pathological
+    file - are killed.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+        others = [future for future in _in_flight.get(executor, ()) if future is not stuck]
+
+    def drain() -> None:
+        futures_wait(others, timeout=settings.PREFLIGHT_TIMEOUT)
+        for process in list((getattr(executor, '_processes', None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        with _executor_lock:
+            _in_flight.pop(executor, None)
+
+    threading.Thread(target=drain, name='preflight-retire', daemon=True).start()
+
+
+def run_analysis(path: str) -> Tuple[Dict[str, Any], bool]:
+    """
+    Analyze a file in the worker pool.
+
+    Returns:
+        (facts, cacheable) - timeouts and an overloaded pool are not cacheable
+    """
+    timeout = settings.PREFLIGHT_TIMEOUT
+
+    # Pools cannot be started from daemonic processes (Celery prefork
+    # children) - those already run off the request path, so analyze inline
+    if multiprocessing.current_process().daemon:
+        return analyze_file(path), True
+
+    executor, slots = _get_executor()
+    if not slots.acquire(timeout=timeout):
+        return {'error': 'Preflight is busy, please try again shortly'}, False
+    future = None
+    try:
+        future = _submit(executor, path)
+        return future.result(timeout=timeout), True
+    except FuturesTimeoutError:
+        logger.warning(f"Preflight analysis timed out after {timeout}s")
+        # Still queued: drop it. Running: only its worker has to go
+        if not future.cancel():
+            _retire_executor(executor, stuck=future)
+        return {'error': f'Analysis timed out after {timeout}s'}, False
+    except BrokenProcessPool:
+        logger.error("Preflight worker died during analysis")
+        _retire_executor(executor, stuck=future)
+        return {'error': 'Analysis failed, please try again'}, False
+    finally:
+        slots.release()
+
+
+# ==================== File access ====================
+
+def _is_own_host(hostname: Optional[str], request_host: Optional[str] = None) -> bool:
+    """Whether a file URL's host is this site (relative URLs, the request's host or ALLOWED_HOSTS)"""
+    if not hostname:
+        return True
+    if request_host and hostname == split_domain_port(request_host)[0]:
+        return True
+    # A wildcard would make every host "ours"
+    return validate_host(hostname, [host for host in settings.ALLOWED_HOSTS if host != '*'])
+
+
+def _local_media_path(file_url: str, request_host: Optional[str] = None) -> Optional[str]:
+    """Path under MEDIA_ROOT for URLs pointing at our own media, else None"""
+    media_url = settings.MEDIA_URL or '/media/'
+    parsed = urlparse(file_url)
+    path = unquote(parsed.path)
+    if not path.startswith(media_url) or not _is_own_host(parsed.hostname, request_host):
+        return None
+    media_root = os.path.realpath(settings.MEDIA_ROOT)
+    candidate = os.path.realpath(os.path.join(media_root, path[len(media_url):]))
+    if not candidate.startswith(media_root + os.sep) or not os.path.isfile(candidate):
+        return None
+    return candidate
+
+
+def _check_remote_host(file_url: str) -> str:
+    """
+    Refuse hosts outside PREFLIGHT_ALLOWED_HOSTS and private/loopback addresses.
+
+    Returns:
+        The checked address, which the download must connect to
+    """
+    parsed = urlparse(file_url)
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        raise PreflightError('Only http(s) file URLs can be analyzed')
+
+    allowed = [host for host in settings.PREFLIGHT_ALLOWED_HOSTS if host]
+    if allowed and parsed.hostname not in allowed:
+        raise PreflightError('File host is not allowed')
+
+    try:
+        addresses = sorted({info[4][0] for info in socket.getaddrinfo(parsed.hostname, None)})
+    except socket.gaierror:
+        raise PreflightError('File host could not be resolved')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global:
+            raise PreflightError('File host is not allowed')
+    return addresses[0]
+
+
+def _hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(READ_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pinned_request(file_url: str, address: str):
+    """
+    GET ``file_url`` from ``address`` without resolving the host again, so a
+    DNS answer changed after the check cannot redirect the download. The
+    Host header, TLS SNI and certificate check still use the URL's host.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    parsed = urlparse(file_url)
+
+    class PinnedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            if parsed.scheme == 'https':
+                kwargs.update(server_hostname=parsed.hostname, assert_hostname=parsed.hostname)
+            super().init_poolmanager(*args, **kwargs)
+
+    ip_host = f'[{address}]' if ':' in address else address
+    netloc = f'{ip_host}:{parsed.port}' if parsed.port else ip_host
+    session = requests.Session()
+    session.mount(f'{parsed.scheme}://', PinnedAdapter())
+    return session.get(
+        parsed._replace(netloc=netloc).geturl(), headers={'Host': parsed.netloc.rpartition('@')[2]},
+        stream=True, timeout=(5, settings.PREFLIGHT_TIMEOUT), allow_redirects=False,
+    )
+
+
+def _download(file_url: str) -> Tuple[str, str, int]:
+    """Stream a remote file to a temp file, hashing as it arrives"""
+    import requests
+
+    address = _check_remote_host(file_url)
+    max_bytes = settings.PREFLIGHT_MAX_FILE_MB * 1024 * 1024
+    # The read timeout is per chunk; bound the whole download as well
+    deadline = time.monotonic() + settings.PREFLIGHT_TIMEOUT
+    digest = hashlib.sha256()
+    size = 0
+
+    fd, path = tempfile.mkstemp(prefix='preflight-')
+    try:
+        with os.fdopen(fd, 'wb') as out, _pinned_request(file_url, address) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(READ_CHUNK):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise PreflightError(f'File is larger than {settings.PREFLIGHT_MAX_FILE_MB}MB')
+                if time.monotonic() > deadline:
+                    raise PreflightError(f'File download took longer than {settings.PREFLIGHT_TIMEOUT}s')
+                digest.update(chunk)
+                out.write(chunk)
+    except requests.RequestException as e:
+        os.unlink(path)
+        raise PreflightError(f'File could not be downloaded: {e}')
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, digest.hexdigest(), size
+
+
+def file_facts(file_url: str, request_host: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Analysis facts for the file at ``file_url``, cached by content hash so
+    re-uploads of the same artwork skip analysis. Media URLs on our own host
+    are read from MEDIA_ROOT; anything else is downloaded.
+    """
+    local_path = _local_media_path(file_url, request_host)
+    if local_path:
+        path, sha256, size, temporary = local_path, _hash_file(local_path), os.path.getsize(local_path), False
+    else:
+        (path, sha256, size), temporary = _download(file_url), True
+
+    try:
+        transient = []
+
+        def build():
+            facts, cacheable = run_analysis(path)
+            if not cacheable:
+                transient.append(facts)
+                return None
+            return facts
+
+        facts = preflight_cache.get_or_set(
+            PREFLIGHT, (ANALYZER_VERSION, sha256), build, timeout=RESULT_CACHE_TIMEOUT
+        )
+        facts = dict(transient[0] if transient else facts)
+    finally:
+        if temporary:
+            os.unlink(path)
+
+    facts.update(sha256=sha256, file_size=size)
+    return facts
+
+
+# ==================== Service ====================
 
 class PreflightService:
     """
@@ -18,7 +312,8 @@ class PreflightService:
         file_url: str,
         product_id: int,
         file_size: Optional[int] = None,
-        file_format: Optional[str] = None
+        file_format: Optional[str] = None,
+        request_host: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Validate design file for print readiness
@@ -26,8 +321,9 @@ class PreflightService:
         Args:
             file_url: URL or path to design file
             product_id: Product ID for product-specific rules
-            file_size: File size in bytes (optional)
-            file_format: File format (PDF, PNG, etc.) (optional)
+            file_size: File size in bytes (optional, measured when omitted)
+            file_format: File format (PDF, PNG, etc.) (optional, detected when omitted)
+            request_host: Host the request came in on; its media URLs are read locally
         
         Returns:
             Dict with validation results:
@@ -39,13 +335,14 @@ class PreflightService:
                     "bleed": "pass|warning|fail",
                     ...
                 },
-                "suggestions": ["Increase DPI to 300", ...]
+                "suggestions": ["Increase DPI to 300", ...],
+                "details": {"sha256": ..., "format": ..., ...}
             }
         """
         from ..models import Product
         
         try:
-            product = Product.objects.get(pk=product_id)
+            product = Product.objects.select_related('production').get(pk=product_id)
         except Product.DoesNotExist:
             return {
                 "status": "fail",
@@ -54,39 +351,54 @@ class PreflightService:
                 "error": "Product not found"
             }
         
+        try:
+            facts = file_facts(file_url, request_host)
+        except PreflightError as e:
+            return {
+                "status": "fail",
+                "checks": {"file": "fail"},
+                "suggestions": [str(e)],
+                "error": str(e)
+            }
+        
         checks = {}
         suggestions = []
         
-        # DPI Check (would need actual file analysis in production)
-        dpi_status = PreflightService._check_dpi(file_url, product)
-        checks["dpi"] = dpi_status["status"]
-        if dpi_status.get("suggestion"):
-            suggestions.append(dpi_status["suggestion"])
-        
-        # Color Mode Check
-        color_status = PreflightService._check_color_mode(file_url, product)
-        checks["color_mode"] = color_status["status"]
-        if color_status.get("suggestion"):
-            suggestions.append(color_status["suggestion"])
-        
-        # Bleed Check
-        bleed_status = PreflightService._check_bleed(file_url, product)
-        checks["bleed"] = bleed_status["status"]
-        if bleed_status.get("suggestion"):
-            suggestions.append(bleed_status["suggestion"])
+        if facts.get("error"):
+            checks["file"] = "fail"
+            suggestions.append(f"File could not be analyzed ({facts['error']})")
+        else:
+            requirements = PreflightService._requirements(product)
+            
+            # DPI Check
+            dpi_status = PreflightService._check_dpi(facts, product, requirements)
+            checks["dpi"] = dpi_status["status"]
+            if dpi_status.get("suggestion"):
+                suggestions.append(dpi_status["suggestion"])
+            
+            # Color Mode Check
+            color_status = PreflightService._check_color_mode(facts, product, requirements)
+            checks["color_mode"] = color_status["status"]
+            if color_status.get("suggestion"):
+                suggestions.append(color_status["suggestion"])
+            
+            # Bleed Check
+            bleed_status = PreflightService._check_bleed(facts, product, requirements)
+            checks["bleed"] = bleed_status["status"]
+            if bleed_status.get("suggestion"):
+                suggestions.append(bleed_status["suggestion"])
         
         # File Format Check
-        format_status = PreflightService._check_file_format(file_format, product)
+        format_status = PreflightService._check_file_format(file_format or facts.get("format"), product)
         checks["file_format"] = format_status["status"]
         if format_status.get("suggestion"):
             suggestions.append(format_status["suggestion"])
         
         # File Size Check
-        if file_size:
-            size_status = PreflightService._check_file_size(file_size, product)
-            checks["file_size"] = size_status["status"]
-            if size_status.get("suggestion"):
-                suggestions.append(size_status["suggestion"])
+        size_status = PreflightService._check_file_size(file_size or facts["file_size"], product)
+        checks["file_size"] = size_status["status"]
+        if size_status.get("suggestion"):
+            suggestions.append(size_status["suggestion"])
         
         # Determine overall status
         if any(status == "fail" for status in checks.values()):
@@ -99,37 +411,147 @@ class PreflightService:
         return {
             "status": overall_status,
             "checks": checks,
-            "suggestions": suggestions
+            "suggestions": suggestions,
+            "details": PreflightService._details(facts)
+        }
+    
+    @staticmethod
+    def _requirements(product: 'Product') -> Dict[str, Any]:
+        """Print requirements from the product's production settings"""
+        production = getattr(product, 'production', None)
+        if production is None:
+            return dict(DEFAULT_REQUIREMENTS)
+        return {
+            'color_profile': production.color_profile,
+            'bleed_mm': production.bleed_mm,
+            'min_resolution_dpi': production.min_resolution_dpi,
         }
     
     @staticmethod
-    def _check_dpi(file_url: str, product: 'Product') -> Dict[str, Any]:
+    def _finished_size_mm(product: 'Product') -> Optional[Tuple[Decimal, Decimal]]:
+        """Trimmed product size (width, height) in mm, if the product defines one"""
+        if not product.width or not product.length:
+            return None
+        factor = _UNIT_TO_MM.get(product.dimension_unit, Decimal('10'))
+        return product.width * factor, product.length * factor
+    
+    @staticmethod
+    def _details(facts: Dict[str, Any]) -> Dict[str, Any]:
+        keys = ('sha256', 'file_size', 'kind', 'format', 'width_px', 'height_px', 'dpi',
+                'mode', 'page_count', 'color_models')
+        return {key: facts[key] for key in keys if facts.get(key) is not None}
+    
+    @staticmethod
+    def _check_dpi(facts: Dict[str, Any], product: 'Product', requirements: Dict[str, Any]) -> Dict[str, Any]:
         """Check DPI/resolution"""
-        # In production, would analyze actual image/PDF
-        # For now, return default pass
+        required = requirements['min_resolution_dpi']
+        
+        if facts['kind'] == 'pdf':
+            ppis = [page['min_image_ppi'] for page in facts['pages'] if page['min_image_ppi'] is not None]
+            if not ppis:
+                # Vector-only artwork has no resolution limit
+                return {"status": "pass", "suggestion": None}
+            effective = min(ppis)
+        else:
+            effective = PreflightService._raster_ppi(facts, product, requirements)
+            if effective is None:
+                return {
+                    "status": "warning",
+                    "suggestion": f"Image has no resolution information; make sure it is at least {required} DPI at print size"
+                }
+        
+        if effective >= required:
+            return {"status": "pass", "suggestion": None}
+        status = "warning" if effective >= required * Decimal('0.75') else "fail"
         return {
-            "status": "pass",
-            "suggestion": None
+            "status": status,
+            "suggestion": f"Effective resolution is {effective:.0f} DPI; increase to at least {required} DPI"
         }
     
     @staticmethod
-    def _check_color_mode(file_url: str, product: 'Product') -> Dict[str, Any]:
+    def _raster_ppi(facts: Dict[str, Any], product: 'Product', requirements: Dict[str, Any]) -> Optional[Decimal]:
+        """
+        Resolution at print size when the product size is known (the image
+        is stretched over the trimmed size plus bleed), else the embedded DPI
+        """
+        size = PreflightService._finished_size_mm(product)
+        if size:
+            bleed = requirements['bleed_mm'] * 2
+            width_in = (size[0] + bleed) / MM_PER_INCH
+            height_in = (size[1] + bleed) / MM_PER_INCH
+            # Either orientation may be intended - use the better fit
+            fits = [
+                min(facts['width_px'] / width_in, facts['height_px'] / height_in),
+                min(facts['width_px'] / height_in, facts['height_px'] / width_in),
+            ]
+            return max(fits)
+        if facts.get('dpi'):
+            return Decimal(str(min(facts['dpi'])))
+        return None
+    
+    @staticmethod
+    def _check_color_mode(facts: Dict[str, Any], product: 'Product', requirements: Dict[str, Any]) -> Dict[str, Any]:
         """Check color mode (CMYK vs RGB)"""
-        # In production, would analyze actual file
-        # For print, CMYK is preferred
+        models = set(facts.get('color_models') or [])
+        if requirements['color_profile'] == 'rgb' or 'rgb' not in models:
+            return {"status": "pass", "suggestion": None}
+        # RGB in print artwork prints, but colours shift on conversion
         return {
             "status": "warning",
             "suggestion": "Convert RGB to CMYK for accurate print colors"
         }
     
     @staticmethod
-    def _check_bleed(file_url: str, product: 'Product') -> Dict[str, Any]:
+    def _check_bleed(facts: Dict[str, Any], product: 'Product', requirements: Dict[str, Any]) -> Dict[str, Any]:
         """Check bleed requirements"""
-        # Would check if design has proper bleed margins
-        return {
-            "status": "pass",
-            "suggestion": None
-        }
+        bleed = requirements['bleed_mm']
+        if not bleed:
+            return {"status": "pass", "suggestion": None}
+        missing = {"status": "warning", "suggestion": f"Add {bleed}mm bleed on every edge"}
+        
+        unverified = {"status": "warning", "suggestion": f"Could not verify bleed; make sure the artwork includes {bleed}mm bleed"}
+        
+        if facts['kind'] == 'pdf':
+            for page in facts['pages']:
+                outer = page['bleed_box'] or page['media_box']
+                if page['trim_box'] and outer:
+                    # Bleed is what the bleed/media box adds around the trim box
+                    trim = page['trim_box']
+                    margins = [trim[0] - outer[0], trim[1] - outer[1], outer[2] - trim[2], outer[3] - trim[3]]
+                    covered = min(Decimal(str(m)) * MM_PER_POINT for m in margins) + BOX_TOLERANCE_MM >= bleed
+                else:
+                    covered = PreflightService._covers_bleed(page['media_box'], product, bleed, MM_PER_POINT)
+                if covered is None:
+                    return unverified
+                if not covered:
+                    return missing
+            return {"status": "pass", "suggestion": None}
+        
+        # Raster: size at the embedded DPI must cover trim size plus bleed
+        if not facts.get('dpi'):
+            return unverified
+        mm_per_px = MM_PER_INCH / Decimal(str(min(facts['dpi'])))
+        box = [0, 0, facts['width_px'], facts['height_px']]
+        covered = PreflightService._covers_bleed(box, product, bleed, mm_per_px)
+        if covered is None:
+            return unverified
+        if not covered:
+            return missing
+        return {"status": "pass", "suggestion": None}
+    
+    @staticmethod
+    def _covers_bleed(box, product: 'Product', bleed: Decimal, mm_per_unit: Decimal) -> Optional[bool]:
+        """
+        Whether a box (left, bottom, right, top) is at least trim size + bleed
+        in either orientation; None when the product has no size to compare to
+        """
+        size = PreflightService._finished_size_mm(product)
+        if not box or not size:
+            return None
+        width = Decimal(str(box[2] - box[0])) * mm_per_unit
+        height = Decimal(str(box[3] - box[1])) * mm_per_unit
+        need_w, need_h = size[0] + bleed * 2 - BOX_TOLERANCE_MM, size[1] + bleed * 2 - BOX_TOLERANCE_MM
+        return (width >= need_w and height >= need_h) or (width >= need_h and height >= need_w)
     
     @staticmethod
     def _check_file_format(file_format: Optional[str], product: 'Product') -> Dict[str, Any]:
@@ -140,7 +562,7 @@ class PreflightService:
                 "suggestion": "File format not specified"
             }
         
-        allowed_formats = ['PDF', 'PNG', 'JPG', 'EPS', 'AI']
+        allowed_formats = ['PDF', 'PNG', 'JPG', 'JPEG', 'TIFF', 'EPS', 'AI']
         if file_format.upper() not in allowed_formats:
             return {
                 "status": "fail",
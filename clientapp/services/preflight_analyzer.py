@@ -0,0 +1,217 @@
+"""
+Preflight Analyzer - file facts for print preflight
+Runs inside preflight worker processes, so it only depends on Pillow and
+pypdf (no Django). Files are never read whole: raster headers are parsed
+without decoding pixels, and PDFs are parsed through a read-only mmap so
+pypdf only touches the objects it needs (page boxes, content streams,
+image dictionaries).
+"""
+import math
+import mmap
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Bump when the facts format changes - it is part of the cache key
+ANALYZER_VERSION = 1
+
+MAX_PDF_PAGES = 50
+MAX_FORM_DEPTH = 3
+POINTS_PER_INCH = 72
+
+Matrix = Tuple[float, float, float, float, float, float]
+IDENTITY: Matrix = (1, 0, 0, 1, 0, 0)
+
+# Pillow mode -> colour model
+_RASTER_COLOR_MODELS = {
+    'CMYK': 'cmyk',
+    'RGB': 'rgb', 'RGBA': 'rgb', 'RGBX': 'rgb', 'P': 'rgb',
+    'L': 'gray', 'LA': 'gray', '1': 'gray', 'I;16': 'gray',
+}
+
+# PDF device colour spaces/operators -> colour model
+_PDF_COLOR_MODELS = {
+    '/DeviceRGB': 'rgb', '/CalRGB': 'rgb',
+    '/DeviceCMYK': 'cmyk',
+    '/DeviceGray': 'gray', '/CalGray': 'gray',
+    '/Separation': 'spot', '/DeviceN': 'spot',
+    '/Lab': 'lab',
+}
+_COLOR_OPERATORS = {b'rg': 'rgb', b'RG': 'rgb', b'k': 'cmyk', b'K': 'cmyk', b'g': 'gray', b'G': 'gray'}
+
+
+def analyze_file(path: str) -> Dict[str, Any]:
+    """
+    Collect the facts preflight checks need from a design file.
+
+    Returns:
+        {"kind": "pdf"|"raster", "format": str, ...} or {"error": str}
+    """
+    with open(path, 'rb') as fh:
+        header = fh.read(1024)
+
+    try:
+        if b'%PDF-' in header:
+            return analyze_pdf(path)
+        return analyze_raster(path)
+    except Exception as e:
+        return {'error': f'{type(e).__name__}: {e}'}
+
+
+# ==================== Raster ====================
+
+def analyze_raster(path: str) -> Dict[str, Any]:
+    """Header-only raster analysis - Image.open does not decode pixel data"""
+    with Image.open(path) as image:
+        dpi = image.info.get('dpi')
+        return {
+            'kind': 'raster',
+            'format': (image.format or '').upper(),
+            'width_px': image.width,
+            'height_px': image.height,
+            'dpi': [round(float(v), 2) for v in dpi] if dpi else None,
+            'mode': image.mode,
+            'color_models': [_RASTER_COLOR_MODELS.get(image.mode, image.mode.lower())],
+            'has_icc_profile': bool(image.info.get('icc_profile')),
+            'has_alpha': 'A' in image.getbands(),
+        }
+
+
+# ==================== PDF ====================
+
+def analyze_pdf(path: str) -> Dict[str, Any]:
+    from pypdf import PdfReader
+
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        reader = PdfReader(mapped)
+        page_count = len(reader.pages)
+        pages = []
+        color_models = set()
+        for index in range(min(page_count, MAX_PDF_PAGES)):
+            page = reader.pages[index]
+            page_facts = _analyze_page(page, reader)
+            color_models.update(page_facts.pop('color_models'))
+            pages.append(page_facts)
+
+    return {
+        'kind': 'pdf',
+        'format': 'PDF',
+        'page_count': page_count,
+        'pages_analyzed': len(pages),
+        'pages': pages,
+        'color_models': sorted(color_models),
+    }
+
+
+def _box(page, name: str) -> Optional[List[float]]:
+    """
+    Page box in points. MediaBox may be inherited from the page tree; the
+    other boxes are None unless the page defines them (pypdf would
+    otherwise fall back to the crop/media box).
+    """
+    if name != 'MediaBox' and f'/{name}' not in page:
+        return None
+    box = getattr(page, name.lower())
+    return [round(float(v), 2) for v in (box.left, box.bottom, box.right, box.top)]
+
+
+def _analyze_page(page, reader) -> Dict[str, Any]:
+    color_models = set()
+    images: List[Dict[str, Any]] = []
+    _walk_content(page.get_contents(), page.get('/Resources'), reader, IDENTITY, images, color_models, 0)
+
+    return {
+        'media_box': _box(page, 'MediaBox'),
+        'trim_box': _box(page, 'TrimBox'),
+        'bleed_box': _box(page, 'BleedBox'),
+        'images': images,
+        'min_image_ppi': min((img['ppi'] for img in images), default=None),
+        'color_models': color_models,
+    }
+
+
+def _multiply(m: Matrix, n: Matrix) -> Matrix:
+    a, b, c, d, e, f = m
+    na, nb, nc, nd, ne, nf = n
+    return (
+        a * na + b * nc, a * nb + b * nd,
+        c * na + d * nc, c * nb + d * nd,
+        e * na + f * nc + ne, e * nb + f * nd + nf,
+    )
+
+
+def _walk_content(contents, resources, reader, ctm: Matrix, images, color_models, depth: int) -> None:
+    """
+    Replay a content stream's graphics-state operators (q/Q/cm) far enough
+    to know the size at which each image XObject is placed, and note the
+    colour operators it uses.
+    """
+    from pypdf.generic import ContentStream
+
+    if contents is None:
+        return
+    resources = resources.get_object() if resources is not None else {}
+    xobjects = resources.get('/XObject')
+    xobjects = xobjects.get_object() if xobjects is not None else {}
+    color_spaces = resources.get('/ColorSpace')
+    color_spaces = color_spaces.get_object() if color_spaces is not None else {}
+
+    stack: List[Matrix] = []
+    for operands, operator in ContentStream(contents, reader).operations:
+        if operator == b'q':
+            stack.append(ctm)
+        elif operator == b'Q':
+            ctm = stack.pop() if stack else IDENTITY
+        elif operator == b'cm' and len(operands) == 6:
+            ctm = _multiply(tuple(float(v) for v in operands), ctm)
+        elif operator in _COLOR_OPERATORS:
+            color_models.add(_COLOR_OPERATORS[operator])
+        elif operator in (b'cs', b'CS') and operands:
+            name = operands[0]
+            space = color_spaces.get(name, name) if hasattr(color_spaces, 'get') else name
+            color_models.add(_color_model(space))
+        elif operator == b'Do' and operands and operands[0] in xobjects:
+            xobject = xobjects[operands[0]].get_object()
+            subtype = xobject.get('/Subtype')
+            if subtype == '/Image':
+                images.append(_placed_image(xobject, ctm))
+                color_models.add(_color_model(xobject.get('/ColorSpace')))
+            elif subtype == '/Form' and depth < MAX_FORM_DEPTH:
+                form_matrix = tuple(float(v) for v in xobject.get('/Matrix', IDENTITY))
+                _walk_content(
+                    xobject, xobject.get('/Resources', resources), reader,
+                    _multiply(form_matrix, ctm), images, color_models, depth + 1,
+                )
+
+
+def _placed_image(xobject, ctm: Matrix) -> Dict[str, Any]:
+    """Effective resolution of an image drawn with ``ctm`` (image space is the unit square)"""
+    width_px = int(xobject.get('/Width', 0))
+    height_px = int(xobject.get('/Height', 0))
+    a, b, c, d, _, _ = ctm
+    width_in = math.hypot(a, b) / POINTS_PER_INCH
+    height_in = math.hypot(c, d) / POINTS_PER_INCH
+    ppi_x = width_px / width_in if width_in else 0
+    ppi_y = height_px / height_in if height_in else 0
+    return {
+        'width_px': width_px,
+        'height_px': height_px,
+        'ppi': round(min(ppi_x, ppi_y), 1),
+        'color_model': _color_model(xobject.get('/ColorSpace')),
+    }
+
+
+def _color_model(space) -> str:
+    """Classify a PDF colour space (name or array) as rgb/cmyk/gray/spot/lab"""
+    if space is None:
+        return 'unknown'
+    space = space.get_object() if hasattr(space, 'get_object') else space
+    if isinstance(space, list) and space:
+        family = str(space[0])
+        if family == '/ICCBased' and len(space) > 1:
+            components = int(space[1].get_object().get('/N', 0))
+            return {1: 'gray', 3: 'rgb', 4: 'cmyk'}.get(components, 'unknown')
+        if family == '/Indexed' and len(space) > 1:
+            return _color_model(space[1])
+        return _PDF_COLOR_MODELS.get(family, 'unknown')
+    return _PDF_COLOR_MODELS.get(str(space), 'unknown')
@@ -9,12 +9,13 @@ from django.core.exceptions import ValidationError
 
 from ..models import (
     Product,
-    ShippingMethod,
     TaxConfiguration,
     TurnAroundTime,
-    Coupon,
+    Customer,
     resolve_unit_price,
 )
+from . import cache as catalog_cache
+from . import fulfilment, promotions
 
 
 class PricingEngine:
@@ -93,11 +94,9 @@ class PricingEngine:
         subtotal = base_total + variable_price + turnaround_price
         
         # Apply discounts (coupons, promotions)
-        discounts = Decimal('0')
-        if coupon_code:
-            discounts = PricingEngine._calculate_discounts(
-                product, quantity, subtotal, coupon_code, customer_id
-            )
+        discounts = PricingEngine._calculate_discounts(
+            product, quantity, subtotal, coupon_code, customer_id
+        )
         
         # Calculate shipping
         shipping = Decimal('0')
@@ -108,9 +107,12 @@ class PricingEngine:
         
         # Calculate tax
         tax = Decimal('0')
-        tax_config = TaxConfiguration.objects.filter(
-            is_active=True
-        ).first()
+        tax_config = catalog_cache.get_or_set(
+            catalog_cache.TAX,
+            ('active-first',),
+            lambda: TaxConfiguration.objects.filter(is_active=True).first(),
+            timeout=3600
+        )
         if tax_config:
             # Check if tax applies to customer type
             if (customer_type == 'B2B' and tax_config.applies_to_b2b) or \
@@ -197,75 +199,20 @@ class PricingEngine:
         product: Product,
         quantity: int,
         subtotal: Decimal,
-        coupon_code: str,
+        coupon_code: Optional[str] = None,
         customer_id: Optional[int] = None
     ) -> Decimal:
-        """Calculate discount from coupon"""
-        try:
-            coupon = Coupon.objects.get(
-                code=coupon_code,
-                is_active=True
-            )
-            
-            # Check if coupon is valid
-            if not PricingEngine._is_coupon_valid(coupon, product, quantity, subtotal, customer_id):
-                return Decimal('0')
-            
-            # Calculate discount
-            if coupon.discount_type == 'percentage':
-                discount = subtotal * (coupon.discount_value / Decimal('100'))
-            elif coupon.discount_type == 'fixed':
-                discount = coupon.discount_value
-            elif coupon.discount_type == 'free_shipping':
-                # Handled separately in shipping calculation
-                return Decimal('0')
-            else:
-                return Decimal('0')
-            
-            # Apply maximum discount if set
-            if coupon.maximum_discount_amount and discount > coupon.maximum_discount_amount:
-                discount = coupon.maximum_discount_amount
-            
-            return discount
-        except Coupon.DoesNotExist:
-            return Decimal('0')
-    
-    @staticmethod
-    def _is_coupon_valid(
-        coupon: Coupon,
-        product: Product,
-        quantity: int,
-        subtotal: Decimal,
-        customer_id: Optional[int] = None
-    ) -> bool:
-        """Validate coupon eligibility"""
-        from django.utils import timezone
-        
-        # Check active status
-        if not coupon.is_active:
-            return False
-        
-        # Check expiry
-        if coupon.expires_at and coupon.expires_at < timezone.now():
-            return False
-        
-        # Check minimum order amount
-        if coupon.minimum_order_amount and subtotal < coupon.minimum_order_amount:
-            return False
-        
-        # Check usage limits
-        if coupon.usage_limit:
-            usage_count = coupon.orders.count() if hasattr(coupon, 'orders') else 0
-            if usage_count >= coupon.usage_limit:
-                return False
-        
-        # Check per-customer limit
-        if coupon.usage_limit_per_customer and customer_id:
-            customer_usage = coupon.orders.filter(customer_id=customer_id).count()
-            if customer_usage >= coupon.usage_limit_per_customer:
-                return False
-        
-        return True
+        """Calculate discount from coupon and automatic promotions (cached rule set)"""
+        customer = Customer.objects.filter(pk=customer_id).first() if customer_id else None
+        # Variable/turnaround charges are spread over the units
+        line = {
+            'product_id': product.pk,
+            'quantity': quantity,
+            'unit_price': subtotal / quantity if quantity else subtotal,
+            'category': product.primary_category,
+        }
+        evaluation = promotions.evaluate([line], customer=customer, coupon_code=coupon_code)
+        return evaluation['discount_total']
     
     @staticmethod
     def _calculate_shipping(
@@ -274,30 +221,11 @@ class PricingEngine:
         shipping_method_id: int,
         subtotal: Decimal
     ) -> Decimal:
-        """Calculate shipping cost"""
-        try:
-            shipping_method = ShippingMethod.objects.get(pk=shipping_method_id)
-            
-            # Check if free shipping threshold is met
-            if hasattr(product, 'shipping') and product.shipping:
-                if product.shipping.free_shipping_threshold:
-                    if subtotal >= product.shipping.free_shipping_threshold:
-                        return Decimal('0')
-            
-            # Calculate shipping cost
-            if shipping_method.pricing_type == 'flat':
-                return shipping_method.flat_rate or Decimal('0')
-            elif shipping_method.pricing_type == 'weight_based':
-                # Would need product weight
-                if hasattr(product, 'shipping') and product.shipping:
-                    weight = product.shipping.shipping_weight or Decimal('0')
-                    return (shipping_method.weight_rate_per_kg or Decimal('0')) * weight
-            elif shipping_method.pricing_type == 'price_based':
-                return subtotal * ((shipping_method.price_rate_percentage or Decimal('0')) / Decimal('100'))
-        except ShippingMethod.DoesNotExist:
-            pass
-        
-        return Decimal('0')
+        """Calculate shipping cost from the parcel's real weight (see services.fulfilment)"""
+        quote = fulfilment.FulfilmentQuoter().quote(
+            [(product.pk, quantity)], subtotal, shipping_method_id=shipping_method_id
+        )
+        return quote['shipping_cost'] if quote else Decimal('0')
     
     @staticmethod
     def _calculate_tax(
@@ -1,11 +1,202 @@
 """
 Product Configuration Rules Engine
 Validates product variable combinations
+
+Rules are compiled per product into lookup tables and per-variable bitsets
+over option indices (bit i of a mask = i-th active option of the variable),
+and kept in process memory keyed by the product's rule version. Validating
+a combination is then a handful of dict lookups, and the still-valid options
+of every variable for a partial selection come from masking the bitsets.
 """
-from typing import Dict, Any, List
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from django.core.exceptions import ValidationError
 
-from ..models import Product, ProductRule
+from ..models import Product, ProductRule, ProductVariable
+from . import cache as rules_cache
+
+# Compiled rule sets kept per process (LRU)
+MAX_COMPILED_PRODUCTS = 512
+
+_compiled: 'OrderedDict[Tuple[int, int], CompiledRules]' = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def rules_namespace(product_id: int) -> str:
+    return f'product-rules:{product_id}'
+
+
+def invalidate_rules(product_id: int) -> None:
+    """Bump the product's rule version so every process recompiles"""
+    rules_cache.bump_namespace(rules_namespace(product_id))
+
+
+# then-value of a 'requires' implication: the variable only has to be present
+PRESENT = object()
+
+
+# Stand-in for unhashable values (lists/dicts), which never match an option
+UNHASHABLE = object()
+
+
+def _key(value: Any) -> Any:
+    """Lookup key for a selected or rule value"""
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return UNHASHABLE
+
+
+class CompiledRules:
+    """
+    One product's active rules, compiled.
+
+    Messages carry the rule's position in priority order so errors come out
+    in the same order as evaluating the rules one by one.
+    """
+
+    def __init__(self, rules: List[ProductRule], domains: Dict[str, List[str]]):
+        self.domains = domains
+        self.bits = {var: {value: 1 << i for i, value in enumerate(values)} for var, values in domains.items()}
+        self.full_masks = {var: (1 << len(values)) - 1 for var, values in domains.items()}
+
+        # (var, value) -> [(order, message)] - the value alone breaks a rule
+        self.excluded: Dict[Tuple[str, Any], List[Tuple[int, str]]] = {}
+        # var -> [(order, min, max, message)]
+        self.ranges: Dict[str, List[Tuple[int, Any, Any, str]]] = {}
+        # (if_var, if_value) -> [(order, then_var, then_value, message)];
+        # then_value PRESENT means "then_var must be selected"
+        self.implications: Dict[Tuple[str, Any], List[Tuple[int, str, Any, str]]] = {}
+        # (var, value) -> [(order, message)] - broken only once a turnaround is chosen
+        self.turnaround_excluded: Dict[Tuple[str, Any], List[Tuple[int, str]]] = {}
+
+        for order, rule in enumerate(rules):
+            self._compile_rule(order, rule, rule.condition_json or {})
+
+        # Options ruled out by unconditional rules, and by turnaround rules
+        self.base_masks = {
+            var: self._mask_without(var, self.excluded, check_ranges=True)
+            for var in domains
+        }
+        self.turnaround_masks = {
+            var: self._mask_without(var, self.turnaround_excluded)
+            for var in domains
+        }
+
+    def _compile_rule(self, order: int, rule: ProductRule, condition: Dict) -> None:
+        message = rule.message
+        if rule.rule_type == 'requires':
+            var = condition.get('variable')
+            dependent = condition.get('requires_variable')
+            if var and dependent:
+                self.implications.setdefault((var, _key(condition.get('value'))), []).append(
+                    (order, dependent, PRESENT,
+                     message or f"{dependent} is required when {var} is {condition.get('value')}")
+                )
+        elif rule.rule_type == 'excludes':
+            var = condition.get('variable')
+            for value in condition.get('excludes', []) or []:
+                self.excluded.setdefault((var, _key(value)), []).append((order, message))
+        elif rule.rule_type == 'range':
+            var = condition.get('variable')
+            self.ranges.setdefault(var, []).append((order, condition.get('min'), condition.get('max'), message))
+        elif rule.rule_type == 'conditional':
+            if_condition = condition.get('if') or {}
+            then_condition = condition.get('then') or {}
+            if if_condition:
+                self.implications.setdefault(
+                    (if_condition.get('variable'), _key(if_condition.get('value'))), []
+                ).append((order, then_condition.get('variable'), then_condition.get('value'), message))
+        elif rule.rule_type == 'turnaround_compatibility':
+            for var, values in (condition.get('incompatible_variables') or {}).items():
+                for value in values or []:
+                    self.turnaround_excluded.setdefault((var, _key(value)), []).append((order, message))
+
+    def _mask_without(self, var: str, table: Dict, check_ranges: bool = False) -> int:
+        """Full mask of ``var`` minus the options listed in ``table`` (and failing range rules)"""
+        mask = self.full_masks[var]
+        for value, bit in self.bits[var].items():
+            if (var, value) in table or (check_ranges and self._range_errors(var, value)):
+                mask &= ~bit
+        return mask
+
+    def _range_errors(self, var: str, value: Any) -> List[Tuple[int, str]]:
+        errors = []
+        for order, min_value, max_value, message in self.ranges.get(var, ()):
+            try:
+                number = float(value)
+            except (ValueError, TypeError):
+                continue
+            if min_value is not None and number < min_value:
+                errors.append((order, message or f"{var} must be at least {min_value}"))
+            elif max_value is not None and number > max_value:
+                errors.append((order, message or f"{var} must be at most {max_value}"))
+        return errors
+
+    # ---------- queries ----------
+
+    def errors(self, variables: Dict[str, Any]) -> List[str]:
+        """Messages of every rule the (partial) selection breaks, in priority order"""
+        found = []
+        turnaround = bool(variables.get('turnaround_id'))
+        for var, raw_value in variables.items():
+            value = _key(raw_value)
+            found.extend(self.excluded.get((var, value), ()))
+            if turnaround:
+                found.extend(self.turnaround_excluded.get((var, value), ()))
+            if var in self.ranges:
+                found.extend(self._range_errors(var, raw_value))
+            for order, then_var, then_value, message in self.implications.get((var, value), ()):
+                if then_var not in variables:
+                    found.append((order, message))
+                elif then_value is not PRESENT and variables[then_var] != then_value:
+                    found.append((order, message))
+        # A rule reports once even if reached through several variables
+        seen = set()
+        messages = []
+        for order, message in sorted(found, key=lambda item: item[0]):
+            if (order, message) not in seen:
+                seen.add((order, message))
+                messages.append(message)
+        return messages
+
+    def valid_options(self, variables: Dict[str, Any]) -> Tuple[Dict[str, List[str]], List[str]]:
+        """
+        Options of every variable that do not break a rule, given the other
+        variables' selections (a variable's own selection is ignored, so the
+        current choice's alternatives are listed too).
+
+        Returns:
+            ({variable: [option, ...]}, [variables required by the selection])
+        """
+        masks = dict(self.base_masks)
+        if variables.get('turnaround_id'):
+            for var, mask in self.turnaround_masks.items():
+                masks[var] &= mask
+
+        required = []
+        for (if_var, if_value), implications in self.implications.items():
+            selected = if_var in variables and _key(variables[if_var]) == if_value
+            for _, then_var, then_value, _ in implications:
+                if then_value is PRESENT:
+                    if selected and then_var not in variables and then_var not in required:
+                        required.append(then_var)
+                    continue
+                if selected and then_var in masks:
+                    masks[then_var] &= self.bits[then_var].get(_key(then_value), 0)
+                # The trigger option is only valid if its consequence can hold
+                if if_var in masks and if_value in self.bits[if_var] and (
+                    then_var in variables and variables[then_var] != then_value
+                ):
+                    masks[if_var] &= ~self.bits[if_var][if_value]
+
+        options = {
+            var: [value for value, bit in self.bits[var].items() if masks[var] & bit]
+            for var in self.domains
+        }
+        return options, required
 
 
 class ProductConfigurationValidator:
@@ -13,175 +204,83 @@ class ProductConfigurationValidator:
     Product Configuration Rules Engine
     Validates product variable combinations
     """
-    
+
+    @staticmethod
+    def compiled_rules(product_id: int) -> Optional[CompiledRules]:
+        """Compiled rules for the product's current rule version (None if no such product)"""
+        version = rules_cache.namespace_version(rules_namespace(product_id))
+        key = (product_id, version)
+        with _compiled_lock:
+            compiled = _compiled.get(key)
+            if compiled is not None:
+                _compiled.move_to_end(key)
+                return compiled
+
+        if not Product.objects.filter(pk=product_id).exists():
+            return None
+        rules = list(ProductRule.objects.filter(product_id=product_id, is_active=True).order_by('-priority'))
+        domains = {}
+        for variable in ProductVariable.objects.filter(
+            product_id=product_id, is_active=True
+        ).prefetch_related('options').order_by('display_order'):
+            domains[variable.name] = [option.name for option in variable.options.all() if option.is_active]
+        compiled = CompiledRules(rules, domains)
+
+        with _compiled_lock:
+            # Drop this product's older versions along with the LRU overflow
+            for stale in [k for k in _compiled if k[0] == product_id]:
+                del _compiled[stale]
+            _compiled[key] = compiled
+            while len(_compiled) > MAX_COMPILED_PRODUCTS:
+                _compiled.popitem(last=False)
+        return compiled
+
     @staticmethod
     def validate(
         product_id: int,
-        variables: Dict[str, Any]
+        variables: Dict[str, Any],
+        include_options: bool = False
     ) -> Dict[str, Any]:
         """
         Validate product configuration
-        
+
         Args:
             product_id: Product ID
-            variables: Product variables dict (e.g., {"paper": "300gsm", "finish": "spot_uv"})
-        
+            variables: Product variables dict (e.g., {"paper": "300gsm", "finish": "spot_uv"});
+                may be a partial selection
+            include_options: Also return the still-valid options of every variable
+
         Returns:
             {
                 "valid": bool,
                 "errors": [str],
-                "warnings": [str]
+                "warnings": [str],
+                "valid_options": {variable: [option]},   (include_options only)
+                "required_variables": [variable]          (include_options only)
             }
         """
-        try:
-            product = Product.objects.get(pk=product_id)
-        except Product.DoesNotExist:
+        compiled = ProductConfigurationValidator.compiled_rules(product_id)
+        if compiled is None:
             return {
                 "valid": False,
                 "errors": ["Product not found"],
                 "warnings": []
             }
-        
-        errors = []
-        warnings = []
-        
-        # Get all active rules for this product
-        rules = ProductRule.objects.filter(
-            product=product,
-            is_active=True
-        ).order_by('-priority')
-        
-        for rule in rules:
-            validation_result = ProductConfigurationValidator._validate_rule(
-                rule, variables
-            )
-            
-            if validation_result["valid"] is False:
-                errors.append(validation_result["message"])
-            elif validation_result.get("warning"):
-                warnings.append(validation_result["message"])
-        
-        return {
+
+        errors = compiled.errors(variables)
+        result = {
             "valid": len(errors) == 0,
             "errors": errors,
-            "warnings": warnings
+            "warnings": []
         }
-    
-    @staticmethod
-    def _validate_rule(rule: ProductRule, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate a single rule"""
-        condition = rule.condition_json
-        
-        if rule.rule_type == 'requires':
-            return ProductConfigurationValidator._validate_requires(rule, condition, variables)
-        elif rule.rule_type == 'excludes':
-            return ProductConfigurationValidator._validate_excludes(rule, condition, variables)
-        elif rule.rule_type == 'range':
-            return ProductConfigurationValidator._validate_range(rule, condition, variables)
-        elif rule.rule_type == 'conditional':
-            return ProductConfigurationValidator._validate_conditional(rule, condition, variables)
-        elif rule.rule_type == 'turnaround_compatibility':
-            return ProductConfigurationValidator._validate_turnaround(rule, condition, variables)
-        
-        return {"valid": True, "message": None}
-    
-    @staticmethod
-    def _validate_requires(rule: ProductRule, condition: Dict, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate 'requires' rule"""
-        required_var = condition.get('variable')
-        required_value = condition.get('value')
-        
-        if required_var in variables:
-            if variables[required_var] == required_value:
-                # Check if required dependent variable is present
-                dependent_var = condition.get('requires_variable')
-                if dependent_var and dependent_var not in variables:
-                    return {
-                        "valid": False,
-                        "message": rule.message or f"{dependent_var} is required when {required_var} is {required_value}"
-                    }
-        
-        return {"valid": True}
-    
-    @staticmethod
-    def _validate_excludes(rule: ProductRule, condition: Dict, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate 'excludes' rule"""
-        var_name = condition.get('variable')
-        excluded_values = condition.get('excludes', [])
-        
-        if var_name in variables:
-            if variables[var_name] in excluded_values:
-                return {
-                    "valid": False,
-                    "message": rule.message
-                }
-        
-        return {"valid": True}
-    
-    @staticmethod
-    def _validate_range(rule: ProductRule, condition: Dict, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate 'range' rule (min/max quantity, etc.)"""
-        var_name = condition.get('variable')
-        min_value = condition.get('min')
-        max_value = condition.get('max')
-        
-        if var_name in variables:
-            value = variables[var_name]
-            try:
-                value = float(value)
-                if min_value is not None and value < min_value:
-                    return {
-                        "valid": False,
-                        "message": rule.message or f"{var_name} must be at least {min_value}"
-                    }
-                if max_value is not None and value > max_value:
-                    return {
-                        "valid": False,
-                        "message": rule.message or f"{var_name} must be at most {max_value}"
-                    }
-            except (ValueError, TypeError):
-                pass
-        
-        return {"valid": True}
-    
-    @staticmethod
-    def _validate_conditional(rule: ProductRule, condition: Dict, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate 'conditional' rule"""
-        # Complex conditional logic
-        if_condition = condition.get('if')
-        then_condition = condition.get('then')
-        
-        if if_condition:
-            if_var = if_condition.get('variable')
-            if_value = if_condition.get('value')
-            
-            if if_var in variables and variables[if_var] == if_value:
-                # Then condition must be met
-                then_var = then_condition.get('variable')
-                then_value = then_condition.get('value')
-                
-                if then_var not in variables or variables[then_var] != then_value:
-                    return {
-                        "valid": False,
-                        "message": rule.message
-                    }
-        
-        return {"valid": True}
-    
-    @staticmethod
-    def _validate_turnaround(rule: ProductRule, condition: Dict, variables: Dict[str, Any]) -> Dict[str, Any]:
-        """Validate turnaround compatibility"""
-        # Check if selected variables are compatible with turnaround time
-        turnaround_id = variables.get('turnaround_id')
-        if turnaround_id:
-            incompatible_vars = condition.get('incompatible_variables', {})
-            for var_name, var_value in variables.items():
-                if var_name in incompatible_vars:
-                    if var_value in incompatible_vars[var_name]:
-                        return {
-                            "valid": False,
-                            "message": rule.message
-                        }
-        
-        return {"valid": True}
+        if include_options:
+            result["valid_options"], result["required_variables"] = compiled.valid_options(variables)
+        return result
 
+    @staticmethod
+    def valid_options(product_id: int, variables: Dict[str, Any]) -> Optional[Dict[str, List[str]]]:
+        """Still-valid options of every variable given a partial selection"""
+        compiled = ProductConfigurationValidator.compiled_rules(product_id)
+        if compiled is None:
+            return None
+        return compiled.valid_options(variables)[0]
@@ -0,0 +1,231 @@
+"""
+Progress Stream
+Coalesced, delta-only progress updates for jobs and purchase orders.
+
+Each streamed entity ('job:42', 'po:17') keeps a state in the shared cache:
+a sequence number and, for every field, its value and the sequence at which
+it last changed. publish() merges new values in, bumps the sequence only
+when something actually changed, and sends just the changed fields to the
+entity's channel group. Because each field remembers when it changed, a
+client reconnecting with the last sequence it saw gets exactly the fields
+changed since (changes_since) without a message log; if the state was
+evicted in between it gets every field again ("reset").
+
+ProgressStreamConsumer (ws/progress/) carries any number of entities over
+one socket and coalesces: deltas for an entity arriving within
+COALESCE_SECONDS go out as one frame with the latest sequence.
+permessage-deflate is negotiated by the ASGI server (client/workers.py).
+
+Saves of jobs, stages and purchase orders never publish in the web request:
+schedule_publish() queues the entity once per transaction and, after
+commit, the publish_progress task (realtime queue) re-reads its fields
+from the rows - not from the job detail cache, which the save just bumped
+- so tasks running out of order still publish the latest state.
+
+Updates of one entity are serialized on its database row (select_for_update),
+so a waiting publisher blocks in the database rather than polling. The async
+wrappers run in the thread pool, never the consumers' shared sync thread.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from asgiref.sync import async_to_sync
+from channels.db import DatabaseSyncToAsync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from ..models import Job, ProgressUpdate, ProgressUpdateBatch, PurchaseOrder
+from . import job_detail
+from .roles import ahas_group
+
+logger = logging.getLogger(__name__)
+
+ENTITY_TYPES = ('job', 'po')
+COALESCE_SECONDS = 0.25
+STATE_TIMEOUT = 86400
+# Groups allowed to watch any job or purchase order
+WATCHER_GROUPS = ('Production Team', 'Account Manager')
+
+
+def entity_key(entity_type: str, entity_id: int) -> str:
+    return f'{entity_type}:{entity_id}'
+
+
+def group_name(entity: str) -> str:
+    return f"progress.{entity.replace(':', '.')}"
+
+
+def _state_key(entity: str) -> str:
+    return f'progress-stream:{entity}'
+
+
+_ROW_MODELS = {'job': Job, 'po': PurchaseOrder}
+
+
+@contextmanager
+def _locked(entity_type: str, entity_id: int):
+    """Serialize state updates of one entity across processes on its database row"""
+    with transaction.atomic():
+        list(_ROW_MODELS[entity_type].objects.select_for_update().filter(pk=entity_id).values_list('pk', flat=True))
+        yield
+
+
+def _new_state() -> Dict:
+    # Seeded from the clock, so a re-created state never reuses sequences a client has seen
+    seq = int(time.time() * 1000)
+    return {'base': seq, 'seq': seq, 'fields': {}}
+
+
+# ==================== Publishing ====================
+
+def publish(entity_type: str, entity_id: int, fields: Dict) -> Optional[Dict]:
+    """
+    Merge ``fields`` into the entity's state and broadcast what changed.
+
+    Returns:
+        The delta frame ({'entity', 'seq', 'changes'}), or None if no field changed
+    """
+    entity = entity_key(entity_type, entity_id)
+    fields = json.loads(json.dumps(fields, cls=DjangoJSONEncoder))
+    with _locked(entity_type, entity_id):
+        state = cache.get(_state_key(entity)) or _new_state()
+        changes = {
+            name: value for name, value in fields.items()
+            if name not in state['fields'] or state['fields'][name][0] != value
+        }
+        if not changes:
+            return None
+        state['seq'] += 1
+        for name, value in changes.items():
+            state['fields'][name] = [value, state['seq']]
+        cache.set(_state_key(entity), state, STATE_TIMEOUT)
+
+    frame = {'entity': entity, 'seq': state['seq'], 'changes': changes}
+    try:
+        async_to_sync(get_channel_layer().group_send)(group_name(entity), {'type': 'progress.delta', **frame})
+    except Exception as e:
+        # Subscribers catch up from the state on their next (re)subscribe
+        logger.warning(f"Could not broadcast progress for {entity}: {e}")
+    return frame
+
+
+apublish = DatabaseSyncToAsync(publish, thread_sensitive=False)
+
+
+def current_fields(entity_type: str, entity_id: int) -> Optional[Dict]:
+    """The entity's streamed fields read from the database (None if it does not exist)"""
+    if entity_type == 'job':
+        fields = job_detail.live_snapshot_data(entity_id)
+        if fields is None:
+            return None
+        latest = ProgressUpdate.objects.filter(job_id=entity_id).order_by('-created_at').first()
+        return {**fields, **(vendor_fields(latest) if latest else {})}
+    po = PurchaseOrder.objects.filter(pk=entity_id).values('status', 'milestone').first()
+    if po is None:
+        return None
+    latest = ProgressUpdateBatch.objects.filter(purchase_order_id=entity_id).order_by('-submission_date').first()
+    return {**po, **(batch_fields(latest) if latest else {})}
+
+
+def vendor_fields(update: ProgressUpdate) -> Dict:
+    return {
+        'vendor_progress': update.percentage_complete,
+        'vendor_status': update.status,
+        'vendor_eta': update.eta,
+    }
+
+
+def batch_fields(batch: ProgressUpdateBatch) -> Dict:
+    return {
+        'progress': batch.percentage_complete,
+        'progress_status': batch.status,
+        'next_milestone': batch.next_milestone,
+        'next_milestone_date': batch.next_milestone_date,
+    }
+
+
+def publish_current(entity_type: str, entity_id: int) -> Optional[Dict]:
+    """Publish whatever changed in the entity's database state"""
+    fields = current_fields(entity_type, entity_id)
+    return publish(entity_type, entity_id, fields) if fields else None
+
+
+_pending = threading.local()
+
+
+def schedule_publish(entity_type: str, entity_id: int) -> None:
+    """
+    Publish the entity from a worker once the current transaction commits.
+    The first flush to run takes every pending entity, so the saves of one
+    transaction (a job and its stages) become one task per entity.
+    """
+    entities = getattr(_pending, 'entities', None)
+    if entities is None:
+        entities = _pending.entities = set()
+    entities.add((entity_type, entity_id))
+    transaction.on_commit(_flush_pending, robust=True)
+
+
+def _flush_pending() -> None:
+    entities = getattr(_pending, 'entities', None)
+    _pending.entities = None
+    for entity_type, entity_id in sorted(entities or ()):
+        try:
+            from ..tasks import publish_progress
+            publish_progress.delay(entity_type, entity_id)
+        except Exception as e:
+            logger.warning(f"Could not queue progress publish for {entity_key(entity_type, entity_id)}, publishing inline: {e}")
+            publish_current(entity_type, entity_id)
+
+
+# ==================== Reading ====================
+
+def changes_since(entity_type: str, entity_id: int, since: Optional[int] = None) -> Optional[Tuple[int, Dict, bool]]:
+    """
+    What a client that last saw sequence ``since`` is missing.
+
+    Returns:
+        (seq, changed fields, reset) - reset means every field is included -
+        or None if the entity does not exist
+    """
+    entity = entity_key(entity_type, entity_id)
+    state = cache.get(_state_key(entity))
+    if state is None:
+        fields = current_fields(entity_type, entity_id)
+        if fields is None:
+            return None
+        publish(entity_type, entity_id, fields)
+        state = cache.get(_state_key(entity)) or _new_state()
+
+    reset = since is None or not state['base'] <= since <= state['seq']
+    changes = {
+        name: value for name, (value, seq) in state['fields'].items()
+        if reset or seq > since
+    }
+    return state['seq'], changes, reset
+
+
+achanges_since = DatabaseSyncToAsync(changes_since, thread_sensitive=False)
+
+
+async def acan_view(user, entity_type: str, entity_id: int) -> bool:
+    """Whether ``user`` may watch the entity (assignee/vendor, watcher groups or superuser)"""
+    if not user.is_authenticated:
+        return False
+    if entity_type == 'job':
+        snapshot = await job_detail.asnapshot(entity_id)
+        if snapshot is None:
+            return False
+        owner_id = snapshot['person_in_charge_id']
+    else:
+        po = await PurchaseOrder.objects.filter(pk=entity_id).values('vendor__user_id').afirst()
+        if po is None:
+            return False
+        owner_id = po['vendor__user_id']
+    return owner_id == user.pk or user.is_superuser or await ahas_group(user, *WATCHER_GROUPS)
@@ -0,0 +1,397 @@
+"""
+Promotion Engine
+Evaluates coupons and automatic promotions for a cart in one pass.
+
+Active Coupon and Promotion definitions are compiled into plain rule dicts
+and cached under the versioned 'promotions' namespace (bumped when a coupon
+or promotion changes, or one runs out of uses), so evaluating a cart costs
+no coupon/promotion queries. Usage is counted at checkout with conditional
+increments - on the coupon/promotion for the global limit, and in
+PromotionUsage for the per-customer limit - so limits hold under concurrent
+checkouts and validation never counts orders.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import Coupon, Order, Promotion, PromotionRedemption, PromotionUsage
+from . import cache as promotions_cache
+
+CENT = Decimal('0.01')
+RULES_TIMEOUT = 3600
+
+
+class PromotionUnavailable(Exception):
+    """A discount ran out of uses between evaluation and checkout"""
+
+
+def _money(value) -> Decimal:
+    return Decimal(value).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+# ==================== Rule set ====================
+
+def _coupon_rule(coupon: Coupon) -> Dict[str, Any]:
+    return {
+        'kind': 'coupon',
+        'id': coupon.pk,
+        'name': coupon.name,
+        'code': coupon.code,
+        'type': coupon.discount_type,
+        'value': coupon.discount_value,
+        'buy': coupon.buy_quantity,
+        'get': coupon.get_quantity,
+        'get_product': None,
+        'tiers': [],
+        'segments': [],
+        'min_amount': coupon.minimum_order_amount,
+        'max_discount': coupon.maximum_discount_amount,
+        'products': frozenset(p.pk for p in coupon.applicable_products.all()),
+        'categories': frozenset(),
+        'per_customer_limit': coupon.usage_limit_per_customer,
+        'usage_limit': coupon.usage_limit,
+        'exhausted': bool(coupon.usage_limit and coupon.usage_count >= coupon.usage_limit),
+        'starts': coupon.valid_from,
+        'ends': coupon.valid_until,
+        'stackable': coupon.stackable,
+    }
+
+
+def _promotion_rule(promotion: Promotion) -> Dict[str, Any]:
+    return {
+        'kind': 'promotion',
+        'id': promotion.pk,
+        'name': promotion.name,
+        'code': None,
+        'type': promotion.promotion_type,
+        'value': promotion.segment_discount_percentage,
+        'buy': promotion.buy_quantity,
+        'get': promotion.get_quantity,
+        'get_product': promotion.get_product_id,
+        'tiers': promotion.tier_rules or [],
+        'segments': promotion.customer_segments or [],
+        'min_amount': promotion.minimum_order_amount,
+        'max_discount': None,
+        'products': frozenset(p.pk for p in promotion.eligible_products.all()),
+        'categories': frozenset(c.name for c in promotion.eligible_categories.all()),
+        'per_customer_limit': promotion.usage_limit_per_customer,
+        'usage_limit': promotion.usage_limit,
+        'exhausted': bool(promotion.usage_limit and promotion.usage_count >= promotion.usage_limit),
+        'starts': promotion.starts_at,
+        'ends': promotion.ends_at,
+        'stackable': promotion.stackable,
+    }
+
+
+def _build_rules() -> Dict[str, Any]:
+    now = timezone.now()
+    coupons = Coupon.objects.filter(is_active=True, valid_until__gte=now).prefetch_related('applicable_products')
+    promotions = Promotion.objects.filter(is_active=True, ends_at__gte=now).prefetch_related(
+        'eligible_products', 'eligible_categories'
+    )
+    return {
+        'coupons': {coupon.code: _coupon_rule(coupon) for coupon in coupons},
+        'promotions': [_promotion_rule(promotion) for promotion in promotions],
+    }
+
+
+def load_rules() -> Dict[str, Any]:
+    """Active coupons (by code) and promotions for the current rule version"""
+    return promotions_cache.get_or_set(promotions_cache.PROMOTIONS, ('rules',), _build_rules, timeout=RULES_TIMEOUT)
+
+
+def invalidate_rules() -> None:
+    promotions_cache.bump_namespace(promotions_cache.PROMOTIONS)
+
+
+# ==================== Discount maths ====================
+
+def buy_x_get_y_discount(lines: Iterable[Dict[str, Any]], buy: Optional[int], get: Optional[int]) -> Decimal:
+    """
+    Buy ``buy`` get ``get`` free across the given lines: every full group of
+    buy+get units makes its ``get`` cheapest units free.
+    """
+    if not buy or not get:
+        return Decimal('0')
+    prices = sorted(
+        Decimal(line['unit_price'])
+        for line in lines
+        for _ in range(int(line['quantity']))
+    )
+    free_units = len(prices) // (buy + get) * get
+    return _money(sum(prices[:free_units], Decimal('0')))
+
+
+def _bogo_discount(rule, eligible, lines) -> Decimal:
+    """BOGO promotion: with a get_product, buying ``buy`` eligible units frees ``get`` of that product"""
+    if not rule['get_product']:
+        return buy_x_get_y_discount(eligible, rule['buy'], rule['get'])
+    if not rule['buy'] or not rule['get']:
+        return Decimal('0')
+    bought = sum(int(line['quantity']) for line in eligible)
+    free_lines = [line for line in lines if line['product_id'] == rule['get_product']]
+    free_units = min(bought // rule['buy'] * rule['get'], sum(int(line['quantity']) for line in free_lines))
+    prices = sorted(Decimal(line['unit_price']) for line in free_lines for _ in range(int(line['quantity'])))
+    return _money(sum(prices[:free_units], Decimal('0')))
+
+
+def _tiered_discount(rule, eligible_total: Decimal) -> Decimal:
+    best = Decimal('0')
+    for tier in rule['tiers']:
+        if eligible_total < Decimal(str(tier.get('min_spend', 0))):
+            continue
+        if tier.get('discount_percentage') is not None:
+            amount = eligible_total * Decimal(str(tier['discount_percentage'])) / 100
+        else:
+            amount = Decimal(str(tier.get('discount_amount', 0)))
+        best = max(best, amount)
+    return _money(min(best, eligible_total))
+
+
+def customer_segments(customer) -> set:
+    """Segments a Promotion's customer_segments can target"""
+    if customer is None:
+        return {'guest'}
+    segments = {'guest' if customer.is_guest else 'registered'}
+    if customer.matched_client_id:
+        segments.add('b2b')
+    return segments
+
+
+def _eligible(rule, lines) -> List[Dict[str, Any]]:
+    if not rule['products'] and not rule['categories']:
+        return list(lines)
+    return [
+        line for line in lines
+        if line['product_id'] in rule['products'] or line.get('category') in rule['categories']
+    ]
+
+
+# ==================== Evaluation ====================
+
+def evaluate(
+    lines: List[Dict[str, Any]],
+    customer=None,
+    coupon_code: Optional[str] = None,
+    shipping: Decimal = Decimal('0'),
+) -> Dict[str, Any]:
+    """
+    Every discount that applies to a cart.
+
+    Args:
+        lines: [{'product_id', 'quantity', 'unit_price', 'category'}] -
+            category is the product's primary_category (optional)
+        customer: Customer, for per-customer limits and segments
+        coupon_code: Coupon entered by the customer
+        shipping: Shipping cost, so free shipping can be weighed against
+            other discounts when they do not stack
+
+    Returns:
+        {
+            "discounts": [{"kind", "id", "name", "code", "amount", "free_shipping", "stackable"}],
+            "discount_total": Decimal,
+            "free_shipping": bool,
+            "coupon_error": str or None,
+        }
+    """
+    rules = load_rules()
+    now = timezone.now()
+    subtotal = sum((Decimal(line['unit_price']) * int(line['quantity']) for line in lines), Decimal('0'))
+
+    candidates = [rule for rule in rules['promotions'] if rule['type'] != 'loyalty']
+    coupon_error = None
+    if coupon_code:
+        coupon_rule = rules['coupons'].get(coupon_code)
+        if coupon_rule is None:
+            coupon_error = "Invalid coupon code"
+        else:
+            candidates.append(coupon_rule)
+
+    # One indexed lookup for every per-customer counter involved
+    used = {}
+    if customer is not None and any(rule['per_customer_limit'] for rule in candidates):
+        for coupon_id, promotion_id, uses in PromotionUsage.objects.filter(customer=customer).filter(
+            Q(coupon_id__in=[r['id'] for r in candidates if r['kind'] == 'coupon'])
+            | Q(promotion_id__in=[r['id'] for r in candidates if r['kind'] == 'promotion'])
+        ).values_list('coupon_id', 'promotion_id', 'uses'):
+            used[('coupon', coupon_id) if coupon_id else ('promotion', promotion_id)] = uses
+
+    segments = None
+    has_paid_order = None
+    applied = []
+    for rule in candidates:
+        reason = None
+        if not (rule['starts'] <= now <= rule['ends']):
+            reason = "Coupon is not valid at this time"
+        elif rule['exhausted']:
+            reason = "Coupon usage limit reached"
+        elif subtotal < rule['min_amount']:
+            reason = f"Minimum order amount of {rule['min_amount']} required"
+        elif rule['per_customer_limit'] and used.get((rule['kind'], rule['id']), 0) >= rule['per_customer_limit']:
+            reason = "You have already used this coupon"
+
+        if reason:
+            if rule['kind'] == 'coupon':
+                coupon_error = reason
+            continue
+
+        eligible = _eligible(rule, lines)
+        eligible_total = sum((Decimal(l['unit_price']) * int(l['quantity']) for l in eligible), Decimal('0'))
+        free_shipping = False
+        kind = rule['type']
+        if kind == 'percentage':
+            amount = eligible_total * rule['value'] / 100
+        elif kind == 'fixed':
+            amount = min(rule['value'], eligible_total)
+        elif kind == 'free_shipping':
+            amount, free_shipping = Decimal('0'), True
+        elif kind in ('buy_x_get_y', 'bogo'):
+            amount = _bogo_discount(rule, eligible, lines)
+        elif kind == 'tiered':
+            amount = _tiered_discount(rule, eligible_total)
+        elif kind in ('segment', 'first_time'):
+            if kind == 'segment':
+                segments = segments if segments is not None else customer_segments(customer)
+                applies = bool(segments & set(rule['segments']))
+            else:
+                if has_paid_order is None:
+                    has_paid_order = customer is not None and Order.objects.filter(
+                        customer=customer, payment_status='completed'
+                    ).exists()
+                applies = customer is not None and not has_paid_order
+            amount = eligible_total * (rule['value'] or 0) / 100 if applies else Decimal('0')
+        else:
+            amount = Decimal('0')
+
+        if rule['max_discount']:
+            amount = min(amount, rule['max_discount'])
+        amount = _money(amount)
+        if amount > 0 or free_shipping:
+            applied.append({
+                'kind': rule['kind'],
+                'id': rule['id'],
+                'name': rule['name'],
+                'code': rule['code'],
+                'amount': amount,
+                'free_shipping': free_shipping,
+                'stackable': rule['stackable'],
+                'per_customer_limit': rule['per_customer_limit'],
+                'usage_limit': rule['usage_limit'],
+            })
+
+    def value(option):
+        return sum(d['amount'] for d in option) + (shipping if any(d['free_shipping'] for d in option) else 0)
+
+    # Stackable discounts combine; a non-stackable one only applies alone
+    options = [[d for d in applied if d['stackable']]] + [[d] for d in applied if not d['stackable']]
+    best = max(options, key=value)
+
+    if coupon_code and not any(d['kind'] == 'coupon' for d in best) and coupon_error is None:
+        if any(d['kind'] == 'coupon' for d in applied):
+            coupon_error = "A better offer that cannot be combined is already applied"
+        else:
+            coupon_error = "Coupon does not apply to this cart"
+
+    discount_total = min(sum((d['amount'] for d in best), Decimal('0')), subtotal)
+    return {
+        'discounts': best,
+        'discount_total': discount_total,
+        'free_shipping': any(d['free_shipping'] for d in best),
+        'coupon_error': coupon_error if coupon_code and not any(d['kind'] == 'coupon' for d in best) else None,
+    }
+
+
+def cart_lines(items) -> List[Dict[str, Any]]:
+    """evaluate() lines for CartItem/OrderItem rows (with product selected)"""
+    return [
+        {
+            'product_id': item.product_id,
+            'quantity': item.quantity,
+            'unit_price': item.unit_price,
+            'category': item.product.primary_category,
+        }
+        for item in items
+    ]
+
+
+# ==================== Usage counting ====================
+
+def _model(kind):
+    return Coupon if kind == 'coupon' else Promotion
+
+
+def redeem(order, evaluation: Dict[str, Any], customer=None) -> List[PromotionRedemption]:
+    """
+    Count the evaluated discounts as used by ``order``. Call inside the
+    checkout transaction: if any discount hit its global or per-customer
+    limit in the meantime, PromotionUnavailable is raised and nothing is
+    counted.
+    """
+    redemptions = []
+    exhausted = False
+    with transaction.atomic():
+        for discount in evaluation['discounts']:
+            kind, pk = discount['kind'], discount['id']
+            updated = _model(kind).objects.filter(pk=pk).filter(
+                Q(usage_limit__isnull=True) | Q(usage_limit=0) | Q(usage_count__lt=F('usage_limit'))
+            ).update(usage_count=F('usage_count') + 1)
+            if not updated:
+                raise PromotionUnavailable(f"{discount['name']} is no longer available")
+            if discount['usage_limit']:
+                exhausted = exhausted or _model(kind).objects.filter(
+                    pk=pk, usage_count__gte=F('usage_limit')
+                ).exists()
+
+            if customer is not None:
+                PromotionUsage.objects.bulk_create(
+                    [PromotionUsage(customer=customer, **{f'{kind}_id': pk})], ignore_conflicts=True
+                )
+                usage = PromotionUsage.objects.filter(customer=customer, **{f'{kind}_id': pk})
+                if discount['per_customer_limit']:
+                    usage = usage.filter(uses__lt=discount['per_customer_limit'])
+                if not usage.update(uses=F('uses') + 1):
+                    raise PromotionUnavailable(f"{discount['name']} was already used")
+
+            redemptions.append(PromotionRedemption(
+                order=order,
+                customer=customer,
+                amount=discount['amount'],
+                free_shipping=discount['free_shipping'],
+                **{f'{kind}_id': pk},
+            ))
+        PromotionRedemption.objects.bulk_create(redemptions)
+        if exhausted:
+            transaction.on_commit(invalidate_rules)
+    return redemptions
+
+
+def release(order) -> int:
+    """Give back the uses counted for a cancelled/refunded order"""
+    with transaction.atomic():
+        claimed = list(
+            PromotionRedemption.objects.filter(order=order, status='applied')
+            .select_for_update(skip_locked=True)
+            .values_list('pk', 'customer_id', 'coupon_id', 'promotion_id')
+        )
+        if not claimed:
+            return 0
+
+        released = defaultdict(int)
+        for _, customer_id, coupon_id, promotion_id in claimed:
+            kind, pk = ('coupon', coupon_id) if coupon_id else ('promotion', promotion_id)
+            if pk is None:
+                continue
+            released[(kind, pk)] += 1
+            if customer_id:
+                PromotionUsage.objects.filter(customer_id=customer_id, uses__gt=0, **{f'{kind}_id': pk}).update(
+                    uses=F('uses') - 1
+                )
+        for (kind, pk), count in released.items():
+            _model(kind).objects.filter(pk=pk, usage_count__gte=count).update(usage_count=F('usage_count') - count)
+        PromotionRedemption.objects.filter(pk__in=[row[0] for row in claimed]).update(status='released')
+        transaction.on_commit(invalidate_rules)
+    return len(claimed)
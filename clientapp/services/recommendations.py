@@ -0,0 +1,202 @@
+"""
+Co-purchase Recommendations
+Keeps a sparse product x product co-occurrence matrix (ProductCoPurchase)
+and each product's top-K neighbours (ProductRecommendation), so "frequently
+bought together" is a single-row lookup instead of a join over order history.
+
+Scores use forward decay: a basket from time t adds 2^((t - EPOCH) / half-life).
+Every score shares the same epoch, so rankings weigh recent baskets more
+while an incremental update only ever adds to the rows it touches. Orders are
+added as they reach a paid status; the nightly rebuild recomputes everything
+(including quote-line co-occurrence) from history.
+"""
+import heapq
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+from itertools import groupby, permutations
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Order, OrderItem, ProductCoPurchase, ProductRecommendation, QuoteLineItem
+
+logger = logging.getLogger(__name__)
+
+# Order statuses that count as a purchase
+PURCHASED_STATUSES = ('paid', 'processing', 'in_production', 'shipped', 'delivered')
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+TOP_K = 20
+WRITE_BATCH_SIZE = 1000
+
+
+def half_life_days() -> float:
+    return float(getattr(settings, 'CROSS_SELL_HALF_LIFE_DAYS', 180))
+
+
+def quote_weight() -> float:
+    """How much a quote-line co-occurrence counts relative to a purchase (0 disables)"""
+    return float(getattr(settings, 'CROSS_SELL_QUOTE_WEIGHT', 0.5))
+
+
+def decay_weight(when: Optional[datetime]) -> float:
+    when = when or timezone.now()
+    return 2 ** ((when - EPOCH).total_seconds() / (half_life_days() * 86400))
+
+
+def _top_k(neighbours: Iterable[Tuple[int, float]]) -> List[List]:
+    return [[product_id, round(score, 6)] for product_id, score in heapq.nlargest(TOP_K, neighbours, key=lambda n: n[1])]
+
+
+# ==================== Incremental ====================
+
+def record_order(order_id: int) -> bool:
+    """
+    Add a purchased order's basket to the matrix and refresh the top-K of
+    its products. Each order is counted once; returns False if it was
+    already indexed or is not purchased.
+    """
+    with transaction.atomic():
+        claimed = Order.objects.filter(
+            pk=order_id, status__in=PURCHASED_STATUSES, copurchase_indexed_at__isnull=True
+        ).update(copurchase_indexed_at=timezone.now())
+        if not claimed:
+            return False
+
+        created_at = Order.objects.values_list('created_at', flat=True).get(pk=order_id)
+        basket = sorted(set(OrderItem.objects.filter(order_id=order_id).values_list('product_id', flat=True)))
+        if len(basket) < 2:
+            return True
+
+        ProductCoPurchase.objects.bulk_create(
+            [ProductCoPurchase(product_id=a, related_product_id=b) for a, b in permutations(basket, 2)],
+            ignore_conflicts=True,
+        )
+        # Every pair of the basket gets the same weight - one UPDATE
+        ProductCoPurchase.objects.filter(product_id__in=basket, related_product_id__in=basket).update(
+            order_score=F('order_score') + decay_weight(created_at),
+            updated_at=timezone.now(),
+        )
+        refresh_neighbours(basket)
+    return True
+
+
+def refresh_neighbours(product_ids: Iterable[int]) -> None:
+    """Recompute the stored top-K of the given products from the matrix"""
+    weight = quote_weight()
+    recommendations = []
+    for product_id in product_ids:
+        rows = (
+            ProductCoPurchase.objects.filter(product_id=product_id)
+            .annotate(score=F('order_score') + F('quote_score') * weight)
+            .order_by('-score')
+            .values_list('related_product_id', 'score')[:TOP_K]
+        )
+        recommendations.append(ProductRecommendation(product_id=product_id, neighbours=_top_k(rows)))
+    ProductRecommendation.objects.bulk_create(
+        recommendations,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['neighbours', 'updated_at'],
+    )
+
+
+def schedule_order_indexing(order_id: int) -> None:
+    """Index the order after commit, in a worker when one is available"""
+    def enqueue():
+        try:
+            from ..tasks import index_order_copurchases
+            index_order_copurchases.delay(order_id)
+        except Exception as e:
+            logger.warning(f"Could not queue co-purchase indexing, indexing inline: {e}")
+            record_order(order_id)
+
+    transaction.on_commit(enqueue)
+
+
+# ==================== Nightly rebuild ====================
+
+def _accumulate(rows, matrix: Dict[Tuple[int, int], List[float]], column: int) -> List[int]:
+    """
+    Add every basket in ``rows`` - (basket_id, product_id, timestamp) ordered
+    by basket - to ``matrix`` column 0 (orders) or 1 (quotes). Returns the
+    basket ids seen.
+    """
+    seen = []
+    for basket_id, lines in groupby(rows, key=lambda row: row[0]):
+        lines = list(lines)
+        seen.append(basket_id)
+        products = sorted({product_id for _, product_id, _ in lines if product_id})
+        if len(products) < 2:
+            continue
+        weight = decay_weight(lines[0][2])
+        for pair in permutations(products, 2):
+            matrix[pair][column] += weight
+    return seen
+
+
+def rebuild_index() -> Dict[str, int]:
+    """Recompute the whole matrix and every top-K list from order and quote history"""
+    matrix: Dict[Tuple[int, int], List[float]] = defaultdict(lambda: [0.0, 0.0])
+    order_rows = (
+        OrderItem.objects.filter(order__status__in=PURCHASED_STATUSES)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id', 'order__created_at')
+        .iterator(chunk_size=WRITE_BATCH_SIZE)
+    )
+    order_ids = _accumulate(order_rows, matrix, 0)
+
+    quote_ids = []
+    if quote_weight():
+        quote_rows = (
+            QuoteLineItem.objects.filter(product__isnull=False)
+            .exclude(quote__status='Lost')
+            .order_by('quote_id')
+            .values_list('quote_id', 'product_id', 'quote__created_at')
+            .iterator(chunk_size=WRITE_BATCH_SIZE)
+        )
+        quote_ids = _accumulate(quote_rows, matrix, 1)
+
+    weight = quote_weight()
+    neighbours: Dict[int, List[Tuple[int, float]]] = defaultdict(list)
+    for (product_id, related_id), (order_score, quote_score) in matrix.items():
+        neighbours[product_id].append((related_id, order_score + quote_score * weight))
+
+    with transaction.atomic():
+        ProductCoPurchase.objects.all().delete()
+        ProductCoPurchase.objects.bulk_create(
+            (
+                ProductCoPurchase(product_id=a, related_product_id=b, order_score=scores[0], quote_score=scores[1])
+                for (a, b), scores in matrix.items()
+            ),
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(
+            (
+                ProductRecommendation(product_id=product_id, neighbours=_top_k(items))
+                for product_id, items in neighbours.items()
+            ),
+            batch_size=WRITE_BATCH_SIZE,
+        )
+        # Orders paid after the read above are not in the matrix and still index themselves
+        now = timezone.now()
+        for start in range(0, len(order_ids), WRITE_BATCH_SIZE):
+            Order.objects.filter(
+                pk__in=order_ids[start:start + WRITE_BATCH_SIZE], copurchase_indexed_at__isnull=True
+            ).update(copurchase_indexed_at=now)
+
+    return {'orders': len(order_ids), 'quotes': len(quote_ids), 'pairs': len(matrix), 'products': len(neighbours)}
+
+
+# ==================== Lookup ====================
+
+def neighbour_ids(product_id: int, limit: int = TOP_K) -> List[int]:
+    """Co-purchased product ids, best first"""
+    neighbours = (
+        ProductRecommendation.objects.filter(product_id=product_id).values_list('neighbours', flat=True).first()
+    )
+    return [related_id for related_id, _ in (neighbours or [])[:limit]]
@@ -0,0 +1,109 @@
+"""
+Role Resolution
+A user's group names and portal/vendor/storefront profiles, resolved once
+and shared by every permission check.
+
+Within a request the resolved Roles are memoized on the user object, so
+permission classes, decorators and template filters cost nothing after the
+first check. Across requests they live in the shared cache (ROLES
+namespace, one key per user), which the signals in storefront_signals clear
+when group membership (m2m_changed), a group or one of the profiles changes.
+is_superuser/is_staff are read from the user row itself, which every request
+loads anyway.
+"""
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable, Optional
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+from . import cache as roles_cache
+
+ROLES_TIMEOUT = 900
+_ATTR = '_resolved_roles'
+
+
+@dataclass(frozen=True)
+class Roles:
+    user_id: Optional[int] = None
+    groups: FrozenSet[str] = field(default_factory=frozenset)
+    # Active ClientPortalUser and its client
+    portal_user_id: Optional[int] = None
+    client_id: Optional[int] = None
+    # Active Vendor
+    vendor_id: Optional[int] = None
+    storefront_customer_id: Optional[int] = None
+
+    def in_group(self, *names: str) -> bool:
+        """Member of any of ``names`` (superusers are not implied)"""
+        return not self.groups.isdisjoint(names)
+
+
+ANONYMOUS = Roles()
+
+
+def _load(user_id: int) -> Roles:
+    groups = frozenset(User.groups.through.objects.filter(user_id=user_id).values_list('group__name', flat=True))
+    profile = User.objects.filter(pk=user_id).values(
+        'client_portal_user__id', 'client_portal_user__client_id', 'client_portal_user__is_active',
+        'vendor_profile__id', 'vendor_profile__active', 'storefront_customer_profile__id',
+    ).first() or {}
+    portal_active = profile.get('client_portal_user__is_active')
+    return Roles(
+        user_id=user_id,
+        groups=groups,
+        portal_user_id=profile.get('client_portal_user__id') if portal_active else None,
+        client_id=profile.get('client_portal_user__client_id') if portal_active else None,
+        vendor_id=profile.get('vendor_profile__id') if profile.get('vendor_profile__active') else None,
+        storefront_customer_id=profile.get('storefront_customer_profile__id'),
+    )
+
+
+def roles_for(user) -> Roles:
+    """Roles of ``user`` (ANONYMOUS for anonymous or missing users)"""
+    if user is None or not getattr(user, 'is_authenticated', False) or user.pk is None:
+        return ANONYMOUS
+    roles = getattr(user, _ATTR, None)
+    if roles is None or roles.user_id != user.pk:
+        roles = roles_cache.get_or_set(roles_cache.ROLES, (user.pk,), lambda: _load(user.pk), timeout=ROLES_TIMEOUT)
+        setattr(user, _ATTR, roles)
+    return roles
+
+
+def has_group(user, *names: str, allow_superuser: bool = False) -> bool:
+    """Whether ``user`` belongs to any of ``names`` (or is a superuser, if allowed)"""
+    if allow_superuser and getattr(user, 'is_superuser', False) and getattr(user, 'is_authenticated', False):
+        return True
+    return roles_for(user).in_group(*names)
+
+
+async def aroles_for(user) -> Roles:
+    """roles_for for async code: a cache hit never leaves the event loop"""
+    if user is None or not getattr(user, 'is_authenticated', False) or user.pk is None:
+        return ANONYMOUS
+    roles = getattr(user, _ATTR, None)
+    if roles is None or roles.user_id != user.pk:
+        user_id = user.pk
+        roles = await roles_cache.aget_or_set(roles_cache.ROLES, (user_id,), lambda: _load(user_id), timeout=ROLES_TIMEOUT)
+        setattr(user, _ATTR, roles)
+    return roles
+
+
+async def ahas_group(user, *names: str, allow_superuser: bool = False) -> bool:
+    if allow_superuser and getattr(user, 'is_superuser', False) and getattr(user, 'is_authenticated', False):
+        return True
+    return (await aroles_for(user)).in_group(*names)
+
+
+def invalidate(user_ids: Optional[Iterable[int]] = None) -> None:
+    """Forget the cached roles of ``user_ids`` (every user if None)"""
+    if user_ids is None:
+        roles_cache.bump_namespace(roles_cache.ROLES)
+        return
+    cache.delete_many([roles_cache.make_key(roles_cache.ROLES, user_id) for user_id in user_ids])
+
+
+def forget(user) -> None:
+    """Drop the roles memoized on this user object"""
+    if hasattr(user, _ATTR):
+        delattr(user, _ATTR)
@@ -0,0 +1,225 @@
+"""
+Product -> StorefrontProduct Synchronization
+Change-data-driven: a watermark on Product.updated_at for batch runs, plus
+post_save hooks that enqueue individual products. Changed rows are applied
+with chunked bulk upserts.
+"""
+import logging
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+
+from ..models import Product, StorefrontProduct, SystemSetting
+from . import cache as catalog_cache
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_KEY = 'storefront_sync_watermark'
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_BASE_PRICE = Decimal('100.00')
+
+# Written on every sync. Anything else (show_price, available_customizations,
+# pricing tiers, images...) keeps its model default on create and is never
+# overwritten afterwards, so storefront-side curation survives later syncs.
+SYNCED_FIELDS = [
+    'name', 'description_short', 'description_long', 'category',
+    'storefront_visible', 'featured', 'customization_level',
+    'base_price', 'price_range_min', 'price_range_max',
+]
+
+
+def storefront_product_id(product: Product) -> str:
+    """Use internal_code as product_id, or generate one"""
+    return product.internal_code or f"PROD-{product.id}"
+
+
+def storefront_fields(product: Product) -> Dict[str, Any]:
+    """Map a Product onto StorefrontProduct field values"""
+    base_price = product.base_price or DEFAULT_BASE_PRICE
+    pricing = getattr(product, 'pricing', None)
+    if not product.base_price and pricing and pricing.base_cost:
+        # Apply default margin (a percentage) to get customer-facing price
+        margin = (pricing.default_margin or Decimal('30')) / Decimal('100')
+        base_price = (pricing.base_cost * (1 + margin)).quantize(Decimal('0.01'))
+
+    return {
+        'name': product.name,
+        'description_short': (product.short_description or '')[:500],
+        'description_long': product.long_description or '',
+        'category': product.primary_category or 'uncategorized',
+        'storefront_visible': product.is_visible and product.status == 'published',
+        'featured': product.feature_product or product.bestseller_badge,
+        'customization_level': product.customization_level or 'semi_customizable',
+        'base_price': base_price,
+        'price_range_min': base_price,
+        'price_range_max': base_price * 3,
+    }
+
+
+def get_watermark() -> Optional[Any]:
+    setting = SystemSetting.objects.filter(key=WATERMARK_KEY).first()
+    return parse_datetime(setting.value) if setting and setting.value else None
+
+
+def set_watermark(value) -> None:
+    SystemSetting.objects.update_or_create(
+        key=WATERMARK_KEY,
+        defaults={
+            'value': value.isoformat(),
+            'description': 'Last Product.updated_at synced to the storefront',
+        }
+    )
+
+
+class StorefrontSyncService:
+    """
+    Applies Product changes to StorefrontProduct in bulk
+    """
+
+    @staticmethod
+    def sync(
+        product_ids: Optional[Iterable[int]] = None,
+        full: bool = False,
+        since=None,
+        force: bool = False,
+        dry_run: bool = False,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> Dict[str, Any]:
+        """
+        Sync products to the storefront
+
+        Args:
+            product_ids: Sync exactly these products (post_save path)
+            full: Consider every product instead of only those changed since
+                the watermark
+            since: Override the stored watermark
+            force: Rewrite rows even when nothing changed
+            dry_run: Report the diff without writing anything
+            chunk_size: Rows per bulk upsert
+
+        Returns:
+            {"created": int, "updated": int, "hidden": int, "unchanged": int,
+             "diff": [{"product_id", "action", "changes"}] (dry run only)}
+        """
+        queryset = Product.objects.select_related('pricing').order_by('updated_at', 'pk')
+        use_watermark = product_ids is None and not full
+        if product_ids is not None:
+            queryset = queryset.filter(pk__in=list(product_ids))
+        elif not full:
+            since = since or get_watermark()
+            # >= so rows committed late with the watermark's timestamp are not
+            # missed; already-synced ones diff as unchanged
+            if since:
+                queryset = queryset.filter(updated_at__gte=since)
+            # Never-synced catalogs only need the products that are visible
+            else:
+                queryset = queryset.filter(is_visible=True, status='published')
+
+        stats = {'created': 0, 'updated': 0, 'hidden': 0, 'unchanged': 0, 'diff': []}
+        high_water = None
+        chunk: List[Product] = []
+
+        for product in queryset.iterator(chunk_size=chunk_size):
+            chunk.append(product)
+            high_water = product.updated_at
+            if len(chunk) >= chunk_size:
+                StorefrontSyncService._apply_chunk(chunk, stats, force, dry_run)
+                chunk = []
+        if chunk:
+            StorefrontSyncService._apply_chunk(chunk, stats, force, dry_run)
+
+        if not dry_run:
+            if stats['created'] or stats['updated'] or stats['hidden']:
+                catalog_cache.bump_namespace(catalog_cache.CATALOG)
+                from .catalog_snapshot import schedule_snapshot_rebuild
+                transaction.on_commit(schedule_snapshot_rebuild)
+            if use_watermark and high_water:
+                set_watermark(high_water)
+
+        if not dry_run:
+            stats.pop('diff')
+        return stats
+
+    @staticmethod
+    def _apply_chunk(products: List[Product], stats: Dict[str, Any], force: bool, dry_run: bool) -> None:
+        wanted = {storefront_product_id(p): storefront_fields(p) for p in products}
+        existing = {
+            row['product_id']: row
+            for row in StorefrontProduct.objects.filter(
+                product_id__in=list(wanted)
+            ).values('product_id', *SYNCED_FIELDS)
+        }
+
+        to_write = []
+        for product_id, fields in wanted.items():
+            current = existing.get(product_id)
+            if current is None:
+                # Hidden products that never reached the storefront stay out
+                if not fields['storefront_visible']:
+                    continue
+                action = 'create'
+                changes = {name: [None, value] for name, value in fields.items()}
+            else:
+                changes = {
+                    name: [current[name], value]
+                    for name, value in fields.items()
+                    if current[name] != value
+                }
+                if not changes and not force:
+                    stats['unchanged'] += 1
+                    continue
+                if current['storefront_visible'] and not fields['storefront_visible']:
+                    action = 'hide'
+                else:
+                    action = 'update'
+
+            stats[{'create': 'created', 'update': 'updated', 'hide': 'hidden'}[action]] += 1
+            if dry_run:
+                stats['diff'].append({'product_id': product_id, 'action': action, 'changes': changes})
+            else:
+                to_write.append(StorefrontProduct(product_id=product_id, **fields))
+
+        if to_write:
+            StorefrontProduct.objects.bulk_create(
+                to_write,
+                update_conflicts=True,
+                unique_fields=['product_id'],
+                update_fields=SYNCED_FIELDS + ['updated_at'],
+            )
+
+
+# ==================== post_save enqueueing ====================
+
+_pending = threading.local()
+
+
+def enqueue_product_sync(product_id: int) -> None:
+    """
+    Queue a product for storefront sync once the current transaction
+    commits. The first flush to run takes every pending id, so the saves of
+    one transaction (e.g. a bulk admin edit) become a single sync.
+    """
+    ids = getattr(_pending, 'ids', None)
+    if ids is None:
+        ids = _pending.ids = set()
+    ids.add(product_id)
+    transaction.on_commit(_flush_pending)
+
+
+def _flush_pending() -> None:
+    ids = getattr(_pending, 'ids', None)
+    _pending.ids = None
+    if not ids:
+        return
+    try:
+        from ..tasks import sync_products_to_storefront_task
+        sync_products_to_storefront_task.delay(sorted(ids))
+    except Exception as e:
+        logger.warning(f"Could not queue storefront sync, syncing inline: {e}")
+        try:
+            StorefrontSyncService.sync(product_ids=ids)
+        except Exception as sync_error:
+            logger.error(f"Storefront sync failed for products {sorted(ids)}: {sync_error}")
@@ -3,134 +3,133 @@ Django signals for automatic change tracking in Product Catalog
 Implements ProductChangeHistory entry creation for ALL product field changes
 """
 
-from django.db.models.signals import post_save, pre_save
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.apps import AppConfig
 from clientapp.models import Product, ProductChangeHistory, ProductPricing, ProductSEO
-import json
-from decimal import Decimal
+import logging
 
-# Track previous values before save
-_product_previous_values = {}
+logger = logging.getLogger(__name__)
 
-@receiver(pre_save, sender=Product)
-def track_product_changes_pre_save(sender, instance, **kwargs):
+# Previous values come from ChangeTrackingMixin: each instance remembers
+# what it was loaded with, so no pre_save SELECT or shared state is needed.
+
+
+def _as_text(value):
+    return str(value) if value is not None else ''
+
+
+def write_change_history(entries):
     """
-    Pre-save signal to capture product values before they change
-    Stores in module-level dict for comparison in post_save
+    Insert ProductChangeHistory rows in one query.
+
+    With PRODUCT_HISTORY_ASYNC the rows are handed to a Celery task after
+    commit instead, taking the history write off the save path.
     """
-    if instance.pk:  # Only for updates, not creates
+    if not entries:
+        return
+    if not getattr(settings, 'PRODUCT_HISTORY_ASYNC', False):
+        ProductChangeHistory.objects.bulk_create(entries)
+        return
+
+    rows = [
+        {
+            'product_id': entry.product_id,
+            'changed_by_id': entry.changed_by_id,
+            'change_type': entry.change_type,
+            'field_changed': entry.field_changed,
+            'old_value': entry.old_value,
+            'new_value': entry.new_value,
+        }
+        for entry in entries
+    ]
+
+    def enqueue():
         try:
-            old_instance = Product.objects.get(pk=instance.pk)
-            _product_previous_values[instance.pk] = {
-                'name': old_instance.name,
-                'short_description': old_instance.short_description,
-                'long_description': old_instance.long_description,
-                'technical_specs': old_instance.technical_specs,
-                'customization_level': old_instance.customization_level,
-                'primary_category': old_instance.primary_category,
-                'sub_category': old_instance.sub_category,
-                'product_family': old_instance.product_family,
-                'visibility': old_instance.visibility,
-                'feature_product': old_instance.feature_product,
-                'bestseller_badge': old_instance.bestseller_badge,
-                'new_arrival': old_instance.new_arrival,
-                'base_price': str(old_instance.base_price) if old_instance.base_price else None,
-                'status': old_instance.status,
-                'internal_code': old_instance.internal_code,
-            }
-        except Product.DoesNotExist:
-            pass
+            from clientapp.tasks import record_product_change_history
+            record_product_change_history.delay(rows)
+        except Exception as e:
+            logger.warning(f"Could not queue product history, writing inline: {e}")
+            ProductChangeHistory.objects.bulk_create(entries)
+
+    transaction.on_commit(enqueue)
+
 
 @receiver(post_save, sender=Product)
-def create_change_history_for_product(sender, instance, created, **kwargs):
+def create_change_history_for_product(sender, instance, created, raw=False, **kwargs):
     """
     Post-save signal to create ProductChangeHistory entries
     Tracks changes to all product fields automatically
     """
-    from django.utils import timezone
-    
-    # Skip if this is a create (not an update)
-    if created:
+    changes = {} if created or raw else instance.tracked_changes()
+    instance.reset_tracked_values()
+    if not changes:
         return
-    
+
     # Get changed_by user (set by the view or model)
     changed_by = getattr(instance, '_changed_by', None)
     if not changed_by:
         # Fall back to updated_by or created_by
         changed_by = instance.updated_by or instance.created_by
-    
-    # Get previous values
-    previous_values = _product_previous_values.pop(instance.pk, {})
-    if not previous_values:
-        return  # No changes tracked
-    
-    # Check each field for changes
-    fields_to_track = [
-        'name', 'short_description', 'long_description', 'technical_specs',
-        'customization_level', 'primary_category', 'sub_category', 'product_family',
-        'visibility', 'feature_product', 'bestseller_badge', 'new_arrival',
-        'base_price', 'status', 'internal_code'
-    ]
-    
-    for field in fields_to_track:
-        old_value = previous_values.get(field)
-        new_value = getattr(instance, field, None)
-        
-        # Convert to strings for comparison
-        old_str = str(old_value) if old_value is not None else ''
-        new_str = str(new_value) if new_value is not None else ''
-        
+
+    entries = []
+    for field, (old_value, new_value) in changes.items():
+        old_str, new_str = _as_text(old_value), _as_text(new_value)
         # Skip if no actual change
         if old_str == new_str:
             continue
-        
-        # Create change history entry
-        ProductChangeHistory.objects.create(
+        entries.append(ProductChangeHistory(
             product=instance,
             changed_by=changed_by,
             change_type='update',
             field_changed=field,
-            old_value=old_str[:255] if old_str else '',  # Truncate to fit in DB
-            new_value=new_str[:255] if new_str else '',
-            changed_at=timezone.now()
-        )
+            old_value=old_str[:255],  # Truncate to fit in DB
+            new_value=new_str[:255],
+        ))
+    write_change_history(entries)
+
 
 @receiver(post_save, sender=ProductPricing)
-def create_change_history_for_pricing(sender, instance, created, **kwargs):
+def create_change_history_for_pricing(sender, instance, created, raw=False, **kwargs):
     """
     Track changes to pricing information
     """
-    from django.utils import timezone
-    
+    if raw:
+        return
+    changes = {} if created else instance.tracked_changes()
+    instance.reset_tracked_values()
+    if not created and not changes:
+        return
+
     # Get the product's user
     changed_by = instance.product.updated_by or instance.product.created_by
-    
+
     if created:
         # Log pricing creation
-        ProductChangeHistory.objects.create(
+        entries = [ProductChangeHistory(
             product=instance.product,
             changed_by=changed_by,
             change_type='update',
             field_changed='pricing_created',
             old_value='',
             new_value='Pricing configuration added',
-            changed_at=timezone.now()
-        )
+        )]
     else:
-        # Log pricing updates
-        fields_to_track = ['base_cost', 'return_margin', 'lead_time_value', 'lead_time_unit']
-        for field in fields_to_track:
-            # We could enhance this with pre_save signal to get old values
-            ProductChangeHistory.objects.create(
+        # Log pricing updates - only the fields that actually changed
+        entries = [
+            ProductChangeHistory(
                 product=instance.product,
                 changed_by=changed_by,
                 change_type='update',
                 field_changed=f'pricing_{field}',
-                old_value='',
-                new_value=str(getattr(instance, field, '')),
-                changed_at=timezone.now()
+                old_value=_as_text(old_value),
+                new_value=_as_text(new_value),
             )
+            for field, (old_value, new_value) in changes.items()
+        ]
+    write_change_history(entries)
 
 class ClientAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
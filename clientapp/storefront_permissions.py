@@ -3,6 +3,7 @@ Storefront-specific permission classes for role-based access control
 """
 from rest_framework import permissions
 from .models import StorefrontCustomer, StorefrontMessage
+from .services.roles import has_group
 
 
 class IsStorefrontUser(permissions.BasePermission):
@@ -35,7 +36,7 @@ class IsCustomerOwner(permissions.BasePermission):
             pass
 
         # Check if user is account manager
-        if request.user.groups.filter(name='Account Managers').exists():
+        if has_group(request.user, 'Account Managers'):
             return True
 
         return False
@@ -50,10 +51,10 @@ class IsAccountManager(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
         # Check if user is in Account Managers group
-        return request.user.groups.filter(name='Account Managers').exists()
+        return has_group(request.user, 'Account Managers')
 
     def has_object_permission(self, request, view, obj):
-        return request.user.groups.filter(name='Account Managers').exists()
+        return has_group(request.user, 'Account Managers')
 
 
 class IsProductionTeam(permissions.BasePermission):
@@ -65,10 +66,10 @@ class IsProductionTeam(permissions.BasePermission):
         if not request.user or not request.user.is_authenticated:
             return False
         # Check if user is in Production Team group
-        return request.user.groups.filter(name='Production Team').exists()
+        return has_group(request.user, 'Production Team')
 
     def has_object_permission(self, request, view, obj):
-        return request.user.groups.filter(name='Production Team').exists()
+        return has_group(request.user, 'Production Team')
 
 
 class IsAccountManagerOrOwner(permissions.BasePermission):
@@ -81,7 +82,7 @@ class IsAccountManagerOrOwner(permissions.BasePermission):
 
     def has_object_permission(self, request, view, obj):
         # Check if user is account manager
-        if request.user.groups.filter(name='Account Managers').exists():
+        if has_group(request.user, 'Account Managers'):
             return True
 
         # Check if user is the customer/owner
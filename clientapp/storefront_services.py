@@ -16,31 +16,25 @@ from .models import (
     Product
 )
 
+from .services import cache as catalog_cache
+from .services import cart_reminders, chatbot, fulfilment
+
 logger = logging.getLogger(__name__)
 
 
 class AbandonedCartService:
     """
     Service to identify and handle abandoned carts
+    Detection and reminders are batched in services.cart_reminders.
     """
     
     @staticmethod
     def identify_abandoned_carts(hours_threshold=24):
         """
         Identify carts that haven't been updated in X hours
-        Returns list of abandoned carts
+        Returns a queryset of abandoned carts
         """
-        threshold_time = timezone.now() - timedelta(hours=hours_threshold)
-        
-        abandoned_carts = Cart.objects.filter(
-            is_active=True,
-            is_abandoned=False,
-            updated_at__lt=threshold_time
-        ).exclude(
-            items__isnull=True
-        ).distinct()
-        
-        return abandoned_carts
+        return cart_reminders.abandoned_carts(hours_threshold)
     
     @staticmethod
     def mark_as_abandoned(cart):
@@ -51,28 +45,26 @@ class AbandonedCartService:
     @staticmethod
     def send_abandoned_cart_reminder(cart):
         """
-        Send reminder email/SMS to customer about abandoned cart
-        TODO: Integrate with email/SMS service
+        Send the reminder email for a single cart
+        Returns False for guest carts, empty carts and carts already reminded.
         """
-        if cart.customer:
-            # Send email to customer.email
-            pass
-        # For guest carts, we'd need to store email in session or cart metadata
-        return True
+        claimed = Cart.objects.filter(
+            pk=cart.pk, customer__isnull=False, reminder_sent_at__isnull=True
+        ).update(reminder_sent_at=timezone.now())
+        if not claimed:
+            return False
+        
+        subject, html, text = cart_reminders.render_reminder()
+        return cart_reminders.send_batch(cart_reminders.recipients_for([cart.pk]), subject, html, text) > 0
     
     @staticmethod
-    def process_abandoned_carts():
+    def process_abandoned_carts(hours_threshold=24):
         """
         Main method to process all abandoned carts
         Run this as a scheduled task (cron/celery)
+        Returns the number of carts newly marked abandoned
         """
-        abandoned_carts = AbandonedCartService.identify_abandoned_carts()
-        
-        for cart in abandoned_carts:
-            AbandonedCartService.mark_as_abandoned(cart)
-            AbandonedCartService.send_abandoned_cart_reminder(cart)
-        
-        return len(abandoned_carts)
+        return cart_reminders.run_campaign(hours_threshold=hours_threshold)['marked']
 
 
 class ShippingCalculatorService:
@@ -82,13 +74,14 @@ class ShippingCalculatorService:
     """
     
     @staticmethod
-    def calculate_shipping(order, shipping_method_id=None):
+    def calculate_shipping(order, shipping_method_id=None, quoter=None):
         """
         Calculate shipping cost for an order
         
         Args:
             order: Order instance
             shipping_method_id: Optional shipping method ID
+            quoter: FulfilmentQuoter of the current request (optional)
         
         Returns:
             dict with shipping_cost, estimated_days, carrier_info
@@ -100,84 +93,43 @@ class ShippingCalculatorService:
                 'error': 'Shipping address required'
             }
         
-        # If shipping method specified, use it
-        if shipping_method_id:
-            try:
-                shipping_method = ShippingMethod.objects.get(
-                    id=shipping_method_id,
-                    is_active=True
-                )
-            except ShippingMethod.DoesNotExist:
-                return {
-                    'shipping_cost': Decimal('0'),
-                    'estimated_days': 0,
-                    'error': 'Shipping method not found'
-                }
-        else:
-            # Use default shipping method
-            shipping_method = ShippingMethod.objects.filter(
-                is_active=True,
-                is_default=True
-            ).first()
-            
-            if not shipping_method:
-                # Fallback to first active method
-                shipping_method = ShippingMethod.objects.filter(is_active=True).first()
-        
-        if not shipping_method:
+        quoter = quoter or fulfilment.FulfilmentQuoter()
+        quote = quoter.quote(
+            fulfilment.order_lines(order),
+            order.subtotal,
+            destination=order.shipping_address,
+            shipping_method_id=shipping_method_id
+        )
+        if not quote:
             return {
                 'shipping_cost': Decimal('0'),
                 'estimated_days': 0,
-                'error': 'No shipping method available'
+                'error': 'Shipping method not found' if shipping_method_id else 'No shipping method available'
             }
         
-        # Calculate total weight (placeholder - would need product weights)
-        total_weight = Decimal('1.0')  # Placeholder
-        
-        # Calculate shipping cost based on method
-        if shipping_method.pricing_type == 'api' and shipping_method.carrier_api_enabled:
-            # Call carrier API
-            shipping_cost = ShippingCalculatorService._call_carrier_api(
-                shipping_method,
-                order,
-                total_weight
-            )
-        else:
-            # Use configured pricing
-            shipping_cost = shipping_method.calculate_shipping_cost(
-                weight=total_weight,
-                order_amount=order.subtotal,
-                destination=order.shipping_address
-            )
-        
         return {
-            'shipping_cost': shipping_cost,
-            'estimated_days_min': shipping_method.estimated_days_min,
-            'estimated_days_max': shipping_method.estimated_days_max,
-            'carrier': shipping_method.carrier or 'Custom',
-            'method_name': shipping_method.name,
-            'shipping_method_id': shipping_method.id,
+            'shipping_cost': quote['shipping_cost'],
+            'estimated_days_min': quote['estimated_days_min'],
+            'estimated_days_max': quote['estimated_days_max'],
+            'carrier': quote['carrier'],
+            'method_name': quote['method_name'],
+            'shipping_method_id': quote['shipping_method_id'],
         }
     
     @staticmethod
-    def _call_carrier_api(shipping_method, order, weight):
-        """
-        Call external carrier API for real-time shipping rates
-        TODO: Implement actual API integration for G4S, DHL, Sendy
-        """
-        # Placeholder implementation
-        # In production, this would:
-        # 1. Authenticate with carrier API using shipping_method.carrier_api_config
-        # 2. Send request with origin, destination, weight, dimensions
-        # 3. Parse response and return shipping cost
-        
-        # For now, return a calculated estimate
-        if shipping_method.weight_rate_per_kg:
-            return weight * shipping_method.weight_rate_per_kg
-        elif shipping_method.flat_rate:
-            return shipping_method.flat_rate
-        else:
-            return Decimal('0')
+    def quote_all_methods(lines, subtotal, destination=None, quoter=None):
+        """Every available shipping option for (product_id, quantity) lines, cheapest first"""
+        return (quoter or fulfilment.FulfilmentQuoter()).quote_all(lines, subtotal, destination)
+    
+    @staticmethod
+    def get_active_methods():
+        """Active shipping methods in model order, served from the shared cache"""
+        return catalog_cache.get_or_set(
+            catalog_cache.SHIPPING,
+            ('active-methods',),
+            lambda: list(ShippingMethod.objects.filter(is_active=True)),
+            timeout=3600
+        )
 
 
 class PaymentGatewayService:
@@ -291,58 +243,45 @@ class PaymentGatewayService:
     @staticmethod
     def handle_payment_webhook(payment_method, webhook_data):
         """
-        Handle payment gateway webhook
-        Updates order and payment transaction status
+        Handle payment gateway webhook synchronously
+        Records the event (gateway retries are deduplicated) and applies it
+        under row locks; the webhook endpoint defers this to a worker instead
+        (services.payment_webhooks)
         """
-        transaction_id = webhook_data.get('transaction_id') or webhook_data.get('reference')
-        
+        from clientapp.services import payment_webhooks
+
         try:
-            payment_transaction = PaymentTransaction.objects.get(
-                transaction_id=transaction_id,
-                payment_method=payment_method
-            )
-        except PaymentTransaction.DoesNotExist:
+            event, _ = payment_webhooks.record(payment_method, webhook_data)
+        except payment_webhooks.WebhookRejected as e:
+            return {'success': False, 'error': str(e)}
+        outcome = event.outcome or payment_webhooks.process(event)
+
+        if outcome in ('', 'unmatched'):
             return {
                 'success': False,
                 'error': 'Payment transaction not found'
             }
-        
-        # Update payment status based on webhook data
-        webhook_status = webhook_data.get('status', '').lower()
-        
-        if webhook_status in ['completed', 'success', 'paid']:
-            payment_transaction.status = 'completed'
-            payment_transaction.completed_at = timezone.now()
-            payment_transaction.gateway_response = webhook_data
-            payment_transaction.save()
-            
-            # Update order
-            order = payment_transaction.order
-            order.payment_status = 'completed'
-            order.status = 'paid'
-            order.paid_at = timezone.now()
-            order.save()
-            
+        if outcome == 'ignored':
             return {
-                'success': True,
-                'order_number': order.order_number,
-                'status': 'completed'
+                'success': False,
+                'error': 'Unknown webhook status'
             }
-        elif webhook_status in ['failed', 'cancelled']:
-            payment_transaction.status = 'failed'
-            payment_transaction.failure_reason = webhook_data.get('message', 'Payment failed')
-            payment_transaction.gateway_response = webhook_data
-            payment_transaction.save()
-            
+
+        payment_transaction = PaymentTransaction.objects.select_related('order').get(
+            transaction_id=event.transaction_id,
+            payment_method=payment_method
+        )
+        if payment_transaction.status == 'completed':
             return {
-                'success': False,
-                'status': 'failed',
-                'message': payment_transaction.failure_reason
+                'success': True,
+                'order_number': payment_transaction.order.order_number,
+                'status': 'completed',
+                'duplicate': outcome != 'applied',
             }
-        
         return {
             'success': False,
-            'error': 'Unknown webhook status'
+            'status': payment_transaction.status,
+            'message': payment_transaction.failure_reason
         }
 
 
@@ -350,30 +289,52 @@ class InventoryService:
     """
     Inventory/Stock Management Service
     Handles soft-locking inventory during checkout
+    (ledger and atomic updates live in services.inventory)
     """
     
     @staticmethod
     def check_availability(product, quantity):
         """
-        Check if product/material is available in required quantity
-        TODO: Integrate with actual inventory system
+        Check if product's materials are available in required quantity
+        Products without material links are not stock-tracked
         """
-        # Placeholder - would check Material/Inventory model
-        # For now, assume all products are available
+        from .services import inventory
+        
+        per_unit = inventory.requirements_for([(product.pk, 1)])
+        if not per_unit:
+            return {
+                'available': True,
+                'quantity_available': None,
+                'can_fulfill': True,
+            }
+        
+        available = inventory.available_quantities(per_unit)
+        # Units of the product the scarcest material still covers
+        units = min(
+            int(available.get(material_id, 0) / amount)
+            for material_id, amount in per_unit.items()
+        )
         return {
-            'available': True,
-            'quantity_available': 999999,  # Placeholder
-            'can_fulfill': True,
+            'available': units > 0,
+            'quantity_available': max(units, 0),
+            'can_fulfill': units >= quantity,
         }
     
     @staticmethod
     def reserve_inventory(order):
         """
         Reserve inventory for an order (soft-lock)
-        Prevents overselling
+        Prevents overselling - all materials or none. Unpaid orders' holds
+        expire after INVENTORY_RESERVATION_TTL_MINUTES.
         """
-        # TODO: Implement inventory reservation
-        # Would create InventoryReservation records
+        from .services import inventory
+        
+        ttl = None if order.payment_status == 'completed' else inventory.reservation_ttl()
+        try:
+            inventory.reserve_order(order, ttl=ttl)
+        except inventory.InsufficientStock as e:
+            logger.info(f"Order {order.order_number} could not reserve stock: {e.shortages}")
+            return False
         return True
     
     @staticmethod
@@ -381,7 +342,9 @@ class InventoryService:
         """
         Release reserved inventory (if order cancelled)
         """
-        # TODO: Implement inventory release
+        from .services import inventory
+        
+        inventory.release_order(order)
         return True
 
 
@@ -389,23 +352,38 @@ class CrossSellService:
     """
     Cross-sell and Up-sell Engine
     Suggests related products based on purchase history
+    (co-purchase index maintained by services.recommendations)
     """
     
+    @staticmethod
+    def _live_products(product_ids, limit):
+        """Published products in the given order"""
+        products = Product.objects.filter(
+            id__in=product_ids,
+            status='published',
+            is_visible=True
+        ).in_bulk()
+        return [products[pk] for pk in product_ids if pk in products][:limit]
+    
     @staticmethod
     def get_related_products(product, limit=5):
         """
         Get related products for cross-selling
         Based on:
-        - Same category
         - Frequently bought together
-        - Similar products
+        - Same category (fills the rest)
         """
-        # Get products in same category
-        related = Product.objects.filter(
-            primary_category=product.primary_category,
-            status='published',
-            is_active=True
-        ).exclude(id=product.id)[:limit]
+        from .services.recommendations import neighbour_ids
+        
+        related = CrossSellService._live_products(neighbour_ids(product.id), limit)
+        if len(related) < limit:
+            related += Product.objects.filter(
+                primary_category=product.primary_category,
+                status='published',
+                is_visible=True
+            ).exclude(
+                id__in=[product.id] + [p.id for p in related]
+            )[:limit - len(related)]
         
         return related
     
@@ -413,25 +391,11 @@ class CrossSellService:
     def get_frequently_bought_together(product, limit=5):
         """
         Get products frequently bought together
-        Based on order history
+        Based on order history (and quotes, see CROSS_SELL_QUOTE_WEIGHT)
         """
-        # Get orders containing this product
-        orders_with_product = Order.objects.filter(
-            items__product=product,
-            status__in=['paid', 'processing', 'delivered']
-        ).values_list('id', flat=True)
+        from .services.recommendations import neighbour_ids
         
-        # Get other products in those orders
-        from django.db.models import Count
-        related_products = Product.objects.filter(
-            order_items__order_id__in=orders_with_product
-        ).exclude(
-            id=product.id
-        ).annotate(
-            frequency=Count('order_items')
-        ).order_by('-frequency')[:limit]
-        
-        return related_products
+        return CrossSellService._live_products(neighbour_ids(product.id), limit)
 
 
 # ============================================================================
@@ -783,21 +747,8 @@ class ChatbotService:
     
     @staticmethod
     def detect_intent(message_text):
-        """Detect customer intent from message"""
-        message_lower = message_text.lower()
-        intent_scores = {}
-        
-        for intent, keywords in ChatbotService.INTENT_PATTERNS.items():
-            score = sum(1 for keyword in keywords if keyword in message_lower)
-            if score > 0:
-                intent_scores[intent] = score
-        
-        if intent_scores:
-            # Return intent with highest score
-            detected_intent = max(intent_scores, key=intent_scores.get)
-            return detected_intent
-        
-        return 'general'
+        """Detect customer intent from message (highest keyword score, see services.chatbot)"""
+        return chatbot.intent_matcher('storefront', ChatbotService.INTENT_PATTERNS).best(message_text)
     
     @staticmethod
     def generate_response(intent, message_text):
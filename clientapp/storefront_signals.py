@@ -2,21 +2,33 @@
 Django signal handlers for storefront backend.
 Automatically creates related objects and sends notifications on model events.
 """
-from django.db.models.signals import post_save, pre_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
 from django.dispatch import receiver
+from django.contrib.auth.models import Group, User
 from django.utils import timezone
 from decimal import Decimal
 from datetime import timedelta
 
 from .models import (
     EstimateQuote, StorefrontMessage, ChatbotConversation,
-    StorefrontCustomer, ProductionUnit,
-    QuotePricingSnapshot, Product
+    StorefrontCustomer, ProductionUnit, Order, Coupon, Promotion,
+    QuotePricingSnapshot, Product, ProductImage, ProductPricing, StorefrontProduct,
+    ProductRule, ProductVariable, ProductVariableOption, ClientPortalUser, Vendor,
+    ClientOrder, ClientInvoice, ProofSubmission, Client, Job, JobAttachment, JobNote, JobVendorStage,
+    ProductionUpdate, QCInspection, Quote, ProgressUpdate, ProgressUpdateBatch, PurchaseOrder
 )
 from .storefront_utils import (
     EmailService, WhatsAppService, ChatbotService,
     NotificationService, IDGenerator
 )
+from .services import cache as catalog_cache
+from .services.catalog_snapshot import schedule_snapshot_rebuild
+from .services.storefront_sync import enqueue_product_sync
+from .services.media_pipeline import schedule_image_processing, delete_variants
+from .services.product_configuration import invalidate_rules
+from .services import client_dashboard, inventory, job_detail, progress_stream, promotions, roles
+from .services.recommendations import PURCHASED_STATUSES, schedule_order_indexing
 
 
 # ===================== EstimateQuote Signals =====================
@@ -66,14 +78,14 @@ def estimate_quote_status_changed(sender, instance, **kwargs):
             if not instance.share_timestamp:
                 instance.share_timestamp = timezone.now()
             
-            # Create Lead from estimate
+            # Link estimate to the customer's lead, creating one if they are new
             try:
-                from .models import Lead
-                lead = Lead.objects.create(
-                    name=instance.customer_name,
+                from .services.lead_dedup import find_or_create
+                lead, _ = find_or_create(
+                    instance.customer_name,
                     email=instance.customer_email,
                     phone=instance.customer_phone,
-                    company=instance.customer_company,
+                    notes=f'Company: {instance.customer_company}' if instance.customer_company else '',
                     source='Storefront - Estimate',
                     status='Qualified',
                     created_by=None  # System created
@@ -316,3 +328,298 @@ def pricing_snapshot_created(sender, instance, created, **kwargs):
         instance.snapshot_id = f"SNAP-{timezone.now().strftime('%Y%m%d%H%M%S')}-{instance.id}"
         instance.save(update_fields=['snapshot_id'])
 
+
+
+# ===================== Catalog Cache Invalidation =====================
+
+_CACHE_NAMESPACES_BY_MODEL = {
+    'Product': (catalog_cache.CATALOG,),
+    'StorefrontProduct': (catalog_cache.CATALOG, catalog_cache.CHATBOT),
+    'ProductImage': (catalog_cache.CATALOG,),
+    'ProductPricing': (catalog_cache.CATALOG,),
+    'ProductVariable': (catalog_cache.CATALOG,),
+    'ProductVariableOption': (catalog_cache.CATALOG,),
+    'TurnAroundTime': (catalog_cache.TURNAROUND, catalog_cache.CATALOG),
+    'ShippingMethod': (catalog_cache.SHIPPING,),
+    'TaxConfiguration': (catalog_cache.TAX,),
+    'Coupon': (catalog_cache.PROMOTIONS,),
+    'Promotion': (catalog_cache.PROMOTIONS,),
+    'ProductFAQ': (catalog_cache.CHATBOT,),
+    'ChatbotIntentKeyword': (catalog_cache.CHATBOT,),
+}
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def invalidate_catalog_cache(sender, **kwargs):
+    """
+    Bump the cache namespaces that depend on the saved/deleted model.
+    - Bumped immediately so this process never re-reads stale entries
+    - Bumped again on commit so a concurrent reader cannot re-cache the
+      pre-commit rows under the new version
+    """
+    namespaces = _CACHE_NAMESPACES_BY_MODEL.get(sender.__name__)
+    if not namespaces or sender._meta.app_label != 'clientapp':
+        return
+    catalog_cache.bump_namespace(*namespaces)
+    transaction.on_commit(lambda: catalog_cache.bump_namespace(*namespaces))
+
+
+@receiver(post_save, sender=StorefrontProduct)
+@receiver(post_delete, sender=StorefrontProduct)
+def rebuild_catalog_snapshot(sender, instance, **kwargs):
+    """Regenerate the pre-rendered catalog snapshot once the change commits"""
+    transaction.on_commit(schedule_snapshot_rebuild)
+
+
+# ===================== Configuration Rule Engine =====================
+
+@receiver(post_save, sender=ProductRule)
+@receiver(post_delete, sender=ProductRule)
+@receiver(post_save, sender=ProductVariable)
+@receiver(post_delete, sender=ProductVariable)
+def invalidate_compiled_rules(sender, instance, **kwargs):
+    """Rules and variable domains changed - recompile the product's rules"""
+    invalidate_rules(instance.product_id)
+    transaction.on_commit(lambda: invalidate_rules(instance.product_id))
+
+
+@receiver(post_save, sender=ProductVariableOption)
+@receiver(post_delete, sender=ProductVariableOption)
+def invalidate_compiled_rules_for_option(sender, instance, **kwargs):
+    """Option lists are the bitset domains - recompile the product's rules"""
+    product_id = ProductVariable.objects.filter(pk=instance.variable_id).values_list('product_id', flat=True).first()
+    if product_id:
+        invalidate_rules(product_id)
+        transaction.on_commit(lambda: invalidate_rules(product_id))
+
+
+# ===================== Product -> Storefront Sync =====================
+
+@receiver(post_save, sender=Product)
+def product_changed_sync_storefront(sender, instance, raw=False, **kwargs):
+    """Enqueue the product for storefront sync after commit"""
+    if not raw:
+        enqueue_product_sync(instance.pk)
+
+
+@receiver(post_save, sender=ProductPricing)
+def product_pricing_changed_sync_storefront(sender, instance, raw=False, **kwargs):
+    """Pricing drives the storefront base price - resync the product"""
+    if not raw:
+        enqueue_product_sync(instance.product_id)
+
+
+# ===================== Product Media Pipeline =====================
+
+@receiver(pre_save, sender=ProductImage)
+def product_image_upload_detected(sender, instance, raw=False, **kwargs):
+    """A new file is being stored - mark the image for (re)processing"""
+    if not raw and instance.image and not instance.image._committed:
+        instance.processing_status = 'pending'
+        instance._media_upload = True
+
+
+@receiver(post_save, sender=ProductImage)
+def product_image_uploaded(sender, instance, raw=False, **kwargs):
+    """Generate variants in the background so the upload returns immediately"""
+    if getattr(instance, '_media_upload', False):
+        instance._media_upload = False
+        schedule_image_processing(instance.pk)
+
+
+@receiver(post_delete, sender=ProductImage)
+def product_image_deleted(sender, instance, **kwargs):
+    """Remove generated variants along with the image"""
+    transaction.on_commit(lambda: delete_variants(instance))
+
+
+# ===================== Inventory Reservations =====================
+
+@receiver(post_save, sender=Order)
+def order_inventory_lifecycle(sender, instance, created, raw=False, **kwargs):
+    """Settle an order's stock holds as it is paid, produced or cancelled"""
+    if raw or created:
+        return
+    if instance.status in ('cancelled', 'refunded'):
+        inventory.release_order(instance)
+    elif instance.status in ('in_production', 'shipped', 'delivered'):
+        inventory.commit_order(instance)
+    elif instance.payment_status == 'completed':
+        inventory.keep_order(instance)
+
+
+# ===================== Co-purchase Index =====================
+
+@receiver(post_save, sender=Order)
+def order_copurchase_index(sender, instance, raw=False, **kwargs):
+    """Add the basket to the recommendation index once the order is paid"""
+    if not raw and instance.status in PURCHASED_STATUSES and instance.copurchase_indexed_at is None:
+        schedule_order_indexing(instance.pk)
+
+
+# ===================== Promotion Engine =====================
+
+@receiver(m2m_changed, sender=Coupon.applicable_products.through)
+@receiver(m2m_changed, sender=Promotion.eligible_products.through)
+@receiver(m2m_changed, sender=Promotion.eligible_categories.through)
+def promotion_eligibility_changed(sender, action, **kwargs):
+    """Eligibility lists are part of the cached rule set"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        promotions.invalidate_rules()
+        transaction.on_commit(promotions.invalidate_rules)
+
+
+@receiver(post_save, sender=Order)
+def order_promotions_released(sender, instance, created, raw=False, **kwargs):
+    """Give back coupon/promotion uses of cancelled or refunded orders"""
+    if not raw and not created and instance.status in ('cancelled', 'refunded'):
+        promotions.release(instance)
+
+
+# ===================== Role Resolution =====================
+
+def _invalidate_roles(user_ids=None):
+    roles.invalidate(user_ids)
+    transaction.on_commit(lambda: roles.invalidate(user_ids))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Forget the cached roles of users whose groups changed"""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, User):
+        roles.forget(instance)
+        _invalidate_roles([instance.pk])
+    else:
+        # group.user_set.clear() does not say which users it removed
+        _invalidate_roles(list(pk_set) if pk_set and action != 'post_clear' else None)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, **kwargs):
+    """A renamed or deleted group changes the names of every member's groups"""
+    _invalidate_roles()
+
+
+@receiver(post_save, sender=ClientPortalUser)
+@receiver(post_delete, sender=ClientPortalUser)
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+@receiver(post_save, sender=StorefrontCustomer)
+@receiver(post_delete, sender=StorefrontCustomer)
+def role_profile_changed(sender, instance, raw=False, **kwargs):
+    """Portal, vendor and storefront profiles are part of a user's roles"""
+    if not raw and instance.user_id:
+        _invalidate_roles([instance.user_id])
+
+
+# ===================== Client Dashboard Metrics =====================
+
+_DASHBOARD_DELTAS = {
+    ClientOrder: client_dashboard.order_changed,
+    ProofSubmission: client_dashboard.proof_changed,
+    ClientInvoice: client_dashboard.invoice_changed,
+}
+
+
+@receiver(post_save, sender=ClientOrder)
+@receiver(post_save, sender=ProofSubmission)
+@receiver(post_save, sender=ClientInvoice)
+def dashboard_source_saved(sender, instance, created, raw=False, **kwargs):
+    """Apply the change in this row's dashboard counters"""
+    if not raw:
+        _DASHBOARD_DELTAS[sender](instance, created=created)
+    instance.reset_tracked_values()
+
+
+@receiver(post_delete, sender=ClientOrder)
+@receiver(post_delete, sender=ProofSubmission)
+@receiver(post_delete, sender=ClientInvoice)
+def dashboard_source_deleted(sender, instance, **kwargs):
+    _DASHBOARD_DELTAS[sender](instance, deleted=True)
+
+
+# ===================== Job Detail Cache =====================
+
+def _invalidate_job_detail(job_ids=(), client_ids=()):
+    job_detail.invalidate(job_ids, client_ids)
+    transaction.on_commit(lambda: job_detail.invalidate(job_ids, client_ids))
+
+
+@receiver(post_save, sender=Job)
+@receiver(post_delete, sender=Job)
+def job_detail_job_changed(sender, instance, **kwargs):
+    """The job's own detail and its client's job list"""
+    _invalidate_job_detail([instance.pk], [instance.client_id])
+
+
+@receiver(post_save, sender=JobAttachment)
+@receiver(post_delete, sender=JobAttachment)
+@receiver(post_save, sender=JobNote)
+@receiver(post_delete, sender=JobNote)
+@receiver(post_save, sender=ProductionUpdate)
+@receiver(post_delete, sender=ProductionUpdate)
+@receiver(post_save, sender=JobVendorStage)
+@receiver(post_delete, sender=JobVendorStage)
+@receiver(post_save, sender=QCInspection)
+@receiver(post_delete, sender=QCInspection)
+def job_detail_row_changed(sender, instance, **kwargs):
+    if instance.job_id:
+        _invalidate_job_detail([instance.job_id])
+
+
+@receiver(post_save, sender=Quote)
+def job_detail_quote_changed(sender, instance, raw=False, **kwargs):
+    """Job specs are read from the quote"""
+    if not raw:
+        job_ids = list(Job.objects.filter(quote_id=instance.pk).values_list('pk', flat=True))
+        if job_ids:
+            _invalidate_job_detail(job_ids)
+
+
+@receiver(post_save, sender=Client)
+def job_detail_client_changed(sender, instance, created, raw=False, **kwargs):
+    if not raw and not created:
+        _invalidate_job_detail(list(instance.jobs.values_list('pk', flat=True)), [instance.pk])
+
+
+@receiver(post_save, sender=Vendor)
+@receiver(post_delete, sender=Vendor)
+def job_detail_vendor_changed(sender, **kwargs):
+    """Vendor names appear on every job with a stage at that vendor"""
+    catalog_cache.bump_namespace(catalog_cache.JOB_DETAIL)
+    transaction.on_commit(lambda: catalog_cache.bump_namespace(catalog_cache.JOB_DETAIL))
+
+
+# ===================== Progress Stream =====================
+# Published by a worker after commit (progress_stream.schedule_publish), from
+# the rows rather than the instance, so the request never waits on the publish
+
+@receiver(post_save, sender=Job)
+def progress_stream_job_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        progress_stream.schedule_publish('job', instance.pk)
+
+
+@receiver(post_save, sender=ProductionUpdate)
+@receiver(post_save, sender=JobVendorStage)
+@receiver(post_save, sender=ProgressUpdate)
+def progress_stream_stage_changed(sender, instance, raw=False, **kwargs):
+    """Stage, production and vendor updates move the job's progress"""
+    if not raw and instance.job_id:
+        progress_stream.schedule_publish('job', instance.job_id)
+
+
+@receiver(post_save, sender=ProgressUpdateBatch)
+def progress_stream_batch_submitted(sender, instance, raw=False, **kwargs):
+    if not raw:
+        progress_stream.schedule_publish('po', instance.purchase_order_id)
+
+
+@receiver(post_save, sender=PurchaseOrder)
+def progress_stream_po_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        progress_stream.schedule_publish('po', instance.pk)
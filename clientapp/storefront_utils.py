@@ -363,15 +363,11 @@ class ChatbotService:
     
     @staticmethod
     def detect_intent(message: str) -> str:
-        """Detect user intent from message"""
-        message_lower = message.lower()
+        """Detect user intent from message (ties go to the intent listed first)"""
+        from clientapp.services import chatbot
         
-        for intent, config in ChatbotService.INTENTS.items():
-            for keyword in config['keywords']:
-                if keyword in message_lower:
-                    return intent
-        
-        return 'general'
+        intents = {intent: config['keywords'] for intent, config in ChatbotService.INTENTS.items()}
+        return chatbot.intent_matcher('assistant', intents).best(message)
     
     @staticmethod
     def handle_product_inquiry(message: str) -> Dict:
@@ -444,28 +440,12 @@ Login: storefront.com/login""",
     
     @staticmethod
     def handle_faq(message: str) -> Dict:
-        """Handle FAQ questions"""
-        faqs = {
-            'turnaround': "We offer 3 turnaround options:\n• Standard: 7 days\n• Rush: 3 days (+1000 KES/item)\n• Expedited: 1 day (+2500 KES/item)",
-            'payment': "We accept: Prepaid, Net 7/15/30 days, Bank transfer, Card, M-Pesa",
-            'delivery': "We offer: Pickup, Courier (Nairobi), Courier (Nationwide)",
-            'minimum': "Minimum order depends on product. Most products start at 100 units.",
-            'customization': "Most of our products are fully customizable. Contact sales for special requirements."
-        }
+        """Handle FAQ questions from the FAQ retrieval index"""
+        from clientapp.services import chatbot
         
-        # Simple FAQ matching
-        message_lower = message.lower()
-        
-        if 'turnaround' in message_lower or 'how long' in message_lower:
-            return {'response': faqs['turnaround'], 'action': 'show_faq'}
-        elif 'payment' in message_lower:
-            return {'response': faqs['payment'], 'action': 'show_faq'}
-        elif 'delivery' in message_lower or 'shipping' in message_lower:
-            return {'response': faqs['delivery'], 'action': 'show_faq'}
-        elif 'minimum' in message_lower:
-            return {'response': faqs['minimum'], 'action': 'show_faq'}
-        elif 'custom' in message_lower:
-            return {'response': faqs['customization'], 'action': 'show_faq'}
+        matches = chatbot.search(message, limit=1, kinds=['faq'])
+        if matches:
+            return {'response': matches[0]['answer'], 'action': 'show_faq'}
         
         return {
             'response': "I can help with common questions. Ask me about turnaround times, payment options, delivery, or customization.",
@@ -7,10 +7,13 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework.throttling import ScopedRateThrottle
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.db.models import Q
+from django.utils.decorators import method_decorator
+from django.views import View
 from decimal import Decimal
 import uuid
 import secrets
@@ -36,13 +39,17 @@ from clientapp.storefront_serializers import (
 from clientapp.storefront_services import (
     EmailService, MessagingService, TaxService, ChatbotService
 )
+from clientapp.services import cache as catalog_cache
+from clientapp.services import lead_dedup
+from clientapp.services.cache import CachedReadMixin
+from clientapp.services.catalog_snapshot import CatalogValidatorsMixin, serve_snapshot
 
 
 # ============================================================================
 # PRODUCTS & CATALOG
 # ============================================================================
 
-class StorefrontProductViewSet(viewsets.ReadOnlyModelViewSet):
+class StorefrontProductViewSet(CatalogValidatorsMixin, CachedReadMixin, viewsets.ReadOnlyModelViewSet):
     """
     Public product catalog endpoint
     No authentication required
@@ -54,6 +61,9 @@ class StorefrontProductViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['name', 'description_short']
     ordering_fields = ['sort_order', 'rating', 'base_price', 'name']
     ordering = ['sort_order', '-featured']
+    cache_namespace = catalog_cache.CATALOG
+    throttle_classes = [ScopedRateThrottle]
+    throttle_scope = 'storefront_catalog'
     
     def get_queryset(self):
         """Filter products"""
@@ -299,11 +309,11 @@ class EstimateQuoteViewSet(viewsets.ModelViewSet):
         
         # Create Lead from customer info
         lead_id = f"LD-{timezone.now().year}-{EstimateQuote.objects.count():05d}"
-        lead = Lead.objects.create(
-            lead_id=lead_id,
-            name=estimate.customer_name,
+        lead, _ = lead_dedup.find_or_create(
+            estimate.customer_name,
             email=estimate.customer_email,
             phone=estimate.customer_phone,
+            lead_id=lead_id,
             source='Storefront',
             status='Qualified',
             preferred_client_type='B2B'
@@ -1088,15 +1098,13 @@ class SaveQuoteFromStorefrontView(APIView):
             estimate = EstimateQuote.objects.get(id=estimate_id)
             
             # Create or get Lead from estimate customer info
-            lead, created = Lead.objects.get_or_create(
-                name=estimate.customer_name,
+            lead, created = lead_dedup.find_or_create(
+                estimate.customer_name,
+                email=estimate.customer_email,
                 phone=estimate.customer_phone,
-                defaults={
-                    'email': estimate.customer_email,
-                    'company': estimate.customer_company or '',
-                    'status': 'new',
-                    'source': 'storefront_shared'
-                }
+                notes=f'Company: {estimate.customer_company}' if estimate.customer_company else '',
+                status='new',
+                source='storefront_shared'
             )
             
             # Create official Quote
@@ -1166,26 +1174,23 @@ class ChatbotKnowledgeView(APIView):
     GET /api/v1/chatbot/knowledge/
     
     Returns product catalog, FAQs, company info for chatbot training
+    ?q=<question> adds the best FAQ/product matches from the retrieval index
     No authentication required
     """
     permission_classes = [permissions.AllowAny]
     
     def get(self, request):
         from django.conf import settings
+        from clientapp.models import ProductFAQ
+        from clientapp.services import chatbot
         
         # Get products
         products = StorefrontProduct.objects.filter(
             storefront_visible=True
-        ).values('id', 'name', 'description', 'base_price')
+        ).values('id', 'name', 'description_short', 'base_price')
         
         # Get FAQs
-        faqs = []
-        try:
-            from clientapp.models import ProductFAQ
-            faqs_qs = ProductFAQ.objects.all().values('question', 'answer')
-            faqs = list(faqs_qs)
-        except:
-            pass
+        faqs = list(ProductFAQ.objects.filter(is_active=True).values('question', 'answer'))
         
         # Company info
         company_info = {
@@ -1198,7 +1203,7 @@ class ChatbotKnowledgeView(APIView):
             'turnaround_expedited_days': getattr(settings, 'TURNAROUND_EXPEDITED_DAYS', 1),
         }
         
-        return Response({
+        data = {
             'products': list(products),
             'faqs': faqs,
             'company_info': company_info,
@@ -1207,7 +1212,72 @@ class ChatbotKnowledgeView(APIView):
                 'contact_sales', 'custom_quote', 'delivery_info',
                 'payment_terms', 'customization_options'
             ]
-        })
+        }
+        query = request.query_params.get('q', '').strip()
+        if query:
+            data['matches'] = chatbot.search(query, limit=5)
+        return Response(data)
+
+
+# ============================================================================
+# CATALOG SNAPSHOT (pre-rendered, pre-compressed)
+# ============================================================================
+
+class StorefrontCatalogSnapshotView(View):
+    """
+    Whole public catalog as one pre-compressed JSON file.
+    Regenerated on product change; served with static-file semantics
+    (gzip/brotli variant, ETag, Cache-Control) and no per-request DB work.
+    """
+    
+    def get(self, request):
+        return serve_snapshot(request)
+    
+    head = get
+
+
+# ============================================================================
+# PAYMENT WEBHOOKS
+# ============================================================================
+
+class PaymentWebhookView(APIView):
+    """
+    Payment gateway callbacks
+    POST /api/v1/payments/webhooks/<provider>/  (mpesa, stripe, pesapal)
+
+    The callback is stored and acknowledged immediately; a worker applies
+    it to the transaction and order. Retries of a stored event are
+    acknowledged again without being re-applied.
+    No authentication required (Stripe signature / callback ?token= instead)
+    """
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def post(self, request, provider):
+        from clientapp.services import payment_webhooks
+
+        try:
+            event, created = payment_webhooks.receive(
+                provider, request.body, request.headers, token=request.query_params.get('token', '')
+            )
+        except payment_webhooks.WebhookNotConfigured as e:
+            # Fail closed; the gateway retries once the secret is set
+            return Response({'detail': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        except payment_webhooks.WebhookRejected as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if provider == 'mpesa':
+            # Daraja expects its own acknowledgement body
+            return Response({'ResultCode': 0, 'ResultDesc': 'Accepted'})
+        if provider == 'pesapal':
+            # Pesapal expects the IPN echoed back with a status
+            return Response({
+                'orderNotificationType': event.payload.get('OrderNotificationType', ''),
+                'orderTrackingId': event.payload.get('OrderTrackingId', ''),
+                'orderMerchantReference': event.payload.get('OrderMerchantReference', ''),
+                'status': 200,
+            })
+        return Response({'received': True, 'duplicate': not created})
 
 
 # ============================================================================
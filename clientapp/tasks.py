@@ -80,72 +80,22 @@ def expire_old_quotes():
         }
 
 
-def remind_approaching_job_deadlines():
+def start_chunked_job(name):
     """
-    Send reminders for jobs nearing their deadline (within 3 days).
-    Only reminds if job status is "pending" or "in_progress".
-    Prevents spam by checking if reminder sent in last 24 hours.
+    Start (or resume) the chunked job ``name`` from services.periodic_jobs.
+    Rows are processed by run_task_chunk sub-tasks, or inline without Celery.
     """
-    from .models import Job, Notification, ActivityLog
+    from .services.chunked_tasks import start
     
     try:
-        today = timezone.now().date()
-        three_days = today + timedelta(days=3)
-        one_day_ago = timezone.now() - timedelta(days=1)
-        
-        # Find jobs approaching deadline
-        approaching_jobs = Job.objects.filter(
-            expected_completion__gte=today,
-            expected_completion__lte=three_days,
-            status__in=['pending', 'in_progress'],
-            person_in_charge__isnull=False
-        ).select_related('person_in_charge', 'client')
-        
-        count = 0
-        for job in approaching_jobs:
-            # Check if reminder already sent today
-            last_reminder = ActivityLog.objects.filter(
-                title__contains=f'Deadline Reminder for Job {job.job_number}',
-                created_at__gte=one_day_ago
-            ).first()
-            
-            if last_reminder:
-                continue
-            
-            # Send reminder notification
-            try:
-                Notification.objects.create(
-                    recipient=job.person_in_charge,
-                    notification_type='job_deadline_reminder',
-                    title=f'Deadline Reminder: {job.job_name}',
-                    message=f'Job {job.job_number} ({job.client.name}) is due on {job.expected_completion}. Days remaining: {(job.expected_completion - today).days}',
-                    link=f'/jobs/{job.id}/',
-                )
-            except Exception as e:
-                logger.warning(f"Failed to create notification for job {job.job_number}: {e}")
-            
-            # Log activity
-            try:
-                ActivityLog.objects.create(
-                    client=job.client,
-                    activity_type='Job',
-                    title=f'Deadline Reminder for Job {job.job_number}',
-                    description=f'Reminder sent to {job.person_in_charge.get_full_name()}. Due: {job.expected_completion}',
-                )
-            except Exception as e:
-                logger.warning(f"Failed to log activity for job {job.job_number}: {e}")
-            
-            count += 1
-        
-        logger.info(f"Sent {count} job deadline reminders")
         return {
             'status': 'success',
-            'reminders_sent': count,
+            **start(name),
             'timestamp': str(timezone.now())
         }
     
     except Exception as exc:
-        logger.error(f"Error in remind_approaching_job_deadlines task: {exc}")
+        logger.error(f"Error starting chunked job {name}: {exc}")
         return {
             'status': 'error',
             'error': str(exc),
@@ -153,101 +103,32 @@ def remind_approaching_job_deadlines():
         }
 
 
+def remind_approaching_job_deadlines():
+    """
+    Send reminders for jobs nearing their deadline (within 3 days).
+    Only reminds if job status is "pending" or "in_progress".
+    Prevents spam by checking if reminder sent in last 24 hours.
+    Runs in chunks: see periodic_jobs.send_deadline_reminders.
+    """
+    return start_chunked_job('job-deadline-reminders')
+
+
 def sync_completed_pos_to_qb():
     """
     Sync completed Purchase Orders to QuickBooks.
     Finds POs marked as completed but not yet synced to QB.
+    Runs in chunks: see periodic_jobs.mark_pos_for_qb_sync.
     """
-    from .models import PurchaseOrder
-    
-    try:
-        # Find completed POs not yet synced
-        completed_pos = PurchaseOrder.objects.filter(
-            status='COMPLETED',
-            invoice_sent=False
-        ).select_related('job', 'vendor')
-        
-        count = 0
-        for po in completed_pos:
-            try:
-                # Mark as ready for QB sync (actual QB sync happens in QB service)
-                po.invoice_sent = True
-                po.save()
-                count += 1
-            except Exception as e:
-                logger.warning(f"Failed to mark PO {po.po_number} for QB sync: {e}")
-        
-        logger.info(f"Marked {count} POs ready for QB sync")
-        return {
-            'status': 'success',
-            'pos_synced': count,
-            'timestamp': str(timezone.now())
-        }
-    
-    except Exception as exc:
-        logger.error(f"Error in sync_completed_pos_to_qb task: {exc}")
-        return {
-            'status': 'error',
-            'error': str(exc),
-            'timestamp': str(timezone.now())
-        }
+    return start_chunked_job('qb-po-sync')
 
 
 def check_po_delivery_overdue():
     """
     Check for Purchase Orders that are overdue (required_by date passed).
     Create alerts for PT to follow up with vendors.
+    Runs in chunks: see periodic_jobs.create_overdue_alerts.
     """
-    from .models import PurchaseOrder, SystemAlert
-    
-    try:
-        today = timezone.now().date()
-        
-        # Find overdue POs
-        overdue_pos = PurchaseOrder.objects.filter(
-            required_by__lt=today,
-            status__in=['NEW', 'ACCEPTED', 'IN_PRODUCTION', 'AWAITING_APPROVAL'],
-        ).select_related('job', 'vendor')
-        
-        count = 0
-        for po in overdue_pos:
-            # Check if alert already exists
-            existing_alert = SystemAlert.objects.filter(
-                title__contains=f'PO {po.po_number} Overdue',
-                resolved=False
-            ).first()
-            
-            if existing_alert:
-                continue
-            
-            # Create system alert
-            try:
-                days_overdue = (today - po.required_by).days
-                SystemAlert.objects.create(
-                    alert_type='po_overdue',
-                    title=f'PO {po.po_number} Overdue',
-                    description=f'PO {po.po_number} from {po.vendor.name} was due on {po.required_by} ({days_overdue} days overdue). Status: {po.status}',
-                    severity='high',
-                    related_po=po,
-                )
-                count += 1
-            except Exception as e:
-                logger.warning(f"Failed to create alert for PO {po.po_number}: {e}")
-        
-        logger.info(f"Created {count} overdue PO alerts")
-        return {
-            'status': 'success',
-            'alerts_created': count,
-            'timestamp': str(timezone.now())
-        }
-    
-    except Exception as exc:
-        logger.error(f"Error in check_po_delivery_overdue task: {exc}")
-        return {
-            'status': 'error',
-            'error': str(exc),
-            'timestamp': str(timezone.now())
-        }
+    return start_chunked_job('po-overdue-alerts')
 
 
 # ============================================================================
@@ -541,30 +422,8 @@ try:
 
     @shared_task
     def update_production_unit_status():
-        """Update production unit statuses based on timelines. Runs every 6 hours."""
-        try:
-            now = timezone.now().date()
-            
-            units_to_start = ProductionUnit.objects.filter(
-                expected_start_date__lte=now,
-                status='pending_po'
-            )
-            units_to_start.update(status='in_progress')
-            started = units_to_start.count()
-            
-            overdue_units = ProductionUnit.objects.filter(
-                expected_end_date__lt=now,
-                status__in=['pending_po', 'in_progress']
-            )
-            overdue_units.update(status='delayed')
-            delayed = overdue_units.count()
-            
-            logger.info(f"Updated {started} units to in_progress, {delayed} to delayed")
-            return {'status': 'success', 'started': started, 'delayed': delayed}
-            
-        except Exception as exc:
-            logger.error(f"Error in update_production_unit_status: {str(exc)}")
-            return {'status': 'error', 'message': str(exc)}
+        """Update production unit statuses based on timelines. Runs every 6 hours (in chunks, see periodic_jobs)."""
+        return start_chunked_job('production-unit-status')
 
     @shared_task
     def generate_daily_report():
@@ -604,28 +463,129 @@ try:
             logger.error(f"Error in generate_daily_report: {str(exc)}")
             return {'status': 'error', 'message': str(exc)}
 
+    @shared_task
+    def regenerate_catalog_snapshot():
+        """Rebuild the pre-compressed storefront catalog snapshot."""
+        from django.core.cache import cache
+        from .services.catalog_snapshot import build_snapshot, SNAPSHOT_PENDING_KEY
+        
+        cache.delete(SNAPSHOT_PENDING_KEY)
+        path = build_snapshot()
+        return {'status': 'success', 'path': str(path)}
+    
+    @shared_task
+    def sync_products_to_storefront_task(product_ids=None):
+        """Apply Product changes to StorefrontProduct (all changes since the watermark if no ids)."""
+        from .services.storefront_sync import StorefrontSyncService
+        
+        stats = StorefrontSyncService.sync(product_ids=product_ids)
+        return {'status': 'success', **stats}
+    
+    @shared_task
+    def process_product_image(image_id):
+        """Generate responsive/WebP/AVIF variants, dimensions and blurhash for a ProductImage."""
+        from .services.media_pipeline import process_image_by_id
+        
+        variants = process_image_by_id(image_id)
+        if variants is None:
+            return {'status': 'skipped_or_failed', 'image_id': image_id}
+        return {'status': 'success', 'image_id': image_id, 'formats': sorted(variants)}
+    
+    @shared_task
+    def record_product_change_history(rows):
+        """Bulk insert ProductChangeHistory rows deferred from product saves."""
+        from .models import ProductChangeHistory
+        
+        # changed_at is auto_now_add, so rows are stamped at write time
+        entries = [ProductChangeHistory(**row) for row in rows]
+        ProductChangeHistory.objects.bulk_create(entries)
+        return {'status': 'success', 'count': len(entries)}
+    
+    @shared_task
+    def publish_progress(entity_type, entity_id):
+        """Publish a saved job or purchase order to the progress stream, read back from the database."""
+        from .services import progress_stream
+        
+        frame = progress_stream.publish_current(entity_type, entity_id)
+        return {'status': 'success' if frame else 'unchanged', 'entity': progress_stream.entity_key(entity_type, entity_id)}
+    
+    @shared_task
+    def expire_inventory_reservations():
+        """Release stock held by reservations past their expiry (unpaid checkouts)."""
+        from .services.inventory import expire_stale_reservations
+        
+        expired = expire_stale_reservations()
+        return {'status': 'success', 'expired': expired}
+    
+    @shared_task
+    def index_order_copurchases(order_id):
+        """Add a paid order's basket to the co-purchase recommendation index."""
+        from .services.recommendations import record_order
+        
+        indexed = record_order(order_id)
+        return {'status': 'success' if indexed else 'skipped', 'order_id': order_id}
+    
+    @shared_task
+    def rebuild_copurchase_index():
+        """Nightly full rebuild of co-purchase counts and top-K recommendations."""
+        from .services.recommendations import rebuild_index
+        
+        stats = rebuild_index()
+        return {'status': 'success', **stats}
+    
+    @shared_task
+    def run_abandoned_cart_campaign(hours_threshold=24):
+        """Mark abandoned carts and send their reminder emails in batches (resumes an unfinished run)."""
+        from .services.cart_reminders import run_campaign
+        
+        stats = run_campaign(hours_threshold=hours_threshold)
+        return {'status': 'success', **stats}
+    
+    @shared_task
+    def catch_up_activity_feed(replay=None):
+        """Project new history rows into the activity feed, keep its monthly partitions ahead and prune months past retention."""
+        from django.conf import settings
+        from .services.activity_feed import REPLAY_WINDOW, catch_up, ensure_partitions, prune
+        
+        partitioned = ensure_partitions()
+        projected = catch_up(replay=REPLAY_WINDOW if replay is None else replay)
+        retention = getattr(settings, 'ACTIVITY_FEED_RETENTION_MONTHS', 0)
+        pruned = prune(retention) if retention else 0
+        return {'status': 'success', 'projected': projected, 'partitions_created': partitioned, 'pruned': pruned}
+    
+    @shared_task
+    def refresh_client_dashboards():
+        """Recompute every client dashboard from the source tables (reconciles the delta-maintained counters)."""
+        from .services.client_dashboard import refresh
+        
+        return {'status': 'success', 'refreshed': refresh()}
+    
+    @shared_task
+    def process_payment_webhooks():
+        """Apply stored payment gateway callbacks (queued on receipt, swept every minute)."""
+        from .services.payment_webhooks import process_pending
+        
+        return {'status': 'success', 'outcomes': process_pending()}
+    
+    @shared_task
+    def merge_duplicate_leads():
+        """Index leads saved before the dedup keys existed and merge leads sharing an email."""
+        from .services.lead_dedup import merge_duplicates
+        
+        return {'status': 'success', 'merged': merge_duplicates()}
+    
+    @shared_task
+    def run_task_chunk(chunk_id):
+        """Process one key-range chunk of a chunked periodic job and queue the next."""
+        from .services.chunked_tasks import run_chunk
+        
+        metrics = run_chunk(chunk_id)
+        return {'status': 'success' if metrics else 'skipped', 'chunk_id': chunk_id, **(metrics or {})}
+    
     @shared_task
     def cleanup_old_conversations():
-        """Archive old chatbot conversations (older than 90 days). Runs weekly."""
-        try:
-            from datetime import timedelta
-            
-            cutoff_date = timezone.now() - timedelta(days=90)
-            
-            old_conversations = ChatbotConversation.objects.filter(
-                ended_at__lt=cutoff_date,
-                resolved=True
-            )
-            
-            count = old_conversations.count()
-            old_conversations.delete()
-            
-            logger.info(f"Cleaned up {count} old conversations")
-            return {'status': 'success', 'deleted_count': count}
-            
-        except Exception as exc:
-            logger.error(f"Error in cleanup_old_conversations: {str(exc)}")
-            return {'status': 'error', 'message': str(exc)}
+        """Delete resolved chatbot conversations older than 90 days. Runs weekly (in chunks, see periodic_jobs)."""
+        return start_chunked_job('conversation-cleanup')
 
     # ==================== EMAIL SENDING TASKS ====================
     
@@ -828,6 +788,7 @@ try:
                 'message': str(e),
             }
 
+    @shared_task
     def send_quote_email_task(quote_id, recipient_email, subject, context=None):
         """
         Send quote email synchronously (no Celery worker required).
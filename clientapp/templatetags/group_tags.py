@@ -1,13 +1,13 @@
 from django import template
 
+from clientapp.services.roles import has_group as _has_group
+
 register = template.Library()
 
 @register.filter(name='has_group')
 def has_group(user, group_name):
     """Return True if user belongs to group `group_name`."""
     try:
-        if not user or not getattr(user, 'is_authenticated', False):
-            return False
-        return user.groups.filter(name=group_name).exists()
+        return _has_group(user, group_name)
     except Exception:
         return False
\ No newline at end of file
@@ -1,3 +1,1757 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import socket
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import requests
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import Group, User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIRequestFactory
+
+from clientapp.api_serializers import ProductImageSerializer
+from clientapp.api_views import CartViewSet
+from clientapp.models import (
+    AbandonedCartCampaign, ActivityFeedEntry, ActivityLog, AuditLog, ChunkedTaskChunk, ChunkedTaskRun, Client, ClientDashboard, ClientInvoice, ClientOrder, ClientPortalUser, Cart, CartItem, ChatbotIntentKeyword, Coupon, Customer, CustomerAddress, InventoryReservation, Job, JobNote, JobVendorStage, Lead, MaterialInventory, Notification, Order, OrderItem, PaymentTransaction, PaymentWebhookEvent, Product, ProductChangeHistory, ProductFAQ, ProductImage, ProductPricing, ProductRule, ProductVariable, ProductVariableOption,
+    ProductMaterialLink, ProductRecommendation, ProductShipping, Promotion, PromotionUsage, ShippingMethod, StorefrontProduct, SystemAlert, Vendor,
+    TaxConfiguration, Quote, TimelineEvent,
+)
+from clientapp.services import cache as catalog_cache
+from clientapp.services import (
+    activity_feed, cart_reminders, chatbot, chunked_tasks, client_dashboard, fulfilment, inventory, job_detail, lead_dedup, payment_webhooks,
+    progress_stream, promotions, recommendations, roles,
+)
+from clientapp.permissions import IsAccountManager, IsClient, IsClientOwner
+from clientapp import views
+from clientapp.services.event_bus import EventBus
+from clientapp.services.media_pipeline import process_image_by_id
+from clientapp.services import preflight
+from clientapp.services.preflight import PreflightService
+from clientapp.services.product_configuration import ProductConfigurationValidator
+from clientapp.services.storefront_sync import StorefrontSyncService, get_watermark
+from clientapp.storefront_services import ChatbotService, CrossSellService, InventoryService, ShippingCalculatorService
+
+
+LOCMEM_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'clientapp-tests',
+    }
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CacheAsideTests(TestCase):
+    """Test the versioned cache-aside helper"""
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def build(self):
+        self.calls += 1
+        return {'value': self.calls}
+
+    def test_value_is_built_once(self):
+        first = catalog_cache.get_or_set('test', ('a',), self.build, beta=0)
+        second = catalog_cache.get_or_set('test', ('a',), self.build, beta=0)
+        self.assertEqual(first, second)
+        self.assertEqual(self.calls, 1)
+
+    def test_bump_namespace_invalidates(self):
+        catalog_cache.get_or_set('test', ('a',), self.build, beta=0)
+        catalog_cache.bump_namespace('test')
+        value = catalog_cache.get_or_set('test', ('a',), self.build, beta=0)
+        self.assertEqual(value, {'value': 2})
+
+    def test_none_is_not_cached(self):
+        catalog_cache.get_or_set('test', ('a',), lambda: None)
+        value = catalog_cache.get_or_set('test', ('a',), self.build, beta=0)
+        self.assertEqual(value, {'value': 1})
+
+    def test_shipping_method_save_invalidates_cached_methods(self):
+        ShippingMethod.objects.create(name='Standard', flat_rate=Decimal('300'), is_default=True)
+        self.assertEqual(len(ShippingCalculatorService.get_active_methods()), 1)
+        ShippingMethod.objects.create(name='Express', flat_rate=Decimal('800'))
+        self.assertEqual(len(ShippingCalculatorService.get_active_methods()), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CatalogConditionalRequestTests(TestCase):
+    """Test ETag/304 handling and the pre-rendered catalog snapshot"""
+
+    def setUp(self):
+        cache.clear()
+        self.snapshot_dir = tempfile.mkdtemp()
+        StorefrontProduct.objects.create(
+            product_id='PROD-001',
+            name='Business Cards',
+            base_price=Decimal('2500.00'),
+            storefront_visible=True,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.snapshot_dir, ignore_errors=True)
+
+    def test_list_returns_validators_and_304(self):
+        url = '/api/v1/storefront/public-products/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stale-while-revalidate', response['Cache-Control'])
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_live_catalog_endpoint_answers_conditional_gets(self):
+        url = '/api/v1/storefront-products/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('stale-while-revalidate', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_deletion_moves_last_modified(self):
+        # Deleting an older product leaves Max(updated_at) where it was
+        StorefrontProduct.objects.create(product_id='PROD-002', name='Flyers', base_price=Decimal('900.00'), storefront_visible=True)
+        url = '/api/v1/storefront/public-products/'
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        StorefrontProduct.objects.filter(product_id='PROD-001').delete()
+        with mock.patch('clientapp.services.catalog_snapshot.timezone.now', return_value=timezone.now() + timedelta(seconds=5)):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_product_change_changes_etag(self):
+        url = '/api/v1/storefront/public-products/'
+        etag = self.client.get(url)['ETag']
+        StorefrontProduct.objects.filter(product_id='PROD-001').first().save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_snapshot_served_gzipped(self):
+        with self.settings(STOREFRONT_SNAPSHOT_DIR=self.snapshot_dir):
+            response = self.client.get('/api/v1/storefront/catalog.json', HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(response['Content-Encoding'], ('gzip', 'br'))
+            response = self.client.get(
+                '/api/v1/storefront/catalog.json',
+                HTTP_ACCEPT_ENCODING='gzip',
+                HTTP_IF_NONE_MATCH=response['ETag'],
+            )
+            self.assertEqual(response.status_code, 304)
+
+    def test_snapshot_refused_encoding_not_used(self):
+        with self.settings(STOREFRONT_SNAPSHOT_DIR=self.snapshot_dir):
+            response = self.client.get(
+                '/api/v1/storefront/catalog.json', HTTP_ACCEPT_ENCODING='gzip;q=0, br;q=0, identity'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.has_header('Content-Encoding'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StorefrontSyncTests(TestCase):
+    """Test the incremental Product -> StorefrontProduct sync"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            name='Flyers',
+            internal_code='FLY-001',
+            auto_generate_code=False,
+            short_description='A5 flyers',
+            long_description='Full colour A5 flyers',
+            status='published',
+            is_visible=True,
+            base_price=Decimal('1500.00'),
+        )
+
+    def test_sync_creates_then_reports_unchanged(self):
+        stats = StorefrontSyncService.sync()
+        self.assertEqual(stats['created'], 1)
+        storefront_product = StorefrontProduct.objects.get(product_id='FLY-001')
+        self.assertEqual(storefront_product.base_price, Decimal('1500.00'))
+        self.assertIsNotNone(get_watermark())
+
+        stats = StorefrontSyncService.sync()
+        self.assertEqual(stats['created'] + stats['updated'], 0)
+
+    def test_dry_run_reports_diff_without_writing(self):
+        StorefrontSyncService.sync()
+        Product.objects.filter(pk=self.product.pk).update(name='Premium Flyers')
+
+        stats = StorefrontSyncService.sync(product_ids=[self.product.pk], dry_run=True)
+        self.assertEqual(stats['updated'], 1)
+        self.assertEqual(stats['diff'][0]['changes']['name'], ['Flyers', 'Premium Flyers'])
+        self.assertEqual(StorefrontProduct.objects.get(product_id='FLY-001').name, 'Flyers')
+
+    def test_unpublishing_hides_storefront_product(self):
+        StorefrontSyncService.sync()
+        self.product.status = 'draft'
+        self.product.save()
+
+        StorefrontSyncService.sync(product_ids=[self.product.pk])
+        self.assertFalse(StorefrontProduct.objects.get(product_id='FLY-001').storefront_visible)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class MediaPipelineTests(TestCase):
+    """Test responsive variant generation for product images"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = self.settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.product = Product.objects.create(
+            name='Posters',
+            short_description='A2 posters',
+            long_description='Full colour A2 posters',
+            base_price=Decimal('900.00'),
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, size=(1000, 500)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (200, 40, 40)).save(buffer, 'JPEG')
+        return SimpleUploadedFile('poster.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_pending_until_processed(self):
+        image = ProductImage.objects.create(product=self.product, image=self.upload(), alt_text='Poster')
+        self.assertEqual(image.processing_status, 'pending')
+        self.assertEqual(ProductImageSerializer(image).data['srcset'], '')
+
+    def test_processing_records_metadata_and_srcset(self):
+        image = ProductImage.objects.create(product=self.product, image=self.upload(), alt_text='Poster')
+        process_image_by_id(image.pk)
+        image.refresh_from_db()
+
+        self.assertEqual(image.processing_status, 'ready')
+        self.assertEqual((image.width, image.height), (1000, 500))
+        self.assertTrue(image.blurhash)
+        self.assertEqual([v['width'] for v in image.variants['jpeg']], [320, 640, 960, 1000])
+        self.assertIn('webp', image.variants)
+
+        data = ProductImageSerializer(image).data
+        self.assertIn('320w', data['srcset'])
+        self.assertIn('image/webp', [source['type'] for source in data['sources']])
+
+    def test_original_is_stored_without_exif(self):
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'  # Make
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise
+        buffer = io.BytesIO()
+        Image.new('RGB', (1000, 500), (200, 40, 40)).save(buffer, 'JPEG', exif=exif)
+        upload = SimpleUploadedFile('phone.jpg', buffer.getvalue(), content_type='image/jpeg')
+        image = ProductImage.objects.create(product=self.product, image=upload, alt_text='Poster')
+        uploaded_name = image.image.name
+
+        process_image_by_id(image.pk)
+        image.refresh_from_db()
+        with image.image.open('rb') as fh:
+            stored = Image.open(fh)
+            stored.load()
+        self.assertEqual(dict(stored.getexif()), {})
+        self.assertEqual(stored.size, (500, 1000))
+        self.assertEqual((image.width, image.height), (500, 1000))
+        self.assertNotEqual(image.image.name, uploaded_name)
+        self.assertFalse(image.image.storage.exists(uploaded_name))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PreflightTests(TestCase):
+    """Test real artwork analysis for business-card sized products"""
+
+    def setUp(self):
+        cache.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = self.settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+        self.settings_override.enable()
+        self.product = Product.objects.create(
+            name='Business Cards',
+            short_description='Standard cards',
+            long_description='90 x 55mm business cards',
+            base_price=Decimal('2500.00'),
+            width=Decimal('9.0'),
+            length=Decimal('5.5'),
+            dimension_unit='cm',
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def media_url(self, name):
+        return f'http://testserver/media/{name}'
+
+    def test_print_ready_cmyk_raster_passes(self):
+        # 96 x 61mm (card + 3mm bleed) at 300 DPI
+        Image.new('CMYK', (1134, 721)).save(f'{self.media_root}/card.tif', dpi=(300, 300))
+        result = PreflightService.validate(self.media_url('card.tif'), self.product.pk)
+        self.assertEqual(result['checks']['dpi'], 'pass')
+        self.assertEqual(result['checks']['color_mode'], 'pass')
+        self.assertEqual(result['checks']['bleed'], 'pass')
+        self.assertEqual(result['details']['format'], 'TIFF')
+
+    def test_low_resolution_rgb_pdf_is_flagged(self):
+        from fpdf import FPDF
+        Image.new('RGB', (300, 300), (10, 200, 30)).save(f'{self.media_root}/logo.png')
+        pdf = FPDF(unit='mm', format=(96, 61))
+        pdf.add_page()
+        pdf.image(f'{self.media_root}/logo.png', x=0, y=0, w=96, h=61)
+        pdf.output(f'{self.media_root}/card.pdf')
+
+        result = PreflightService.validate(self.media_url('card.pdf'), self.product.pk)
+        self.assertEqual(result['checks']['dpi'], 'fail')
+        self.assertEqual(result['checks']['color_mode'], 'warning')
+        self.assertEqual(result['checks']['bleed'], 'pass')
+        self.assertEqual(result['status'], 'fail')
+
+    def test_results_are_cached_by_content_hash(self):
+        Image.new('CMYK', (1134, 721)).save(f'{self.media_root}/a.tif', dpi=(300, 300))
+        shutil.copy(f'{self.media_root}/a.tif', f'{self.media_root}/b.tif')
+
+        with mock.patch.object(preflight, 'run_analysis', wraps=preflight.run_analysis) as run:
+            PreflightService.validate(self.media_url('a.tif'), self.product.pk)
+            PreflightService.validate(self.media_url('b.tif'), self.product.pk)
+        self.assertEqual(run.call_count, 1)
+
+    def test_private_hosts_are_refused(self):
+        result = PreflightService.validate('http://127.0.0.1/card.pdf', self.product.pk)
+        self.assertEqual(result['status'], 'fail')
+        self.assertEqual(result['checks'], {'file': 'fail'})
+
+    @override_settings(PREFLIGHT_TIMEOUT=0)
+    def test_timeout_retires_only_the_stuck_pool(self):
+        executor, slots = preflight._get_executor()
+        stuck = Future()
+        stuck.set_running_or_notify_cancel()
+        with mock.patch.object(preflight, '_submit', return_value=stuck), \
+                mock.patch.object(preflight, '_retire_executor', wraps=preflight._retire_executor) as retire:
+            facts, cacheable = preflight.run_analysis('/tmp/stuck.pdf')
+        self.assertEqual((facts, cacheable), ({'error': 'Analysis timed out after 0s'}, False))
+        retire.assert_called_once_with(executor, stuck=stuck)
+
+        # New work gets a new pool; requests still in flight release the same slots
+        new_executor, new_slots = preflight._get_executor()
+        self.assertIsNot(new_executor, executor)
+        self.assertIs(new_slots, slots)
+
+    def test_media_path_on_foreign_host_is_not_read_locally(self):
+        Image.new('CMYK', (1134, 721)).save(f'{self.media_root}/card.tif', dpi=(300, 300))
+        with mock.patch.object(preflight, '_download', side_effect=preflight.PreflightError('refused')) as download:
+            result = PreflightService.validate('https://elsewhere.example/media/card.tif', self.product.pk)
+        download.assert_called_once()
+        self.assertEqual(result['checks'], {'file': 'fail'})
+
+    def test_download_connects_to_the_checked_address(self):
+        addresses = [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('93.184.216.34', 0))]
+        with mock.patch.object(preflight.socket, 'getaddrinfo', return_value=addresses), \
+                mock.patch('requests.Session.get', side_effect=requests.ConnectionError('offline')) as get:
+            result = PreflightService.validate('https://files.example/card.pdf?v=2', self.product.pk)
+        self.assertEqual(get.call_args.args[0], 'https://93.184.216.34/card.pdf?v=2')
+        self.assertEqual(get.call_args.kwargs['headers'], {'Host': 'files.example'})
+        self.assertEqual(result['checks'], {'file': 'fail'})
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductConfigurationRulesTests(TestCase):
+    """Test the compiled configuration rule engine"""
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            name='Flyers',
+            short_description='A5 flyers',
+            long_description='Full colour A5 flyers',
+            base_price=Decimal('1500.00'),
+        )
+        for name, options in (('paper', ['150gsm', '300gsm']), ('finish', ['none', 'gloss', 'spot_uv'])):
+            variable = ProductVariable.objects.create(product=self.product, name=name)
+            for order, option in enumerate(options):
+                ProductVariableOption.objects.create(variable=variable, name=option, display_order=order)
+
+        ProductRule.objects.create(
+            product=self.product,
+            rule_type='conditional',
+            condition_json={'if': {'variable': 'finish', 'value': 'spot_uv'}, 'then': {'variable': 'paper', 'value': '300gsm'}},
+            message='Spot UV needs 300gsm paper',
+        )
+        ProductRule.objects.create(
+            product=self.product,
+            rule_type='excludes',
+            condition_json={'variable': 'finish', 'excludes': ['gloss']},
+            message='Gloss is unavailable',
+        )
+
+    def validate(self, variables):
+        return ProductConfigurationValidator.validate(self.product.pk, variables, include_options=True)
+
+    def test_errors_match_rules(self):
+        result = self.validate({'paper': '150gsm', 'finish': 'spot_uv'})
+        self.assertFalse(result['valid'])
+        self.assertEqual(result['errors'], ['Spot UV needs 300gsm paper'])
+
+        self.assertTrue(self.validate({'paper': '300gsm', 'finish': 'spot_uv'})['valid'])
+        self.assertEqual(self.validate({'finish': 'gloss'})['errors'], ['Gloss is unavailable'])
+
+    def test_valid_options_for_partial_selection(self):
+        options = self.validate({})['valid_options']
+        self.assertEqual(options['finish'], ['none', 'spot_uv'])
+
+        options = self.validate({'paper': '150gsm'})['valid_options']
+        self.assertEqual(options['finish'], ['none'])
+        self.assertEqual(options['paper'], ['150gsm', '300gsm'])
+
+        options = self.validate({'finish': 'spot_uv'})['valid_options']
+        self.assertEqual(options['paper'], ['300gsm'])
+
+    def test_rule_change_recompiles(self):
+        self.assertTrue(self.validate({'paper': '150gsm'})['valid'])
+        ProductRule.objects.create(
+            product=self.product,
+            rule_type='excludes',
+            condition_json={'variable': 'paper', 'excludes': ['150gsm']},
+            message='150gsm is out of stock',
+        )
+        self.assertEqual(self.validate({'paper': '150gsm'})['errors'], ['150gsm is out of stock'])
+
+    def test_view_returns_valid_options(self):
+        response = self.client.post(
+            '/api/v1/product-configurations/validate/',
+            {'product_id': self.product.pk, 'variables': {'paper': '150gsm'}},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['valid_options']['finish'], ['none'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProductChangeTrackingTests(TestCase):
+    """Test load-time dirty tracking for product history"""
+
+    def setUp(self):
+        cache.clear()
+        Product.objects.create(
+            name='Stickers',
+            internal_code='STK-001',
+            auto_generate_code=False,
+            short_description='Vinyl stickers',
+            long_description='Die-cut vinyl stickers',
+            base_price=Decimal('800.00'),
+        )
+
+    def test_changed_fields_are_recorded_without_reselecting(self):
+        product = Product.objects.get(name='Stickers')
+        product.name = 'Vinyl Stickers'
+        product.base_price = Decimal('950.00')
+
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        product_selects = [
+            q['sql'] for q in queries.captured_queries
+            if q['sql'].startswith('SELECT') and 'FROM "clientapp_product" WHERE "clientapp_product"."id"' in q['sql']
+        ]
+        self.assertEqual(product_selects, [])
+
+        history = {h.field_changed: (h.old_value, h.new_value) for h in ProductChangeHistory.objects.filter(product=product)}
+        self.assertEqual(history, {
+            'name': ('Stickers', 'Vinyl Stickers'),
+            'base_price': ('800.00', '950.00'),
+        })
+
+    def test_unchanged_save_writes_no_history(self):
+        product = Product.objects.get(name='Stickers')
+        product.save()
+        product.name = 'Vinyl Stickers'
+        product.save()
+        product.save()
+        self.assertEqual(ProductChangeHistory.objects.filter(product=product).count(), 1)
+
+    def test_deferred_fields_are_not_loaded_to_track_them(self):
+        product = Product.objects.only('name', 'internal_code').get(name='Stickers')
+        product.name = 'Vinyl Stickers'
+        with self.assertNumQueries(0):
+            product.reset_tracked_values()
+        self.assertEqual(set(product._loaded_values), {'name', 'internal_code'})
+
+        product.refresh_from_db(fields=['name'])
+        self.assertEqual(product.tracked_changes(), {})
+        # Loading a deferred field makes its database value the baseline
+        self.assertEqual(product.base_price, Decimal('800.00'))
+        self.assertEqual(product.loaded_value('base_price'), Decimal('800.00'))
+
+    def test_pricing_logs_only_changed_fields(self):
+        product = Product.objects.get(name='Stickers')
+        ProductPricing.objects.create(product=product)
+        pricing = ProductPricing.objects.get(product=product)
+        pricing.base_cost = Decimal('20.00')
+        pricing.save()
+        fields = list(ProductChangeHistory.objects.filter(product=product).values_list('field_changed', flat=True))
+        self.assertEqual(sorted(fields), ['pricing_base_cost', 'pricing_created'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class InventoryReservationTests(TestCase):
+    """Test the reservation ledger and atomic stock holds"""
+
+    def setUp(self):
+        cache.clear()
+        self.paper = MaterialInventory.objects.create(
+            material_name='Art Paper', material_code='PAP-1', virtual_stock=Decimal('100'), low_stock_threshold=Decimal('10'),
+        )
+        self.ink = MaterialInventory.objects.create(
+            material_name='Ink', material_code='INK-1', virtual_stock=Decimal('5'), low_stock_threshold=Decimal('1'),
+        )
+        product = Product.objects.create(
+            name='Flyers',
+            internal_code='FLY-001',
+            auto_generate_code=False,
+            short_description='A5 flyers',
+            long_description='A5 flyers',
+            base_price=Decimal('10.00'),
+        )
+        ProductMaterialLink.objects.create(product=product, material=self.paper, quantity_per_product=Decimal('2'))
+        ProductMaterialLink.objects.create(product=product, material=self.ink, quantity_per_product=Decimal('0.1'))
+        customer = Customer.objects.create(email='buyer@example.com', first_name='Ann', last_name='Buyer')
+        self.order = Order.objects.create(customer=customer, subtotal=Decimal('400'), total_amount=Decimal('400'))
+        OrderItem.objects.create(
+            order=self.order, product=product, product_name='Flyers', unit_price=Decimal('10'),
+            quantity=40, line_total=Decimal('400'),
+        )
+
+    def _stock(self, material):
+        material.refresh_from_db()
+        return material.virtual_stock, material.reserved_stock
+
+    def test_order_is_reserved_all_or_nothing(self):
+        inventory.reserve_order(self.order)
+        self.assertEqual(self._stock(self.paper), (Decimal('100'), Decimal('80')))
+        self.assertEqual(self._stock(self.ink), (Decimal('5'), Decimal('4')))
+        self.assertEqual(inventory.reserved_totals([self.paper.pk]), {self.paper.pk: Decimal('80')})
+
+        # Paper has 20 left, ink only 1 - the whole second hold is refused
+        with self.assertRaises(inventory.InsufficientStock) as raised:
+            inventory.reserve({self.paper.pk: 10, self.ink.pk: 2})
+        self.assertEqual(raised.exception.shortages, {self.ink.pk: Decimal('1')})
+        self.assertEqual(self._stock(self.paper), (Decimal('100'), Decimal('80')))
+        self.assertEqual(InventoryReservation.objects.count(), 2)
+
+    def test_release_commit_and_expiry(self):
+        inventory.reserve_order(self.order)
+        self.order.status = 'cancelled'
+        self.order.save()
+        self.assertEqual(self._stock(self.paper), (Decimal('100'), Decimal('0')))
+        self.assertEqual(inventory.release_order(self.order), 0)
+
+        inventory.reserve({self.paper.pk: 30}, ttl=timedelta(minutes=-1))
+        inventory.reserve({self.paper.pk: 20}, order=self.order)
+        self.assertEqual(inventory.expire_stale_reservations(), 1)
+        self.assertEqual(self._stock(self.paper), (Decimal('100'), Decimal('20')))
+
+        self.assertEqual(inventory.commit_order(self.order), 1)
+        self.assertEqual(self._stock(self.paper), (Decimal('80'), Decimal('0')))
+
+    def test_low_stock_alert_follows_the_ledger(self):
+        inventory.reserve({self.paper.pk: 95})
+        inventory.reserve({self.paper.pk: 1})
+        alerts = SystemAlert.objects.filter(alert_type='low_stock', is_active=True)
+        self.assertEqual(alerts.count(), 1)
+        self.assertIn('Art Paper', alerts.get().title)
+
+        InventoryReservation.objects.filter(material=self.paper).update(expires_at=timezone.now())
+        inventory.expire_stale_reservations()
+        self.assertFalse(alerts.exists())
+
+    def test_availability_in_product_units(self):
+        product = Product.objects.get(name='Flyers')
+        result = inventory.requirements_for([(product.pk, 3), (product.pk, 2)])
+        self.assertEqual(result, {self.paper.pk: Decimal('10'), self.ink.pk: Decimal('0.5')})
+        self.assertEqual(InventoryService.check_availability(product, 60)['quantity_available'], 50)
+        self.assertFalse(InventoryService.check_availability(product, 60)['can_fulfill'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class InventoryRaceTests(TransactionTestCase):
+    """Test concurrent checkouts competing for the same stock"""
+    # Committed data: each checkout runs on its own thread and connection
+
+    def setUp(self):
+        cache.clear()
+        self.paper = MaterialInventory.objects.create(
+            material_name='Art Paper', material_code='PAP-1', virtual_stock=Decimal('2'), low_stock_threshold=Decimal('1'),
+        )
+        self.product = Product.objects.create(
+            name='Flyers',
+            internal_code='FLY-001',
+            auto_generate_code=False,
+            short_description='A5 flyers',
+            long_description='A5 flyers',
+            base_price=Decimal('10.00'),
+        )
+        ProductMaterialLink.objects.create(product=self.product, material=self.paper, quantity_per_product=Decimal('2'))
+
+    def test_checkouts_racing_for_the_last_unit(self):
+        carts = []
+        for i in range(2):
+            customer = Customer.objects.create(email=f'racer{i}@example.com', first_name='Racer', last_name=str(i))
+            cart = Cart.objects.create(customer=customer)
+            CartItem.objects.create(cart=cart, product=self.product, product_name='Flyers', unit_price=Decimal('10'), quantity=1)
+            carts.append(cart)
+
+        checkout = CartViewSet.as_view({'post': 'checkout'})
+        start = threading.Barrier(len(carts))
+
+        def race(cart):
+            try:
+                start.wait(5)
+                return checkout(APIRequestFactory().post(f'/carts/{cart.pk}/checkout/', {}, format='json'), pk=cart.pk)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(carts)) as pool:
+            responses = list(pool.map(race, carts))
+
+        by_status = {response.status_code: (cart, response) for cart, response in zip(carts, responses)}
+        self.assertEqual(sorted(by_status), [201, 409])
+        loser, refused = by_status[409]
+        self.assertEqual(refused.data['shortages'], {self.paper.pk: 2.0})
+        self.assertEqual(Order.objects.filter(customer__email__startswith='racer').count(), 1)
+        self.paper.refresh_from_db()
+        self.assertEqual((self.paper.virtual_stock, self.paper.reserved_stock), (Decimal('2'), Decimal('2')))
+        self.assertTrue(Cart.objects.get(pk=loser.pk).is_active)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CoPurchaseRecommendationTests(TestCase):
+    """Test the co-purchase index behind CrossSellService"""
+
+    def setUp(self):
+        cache.clear()
+        self.products = {}
+        for code in ('CARDS', 'FLYER', 'BANNER', 'MUG'):
+            self.products[code] = Product.objects.create(
+                name=code.title(),
+                internal_code=code,
+                auto_generate_code=False,
+                short_description=code,
+                long_description=code,
+                base_price=Decimal('10.00'),
+                status='published',
+            )
+        self.customer = Customer.objects.create(email='shop@example.com', first_name='Sam', last_name='Shop')
+
+    def _order(self, codes, status='paid', days_ago=0):
+        order = Order.objects.create(
+            customer=self.customer, status=status, subtotal=Decimal('10'), total_amount=Decimal('10'),
+        )
+        for code in codes:
+            OrderItem.objects.create(
+                order=order, product=self.products[code], product_name=code, unit_price=Decimal('10'),
+                quantity=1, line_total=Decimal('10'),
+            )
+        if days_ago:
+            Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def _neighbours(self, code):
+        return [
+            Product.objects.get(pk=pk).internal_code
+            for pk in recommendations.neighbour_ids(self.products[code].pk)
+        ]
+
+    def test_orders_are_indexed_once_with_recency_decay(self):
+        # Two old baskets with banners lose to one recent basket with flyers
+        old = [self._order(['CARDS', 'BANNER'], days_ago=720) for _ in range(2)]
+        recent = self._order(['CARDS', 'FLYER'])
+        pending = self._order(['CARDS', 'MUG'], status='pending')
+        for order in old + [recent, pending]:
+            recommendations.record_order(order.pk)
+
+        self.assertFalse(recommendations.record_order(recent.pk))
+        self.assertEqual(self._neighbours('CARDS'), ['FLYER', 'BANNER'])
+        self.assertEqual(self._neighbours('FLYER'), ['CARDS'])
+
+        incremental = dict(ProductRecommendation.objects.values_list('product_id', 'neighbours'))
+        stats = recommendations.rebuild_index()
+        self.assertEqual(stats['orders'], 3)
+        rebuilt = dict(ProductRecommendation.objects.values_list('product_id', 'neighbours'))
+        self.assertEqual(rebuilt.keys(), incremental.keys())
+        for product_id, neighbours in rebuilt.items():
+            self.assertEqual([n[0] for n in neighbours], [n[0] for n in incremental[product_id]])
+
+    def test_cross_sell_is_a_lookup_of_live_products(self):
+        recommendations.record_order(self._order(['CARDS', 'FLYER', 'BANNER']).pk)
+        recommendations.record_order(self._order(['CARDS', 'BANNER']).pk)
+        Product.objects.filter(pk=self.products['FLYER'].pk).update(status='draft')
+
+        with self.assertNumQueries(2):
+            together = CrossSellService.get_frequently_bought_together(self.products['CARDS'])
+        self.assertEqual([p.internal_code for p in together], ['BANNER'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class PromotionEngineTests(TestCase):
+    """Test cached promotion rules, stacking and atomic usage counting"""
+
+    def setUp(self):
+        cache.clear()
+        now = timezone.now()
+        self.window = {'starts_at': now - timedelta(days=1), 'ends_at': now + timedelta(days=1)}
+        self.customer = Customer.objects.create(email='promo@example.com', first_name='Pat', last_name='Promo')
+        self.coupon = Coupon.objects.create(
+            code='SAVE10', name='10% off', discount_type='percentage', discount_value=Decimal('10'),
+            valid_from=self.window['starts_at'], valid_until=self.window['ends_at'],
+        )
+        self.bogo = Promotion.objects.create(
+            name='Buy 2 get 1', promotion_type='bogo', buy_quantity=2, get_quantity=1, **self.window,
+        )
+        self.lines = [
+            {'product_id': 1, 'quantity': 3, 'unit_price': Decimal('100'), 'category': 'Print'},
+            {'product_id': 2, 'quantity': 1, 'unit_price': Decimal('40'), 'category': 'Print'},
+        ]
+
+    def _order(self):
+        return Order.objects.create(customer=self.customer, subtotal=Decimal('340'), total_amount=Decimal('340'))
+
+    def test_discounts_stack_in_one_pass_from_cached_rules(self):
+        result = promotions.evaluate(self.lines, customer=self.customer, coupon_code='SAVE10')
+        # BOGO frees the cheapest of 4 units (40), the coupon takes 10% of 340
+        self.assertEqual({d['name']: d['amount'] for d in result['discounts']}, {'Buy 2 get 1': Decimal('40.00'), '10% off': Decimal('34.00')})
+        self.assertEqual(result['discount_total'], Decimal('74.00'))
+
+        with self.assertNumQueries(1):
+            promotions.evaluate(self.lines, customer=self.customer, coupon_code='SAVE10')
+
+        # A non-stackable offer applies alone when it beats the stack
+        Promotion.objects.create(
+            name='Big spender', promotion_type='tiered', stackable=False,
+            tier_rules=[{'min_spend': 300, 'discount_amount': 100}], **self.window,
+        )
+        result = promotions.evaluate(self.lines, customer=self.customer, coupon_code='SAVE10')
+        self.assertEqual([d['name'] for d in result['discounts']], ['Big spender'])
+        self.assertEqual(result['coupon_error'], 'A better offer that cannot be combined is already applied')
+
+    def test_usage_limits_are_counted_atomically(self):
+        evaluation = promotions.evaluate(self.lines, customer=self.customer, coupon_code='SAVE10')
+        order = self._order()
+        promotions.redeem(order, evaluation, customer=self.customer)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.usage_count, 1)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(self.coupon.is_valid(customer=self.customer, order_amount=340)[1], 'You have already used this coupon')
+        self.assertEqual(
+            promotions.evaluate(self.lines, customer=self.customer, coupon_code='SAVE10')['coupon_error'],
+            'You have already used this coupon',
+        )
+        # A second checkout with the stale evaluation is refused as a whole
+        with self.assertRaises(promotions.PromotionUnavailable):
+            promotions.redeem(self._order(), evaluation, customer=self.customer)
+        self.assertEqual(Promotion.objects.get(pk=self.bogo.pk).usage_count, 1)
+
+        order.status = 'cancelled'
+        order.save()
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.usage_count, 0)
+        self.assertEqual(PromotionUsage.objects.get(customer=self.customer, coupon=self.coupon).uses, 0)
+        self.assertIsNone(promotions.evaluate(self.lines, customer=self.customer, coupon_code='SAVE10')['coupon_error'])
+
+    def test_buy_x_get_y_coupon(self):
+        coupon = Coupon.objects.create(
+            code='B3G1', name='Buy 3 get 1', discount_type='buy_x_get_y', discount_value=Decimal('0'),
+            buy_quantity=3, get_quantity=1,
+            valid_from=self.window['starts_at'], valid_until=self.window['ends_at'],
+        )
+        self.assertEqual(coupon.calculate_discount(Decimal('340'), items=self.lines), Decimal('40.00'))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, MAILGUN_API_KEY='', MAILGUN_DOMAIN='', ABANDONED_CART_EMAILS_PER_MINUTE=0)
+class AbandonedCartCampaignTests(TestCase):
+    """Test set-based abandoned cart marking and the batched, resumable reminder run"""
+
+    def setUp(self):
+        cache.clear()
+        product = Product.objects.create(
+            name='Stickers',
+            internal_code='STK-001',
+            auto_generate_code=False,
+            short_description='Vinyl stickers',
+            long_description='Vinyl stickers',
+            base_price=Decimal('5.00'),
+        )
+        self.carts = []
+        for i in range(5):
+            customer = Customer.objects.create(email=f'cart{i}@example.com', first_name=f'Cart<{i}>', last_name='Owner')
+            cart = Cart.objects.create(customer=customer)
+            CartItem.objects.create(cart=cart, product=product, product_name='Stickers', unit_price=Decimal('5'), quantity=10)
+            self.carts.append(cart)
+        # A fresh cart and an empty stale cart are left alone
+        Cart.objects.create(customer=Customer.objects.create(email='empty@example.com', first_name='E', last_name='Mpty'))
+        fresh = Cart.objects.create(customer=Customer.objects.create(email='fresh@example.com', first_name='F', last_name='Resh'))
+        CartItem.objects.create(cart=fresh, product=product, product_name='Stickers', unit_price=Decimal('5'), quantity=1)
+        Cart.objects.exclude(pk=fresh.pk).update(updated_at=timezone.now() - timedelta(hours=30))
+
+    def test_campaign_marks_in_one_update_and_sends_in_batches(self):
+        stats = cart_reminders.run_campaign(chunk_size=2)
+
+        self.assertEqual((stats['marked'], stats['sent'], stats['failed']), (5, 5, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f'cart{i}@example.com' for i in range(5)])
+        html = mail.outbox[0].alternatives[0][0]
+        self.assertIn('Cart&lt;0&gt;', html)
+        self.assertIn('10 x Stickers', html)
+        self.assertNotIn('%recipient.', html)
+
+        campaign = AbandonedCartCampaign.objects.get(pk=stats['campaign_id'])
+        self.assertEqual((campaign.status, campaign.sent_count, campaign.last_cart_id), ('completed', 5, self.carts[-1].pk))
+
+        # Nothing new: a second run sends nothing
+        mail.outbox = []
+        self.assertEqual(cart_reminders.run_campaign()['sent'], 0)
+        self.assertEqual(mail.outbox, [])
+
+    def test_interrupted_campaign_resumes_without_double_sending(self):
+        real_send = cart_reminders.send_batch
+        calls = []
+
+        def crash_on_second_batch(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return real_send(*args, **kwargs)
+
+        with mock.patch.object(cart_reminders, 'send_batch', side_effect=crash_on_second_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                cart_reminders.run_campaign(chunk_size=2)
+        self.assertEqual(len(mail.outbox), 2)
+
+        stats = cart_reminders.run_campaign(chunk_size=2)
+        campaign = AbandonedCartCampaign.objects.get()
+        # The batch that was claimed when the run died is not sent again
+        self.assertEqual(stats['sent'], 1)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['cart0@example.com', 'cart1@example.com', 'cart4@example.com'])
+        self.assertEqual((campaign.status, campaign.sent_count), ('completed', 3))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ChatbotMatchingTests(TestCase):
+    """Test the compiled intent matcher and the FAQ retrieval index"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_intents_match_whole_words_and_admin_keywords(self):
+        self.assertEqual(ChatbotService.detect_intent('Hi there'), 'greeting')
+        # 'hi' inside 'this' is not a greeting
+        self.assertEqual(ChatbotService.detect_intent('Is this printed on both sides?'), 'general')
+        self.assertEqual(ChatbotService.detect_intent('How much would a rush job cost?'), 'pricing')
+
+        with self.assertNumQueries(0):
+            ChatbotService.detect_intent('Hello')
+
+        ChatbotIntentKeyword.objects.create(intent='ordering', keyword='re-order', weight=3)
+        self.assertEqual(ChatbotService.detect_intent('Can I re-order last month\'s flyers at the same price?'), 'ordering')
+
+    def test_faq_retrieval_refreshes_on_content_change(self):
+        from clientapp.storefront_utils import ChatbotService as AssistantChatbot
+
+        reply = AssistantChatbot.handle_faq("What's your turnaround time?")
+        self.assertIn('Standard: 7 days', reply['response'])
+
+        product = Product.objects.create(
+            name='Banners', internal_code='BAN-001', auto_generate_code=False,
+            short_description='PVC banners', long_description='PVC banners', base_price=Decimal('20.00'),
+        )
+        self.assertEqual(chatbot.search('Are the banners waterproof?'), [])
+        ProductFAQ.objects.create(product=product, question='Are banners waterproof?', answer='Yes, PVC banners are waterproof.')
+
+        matches = chatbot.search('Are the banners waterproof?')
+        self.assertEqual(matches[0]['answer'], 'Yes, PVC banners are waterproof.')
+        self.assertEqual(AssistantChatbot.handle_faq('waterproof banner?')['response'], 'Yes, PVC banners are waterproof.')
+
+
+class FakeCarrier(fulfilment.CarrierClient):
+    """Carrier API stand-in: carrier_api_config['rate'] flat, else 100 per kg; records each request"""
+
+    def __init__(self):
+        self.calls = []
+
+    def rates(self, methods, parcel, destination):
+        self.calls.append((methods[0].carrier, tuple(m.pk for m in methods), parcel.weight_kg))
+        return {
+            method.pk: Decimal(str(method.carrier_api_config.get('rate', parcel.weight_kg * 100)))
+            for method in methods
+        }
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class FulfilmentQuoteTests(TestCase):
+    """Test parcel weights, all-method shipping quotes and memoized tax lookup"""
+
+    def setUp(self):
+        cache.clear()
+        self.carrier = FakeCarrier()
+        patcher = mock.patch.object(fulfilment, 'carrier_client', return_value=self.carrier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        products = []
+        for code in ('CRD-001', 'BOX-001'):
+            products.append(Product.objects.create(
+                name=code, internal_code=code, auto_generate_code=False,
+                short_description=code, long_description=code, base_price=Decimal('10.00'),
+            ))
+        self.cards, self.box = products
+        ProductShipping.objects.create(product=self.cards, shipping_weight=Decimal('500'), shipping_weight_unit='g')
+        # 40 x 30 x 20 cm = 4.8 kg volumetric, heavier than its 1 kg
+        ProductShipping.objects.create(
+            product=self.box, shipping_weight=Decimal('1'), package_length=Decimal('40'),
+            package_width=Decimal('30'), package_height=Decimal('20'),
+        )
+        self.lines = [(self.cards.pk, 4), (self.box.pk, 1)]
+
+        self.flat = ShippingMethod.objects.create(name='Pickup', flat_rate=Decimal('300'), is_default=True)
+        self.by_weight = ShippingMethod.objects.create(
+            name='Courier', pricing_type='weight_based', weight_rate_per_kg=Decimal('100'),
+        )
+        for name, rate in (('DHL Express', '950'), ('DHL Economy', '700')):
+            ShippingMethod.objects.create(
+                name=name, carrier='DHL', pricing_type='api', carrier_api_enabled=True,
+                carrier_api_config={'rate': rate},
+            )
+
+        customer = Customer.objects.create(email='ship@example.com', first_name='Sam', last_name='Shipper')
+        self.address = CustomerAddress.objects.create(
+            customer=customer, full_name='Sam Shipper', phone='0700000000', address_line_1='1 Road', city='Nairobi',
+        )
+        TaxConfiguration.objects.create(name='Kenya VAT', rate=Decimal('16'))
+
+    def test_quotes_every_method_with_real_weight(self):
+        quotes = fulfilment.FulfilmentQuoter().quote_all(self.lines, Decimal('1000'), destination=self.address)
+
+        self.assertEqual(
+            [(q['method_name'], q['shipping_cost']) for q in quotes],
+            [('Pickup', Decimal('300.00')), ('Courier', Decimal('680.00')), ('DHL Economy', Decimal('700.00')), ('DHL Express', Decimal('950.00'))],
+        )
+        self.assertEqual(quotes[0]['weight_kg'], Decimal('6.800'))
+        # Both DHL methods were priced in one carrier request
+        self.assertEqual(len(self.carrier.calls), 1)
+
+        # Another request: methods and carrier rates come from the shared cache
+        with self.assertNumQueries(1):
+            fulfilment.FulfilmentQuoter().quote_all(self.lines, Decimal('1000'), destination=self.address)
+        self.assertEqual(len(self.carrier.calls), 1)
+
+        ProductShipping.objects.filter(product=self.cards).update(free_shipping=True)
+        ProductShipping.objects.filter(product=self.box).update(free_shipping_threshold=Decimal('500'))
+        quote = fulfilment.FulfilmentQuoter().quote(self.lines, Decimal('1000'), shipping_method_id=self.by_weight.pk)
+        self.assertEqual(quote['shipping_cost'], Decimal('0.00'))
+
+    def test_checkout_taxes_the_discounted_amount(self):
+        now = timezone.now()
+        Coupon.objects.create(
+            code='TENOFF', name='10% off', discount_type='percentage', discount_value=Decimal('10'),
+            valid_from=now - timedelta(days=1), valid_until=now + timedelta(days=1),
+        )
+        cart = Cart.objects.create(customer=self.address.customer)
+        CartItem.objects.create(cart=cart, product=self.cards, product_name='Cards', unit_price=Decimal('10'), quantity=100)
+
+        request = APIRequestFactory().post(
+            f'/carts/{cart.pk}/checkout/', {'coupon_code': 'TENOFF', 'shipping_address_id': self.address.pk}, format='json',
+        )
+        response = CartViewSet.as_view({'post': 'checkout'})(request, pk=cart.pk)
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        # 16% of 1000 - 100
+        self.assertEqual((order.discount_amount, order.tax_amount, order.total_amount), (Decimal('100.00'), Decimal('144.00'), Decimal('1044.00')))
+
+    def test_tax_configuration_is_memoized_per_request(self):
+        quoter = fulfilment.FulfilmentQuoter()
+        self.assertEqual(quoter.tax(Decimal('1000'), self.address), (Decimal('160.00'), Decimal('16.00')))
+        with self.assertNumQueries(0):
+            quoter.tax(Decimal('250'), self.address)
+        self.assertEqual(quoter.tax(Decimal('1000'), None), (Decimal('0'), Decimal('0')))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ActivityFeedTests(TestCase):
+    """Test the activity feed projection and keyset-paginated entity feeds"""
+
+    def setUp(self):
+        cache.clear()
+        self.client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+        self.quote = Quote.objects.create(
+            client=self.client_record, product_name='Flyers', quantity=100, total_amount=Decimal('5000'),
+        )
+
+    def test_client_feed_merges_own_and_child_streams(self):
+        ActivityLog.objects.bulk_create([
+            ActivityLog(client=self.client_record, activity_type='Call', title='Intro call', description='Called'),
+            ActivityLog(
+                client=self.client_record, activity_type='Quote', title='Quote discussed', description='Sent',
+                related_quote=self.quote,
+            ),
+        ])
+        # Webhook lookup uses JSON containment, which SQLite lacks
+        with mock.patch.object(EventBus, '_trigger_webhooks'):
+            EventBus.emit_event('quote.sent', 'quote', self.quote.pk)
+        # The EventBus event is projected straight away; bulk-created history on catch-up
+        self.assertEqual(ActivityFeedEntry.objects.count(), 1)
+        self.assertEqual(activity_feed.catch_up()['activity'], 2)
+        self.assertEqual(activity_feed.catch_up()['activity'], 0)
+
+        entries, _ = activity_feed.feed('client', self.client_record.pk)
+        self.assertEqual({e.event_type for e in entries}, {'activity.call', 'activity.quote', 'quote.sent'})
+        quote_entries, _ = activity_feed.feed('quote', self.quote.pk)
+        self.assertEqual({e.event_type for e in quote_entries}, {'activity.quote', 'quote.sent'})
+        own_entries, _ = activity_feed.feed('client', self.client_record.pk, include_related=False)
+        self.assertEqual([e.event_type for e in own_entries], ['activity.call'])
+
+    def test_cursor_moves_past_rows_that_project_to_nothing(self):
+        AuditLog.objects.bulk_create([
+            AuditLog(action='LOGIN', model_name='User', object_id=None),
+            AuditLog(action='UPDATE', model_name='Setting', object_id='site-name'),
+        ])
+        self.assertEqual(activity_feed.catch_up(max_batches=1, batch_size=2)['audit'], 0)
+        self.assertEqual(activity_feed.get_cursor('audit'), AuditLog.objects.latest('pk').pk)
+
+        # One batch reaches the new row instead of rescanning the two above
+        quote_update = AuditLog.objects.create(action='UPDATE', model_name='Quote', object_id=str(self.quote.pk))
+        self.assertEqual(activity_feed.catch_up(max_batches=1, batch_size=2)['audit'], 1)
+        self.assertEqual(activity_feed.get_cursor('audit'), quote_update.pk)
+
+    def test_keyset_pagination_is_stable_across_equal_timestamps(self):
+        moment = timezone.now()
+        events = TimelineEvent.objects.bulk_create([
+            TimelineEvent(event_type='custom', entity_type='quote', entity_id=self.quote.pk, metadata={'n': n})
+            for n in range(5)
+        ])
+        TimelineEvent.objects.filter(pk__in=[e.pk for e in events]).update(timestamp=moment)
+        activity_feed.catch_up()
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = activity_feed.feed('quote', self.quote.pk, cursor=cursor, limit=2)
+            seen.extend(entry.metadata['n'] for entry in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [4, 3, 2, 1, 0])
+        with self.assertRaises(activity_feed.InvalidCursor):
+            activity_feed.feed('quote', self.quote.pk, cursor='not-a-cursor')
+
+    def test_months_are_partitions_and_pruning_drops_them(self):
+        ActivityLog.objects.bulk_create([
+            ActivityLog(client=self.client_record, activity_type='Call', title=f'Call {n}', description='Called')
+            for n in range(3)
+        ])
+        old, recent, _ = ActivityLog.objects.order_by('pk')
+        ActivityLog.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=400))
+        ActivityLog.objects.filter(pk=recent.pk).update(created_at=timezone.now() - timedelta(days=40))
+        activity_feed.catch_up()
+        # History older than the partitions waits in the DEFAULT partition
+        self.assertEqual(activity_feed.ensure_partitions(ahead=1), 4)
+        self.assertEqual(activity_feed.ensure_partitions(ahead=1), 0)
+        old_month = ActivityFeedEntry.objects.get(source_id=old.pk).month
+        self.assertIn(old_month, activity_feed.partitions())
+        self.assertEqual(ActivityFeedEntry.objects.count(), 3)
+
+        self.assertEqual(activity_feed.prune(retention_months=6), 1)
+        self.assertNotIn(old_month, activity_feed.partitions())
+        self.assertEqual(len(activity_feed.feed('client', self.client_record.pk)[0]), 2)
+        # The dropped row is projected again only by a rescan
+        self.assertEqual(activity_feed.catch_up()['activity'], 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RoleResolutionTests(TestCase):
+    """Test per-request and cached role resolution for permission checks"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('am', password='x')
+        self.managers = Group.objects.create(name='Account Manager')
+        self.client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+        self.request = mock.Mock(user=self.user)
+
+    def test_roles_resolved_once_per_request_and_cached_across_requests(self):
+        self.user.groups.add(self.managers)
+        ClientPortalUser.objects.create(user=self.user, client=self.client_record)
+        quote = Quote.objects.create(client=self.client_record, product_name='Flyers', quantity=100)
+
+        with self.assertNumQueries(2):
+            self.assertTrue(IsAccountManager().has_permission(self.request, None))
+            self.assertTrue(IsClient().has_permission(self.request, None))
+            self.assertTrue(IsClientOwner().has_object_permission(self.request, None, quote))
+            self.assertFalse(roles.has_group(self.user, 'Production Team'))
+
+        # A new request (fresh user object) is served from the shared cache
+        self.request.user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(IsAccountManager().has_permission(self.request, None))
+
+    def test_membership_and_profile_changes_invalidate(self):
+        self.assertFalse(IsAccountManager().has_permission(self.request, None))
+        self.user.groups.add(self.managers)
+        self.assertTrue(IsAccountManager().has_permission(self.request, None))
+
+        other = User.objects.get(pk=self.user.pk)
+        self.managers.user_set.remove(self.user)
+        self.assertFalse(roles.has_group(other, 'Account Manager'))
+
+        portal_user = ClientPortalUser.objects.create(user=self.user, client=self.client_record)
+        self.assertTrue(IsClient().has_permission(mock.Mock(user=User.objects.get(pk=self.user.pk)), None))
+        portal_user.is_active = False
+        portal_user.save()
+        self.assertFalse(IsClient().has_permission(mock.Mock(user=User.objects.get(pk=self.user.pk)), None))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class QuotesListTests(TestCase):
+    """Test the SQL-grouped quotes list"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('am', password='x', first_name='Alex')
+        self.user.groups.add(Group.objects.create(name='Account Manager'))
+        self.client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+
+    def add_quote(self, quote_id, lines, minutes_ago):
+        Quote.objects.bulk_create([
+            Quote(
+                quote_id=quote_id, client=self.client_record, created_by=self.user, product_name=f'Item {n}',
+                quantity=1, total_amount=total, production_cost=cost, status=status,
+                valid_until=timezone.now().date(),
+            )
+            for n, (total, cost, status) in enumerate(lines)
+        ])
+        Quote.objects.filter(quote_id=quote_id).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+
+    def get(self, **params):
+        request = RequestFactory().get('/quotes/', params)
+        request.user = self.user
+        request._messages = mock.Mock()
+        with mock.patch.object(views, 'render') as render:
+            views.quotes_list(request)
+        return render.call_args[0][2]
+
+    def test_groups_filters_and_summarizes_in_sql(self):
+        self.add_quote('QT-1', [(Decimal('100'), Decimal('60'), 'Approved'), (Decimal('100'), None, 'Draft')], 10)
+        self.add_quote('QT-2', [(Decimal('50'), Decimal('50'), 'Costed')], 5)
+
+        context = self.get()
+        self.assertEqual(context['total_quotes_count'], 2)
+        self.assertEqual(context['total_value'], Decimal('250'))
+        # (40% + 0%) / 2
+        self.assertAlmostEqual(float(context['avg_margin']), 35.0)
+        self.assertEqual([q['quote_number'] for q in context['quotes']], ['QT-2', 'QT-1'])
+        first = context['quotes'][1]
+        self.assertEqual((first['item_count'], first['approved_items'], first['total_value']), (2, 1, Decimal('200')))
+        self.assertEqual(first['account_manager'], 'Alex')
+
+        self.assertEqual([q['quote_number'] for q in self.get(status='Costed')['quotes']], ['QT-2'])
+        self.assertEqual([q['quote_number'] for q in self.get(search='acme')['quotes']], ['QT-2', 'QT-1'])
+        self.assertEqual(self.get(search='QT-1')['page_obj'].paginator.count, 1)
+
+    def test_query_count_does_not_grow_with_history(self):
+        for n in range(5):
+            self.add_quote(f'QT-{n}', [(Decimal('10'), Decimal('5'), 'Draft')] * 3, n)
+        self.get()
+        with CaptureQueriesContext(connection) as small:
+            self.get()
+        for n in range(5, 60):
+            self.add_quote(f'QT-{n}', [(Decimal('10'), Decimal('5'), 'Draft')] * 3, n)
+        with CaptureQueriesContext(connection) as large:
+            context = self.get()
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(context['quotes']), 25)
+        self.assertEqual(context['total_quotes_count'], 60)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ClientDashboardMetricsTests(TestCase):
+    """Test delta-maintained client dashboard metrics against the full recompute"""
+
+    def setUp(self):
+        cache.clear()
+        self.client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+
+    def order(self, total, status='submitted', **fields):
+        return ClientOrder.objects.create(
+            client=self.client_record, subtotal=total, total_amount=total, shipping_address='Nairobi',
+            status=status, **fields
+        )
+
+    def snapshot(self):
+        dashboard = ClientDashboard.objects.get(client=self.client_record)
+        return {field: getattr(dashboard, field) for field in client_dashboard.COUNTERS + client_dashboard.DERIVED}
+
+    def test_transitions_apply_deltas_matching_recompute(self):
+        first = self.order(Decimal('1000'), delivery_date=timezone.localdate() + timedelta(days=3))
+        second = self.order(Decimal('500'))
+        self.order(Decimal('200'), status='draft')
+        invoice = ClientInvoice.objects.create(
+            client=self.client_record, order=first, subtotal=Decimal('1000'), total_amount=Decimal('1000'),
+            balance_due=Decimal('1000'), status='issued', invoice_date=timezone.localdate(),
+            due_date=timezone.localdate(),
+        )
+
+        first.status = 'delivered'
+        first.save()
+        second = ClientOrder.objects.get(pk=second.pk)
+        second.status = 'cancelled'
+        second.save()
+        invoice.amount_paid, invoice.balance_due = Decimal('400'), Decimal('600')
+        invoice.save()
+
+        incremental = self.snapshot()
+        self.assertEqual(incremental['total_orders'], 3)
+        self.assertEqual(incremental['active_orders'], 0)
+        self.assertEqual(incremental['completed_orders'], 1)
+        self.assertEqual(incremental['total_spent'], Decimal('1000'))
+        self.assertEqual(incremental['pending_payment'], Decimal('600'))
+        self.assertEqual(incremental['on_time_delivery_rate'], Decimal('100'))
+
+        ClientDashboard.objects.filter(client=self.client_record).update(total_orders=99)
+        self.assertEqual(client_dashboard.refresh(), 1)
+        self.assertEqual(self.snapshot(), incremental)
+
+        second.delete()
+        self.assertEqual(self.snapshot()['total_orders'], 2)
+
+    def test_status_changes_only_write_changed_counters(self):
+        order = self.order(Decimal('1000'))
+        order = ClientOrder.objects.get(pk=order.pk)
+        order.status = 'in_production'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        dashboard_queries = [q['sql'] for q in queries if 'clientapp_clientdashboard' in q['sql']]
+        self.assertEqual(len(dashboard_queries), 0)  # active -> active changes no counter
+        order.status = 'delivered'
+        with CaptureQueriesContext(connection) as queries:
+            order.save()
+        dashboard_queries = [q['sql'] for q in queries if 'clientapp_clientdashboard' in q['sql']]
+        # counters, then the derived averages
+        self.assertEqual(len(dashboard_queries), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PAYMENT_WEBHOOK_SECRETS={'stripe': 'whsec_test', 'mpesa': 'mp-token'})
+class PaymentWebhookTests(TestCase):
+    """Test idempotent, order-tolerant payment callback ingestion"""
+
+    def setUp(self):
+        cache.clear()
+        customer = Customer.objects.create(email='payer@example.com', first_name='Pay', last_name='Er')
+        self.order = Order.objects.create(customer=customer, subtotal=Decimal('500'), total_amount=Decimal('500'))
+        self.payment = PaymentTransaction.objects.create(
+            order=self.order, customer=customer, payment_method='stripe', amount=Decimal('500'), transaction_id='TX-1',
+        )
+
+    def post(self, provider, body, headers, token=''):
+        url = reverse('payment-webhook', args=[provider]) + (f'?token={token}' if token else '')
+        extra = {f"HTTP_{name.upper().replace('-', '_')}": value for name, value in headers.items()}
+        return self.client.post(url, body, content_type='application/json', **extra)
+
+    def test_retries_and_out_of_order_events_apply_once(self):
+        gateway = payment_webhooks.FakeGateway('stripe')
+        body, headers, token = gateway.callback('TX-1', 'completed', event_id='evt_paid')
+        self.assertEqual(self.post('stripe', body, headers).json(), {'received': True, 'duplicate': False})
+        self.assertEqual(self.post('stripe', body, headers).json(), {'received': True, 'duplicate': True})
+        self.assertEqual(self.post('stripe', body, {'Stripe-Signature': 't=1,v1=forged'}).status_code, 400)
+        late_failure = gateway.callback('TX-1', 'failed', event_id='evt_failed')
+        self.post('stripe', late_failure[0], late_failure[1])
+
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 2)
+        self.assertEqual(payment_webhooks.process_pending(), {'applied': 1, 'stale': 1})
+        self.payment.refresh_from_db()
+        self.order.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual((self.order.status, self.order.payment_status), ('paid', 'completed'))
+        self.assertEqual(payment_webhooks.process_pending(), {})
+
+    def test_callback_before_transaction_is_retried(self):
+        body, headers, token = payment_webhooks.FakeGateway('mpesa').callback('ws_CO_42', 'completed')
+        self.assertEqual(self.post('mpesa', body, headers).status_code, 400)
+        self.assertEqual(self.post('mpesa', body, headers, token).json(), {'ResultCode': 0, 'ResultDesc': 'Accepted'})
+        self.assertEqual(payment_webhooks.process_pending(), {'retry': 1})
+
+        PaymentTransaction.objects.create(
+            order=self.order, customer=self.order.customer, payment_method='mpesa', amount=Decimal('500'),
+            transaction_id='ws_CO_42',
+        )
+        self.assertEqual(payment_webhooks.process_pending(), {'applied': 1})
+        event = PaymentWebhookEvent.objects.get()
+        self.assertEqual((event.outcome, event.attempts), ('applied', 2))
+
+    def test_unconfigured_provider_is_refused(self):
+        body = json.dumps({
+            'OrderTrackingId': 'trk-1', 'OrderMerchantReference': 'TX-1', 'OrderNotificationType': 'IPNCHANGE',
+        }).encode()
+        response = self.post('pesapal', body, {})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(PaymentWebhookEvent.objects.exists())
+
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.post('pesapal', body, {}).status_code, 200)
+        self.assertEqual(PaymentWebhookEvent.objects.count(), 1)
+
+    @override_settings(PAYMENT_WEBHOOK_SECRETS={'pesapal': 'ipn-token'})
+    def test_pesapal_status_is_looked_up_before_applying(self):
+        PaymentTransaction.objects.create(
+            order=self.order, customer=self.order.customer, payment_method='pesapal', amount=Decimal('500'),
+            transaction_id='PP-1',
+        )
+        gateway = payment_webhooks.FakeGateway('pesapal')
+        body, headers, token = gateway.callback('PP-1', 'pending')
+        self.assertNotIn(b'status', body.lower())
+        self.assertEqual(self.post('pesapal', body, headers, token).json(), {
+            'orderNotificationType': 'IPNCHANGE', 'orderTrackingId': 'trk-PP-1', 'orderMerchantReference': 'PP-1',
+            'status': 200,
+        })
+
+        with mock.patch.object(payment_webhooks, 'pesapal_transaction_status', side_effect=gateway.transaction_status):
+            # Still pending at Pesapal: kept for a later run
+            self.assertEqual(payment_webhooks.process_pending(), {'retry': 1})
+            # The order's next IPN is the same event, not a new one
+            body, headers, token = gateway.callback('PP-1', 'completed')
+            self.post('pesapal', body, headers, token)
+            self.assertEqual(payment_webhooks.process_pending(), {'applied': 1})
+            event = PaymentWebhookEvent.objects.get()
+            self.assertEqual((event.event_id, event.status), ('trk-PP-1', 'completed'))
+
+            # Another IPN after processing looks the status up again
+            self.post('pesapal', body, headers, token)
+            self.assertEqual(payment_webhooks.process_pending(), {'duplicate': 1})
+        payment = PaymentTransaction.objects.get(transaction_id='PP-1')
+        self.assertEqual((payment.status, payment.gateway_response['status_code']), ('completed', 1))
+
+
+@override_settings(CACHES=LOCMEM_CACHE, LEAD_DEFAULT_COUNTRY_CODE='254')
+class LeadDedupTests(TestCase):
+    """Test normalized lead match keys, ranked candidates and batched merges"""
+
+    def test_keys_normalize_and_candidates_rank_in_one_query(self):
+        self.assertEqual(lead_dedup.canonical_email(' Jane.Doe+print@GoogleMail.com '), 'janedoe@gmail.com')
+        self.assertEqual(lead_dedup.canonical_phone('0712 345 678'), '+254712345678')
+        self.assertEqual(lead_dedup.canonical_phone('+254-712-345-678'), '+254712345678')
+        self.assertEqual(lead_dedup.name_key('Anne Smyth'), lead_dedup.name_key('smith, Ann Ltd'))
+
+        exact = Lead.objects.create(name='Jane Doe', email='janedoe@gmail.com', phone='0712345678')
+        by_phone = Lead.objects.create(name='J. Doe Printing', phone='+254712345678')
+        by_name = Lead.objects.create(name='Jayne Doe', phone='0799000000')
+        Lead.objects.create(name='Someone Else', phone='0711111111')
+
+        with self.assertNumQueries(1):
+            matches = lead_dedup.candidates(name='Jane Doe', email='Jane.Doe@gmail.com', phone='712345678')
+        self.assertEqual([lead.pk for lead in matches], [exact.pk, by_phone.pk, by_name.pk])
+        self.assertEqual([lead.match_score for lead in matches], [9, 3, 2])
+
+        lead, created = lead_dedup.find_or_create('Jane D', email='janedoe+quotes@gmail.com', source='Website')
+        self.assertEqual((lead.pk, created), (exact.pk, False))
+        self.assertTrue(lead_dedup.find_or_create('Jayne Doe', phone='0700000009')[1])
+        # A shared phone alone is not the same person
+        self.assertTrue(lead_dedup.find_or_create('J. Doe Printing', phone='0712345678')[1])
+
+    def test_name_typos_soundex_misses_match_by_trigram(self):
+        self.assertNotEqual(lead_dedup.name_key('Katherine Mwagni'), lead_dedup.name_key('Catherine Mwangi'))
+        lead = Lead.objects.create(name='Catherine Mwangi', phone='0712000001')
+        closer = Lead.objects.create(name='Katherine Mwangi', phone='0712000002')
+        Lead.objects.create(name='Peter Otieno', phone='0712000003')
+
+        with self.assertNumQueries(1):
+            matches = lead_dedup.candidates(name='Katherine Mwagni')
+        self.assertEqual([match.pk for match in matches], [closer.pk, lead.pk])
+        self.assertEqual({match.match_score for match in matches}, {lead_dedup.NAME_SCORE})
+
+    def test_merge_moves_references_in_batches(self):
+        user = User.objects.create_user('am', password='x')
+        keep = Lead.objects.create(name='Acme', email='buyer@acme.co.ke', phone='0700000001')
+        duplicates = [
+            Lead.objects.create(name='Acme Ltd', email='Buyer@Acme.co.ke', phone='0700000002', notes='Wants banners'),
+            Lead.objects.create(name='ACME', phone='+254700000001', product_interest='Flyers'),
+        ]
+        Lead.objects.filter(pk=keep.pk).update(email_key='', phone_key='', name_key=None)  # saved before the keys existed
+        for lead in duplicates:
+            Notification.objects.create(
+                recipient=user, notification_type='lead_created', title='New', message='x', related_lead=lead,
+            )
+        converted = Client.objects.create(name='Acme', phone='0700000001', converted_from_lead=duplicates[1])
+
+        result = lead_dedup.merge_duplicates(batch_size=1)
+        self.assertEqual(result, {'reindexed': 1, 'email_key': 1, 'phone_suggestions': 1})
+        # The phone-only match is kept and reported for review
+        self.assertEqual(sorted(Lead.objects.values_list('pk', flat=True)), [keep.pk, duplicates[1].pk])
+        self.assertEqual(lead_dedup.phone_matches(), [[keep.pk, duplicates[1].pk]])
+        self.assertEqual(Notification.objects.filter(related_lead=keep).count(), 1)
+        converted.refresh_from_db()
+        self.assertEqual(converted.converted_from_lead_id, duplicates[1].pk)
+        keep.refresh_from_db()
+        self.assertIn('Wants banners', keep.notes)
+
+        # A name with no Latin letters keys to '' and is indexed only once
+        Lead.objects.create(name='Иван', phone='0733000000')
+        self.assertEqual(lead_dedup.reindex(), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class JobDetailReadModelTests(TestCase):
+    """Test the cached, prefetched job detail view-model"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('pt', password='x', first_name='Pat')
+        self.client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+        self.job = Job.objects.create(
+            client=self.client_record, job_name='Flyers', job_type='printing', product='Flyers', quantity=500,
+            status='in_progress', created_by=self.user,
+        )
+        Job.objects.create(client=self.client_record, job_name='Cards', job_type='printing', product='Cards', quantity=100)
+        self.vendor = Vendor.objects.create(name='PrintCo', email='print@example.com', phone='0700000002')
+
+    def add_stage(self, order, status, progress=0):
+        return JobVendorStage.objects.create(
+            job=self.job, vendor=self.vendor, stage_order=order, stage_name=f'Stage {order}', status=status,
+            progress=progress,
+        )
+
+    def test_fixed_queries_then_cached(self):
+        for n in range(3):
+            self.add_stage(n + 1, 'completed' if n == 0 else 'pending')
+            JobNote.objects.create(job=self.job, content=f'Note {n}', created_by=self.user)
+
+        with self.assertNumQueries(7):  # job + five prefetches + the client's job list
+            detail = job_detail.job_detail(self.job.pk)
+        self.assertEqual(detail['overall_progress'], 33)
+        self.assertEqual(detail['primary_vendor'].name, 'PrintCo')
+        self.assertEqual(len(detail['notes']), 3)
+        self.assertEqual(detail['job_stats']['total'], 2)
+        self.assertEqual([job['is_current'] for job in detail['client_jobs']], [False, True])
+
+        with self.assertNumQueries(0):
+            again = job_detail.job_detail(self.job.pk)
+        self.assertEqual(again['notes'][0].created_by.first_name, 'Pat')
+        self.assertIsNone(job_detail.job_detail(0))
+
+    def test_related_changes_bump_the_job_version(self):
+        stage = self.add_stage(1, 'in_production', progress=50)
+        self.assertEqual(job_detail.job_detail(self.job.pk)['overall_progress'], 50)
+
+        stage.progress = 80
+        stage.save()
+        JobNote.objects.create(job=self.job, content='Proof approved', created_by=self.user)
+        detail = job_detail.job_detail(self.job.pk)
+        self.assertEqual(detail['overall_progress'], 80)
+        self.assertEqual(detail['notes'][0].content, 'Proof approved')
+
+        self.vendor.name = 'PrintCo Ltd'
+        self.vendor.save()
+        self.assertEqual(job_detail.job_detail(self.job.pk)['primary_vendor'].name, 'PrintCo Ltd')
+
+        sibling = Job.objects.exclude(pk=self.job.pk).get()
+        sibling.status = 'completed'
+        sibling.save()
+        self.assertEqual(job_detail.job_detail(self.job.pk)['job_stats']['completed'], 1)
+
+        self.client.force_login(self.user)
+        response = self.client.get(f'/job/{self.job.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'PrintCo Ltd')
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class JobSocketTests(TransactionTestCase):
+    """Test the async job WebSocket consumer and the connection storm benchmark"""
+    # Committed data: the consumer closes old connections on connect, which would end a test transaction
+
+    def setUp(self):
+        cache.clear()
+        self.assignee = User.objects.create_user('pt', password='x', first_name='Pat')
+        self.outsider = User.objects.create_user('outsider', password='x')
+        client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+        self.job = Job.objects.create(
+            client=client_record, job_name='Flyers', job_type='printing', product='Flyers', quantity=500,
+            person_in_charge=self.assignee,
+        )
+
+    async def connect(self, user):
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+        from clientapp.routing import websocket_urlpatterns
+
+        path = f'/ws/jobs/{self.job.pk}/'
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+            'type': 'websocket', 'path': path, 'query_string': b'', 'headers': [], 'subprotocols': [], 'user': user,
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        messages = [await communicator.receive_output(5)]
+        if messages[0]['type'] == 'websocket.accept':
+            messages.append(await communicator.receive_output(5))
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+        return messages
+
+    def test_snapshot_and_access_come_from_cache(self):
+        accepted, initial = async_to_sync(self.connect)(self.assignee)
+        self.assertEqual(accepted['type'], 'websocket.accept')
+        data = json.loads(initial['text'])['data']
+        self.assertEqual((data['id'], data['person_in_charge']), (self.job.pk, 'Pat'))
+        self.assertEqual(async_to_sync(self.connect)(self.outsider)[0]['type'], 'websocket.close')
+
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(self.connect)(self.assignee)
+        self.assertEqual(len(queries), 0)
+
+        self.job.person_in_charge = self.outsider
+        self.job.save()
+        self.assertEqual(async_to_sync(self.connect)(self.outsider)[0]['type'], 'websocket.accept')
+
+    def test_storm_benchmark_reports_time_to_first_message(self):
+        out = io.StringIO()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = f'{directory}/storm.json'
+        call_command('wsloadtest', job_id=self.job.pk, username='pt', connections=50, cold=True, save=path, stdout=out)
+        with open(path) as fh:
+            results = json.load(fh)['results']
+        self.assertEqual((results['accepted'], results['rejected'], results['timeouts']), (50, 0, 0))
+        self.assertIn('first message p99 ms', out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ProgressStreamTests(TransactionTestCase):
+    """Test delta publishing, resume and the coalescing progress socket"""
+    # Committed data: the async wrappers read it from pool threads
+
+    def setUp(self):
+        cache.clear()
+        self.assignee = User.objects.create_user('pt', password='x', first_name='Pat')
+        self.outsider = User.objects.create_user('outsider', password='x')
+        client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+        self.job = Job.objects.create(
+            client=client_record, job_name='Flyers', job_type='printing', product='Flyers', quantity=500,
+            person_in_charge=self.assignee,
+        )
+        # Start every test from an empty stream state, whatever the create published
+        cache.clear()
+
+    def test_publish_sends_changed_fields_and_resumes_from_sequence(self):
+        first = progress_stream.publish('job', self.job.pk, {'vendor_progress': 10, 'vendor_status': 'on_schedule'})
+        self.assertIsNone(progress_stream.publish('job', self.job.pk, {'vendor_progress': 10}))
+        second = progress_stream.publish('job', self.job.pk, {'vendor_progress': 40, 'vendor_status': 'on_schedule'})
+        self.assertEqual((second['seq'], second['changes']), (first['seq'] + 1, {'vendor_progress': 40}))
+
+        seq, changes, reset = progress_stream.changes_since('job', self.job.pk, first['seq'])
+        self.assertEqual((seq, changes, reset), (second['seq'], {'vendor_progress': 40}, False))
+        for since in (None, 0, second['seq'] + 5):
+            seq, changes, reset = progress_stream.changes_since('job', self.job.pk, since)
+            self.assertTrue(reset)
+            self.assertEqual(changes, {'vendor_progress': 40, 'vendor_status': 'on_schedule'})
+
+        # An evicted state is rebuilt from the database
+        cache.clear()
+        seq, changes, reset = progress_stream.changes_since('job', self.job.pk, second['seq'])
+        self.assertTrue(reset)
+        self.assertEqual((changes['job_number'], changes['status']), (self.job.job_number, self.job.status))
+        self.assertIsNone(progress_stream.changes_since('po', 999999))
+
+    def test_saves_are_published_by_a_worker_once_per_transaction(self):
+        from clientapp.tasks import publish_progress
+
+        with mock.patch('clientapp.tasks.publish_progress.delay') as delay:
+            with transaction.atomic():
+                self.job.status = 'in_progress'
+                self.job.save()
+                self.job.save()
+            self.assertEqual(delay.call_args_list, [mock.call('job', self.job.pk)])
+        # Nothing was published in the saving thread
+        self.assertIsNone(cache.get(f'progress-stream:job:{self.job.pk}'))
+
+        publish_progress('job', self.job.pk)
+        seq, changes, reset = progress_stream.changes_since('job', self.job.pk)
+        self.assertEqual((changes['status'], changes['progress']), ('in_progress', 50))
+
+    async def stream(self, user, *published):
+        from asgiref.testing import ApplicationCommunicator
+        from channels.routing import URLRouter
+        from clientapp.routing import websocket_urlpatterns
+
+        communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+            'type': 'websocket', 'path': '/ws/progress/', 'query_string': b'', 'headers': [], 'subprotocols': [],
+            'user': user,
+        })
+        await communicator.send_input({'type': 'websocket.connect'})
+        self.assertEqual((await communicator.receive_output(5))['type'], 'websocket.accept')
+        await communicator.send_input({'type': 'websocket.receive', 'text': json.dumps({
+            'action': 'subscribe', 'entities': [{'type': 'job', 'id': self.job.pk}, {'type': 'bogus', 'id': 1}],
+        })})
+        frames = [json.loads((await communicator.receive_output(5))['text'])]
+        for fields in published:
+            await progress_stream.apublish('job', self.job.pk, fields)
+        if published:
+            frames.append(json.loads((await communicator.receive_output(5))['text']))
+        await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+        await communicator.wait(5)
+        return frames
+
+    def test_socket_coalesces_deltas_for_authorized_subscribers(self):
+        initial, coalesced = async_to_sync(self.stream)(
+            self.assignee, {'vendor_progress': 10}, {'vendor_progress': 30, 'vendor_status': 'behind'},
+        )
+        self.assertEqual((initial['entity'], initial['reset']), (f'job:{self.job.pk}', True))
+        self.assertEqual(initial['changes']['person_in_charge'], 'Pat')
+        self.assertEqual(coalesced['seq'], initial['seq'] + 2)
+        self.assertEqual((coalesced['changes'], coalesced['reset']), ({'vendor_progress': 30, 'vendor_status': 'behind'}, False))
+
+        denied, = async_to_sync(self.stream)(self.outsider)
+        self.assertEqual((denied['type'], denied['error']), ('error', 'forbidden'))
+
+    def test_malformed_messages_get_an_error_frame(self):
+        async def send(*messages):
+            from asgiref.testing import ApplicationCommunicator
+            from channels.routing import URLRouter
+            from clientapp.routing import websocket_urlpatterns
+
+            communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), {
+                'type': 'websocket', 'path': '/ws/progress/', 'query_string': b'', 'headers': [], 'subprotocols': [],
+                'user': self.assignee,
+            })
+            await communicator.send_input({'type': 'websocket.connect'})
+            await communicator.receive_output(5)
+            frames = []
+            for message in messages:
+                await communicator.send_input({'type': 'websocket.receive', 'text': message})
+                frames.append(json.loads((await communicator.receive_output(5))['text']))
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait(5)
+            return frames
+
+        frames = async_to_sync(send)(
+            '[1, 2]',
+            'not json',
+            json.dumps({'action': 'subscribe', 'entities': ['job:1']}),
+        )
+        self.assertEqual([frame['error'] for frame in frames], ['invalid message', 'invalid message', 'invalid entity'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ChunkedTaskTests(TestCase):
+    """Test key-range chunking, checkpoints, the concurrency cap and a chunked periodic job"""
+
+    def setUp(self):
+        cache.clear()
+        self.leads = [Lead.objects.create(name=f'Lead {n}', phone=f'07000000{n:02d}') for n in range(7)]
+        self.seen = []
+        self.fail_on = {self.leads[4].pk}
+        self.always_fail = set()
+        self.addCleanup(chunked_tasks.JOBS.pop, 'test-leads', None)
+
+    def register(self, **options):
+        def process(leads):
+            for lead in leads:
+                if lead.pk in self.fail_on:
+                    if lead.pk not in self.always_fail:
+                        self.fail_on.discard(lead.pk)
+                    raise RuntimeError('worker lost')
+                self.seen.append(lead.pk)
+            return {'seen': len(leads)}
+        chunked_tasks.register('test-leads', lambda: Lead.objects.all(), **options)(process)
+
+    def test_failed_chunk_is_retried_from_checkpoint_in_the_same_run(self):
+        self.register(chunk_size=3, batch_size=1)
+        summary = chunked_tasks.start('test-leads', inline=True)
+        self.assertEqual((summary['chunks'], summary['completed']), (3, True))
+        self.assertEqual((summary['rows'], summary['metrics'], summary['failed_chunks']), (7, {'seen': 7}, 0))
+        retried = ChunkedTaskChunk.objects.get(index=1)
+        self.assertEqual((retried.status, retried.attempts, retried.error), ('done', 2, ''))
+        self.assertEqual(sorted(self.seen), [lead.pk for lead in self.leads])
+
+    def test_chunk_failing_every_attempt_is_given_up(self):
+        self.register(chunk_size=3, batch_size=1)
+        self.always_fail = set(self.fail_on)
+        summary = chunked_tasks.start('test-leads', inline=True)
+        self.assertEqual((summary['completed'], summary['failed_chunks'], summary['rows']), (True, 1, 5))
+        failed = ChunkedTaskChunk.objects.get(status='failed')
+        self.assertEqual((failed.index, failed.last_pk, failed.attempts), (1, self.leads[3].pk, chunked_tasks.MAX_ATTEMPTS))
+
+    def test_chunks_are_queued_up_to_the_concurrency_cap(self):
+        self.fail_on = set()
+        self.register(chunk_size=2, max_concurrency=2)
+        with mock.patch('clientapp.tasks.run_task_chunk.apply_async') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                summary = chunked_tasks.start('test-leads')
+            self.assertEqual((summary['chunks'], summary['queued'], delay.call_count), (4, 2, 2))
+
+            # Each finished chunk queues the next one, never more than two in flight
+            processed = 0
+            while processed < delay.call_count:
+                with self.captureOnCommitCallbacks(execute=True):
+                    chunked_tasks.run_chunk(delay.call_args_list[processed].args[0][0])
+                processed += 1
+                self.assertLessEqual(ChunkedTaskChunk.objects.filter(status__in=('queued', 'running')).count(), 2)
+            self.assertEqual(processed, 4)
+            # A redelivered task finds its chunk already done
+            self.assertIsNone(chunked_tasks.run_chunk(delay.call_args_list[0].args[0][0]))
+        run = ChunkedTaskRun.objects.get(pk=summary['run'])
+        self.assertEqual((run.status, run.rows, run.metrics), ('completed', 7, {'seen': 7}))
+
+    def test_deadline_reminders_are_sent_once_per_day(self):
+        assignee = User.objects.create_user('pt', password='x')
+        client_record = Client.objects.create(name='Acme Ltd', phone='0700000001')
+        for name in ('Flyers', 'Banners'):
+            Job.objects.create(
+                client=client_record, job_name=name, job_type='printing', product=name, quantity=100,
+                person_in_charge=assignee, expected_completion=timezone.now().date() + timedelta(days=2),
+            )
+        first = chunked_tasks.start('job-deadline-reminders', inline=True)
+        self.assertEqual(first['metrics'], {'reminders_sent': 2, 'already_reminded': 0})
+        second = chunked_tasks.start('job-deadline-reminders', inline=True)
+        self.assertEqual(second['metrics'], {'reminders_sent': 0, 'already_reminded': 2})
+        self.assertEqual(Notification.objects.filter(recipient=assignee, notification_type='job_deadline_reminder').count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class TaskRoutingTests(TestCase):
+    """Test Celery queue routing and the queue latency benchmark"""
+
+    def test_customer_email_and_bulk_work_use_separate_pools(self):
+        from client.celery import app
+        from django.conf import settings
+
+        def queue(name, **options):
+            return app.amqp.router.route(options, name)['queue'].name
+
+        pools = {q: pool for pool, queues in settings.CELERY_WORKER_POOLS.items() for q in queues}
+        self.assertEqual(queue('clientapp.tasks.send_email_async'), 'email')
+        self.assertEqual(queue('clientapp.tasks.celery_sync_completed_pos_to_qb'), 'integrations')
+        self.assertEqual(queue('clientapp.tasks.run_task_chunk', queue='integrations'), 'integrations')
+        self.assertEqual(queue('clientapp.tasks.process_product_image'), 'media')
+        self.assertEqual(pools['media'], pools['integrations'])
+        self.assertNotEqual(pools['email'], pools['integrations'])
+        self.assertNotEqual(pools['realtime'], pools['reports'])
+
+    def test_benchmark_reports_email_wait_during_a_sync(self):
+        out = io.StringIO()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = f'{directory}/queues.json'
+        call_command('queuebench', records=400, batch_size=100, emails=5, email_interval_ms=1, save=path, stdout=out)
+        with open(path) as fh:
+            results = json.load(fh)['results']
+        self.assertEqual(results['emails_started'], 5)
+        self.assertIn('email wait p95 ms', out.getvalue())
@@ -11,7 +11,7 @@ from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.db.models import Avg, Count, Q, Sum
 from django.urls import reverse
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
@@ -151,6 +151,8 @@ def notification_count_processor(request):
     return {'unread_notifications_count': 0}
 
 from clientapp.quote_approval_services import QuoteApprovalService
+from clientapp.services.roles import has_group
+from clientapp.services import job_detail as job_detail_service
 def send_quote_email(quote_id, request):
     """
     Send quote to client via email with approval link
@@ -191,13 +193,13 @@ def group_required(group_name, allow_superuser=False):
                 return redirect(f"{login_url}?next={request.get_full_path()}")
             if allow_superuser and user.is_superuser:
                 return view_func(request, *args, **kwargs)
-            if user.groups.filter(name=group_name).exists():
+            if has_group(user, group_name):
                 return view_func(request, *args, **kwargs)
 
             messages.warning(request, "You don't have access to that section.")
-            if user.groups.filter(name='Production Team').exists():
+            if has_group(user, 'Production Team'):
                 return redirect(reverse('production2_dashboard'))
-            elif user.groups.filter(name='Account Manager').exists():
+            elif has_group(user, 'Account Manager'):
                 return redirect(reverse('dashboard'))
             else:
                 # User has no recognized group → send to login
@@ -294,7 +296,7 @@ def group_required(group_name, allow_superuser=False):
                 return redirect(f"{login_url}?next={request.get_full_path()}")
             if allow_superuser and user.is_superuser:
                 return view_func(request, *args, **kwargs)
-            if user.groups.filter(name=group_name).exists():
+            if has_group(user, group_name):
                 return view_func(request, *args, **kwargs)
 
             #redirect instead of 403
@@ -302,9 +304,9 @@ def group_required(group_name, allow_superuser=False):
 
             # Determine best fallback based on user's groups
             fallback_name = 'dashboard'
-            if user.groups.filter(name='Production Team').exists():
+            if has_group(user, 'Production Team'):
                 fallback_name = 'production2_dashboard'
-            elif user.groups.filter(name='Account Manager').exists():
+            elif has_group(user, 'Account Manager'):
                 fallback_name = 'dashboard'
 
             return redirect(reverse(fallback_name))
@@ -705,7 +707,7 @@ def create_multi_quote(request):
 def analytics(request):
     """Vendor Performance Analytics Dashboard"""
     # Check permission
-    if not (request.user.groups.filter(name='Account Manager').exists() or request.user.is_superuser):
+    if not has_group(request.user, 'Account Manager', allow_superuser=True):
         return redirect('login')
     
     context = {
@@ -1168,7 +1170,10 @@ def api_send_job_message(request, job_id):
 def api_get_job_details(request, job_id):
     """API endpoint to get job details for modal"""
     try:
-        job = Job.objects.get(pk=job_id)
+        detail = job_detail_service.job_detail(job_id, include_client_jobs=False)
+        if detail is None:
+            raise Job.DoesNotExist
+        job = detail['job']
         
         # Calculate metrics
         days_until = (job.expected_completion - timezone.now().date()).days if job.expected_completion else 0
@@ -1509,31 +1514,25 @@ def api_job_progress(request, job_id):
     POST: Only Account Managers or the assigned PT user can add updates
     """
     try:
-        job = Job.objects.get(pk=job_id)
-        
         if request.method == 'GET':
             # Get progress updates (anyone logged in can view)
-            updates = ProductionUpdate.objects.filter(
-                job=job,
-                update_type='job'
-            ).values(
-                'id', 'status', 'progress', 'notes', 
-                'created_by__first_name', 'created_by__last_name', 'created_at'
-            ).order_by('-created_at')
+            detail = job_detail_service.job_detail(job_id, include_client_jobs=False)
+            if detail is None:
+                raise Job.DoesNotExist
+            updates = [u for u in detail['production_updates'] if u.update_type == 'job']
             
-            # Calculate overall progress (average of all updates, or latest)
-            latest = updates.first() if updates.exists() else None
-            overall_progress = latest['progress'] if latest else 0
+            # Overall progress is the latest update's
+            overall_progress = updates[0].progress if updates else 0
             
             updates_list = [
                 {
-                    'id': u['id'],
-                    'status': u['status'],
-                    'status_display': dict(ProductionUpdate.UPDATE_TYPE_CHOICES).get(u['status'], u['status']),
-                    'progress': u['progress'],
-                    'notes': u['notes'],
-                    'created_by': f"{u['created_by__first_name']} {u['created_by__last_name']}".strip() if u['created_by__first_name'] else 'Unknown',
-                    'created_at': u['created_at'].strftime('%b %d, %Y %I:%M %p')
+                    'id': u.id,
+                    'status': u.status,
+                    'status_display': dict(ProductionUpdate.UPDATE_TYPE_CHOICES).get(u.status, u.status),
+                    'progress': u.progress,
+                    'notes': u.notes,
+                    'created_by': f"{u.created_by.first_name} {u.created_by.last_name}".strip() if u.created_by and u.created_by.first_name else 'Unknown',
+                    'created_at': u.created_at.strftime('%b %d, %Y %I:%M %p')
                 }
                 for u in updates
             ]
@@ -1545,9 +1544,10 @@ def api_job_progress(request, job_id):
             })
         
         elif request.method == 'POST':
+            job = Job.objects.get(pk=job_id)
+            
             # Check permissions: Only AM or the assigned PT user can add progress
-            user_groups = request.user.groups.values_list('name', flat=True)
-            is_account_manager = 'Account Manager' in user_groups
+            is_account_manager = has_group(request.user, 'Account Manager')
             is_assigned_user = job.person_in_charge and job.person_in_charge.id == request.user.id
             
             if not (is_account_manager or is_assigned_user):
@@ -2000,22 +2000,16 @@ def client_list(request):
 
 
 def check_duplicate_lead(request):
-    """Check for duplicate leads - AJAX endpoint"""
-    name = request.GET.get('name', '')
-    email = request.GET.get('email', '')
-    phone = request.GET.get('phone', '')
-    
-    # Check only for the provided field (not all three)
-    if email:
-        duplicate = Lead.objects.filter(email__iexact=email).first()
-    elif phone:
-        duplicate = Lead.objects.filter(phone=phone).first()
-    elif name:
-        duplicate = Lead.objects.filter(name__iexact=name).first()
-    else:
-        duplicate = None
-    
-    if duplicate:
+    """Check for duplicate leads - AJAX endpoint (ranked fuzzy matches on name, email and phone)"""
+    from .services.lead_dedup import candidates
+
+    matches = candidates(
+        name=request.GET.get('name', ''),
+        email=request.GET.get('email', ''),
+        phone=request.GET.get('phone', ''),
+    )
+    if matches:
+        duplicate = matches[0]
         return JsonResponse({
             'duplicate': True,
             'id': duplicate.id,
@@ -2023,7 +2017,11 @@ def check_duplicate_lead(request):
             'lead_id': duplicate.lead_id,
             'email': duplicate.email,
             'phone': duplicate.phone,
-            'message': f'Similar lead found: {duplicate.name} ({duplicate.lead_id})'
+            'message': f'Similar lead found: {duplicate.name} ({duplicate.lead_id})',
+            'candidates': [
+                {'id': lead.id, 'lead_id': lead.lead_id, 'name': lead.name, 'score': lead.match_score}
+                for lead in matches
+            ],
         })
     return JsonResponse({'duplicate': False})
 
@@ -2250,7 +2248,7 @@ def quote_create(request):
                     return redirect('quotes_list')
                 
                 # Check if quote is locked (sent to PT for costing)
-                if existing_quote.status == 'Sent to PT' and request.user.groups.filter(name='Account Manager').exists():
+                if existing_quote.status == 'Sent to PT' and has_group(request.user, 'Account Manager'):
                     messages.error(request, f'Quote {quote_group_id} is locked. Production Team is currently costing this quote. Please wait for costing to complete before editing.')
                     return redirect('quote_detail', quote_id=quote_group_id)
             else:
@@ -2822,7 +2820,7 @@ def quote_detail(request, quote_id):
     can_send_to_pt, send_to_pt_error = quote.can_send_to_pt()
     
     # Check if quote is locked (sent to PT) - Account Managers cannot edit when sent to PT
-    is_locked = quote.status == 'Sent to PT' and request.user.groups.filter(name='Account Manager').exists()
+    is_locked = quote.status == 'Sent to PT' and has_group(request.user, 'Account Manager')
     
     # Pass error message to template
     context = {
@@ -2934,93 +2932,96 @@ def handle_quote_approval(request, quote_id):
 @group_required('Account Manager')
 def quotes_list(request):
     """List all quotes with filters"""
-    from decimal import Decimal
     from datetime import datetime, timedelta
-    
-    all_quotes = Quote.objects.select_related('client', 'lead', 'created_by').order_by('-created_at')
-    
-    # Group quotes by quote_id
-    quotes_dict = {}
-    for quote in all_quotes:
-        if quote.quote_id not in quotes_dict:
-            # Determine client name
-            client_name = '-'
-            if quote.client:
-                client_name = quote.client.name
-            elif quote.lead:
-                client_name = quote.lead.name
-            
-            # Determine account manager
-            account_manager = '-'
-            if quote.created_by:
-                account_manager = quote.created_by.get_full_name() or quote.created_by.username
-            
-            # Calculate valid until date (30 days from creation)
-            valid_until = quote.created_at + timedelta(days=30)
-            days_remaining = (valid_until.date() - datetime.now().date()).days
-            
-            quotes_dict[quote.quote_id] = {
-                'id': quote.id,
-                'quote_number': quote.quote_id,
-                'client_name': client_name,
-                'account_manager': account_manager,
-                'item_count': 0,
-                'approved_items': 0,
-                'total_value': Decimal('0'),
-                'total_cost': Decimal('0'),
-                'margin': 0,
-                'status': quote.status,
-                'created_date': quote.created_at.strftime('%b %d, %Y'),
-                'valid_until': valid_until.strftime('%b %d, %Y'),
-                'days_remaining': days_remaining,
-            }
-        
-        # Increment counters
-        quotes_dict[quote.quote_id]['item_count'] += 1
-        quotes_dict[quote.quote_id]['total_value'] += quote.total_amount
-        if quote.production_cost: 
-            quotes_dict[quote.quote_id]['total_cost'] += quote.production_cost
-        # Count approved items
-        if quote.status == 'Approved':
-            quotes_dict[quote.quote_id]['approved_items'] += 1
-        
-        # Calculate margin 
-        if quote.unit_price > 0:
-            
-            quotes_dict[quote.quote_id]['margin'] = 25.0
-        for q in quotes_dict.values():
-            if q['total_value'] > 0:
-                cost = q['total_cost']
-                q['margin'] = ((q['total_value'] - cost) / q['total_value']) * 100
-            else:
-                q['margin'] = 0
-    quotes_list = list(quotes_dict.values())
+    from django.db.models import Case, DecimalField, F, Max, OuterRef, Subquery, Value, When
+    from django.db.models.functions import Coalesce
+
+    # One row per quote_id; the newest line stands for the quote (status, client, AM)
+    latest_line = Quote.objects.filter(quote_id=OuterRef('quote_id')).order_by('-created_at', '-id')
+    money = DecimalField(max_digits=14, decimal_places=2)
+    groups = Quote.objects.order_by().values('quote_id').annotate(
+        latest_id=Subquery(latest_line.values('id')[:1]),
+        latest_status=Subquery(latest_line.values('status')[:1]),
+        latest_client_name=Subquery(
+            latest_line.annotate(name=Coalesce('client__name', 'lead__name')).values('name')[:1]
+        ),
+        latest_created_at=Max('created_at'),
+        item_count=Count('id'),
+        approved_items=Count('id', filter=Q(status='Approved')),
+        total_value=Coalesce(Sum('total_amount'), Value(0), output_field=money),
+        total_cost=Coalesce(Sum('production_cost'), Value(0), output_field=money),
+    ).annotate(
+        margin=Case(
+            When(total_value__gt=0, then=(F('total_value') - F('total_cost')) * 100 / F('total_value')),
+            default=Value(0),
+            output_field=DecimalField(max_digits=14, decimal_places=4),
+        ),
+    )
+
+    summary = groups.aggregate(
+        quote_count=Count('quote_id'),
+        pending_count=Count('quote_id', filter=Q(latest_status='Pending PT Approval')),
+        value=Sum('total_value'),
+        average_margin=Avg('margin'),
+    )
 
-    total_quotes_count = len(quotes_list)
-    pending_approval_count = sum(1 for q in quotes_list if q['status'] == 'Pending PT Approval')
-    total_value = sum(q['total_value'] for q in quotes_list)
-    avg_margin = sum(q['margin'] for q in quotes_list) / total_quotes_count if total_quotes_count > 0 else 0
-    
     # Apply status filter
     status_filter = request.GET.get('status', 'all')
     if status_filter and status_filter != 'all':
-        quotes_list = [q for q in quotes_list if q['status'] == status_filter]
-    
+        groups = groups.filter(latest_status=status_filter)
+
     # Apply search filter
     search_query = request.GET.get('search', '')
     if search_query:
-        quotes_list = [q for q in quotes_list if 
-                      search_query.lower() in q['quote_number'].lower() or 
-                      search_query.lower() in q['client_name'].lower()]
-    
+        groups = groups.filter(Q(quote_id__icontains=search_query) | Q(latest_client_name__icontains=search_query))
+
+    paginator = Paginator(groups.order_by('-latest_created_at', '-quote_id'), 25)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    # Representative lines of this page only
+    lines = Quote.objects.select_related('client', 'lead', 'created_by').in_bulk(
+        [group['latest_id'] for group in page_obj]
+    )
+    quotes_list = []
+    for group in page_obj:
+        quote = lines[group['latest_id']]
+        client_name = '-'
+        if quote.client:
+            client_name = quote.client.name
+        elif quote.lead:
+            client_name = quote.lead.name
+
+        account_manager = '-'
+        if quote.created_by:
+            account_manager = quote.created_by.get_full_name() or quote.created_by.username
+
+        # Calculate valid until date (30 days from creation)
+        valid_until = quote.created_at + timedelta(days=30)
+        quotes_list.append({
+            'id': quote.id,
+            'quote_number': quote.quote_id,
+            'client_name': client_name,
+            'account_manager': account_manager,
+            'item_count': group['item_count'],
+            'approved_items': group['approved_items'],
+            'total_value': group['total_value'],
+            'total_cost': group['total_cost'],
+            'margin': group['margin'],
+            'status': quote.status,
+            'created_date': quote.created_at.strftime('%b %d, %Y'),
+            'valid_until': valid_until.strftime('%b %d, %Y'),
+            'days_remaining': (valid_until.date() - datetime.now().date()).days,
+        })
+
     context = {
         'quotes': quotes_list,
+        'page_obj': page_obj,
         'status_filter': status_filter,
         'search_query': search_query,
-        'total_quotes_count': total_quotes_count,
-        'pending_approval_count': pending_approval_count,
-        'total_value': total_value,
-        'avg_margin': avg_margin,
+        'total_quotes_count': summary['quote_count'],
+        'pending_approval_count': summary['pending_count'],
+        'total_value': summary['value'] or 0,
+        'avg_margin': summary['average_margin'] or 0,
     }
     
     return render(request, 'quote_list.html', context)
@@ -3258,199 +3259,16 @@ def create_job(request):
 @login_required
 def job_detail(request, pk):
     """View job details with all related information"""
-    from django.utils import timezone
-    from datetime import timedelta
-    from decimal import Decimal
-    
-    job = get_object_or_404(Job.objects.select_related('client', 'quote', 'created_by'), pk=pk)
-    
-    # Get related data
-    attachments = job.attachments.select_related('uploaded_by').order_by('-uploaded_at')
-    notes = job.job_notes.select_related('created_by').order_by('-created_at')
-    production_updates = job.production_updates.select_related('created_by').order_by('-created_at')
-    
-    # Get vendor stages
-    vendor_stages = job.vendor_stages.select_related('vendor').order_by('stage_order') if hasattr(job, 'vendor_stages') else []
-    
-    # Get QC inspection if exists
-    qc_inspection = None
-    try:
-        qc_inspection = job.qc_inspection
-    except:
-        pass
-    
-    # Calculate progress
-    overall_progress = 0
-    current_stage = None
-    if vendor_stages:
-        total_stages = len(vendor_stages)
-        completed_stages = sum(1 for s in vendor_stages if s.status == 'completed')
-        in_progress_stage = next((s for s in vendor_stages if s.status in ['in_production', 'sent_to_vendor']), None)
-        
-        if in_progress_stage:
-            # Calculate based on stages + current stage progress
-            base_progress = (completed_stages / total_stages) * 100
-            stage_contribution = (in_progress_stage.progress / total_stages)
-            overall_progress = int(base_progress + stage_contribution)
-            current_stage = in_progress_stage
-        else:
-            overall_progress = int((completed_stages / total_stages) * 100) if completed_stages > 0 else 0
-    elif job.status == 'completed':
-        overall_progress = 100
-    elif job.status == 'in_progress':
-        # Get from last production updatee
-        last_update = production_updates.first()
-        overall_progress = last_update.progress if last_update else 50
-    else:
-        overall_progress = 0
-    
-    # Calculate deadline
-    now = timezone.now()
-    deadline = timezone.make_aware(
-        timezone.datetime.combine(job.expected_completion, timezone.datetime.min.time())
-    ) if job.expected_completion else now
-    time_remaining = deadline - now
-    hours_remaining = int(time_remaining.total_seconds() / 3600)
-    is_overdue = hours_remaining < 0
-    
-    if is_overdue:
-        deadline_text = f"Overdue by {abs(hours_remaining)}h"
-    elif hours_remaining < 24:
-        deadline_text = f"{hours_remaining}h remaining"
-    else:
-        days_remaining = hours_remaining // 24
-        deadline_text = f"{days_remaining} days remaining"
-    
-    # Get primary vendor
-    primary_vendor = None
-    if vendor_stages:
-        current = current_stage or vendor_stages[0]
-        primary_vendor = current.vendor
-    
-    # Get account manager who created this job
-    am_name = "System"
-    if job.created_by:
-        am_name = job.created_by.get_full_name() or job.created_by.username
-    
-    # Calculate current stage info
-    current_stage_text = "Not Started"
-    if current_stage:
-        current_stage_text = f"{current_stage.stage_name} (Day {(now - current_stage.started_at).days + 1 if current_stage.started_at else 1} of {(current_stage.expected_completion - current_stage.started_at).days if current_stage.started_at and current_stage.expected_completion else '?'})"
-    elif job.status == 'completed':
-        current_stage_text = "Completed"
-    elif job.status == 'in_progress':
-        current_stage_text = "Vendor Production"
-    
-    # Get job specs from quote
-    specs = {}
-    if job.quote:
-        specs = {
-            'product_type': job.quote.product_name or job.product,
-            'colors': '4/4 (CMYK both sides)',  # Default, could be stored in quote
-            'size': 'A4 (210mm × 297mm)',  
-            'finishing': 'Matt Lamination',  # Default
-            'quantity': f"{job.quantity:,} pcs",
-            'folding': 'Tri-fold',  # Default
-            'material': '150gsm Gloss Art Paper', 
-            'binding': 'None', 
-        }
-    else:
-        specs = {
-            'product_type': job.product,
-            'colors': '4/4 (CMYK both sides)',
-            'size': 'A4 (210mm × 297mm)',
-            'finishing': 'Matt Lamination',
-            'quantity': f"{job.quantity:,} pcs",
-            'folding': 'None',
-            'material': 'Standard',
-            'binding': 'None',
-        }
-    
-    # Check if user can manage
-    can_manage = request.user.groups.filter(name='Production Team').exists()
-    
-    # Get all jobs for the same client
-    client_jobs = []
-    job_stats = {'total': 0, 'in_progress': 0, 'overdue': 0, 'completed': 0, 'pending': 0}
-    
-    if job.client:
-        client_jobs_qs = Job.objects.filter(client=job.client).select_related('quote').order_by('-created_at')
-        for cj in client_jobs_qs:
-            # Calculate progress for each job
-            cj_progress = 0
-            if cj.status == 'completed':
-                cj_progress = 100
-            elif cj.status == 'in_progress':
-                cj_progress = 50
-            elif cj.status == 'pending':
-                cj_progress = 10
-            
-            # Calculate deadline info
-            cj_days = (cj.expected_completion - now.date()).days if cj.expected_completion else 0
-            cj_is_overdue = cj_days < 0
-            
-            client_jobs.append({
-                'id': cj.id,
-                'job_number': cj.job_number,
-                'product': cj.product,
-                'quantity': cj.quantity,
-                'status': cj.status,
-                'status_display': cj.get_status_display(),
-                'priority': cj.priority,
-                'priority_display': cj.get_priority_display(),
-                'expected_completion': cj.expected_completion,
-                'days_remaining': cj_days,
-                'is_overdue': cj_is_overdue,
-                'progress': cj_progress,
-                'is_current': cj.id == job.id,
-                'job_type': cj.get_job_type_display(),
-                'person_in_charge': cj.person_in_charge,
-                'notes': cj.notes[:50] + '...' if cj.notes and len(cj.notes) > 50 else cj.notes,
-            })
-            
-            # Update stats
-            job_stats['total'] += 1
-            if cj.status == 'in_progress':
-                job_stats['in_progress'] += 1
-            elif cj.status == 'completed':
-                job_stats['completed'] += 1
-            elif cj.status == 'pending':
-                job_stats['pending'] += 1
-            if cj_is_overdue and cj.status != 'completed':
-                job_stats['overdue'] += 1
+    detail = job_detail_service.job_detail(pk)
+    if detail is None:
+        raise Http404('Job not found')
     
     context = {
-        'job': job,
+        **detail,
         'current_view': 'my_jobs',
-        'client_jobs': client_jobs,
-        'job_stats': job_stats,
-        
-        # Progress info
-        'overall_progress': overall_progress,
-        'current_stage': current_stage,
-        'current_stage_text': current_stage_text,
-        
-        # Deadline info
-        'deadline_text': deadline_text,
-        'hours_remaining': hours_remaining,
-        'is_overdue': is_overdue,
-        
-        # Related data
-        'attachments': attachments,
-        'notes': notes,
-        'production_updates': production_updates,
-        'vendor_stages': vendor_stages,
-        'qc_inspection': qc_inspection,
-        
-        # Vendor info
-        'primary_vendor': primary_vendor,
-        'am_name': am_name,
-        
-        # Job specs
-        'specs': specs,
         
         # Permissions
-        'can_manage': can_manage,
+        'can_manage': has_group(request.user, 'Production Team'),
         
         # For vendor/process lists
         'vendors': Vendor.objects.filter(active=True).order_by('name'),
@@ -5000,7 +4818,7 @@ def notifications(request):
 def permission_denied_view(request, *args, **kwargs):
     messages.warning(request, "You don't have access to that section.")
     fallback = 'dashboard'
-    if request.user.groups.filter(name='Production Team').exists():
+    if has_group(request.user, 'Production Team'):
         fallback = 'production2_dashboard'
     return redirect(reverse(fallback))
 def login_redirect(request):
@@ -5019,9 +4837,9 @@ def login_redirect(request):
         return redirect('admin_dashboard_index')
     
     # Check groups and redirect accordingly
-    if user.groups.filter(name='Production Team').exists():
+    if has_group(user, 'Production Team'):
         return redirect('production2_dashboard')
-    elif user.groups.filter(name='Account Manager').exists():
+    elif has_group(user, 'Account Manager'):
         return redirect('dashboard')
     else:
         from django.shortcuts import render
@@ -5233,8 +5051,8 @@ def lpo_detail(request, lpo_number):
     lpo = get_object_or_404(LPO, lpo_number=lpo_number)
     
     # Check permissions
-    is_am = request.user.groups.filter(name='Account Manager').exists()
-    is_production = request.user.groups.filter(name='Production Team').exists()
+    is_am = has_group(request.user, 'Account Manager')
+    is_production = has_group(request.user, 'Production Team')
     
     if not (is_am or is_production or request.user.is_superuser):
         messages.error(request, "You don't have permission to view this LPO")
@@ -5817,7 +5635,7 @@ def group_required_production(group_name):
     """Decorator to require Production Team group membership"""
     def decorator(view_func):
         def wrapped(request, *args, **kwargs):
-            if not request.user.groups.filter(name=group_name).exists():
+            if not has_group(request.user, group_name):
                 messages.error(request, "You don't have permission to access this page.")
                 return redirect('production2_dashboard')
             return view_func(request, *args, **kwargs)
@@ -6061,7 +5879,7 @@ def product_detail(request, pk):
         pass
     
     # Check if user is in Production Team group
-    is_production_team = request.user.groups.filter(name='Production Team').exists()
+    is_production_team = has_group(request.user, 'Production Team')
     
     context = {
         'product': product,
@@ -8088,8 +7906,8 @@ def delivery_list(request):
     """Display list of all deliveries"""
     
     # Check user permissions
-    is_production = request.user.groups.filter(name='Production Team').exists()
-    is_am = request.user.groups.filter(name='Account Manager').exists()
+    is_production = has_group(request.user, 'Production Team')
+    is_am = has_group(request.user, 'Account Manager')
     
     if is_production:
         # PT sees all deliveries
@@ -12189,7 +12007,7 @@ def production_team_dashboard(request):
     from datetime import timedelta, date
     
     # Check if user is in Production Team
-    if not request.user.groups.filter(name='Production Team').exists() and not request.user.is_staff:
+    if not has_group(request.user, 'Production Team') and not request.user.is_staff:
         return render(request, '403.html', {'message': 'Access denied. Production Team only.'}, status=403)
     
     # Get current user's jobs
@@ -0,0 +1,38 @@
+"""
+Gunicorn configuration for the web dyno.
+
+Serves client.asgi:application through uvicorn workers so the same process
+pool handles plain HTTP and the Channels WebSocket routes.
+
+Environment overrides:
+    WEB_CONCURRENCY    worker processes (default: 2 * CPUs + 1); exported to the
+                       workers, which size their DB pools from it (settings
+                       DB_WEB_MAX_CONNECTIONS)
+    WEB_WORKER_CLASS   worker class (default: client.workers.UvicornWorker);
+                       must be an ASGI worker, the Procfile serves client.asgi
+    WEB_WS_DEFLATE     negotiate permessage-deflate on WebSockets (default: 1)
+    WEB_TIMEOUT        worker timeout in seconds (default: 60)
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# Settings are imported in the workers after this; each pool takes 1/workers
+# of the connection budget
+os.environ['WEB_CONCURRENCY'] = str(workers)
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'client.workers.UvicornWorker')
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers periodically to bound memory growth; jitter avoids every
+# worker restarting at the same moment.
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 2000))
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
@@ -17,6 +17,8 @@ from quickbooks.objects.customer import Customer
 from quickbooks.objects.account import Account
 from quickbooks.objects.item import Item
 
+from clientapp.services.roles import has_group
+
 from .models import QuickBooksToken
 from .helpers import get_qb_client
 
@@ -95,12 +97,12 @@ def group_required(group_name, allow_superuser=False):
                 return redirect(f"{login_url}?next={request.get_full_path()}")
             if allow_superuser and user.is_superuser:
                 return view_func(request, *args, **kwargs)
-            if user.groups.filter(name=group_name).exists():
+            if has_group(user, group_name):
                 return view_func(request, *args, **kwargs)
 
             messages.warning(request, "You don't have access to that section.")
             fallback_name = 'dashboard'
-            if user.groups.filter(name='Finance').exists():
+            if has_group(user, 'Finance'):
                 fallback_name = 'analytics_dashboard'
             return redirect(reverse(fallback_name))
         return _wrapped